@@ -9,10 +9,15 @@ import os
 import re
 import json
 import logging
-from typing import Dict, List, Tuple, Optional, Any
+import threading
+from typing import Dict, Iterable, List, Tuple, Optional, Any
 from datetime import datetime
 import google.generativeai as genai
 from dotenv import load_dotenv
+from gemini_cache import GeminiResponseCache
+from gemini_client import GeminiClient, GeminiUnavailable, shared_client
+from leak_gate import LeakGate, UNGATED
+from evidence_snippet import build_evidence_snippet, MIN_BUDGET_CHARS
 
 # Load environment variables
 load_dotenv()
@@ -21,18 +26,95 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Rough token estimate for packing batches (Gemini averages about 4 characters per token)
+CHARS_PER_TOKEN = 4
+# Tokens set aside per document for its entry in a batched answer
+BATCH_ANSWER_TOKENS = 300
+# Output token limit of gemini-1.5-flash: a batched answer longer than this is cut off
+MAX_ANSWER_TOKENS = 8192
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def leak_detection_error() -> Dict[str, Any]:
+    """detect_leaks_with_gemini() result when Gemini could not be asked or answered unusably."""
+    return {
+        "leak_detected": False,
+        "confidence_score": 0,
+        "detected_entities": {},
+        "context": "Error during analysis",
+        "severity": "LOW"
+    }
+
+
+def parse_batch_answers(response_text: str, documents: Dict[str, Any]) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    {document id: answer} from a batched leak detection response.
+    Returns None when the response is not a JSON array of per-document answers (malformed or cut off).
+    """
+    try:
+        answers = json.loads(response_text)
+    except ValueError:
+        return None
+    if isinstance(answers, dict):
+        answers = answers.get('documents', answers.get('results'))
+    if not isinstance(answers, list):
+        return None
+    
+    parsed = {}
+    for answer in answers:
+        if not isinstance(answer, dict) or 'leak_detected' not in answer:
+            continue
+        doc_id = str(answer.get('id'))
+        if doc_id in documents and doc_id not in parsed:
+            parsed[doc_id] = {field: value for field, value in answer.items() if field != 'id'}
+    return parsed or None
+
 class GeminiAIProcessor:
     """Main class for handling all AI-driven leak detection operations using Gemini."""
     
-    def __init__(self, api_key: str = None):
-        """Initialize Gemini AI processor with API key."""
+    def __init__(self, api_key: str = None, cache: GeminiResponseCache = None, client: GeminiClient = None):
+        """Initialize Gemini AI processor with API key.
+        
+        cache: response cache for repeated inputs (default: built from GEMINI_CACHE_* unless GEMINI_CACHE_ENABLED=false;
+            False disables it)
+        client: rate limiter / retry / circuit breaker layer (default: the process-wide shared client)
+        
+        While Gemini is unavailable (circuit breaker open, retries exhausted) every method
+        raises GeminiUnavailable instead of returning its error result, so callers can
+        queue the work rather than store a degraded classification.
+        """
         self.api_key = api_key or os.getenv('GEMINI_API_KEY')
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY not found in environment variables")
         
         # Configure Gemini
         genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.model_name = 'gemini-1.5-flash'
+        self.model = genai.GenerativeModel(self.model_name)
+        # One token bucket and breaker for the crawler, OCR and dashboard (shared across processes via SQLite)
+        self.client = client or shared_client()
+        
+        # Identical inputs (mirrored dumps, repeated searches) are answered from the local cache
+        self.cache = cache
+        if self.cache is None and os.getenv('GEMINI_CACHE_ENABLED', 'true').lower() == 'true':
+            try:
+                self.cache = GeminiResponseCache.from_env()
+            except Exception as e:
+                logger.warning(f"Gemini response cache unavailable, calling the API every time: {str(e)}")
+        
+        # Batched leak detection: documents per request follow the token budget; a malformed
+        # answer halves the document limit, and every whole answer at the limit raises it by one
+        self.batch_token_budget = int(os.getenv('GEMINI_BATCH_TOKEN_BUDGET', 16000))
+        self.batch_limit = None
+        self.batch_counts = {'requests': 0, 'single_requests': 0, 'documents': 0, 'splits': 0, 'retried': 0}
+        self._batch_lock = threading.Lock()
+        # Long pages are cut down to the context around their local hits, up to this many tokens each
+        # (at least enough for one evidence window)
+        self.snippet_token_budget = max(int(os.getenv('GEMINI_SNIPPET_TOKEN_BUDGET', 1000)),
+                                        -(-MIN_BUDGET_CHARS // CHARS_PER_TOKEN))
         
         # Enhanced regex patterns for local PII detection
         self.local_patterns = {
@@ -99,15 +181,46 @@ class GeminiAIProcessor:
         logger.info(f"Local regex detected: {len(detected_entities)} categories")
         return detected_entities
     
-    def detect_leaks_with_gemini(self, text_snippet: str, max_length: int = 4000) -> Dict[str, Any]:
+    def _generate(self, prompt: str):
+        """model.generate_content() under the shared rate limit, retries and circuit breaker."""
+        return self.client.call(lambda: self.model.generate_content(prompt))
+    
+    def _generate_json(self, prompt_type: str, cache_input: str, prompt: str) -> Dict[str, Any]:
+        """
+        Gemini's JSON answer to prompt, from the response cache when cache_input was already asked.
+        Raises on API or JSON errors, so failures are never cached.
+        """
+        call = lambda: json.loads(self._generate(prompt).text)
+        if not self.cache:
+            return call()
+        return self.cache.get_or_call(prompt_type, self.model_name, cache_input, call)
+    
+    def evidence_snippet(self, text: str, max_length: int = None, keywords: Iterable[str] = ()) -> str:
+        """
+        The part of text sent to Gemini: all of it when it fits max_length characters
+        (default: GEMINI_SNIPPET_TOKEN_BUDGET tokens), else the windows around its local hits.
+        """
+        return build_evidence_snippet(text, max_length or self.snippet_token_budget * CHARS_PER_TOKEN, keywords)
+    
+    def detect_leaks_with_gemini(self, text_snippet: str, max_length: int = None,
+                                 keywords: Iterable[str] = ()) -> Dict[str, Any]:
         """
         Send suspicious text snippets to Gemini for context-aware PII detection.
+        keywords: keywords.json terms already matched on the page, kept in the snippet with their context
         """
-        # Truncate text if too long
-        if len(text_snippet) > max_length:
-            text_snippet = text_snippet[:max_length] + "..."
-        
-        prompt = f"""
+        try:
+            text_snippet = self.evidence_snippet(text_snippet, max_length, keywords)
+            result = self._generate_json('detect_leaks', text_snippet, self._leak_detection_prompt(text_snippet))
+            logger.info(f"Gemini leak detection completed with confidence: {result.get('confidence_score', 0)}")
+            return result
+        except GeminiUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"Gemini leak detection failed: {str(e)}")
+            return leak_detection_error()
+    
+    def _leak_detection_prompt(self, text_snippet: str) -> str:
+        return f"""
         Analyze the following text for potential data leaks and PII (Personally Identifiable Information).
         Focus on detecting:
         - Aadhaar numbers (Indian national ID)
@@ -143,21 +256,157 @@ class GeminiAIProcessor:
             "severity": "LOW/MEDIUM/HIGH/CRITICAL"
         }}
         """
+    
+    def _batch_leak_detection_prompt(self, documents: Dict[str, Tuple[str, str]]) -> str:
+        """Prompt asking for one detect_leaks_with_gemini() answer per {document id: (key, snippet)}."""
+        texts = "\n".join(f'<document id="{doc_id}">\n{snippet}\n</document>'
+                          for doc_id, (_, snippet) in documents.items())
+        return f"""
+        Analyze each of the following {len(documents)} documents separately for potential data leaks and PII
+        (Personally Identifiable Information). Focus on detecting:
+        - Aadhaar numbers (Indian national ID)
+        - PAN cards (Indian tax ID)
+        - Phone numbers (especially Indian numbers)
+        - Email addresses
+        - Banking/Financial information
+        - Telecom data (IMEI, SIM details)
+        - KYC documents references
+        - Credit card information
+        - Government IDs (passport, driving license, voter ID)
+        
+        Documents to analyze:
+        {texts}
+        
+        Please respond with a JSON array holding one object per document, each with its document id:
+        [
+            {{
+                "id": "document id",
+                "leak_detected": true/false,
+                "confidence_score": 0-100,
+                "detected_entities": {{
+                    "Aadhaar": ["list of aadhaar numbers"],
+                    "PAN": ["list of PAN numbers"],
+                    "Phone": ["list of phone numbers"],
+                    "Email": ["list of emails"],
+                    "Banking": ["list of banking info"],
+                    "Telecom": ["list of telecom data"],
+                    "Government_ID": ["list of govt IDs"],
+                    "Other_PII": ["other sensitive data"]
+                }},
+                "context": "brief description of the leak context",
+                "severity": "LOW/MEDIUM/HIGH/CRITICAL"
+            }}
+        ]
+        """
+    
+    def detect_leaks_batch(self, documents: Dict[str, str], max_length: int = None,
+                           keywords: Dict[str, Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        detect_leaks_with_gemini() for several documents, packed into as few requests as the token budget allows.
+        keywords: {document key: matched keywords.json terms}
+        Returns {document key: result}. Documents whose answer is lost get the usual error result.
+        """
+        keywords = keywords or {}
+        results = {}
+        pending = []
+        for key, text in documents.items():
+            snippet = self.evidence_snippet(text, max_length, keywords.get(key, ()))
+            cached = self.cache.get('detect_leaks', self.model_name, snippet) if self.cache else None
+            if cached is not None:
+                results[key] = cached
+            else:
+                pending.append((key, snippet))
         
+        for batch in self._pack_batches(pending):
+            results.update(self._detect_leaks_request(batch))
+        return results
+    
+    def _pack_batches(self, documents: List[Tuple[str, str]]) -> List[List[Tuple[str, str]]]:
+        """Group (key, snippet) pairs into requests that fit the token budget, the answer limit and the adaptive document limit."""
+        overhead = estimate_tokens(self._batch_leak_detection_prompt({}))
+        batches, batch, tokens = [], [], overhead
+        for key, snippet in documents:
+            cost = estimate_tokens(snippet) + BATCH_ANSWER_TOKENS
+            full = ((self.batch_limit is not None and len(batch) >= self.batch_limit)
+                    or (len(batch) + 1) * BATCH_ANSWER_TOKENS > MAX_ANSWER_TOKENS)
+            if batch and (full or tokens + cost > self.batch_token_budget):
+                batches.append(batch)
+                batch, tokens = [], overhead
+            batch.append((key, snippet))
+            tokens += cost
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    def _detect_leaks_request(self, batch: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+        """One Gemini request for the batch; malformed answers split it, documents left unanswered are retried."""
+        if len(batch) == 1:
+            key, snippet = batch[0]
+            return {key: self._detect_leaks_single(snippet)}
+        
+        documents = {f"doc{i}": item for i, item in enumerate(batch)}
         try:
-            response = self.model.generate_content(prompt)
-            result = json.loads(response.text)
-            logger.info(f"Gemini leak detection completed with confidence: {result.get('confidence_score', 0)}")
-            return result
+            response_text = self._generate(self._batch_leak_detection_prompt(documents)).text
+        except GeminiUnavailable:
+            raise
+        except Exception as e:
+            # A rejected request: splitting would only spend more requests on it
+            logger.error(f"Gemini batch leak detection failed for {len(batch)} documents: {str(e)}")
+            return {key: leak_detection_error() for key, _ in batch}
+        with self._batch_lock:
+            self.batch_counts['requests'] += 1
+            self.batch_counts['documents'] += len(batch)
+        
+        answers = parse_batch_answers(response_text, documents)
+        if answers is None:
+            # Usually an answer cut off at the output limit: halve this batch and cap the ones after it
+            logger.warning(f"Malformed Gemini batch answer for {len(batch)} documents, splitting")
+            with self._batch_lock:
+                self.batch_counts['splits'] += 1
+                self.batch_limit = max(1, len(batch) // 2)
+            middle = len(batch) // 2
+            return {**self._detect_leaks_request(batch[:middle]), **self._detect_leaks_request(batch[middle:])}
+        
+        results = {}
+        for doc_id, answer in answers.items():
+            key, snippet = documents[doc_id]
+            results[key] = answer
+            if self.cache:
+                self.cache.put('detect_leaks', self.model_name, snippet, answer)
+        missing = [item for doc_id, item in documents.items() if doc_id not in answers]
+        if missing:
+            with self._batch_lock:
+                self.batch_counts['retried'] += len(missing)
+            results.update(self._detect_leaks_request(missing))
+        elif self.batch_limit is not None and len(batch) >= self.batch_limit:
+            # A full batch came back whole: allow one more document per request again
+            with self._batch_lock:
+                self.batch_limit += 1
+        logger.info(f"Gemini batch leak detection completed for {len(batch)} documents")
+        return results
+    
+    def _detect_leaks_single(self, snippet: str) -> Dict[str, Any]:
+        """The single-document prompt for a batch remainder (already looked up in the cache by the batch)."""
+        with self._batch_lock:
+            self.batch_counts['single_requests'] += 1
+            self.batch_counts['documents'] += 1
+        try:
+            result = json.loads(self._generate(self._leak_detection_prompt(snippet)).text)
+        except GeminiUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Gemini leak detection failed: {str(e)}")
-            return {
-                "leak_detected": False,
-                "confidence_score": 0,
-                "detected_entities": {},
-                "context": "Error during analysis",
-                "severity": "LOW"
-            }
+            return leak_detection_error()
+        if self.cache:
+            self.cache.put('detect_leaks', self.model_name, snippet, result)
+        return result
+    
+    def batch_snapshot(self) -> Dict[str, Any]:
+        """Batched leak detection counters: requests, documents per request, splits and the current limit."""
+        with self._batch_lock:
+            requests = self.batch_counts['requests'] + self.batch_counts['single_requests']
+            return dict(self.batch_counts, batch_limit=self.batch_limit or 0,
+                        documents_per_request=round(self.batch_counts['documents'] / requests, 2) if requests else 0.0)
     
     def classify_leak_data(self, leak_records: List[Dict]) -> Dict[str, Any]:
         """
@@ -203,10 +452,12 @@ class GeminiAIProcessor:
         """
         
         try:
-            response = self.model.generate_content(prompt)
+            response = self._generate(prompt)
             result = json.loads(response.text)
             logger.info(f"Gemini classification completed: {result.get('primary_classification', 'Unknown')}")
             return result
+        except GeminiUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Gemini classification failed: {str(e)}")
             return {
@@ -249,10 +500,11 @@ class GeminiAIProcessor:
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            result = json.loads(response.text)
+            result = self._generate_json('process_ocr_text', ocr_text, prompt)
             logger.info(f"OCR processing completed for document type: {result.get('document_type', 'Unknown')}")
             return result
+        except GeminiUnavailable:
+            raise
         except Exception as e:
             logger.error(f"OCR processing failed: {str(e)}")
             return {
@@ -286,10 +538,11 @@ class GeminiAIProcessor:
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            result = json.loads(response.text)
+            result = self._generate_json('fuzzy_match_identifier', f"{identifier}\0{dataset_description}", prompt)
             logger.info(f"Fuzzy matching completed: {result.get('match_type', 'NONE')} match")
             return result
+        except GeminiUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Fuzzy matching failed: {str(e)}")
             return {
@@ -326,10 +579,12 @@ class GeminiAIProcessor:
         """
         
         try:
-            response = self.model.generate_content(prompt)
+            response = self._generate(prompt)
             result = json.loads(response.text)
             logger.info(f"Incident summary generated: {result.get('severity_level', 'Unknown')} severity")
             return result
+        except GeminiUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Summary generation failed: {str(e)}")
             return {
@@ -346,19 +601,25 @@ class GeminiAIProcessor:
 
 
 # Helper functions for integration with existing system
-def detect_and_classify_leaks(text: str, ai_processor: GeminiAIProcessor = None) -> Dict[str, Any]:
+def detect_and_classify_leaks(text: str, ai_processor: GeminiAIProcessor = None, gate: LeakGate = None,
+                              keywords: Iterable[str] = ()) -> Dict[str, Any]:
     """
     Main function to detect and classify leaks using the complete AI workflow.
+    Gemini is asked when local regex finds something. A caller that passes a gate (e.g.
+    LeakGate.from_env()) only asks it when the page's local evidence clears the gate too.
+    keywords: keywords.json terms matched on the page.
     """
     if not ai_processor:
         ai_processor = GeminiAIProcessor()
+    gate = gate or UNGATED
     
     # Step 1: Local regex detection
     local_results = ai_processor.run_local_regex_detection(text)
+    decision = gate.check(text, len(keywords), local_hits=bool(local_results)) if gate.enabled else None
     
-    # Step 2: If local detection finds something suspicious, use Gemini
-    if local_results:
-        gemini_results = ai_processor.detect_leaks_with_gemini(text)
+    # Step 2: If local detection finds something and the gate scores it high enough, use Gemini
+    if (decision.passed if decision else local_results):
+        gemini_results = ai_processor.detect_leaks_with_gemini(text, keywords=keywords)
         
         # Combine results
         combined_results = {
@@ -367,15 +628,59 @@ def detect_and_classify_leaks(text: str, ai_processor: GeminiAIProcessor = None)
             "processed_at": datetime.now().isoformat(),
             "detection_method": "hybrid"
         }
-        
-        return combined_results
     else:
-        return {
-            "local_detection": {},
+        combined_results = {
+            "local_detection": local_results,
             "ai_detection": {"leak_detected": False, "confidence_score": 0},
             "processed_at": datetime.now().isoformat(),
             "detection_method": "local_only"
         }
+    if decision is not None:
+        combined_results["gate"] = decision._asdict()
+    return combined_results
+
+
+def detect_and_classify_leaks_batch(texts: Dict[str, str], ai_processor: GeminiAIProcessor = None,
+                                    gate: LeakGate = None,
+                                    keywords: Dict[str, Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    detect_and_classify_leaks() for several pages at once: the pages flagged by local
+    regex (and passed by the gate, if one is given) share batched Gemini requests.
+    Returns {page key: combined results}.
+    keywords: {page key: keywords.json terms matched on the page}
+    """
+    if not ai_processor:
+        ai_processor = GeminiAIProcessor()
+    gate = gate or UNGATED
+    
+    local_results = {key: ai_processor.run_local_regex_detection(text) for key, text in texts.items()}
+    keywords = keywords or {}
+    decisions = {key: gate.check(text, len(keywords.get(key, ())), local_hits=bool(local_results[key]))
+                 for key, text in texts.items()} if gate.enabled else {}
+    flagged = [key for key in texts if (decisions[key].passed if decisions else local_results[key])]
+    gemini_results = ai_processor.detect_leaks_batch({key: texts[key] for key in flagged},
+                                                     keywords={key: keywords[key] for key in flagged if key in keywords})
+    processed_at = datetime.now().isoformat()
+    
+    results = {}
+    for key in texts:
+        if key in gemini_results:
+            results[key] = {
+                "local_detection": local_results[key],
+                "ai_detection": gemini_results[key],
+                "processed_at": processed_at,
+                "detection_method": "hybrid"
+            }
+        else:
+            results[key] = {
+                "local_detection": local_results[key],
+                "ai_detection": {"leak_detected": False, "confidence_score": 0},
+                "processed_at": processed_at,
+                "detection_method": "local_only"
+            }
+        if key in decisions:
+            results[key]["gate"] = decisions[key]._asdict()
+    return results
 
 
 def search_by_identifier(identifier: str, leak_index: List[Dict], ai_processor: GeminiAIProcessor = None) -> List[Dict]:
@@ -0,0 +1,158 @@
+"""
+Asynchronous AI Classification Stage
+Runs Gemini leak classification on worker threads so the Scrapy reactor keeps fetching.
+
+Pages are stored with their regex results straight away; when the AI verdict
+arrives it is handed to an on_result callback that updates the stored row.
+The crawler only submits pages that passed its leak gate, so the stage does
+not gate them again. Pages come with the keywords.json terms matched on them,
+which the Gemini snippet keeps along with the local regex hits. Pages the
+stage cannot take (queue full, still queued at shutdown, Gemini still down
+after max_retries attempts) are handed to an on_pending callback that stores
+them for a later run, so an outage does not keep the crawl open.
+"""
+
+import json
+import time
+import logging
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from ai_utils import detect_and_classify_leaks, detect_and_classify_leaks_batch
+from gemini_client import GeminiUnavailable
+from leak_gate import UNGATED
+from crawler.worker_stage import BoundedWorkerStage, RetryLater, OVERFLOW_POLICIES
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class AIJob(NamedTuple):
+    text: str
+    keywords: Tuple[str, ...]  # keywords.json terms matched on the page
+
+
+def interpret_ai_results(ai_results: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn detect_and_classify_leaks() output into scraped_data column values."""
+    fields = {
+        'ai_classification': None,
+        'leak_severity': None,
+        'ai_confidence': 0.0,
+        'detection_method': 'regex',
+        'local_detection_results': json.dumps(ai_results.get('local_detection', {})),
+        'gemini_detection_results': None,
+    }
+
+    if ai_results.get('detection_method') != 'hybrid':
+        return fields
+
+    gemini_results = ai_results.get('ai_detection', {})
+    fields['gemini_detection_results'] = json.dumps(gemini_results)
+
+    if gemini_results.get('leak_detected', False):
+        fields['detection_method'] = 'ai_hybrid'
+        fields['ai_confidence'] = gemini_results.get('confidence_score', 0) / 100.0
+        fields['leak_severity'] = gemini_results.get('severity', 'LOW')
+
+        # Determine primary classification based on detected entities
+        detected_entities = gemini_results.get('detected_entities', {})
+        if detected_entities.get('Aadhaar'):
+            fields['ai_classification'] = "Aadhaar"
+        elif detected_entities.get('PAN'):
+            fields['ai_classification'] = "PAN"
+        elif detected_entities.get('Banking'):
+            fields['ai_classification'] = "Banking/Financial"
+        elif detected_entities.get('Telecom'):
+            fields['ai_classification'] = "Telecom"
+        else:
+            fields['ai_classification'] = "General PII"
+
+    return fields
+
+
+class AIClassificationStage(BoundedWorkerStage):
+    """Bounded queue of pages waiting for Gemini, drained by a fixed pool of worker threads.
+
+    Args:
+        ai_processor: GeminiAIProcessor shared by all workers
+        on_result: called as on_result(url, fields) from a worker thread
+        max_in_flight: number of concurrent Gemini calls (worker threads)
+        max_queue: pages allowed to wait for a free worker
+        overflow_policy: what submit() does when the queue is full:
+            'defer'       hand the page to on_pending (e.g. the ai_pending table) for a later run
+            'drop'        reject the new page (it keeps its regex-only result)
+            'drop_oldest' evict the longest-waiting page to make room
+        on_pending: called as on_pending(url, job, reason) for pages deferred by the 'defer' policy
+        metrics: optional CrawlMetrics; each call is timed under the 'gemini' stage
+        max_batch: queued pages a free worker classifies together in batched Gemini requests
+            (packed by the processor's token budget); 1 sends every page on its own
+        max_retries: times a page is re-queued while Gemini is unavailable; after that it is
+            deferred like an overflowing page (or failed, without the 'defer' policy)
+    """
+
+    def __init__(self, ai_processor, on_result: Callable[[str, Dict[str, Any]], None],
+                 max_in_flight: int = 4, max_queue: int = 200, overflow_policy: str = 'defer',
+                 metrics=None, max_batch: int = 1,
+                 on_pending: Optional[Callable[[str, AIJob, str], None]] = None, max_retries: Optional[int] = 3):
+        self.ai_processor = ai_processor
+        self.on_result = on_result
+        self.on_pending = on_pending
+        self.metrics = metrics
+        super().__init__(max_in_flight, max_queue, overflow_policy, name='ai-stage', max_batch=max_batch,
+                         max_retries=max_retries)
+
+    def submit(self, url: str, text: str, keywords: Iterable[str] = ()) -> bool:
+        """Queue a page for classification. Returns False if it was dropped or deferred."""
+        return super().submit(url, AIJob(text, tuple(keywords)))
+
+    def process(self, url: str, job: AIJob):
+        started = time.perf_counter()
+        try:
+            ai_results = detect_and_classify_leaks(job.text, self.ai_processor, gate=UNGATED, keywords=job.keywords)
+        except GeminiUnavailable as e:
+            # Quota exhausted / outage: keep the page queued instead of storing an error verdict
+            raise RetryLater(str(e), e.retry_after)
+        if self.metrics:
+            self.metrics.observe('gemini', time.perf_counter() - started)
+            self.metrics.inc('ai_calls')
+        self.deliver(url, ai_results)
+
+    def process_batch(self, jobs: List[Tuple[str, AIJob]]):
+        started = time.perf_counter()
+        try:
+            batch_results = detect_and_classify_leaks_batch({url: job.text for url, job in jobs}, self.ai_processor,
+                                                            gate=UNGATED,
+                                                            keywords={url: job.keywords for url, job in jobs})
+        except GeminiUnavailable as e:
+            raise RetryLater(str(e), e.retry_after)
+        if self.metrics:
+            self.metrics.observe('gemini', time.perf_counter() - started)
+            self.metrics.inc('ai_calls', len(jobs))
+        for url, _ in jobs:
+            self.deliver(url, batch_results[url])
+
+    def deliver(self, url: str, ai_results: Dict[str, Any]):
+        fields = interpret_ai_results(ai_results)
+        self.on_result(url, fields)
+        if fields['ai_classification']:
+            print(f"🤖 AI Detection: {fields['ai_classification']} ({fields['leak_severity']}) "
+                  f"- Confidence: {fields['ai_confidence']:.2f} | {url}")
+
+    def on_retry(self, jobs: List[Tuple[str, AIJob]], error: RetryLater):
+        if self.metrics:
+            self.metrics.inc('ai_retried', len(jobs))
+        print(f"⏸️ Gemini unavailable, {len(jobs)} pages re-queued (retry in {error.delay:.0f}s): {str(error)}")
+
+    def on_defer(self, jobs: List[Tuple[str, AIJob]], reason: str):
+        if self.on_pending is None:
+            raise RuntimeError("no on_pending callback to defer pages to")
+        for url, job in jobs:
+            self.on_pending(url, job, reason)
+        if self.metrics:
+            self.metrics.inc('ai_deferred', len(jobs))
+        print(f"⏸️ {len(jobs)} pages deferred for a later run ({reason})")
+
+    def on_failure(self, url: str, error: Exception):
+        if self.metrics:
+            self.metrics.inc('ai_failures')
+        print(f"⚠ AI processing failed for {url}: {str(error)}")
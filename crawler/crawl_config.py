@@ -0,0 +1,280 @@
+"""
+Crawl Configuration and Shared Resources
+Explicit settings for a crawl, and the expensive objects several crawls in one process can share.
+
+CrawlConfig holds every crawler tunable. Field names are the lower-cased
+environment variables from .env.example, so CrawlConfig.from_env() reads the
+same settings the command line always used, while code embedding the crawler
+can build one directly (or _replace() fields) without touching os.environ.
+
+CrawlResources builds the keyword automatons, the Gemini client, the OCR
+processor and the database schema on first use only, so importing the crawler or constructing a
+spider is cheap, and a long-lived service that passes one CrawlResources to
+each crawl pays for them once.
+"""
+
+import os
+import sys
+import logging
+import threading
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.models import BASE_DIR, initialize_database
+from crawler.keyword_matcher import KeywordMatcher
+from crawler.seeds import Seed
+from crawler.download_filter import DEFAULT_ALLOWED_TYPES
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROXY = 'http://127.0.0.1:8118'
+
+# Fields that describe one crawl rather than the environment
+_NOT_FROM_ENV = ('seeds', 'run_label', 'shard_index', 'shard_count')
+
+_TRUE = ('1', 'true', 'yes', 'on')
+
+
+class CrawlConfig(NamedTuple):
+    # What to crawl
+    seeds: Tuple[Seed, ...] = ()
+    run_label: Optional[str] = None
+    shard_index: Optional[int] = None
+    shard_count: int = 1
+    seed_max_depth: int = 0          # 0 = unlimited
+    seed_max_pages: int = 0
+    seed_stats_interval: float = 60.0
+
+    # Scrapy / downloader
+    crawler_delay: float = 1.5
+    retry_times: int = 5
+    concurrent_requests: int = 32
+    host_throttle_enabled: bool = True
+    host_throttle_min_delay: float = 0.25
+    host_throttle_max_delay: float = 30.0
+    host_throttle_max_concurrency: int = 8
+    host_throttle_target_concurrency: float = 2.0
+    proxy_pool: Tuple[str, ...] = (DEFAULT_PROXY,)
+    proxy_pool_policy: str = 'least_loaded'
+    proxy_pool_max_failures: int = 3
+    proxy_pool_cooldown: float = 60.0
+    host_health_enabled: bool = True
+    host_health_failures: int = 3
+    host_health_backoff: float = 300.0
+    host_health_max_backoff: float = 86400.0
+    host_health_db_path: Optional[str] = None
+    download_filter_enabled: bool = True
+    download_allowed_types: Tuple[str, ...] = DEFAULT_ALLOWED_TYPES
+    download_max_bytes: int = 64 * 1024 * 1024
+    write_behind_batch_size: int = 100
+    write_behind_flush_interval: float = 5.0
+    write_behind_max_pending: int = 5000
+    write_behind_max_overflow: int = 5000
+
+    # Frontier
+    frontier_db_path: Optional[str] = None
+    frontier_batch: int = 100
+    frontier_commit_every: int = 500
+    frontier_lease: float = 300.0
+
+    # Metrics
+    metrics_file: str = 'crawl_metrics.jsonl'
+    metrics_flush_interval: float = 30.0
+    metrics_port: int = 0
+
+    # Page analysis
+    keywords_path: str = os.path.join(BASE_DIR, 'keywords.json')
+    keyword_whole_word: bool = False
+    crawl_priority_enabled: bool = True
+    crawl_priority_keyword_weight: float = 40.0
+    crawl_priority_parent_weight: float = 30.0
+    crawl_priority_host_weight: float = 30.0
+    crawl_priority_depth_penalty: float = 1.0
+    crawl_priority_rank_weight: float = 20.0
+    link_graph_enabled: bool = True
+    link_graph_batch_size: int = 1000
+    link_graph_rank_every: int = 2000
+    html_extract_backend: str = 'lxml'
+    stream_scan_threshold: int = 2 * 1024 * 1024
+    stream_chunk_bytes: int = 1024 * 1024
+    stream_overlap_chars: int = 512
+    near_dup_enabled: bool = True
+    near_dup_max_distance: int = 3
+    near_dup_min_tokens: int = 50
+    recrawl_incremental: bool = True
+
+    # Gemini
+    ai_processing_enabled: bool = True
+    ai_gate_threshold: float = 25.0       # 0 = every page with a local hit goes to Gemini
+    ai_max_in_flight: int = 4
+    ai_queue_size: int = 200
+    ai_overflow_policy: str = 'defer'
+    ai_max_retries: int = 3               # re-queues per page while Gemini is down, then deferred
+    ai_batch_size: int = 8
+    ai_drain_timeout: float = 120.0
+
+    # OCR of images / PDFs linked from leak pages
+    ocr_enabled: bool = True
+    ocr_workers: int = 2
+    ocr_queue_size: int = 20
+    ocr_min_bytes: int = 4096
+    ocr_max_bytes: int = 8 * 1024 * 1024
+    ocr_max_per_page: int = 5
+    ocr_max_pdf_pages: int = 5
+    ocr_language: str = 'eng'
+
+    @classmethod
+    def from_env(cls, environ=None, **overrides) -> 'CrawlConfig':
+        """Config from environment variables (FIELD_NAME upper-cased), then explicit overrides."""
+        environ = os.environ if environ is None else environ
+        values = {}
+        for field, field_type in cls.__annotations__.items():
+            if field in _NOT_FROM_ENV:
+                continue
+            raw = environ.get(field.upper())
+            if field == 'proxy_pool':
+                # A single HTTP_PROXY still works when no pool is configured
+                raw = raw or environ.get('HTTP_PROXY')
+            if raw is None or (raw == '' and field_type is not str):
+                continue
+            values[field] = _parse(raw, field_type)
+        values.update(overrides)
+        return cls(**values)
+
+    def to_env(self) -> Dict[str, str]:
+        """Environment variables that make from_env() rebuild this config (for worker processes)."""
+        env = {}
+        for field in self._fields:
+            value = getattr(self, field)
+            if field in _NOT_FROM_ENV or value is None:
+                continue
+            if isinstance(value, bool):
+                value = 'true' if value else 'false'
+            elif isinstance(value, tuple):
+                value = ','.join(value)
+            env[field.upper()] = str(value)
+        return env
+
+    def scrapy_settings(self) -> Dict[str, Any]:
+        """Scrapy settings for a crawler running this config."""
+        return {
+            # Starting point only: AdaptiveHostThrottleMiddleware tunes delay, concurrency and retries per host
+            'DOWNLOAD_DELAY': self.crawler_delay,
+            'RETRY_TIMES': self.retry_times,
+            'CONCURRENT_REQUESTS': self.concurrent_requests,
+            'CONCURRENT_REQUESTS_PER_DOMAIN': self.host_throttle_max_concurrency,
+            'HOST_THROTTLE_ENABLED': self.host_throttle_enabled,
+            'HOST_THROTTLE_MIN_DELAY': self.host_throttle_min_delay,
+            'HOST_THROTTLE_MAX_DELAY': self.host_throttle_max_delay,
+            'HOST_THROTTLE_MAX_CONCURRENCY': self.host_throttle_max_concurrency,
+            'HOST_THROTTLE_TARGET_CONCURRENCY': self.host_throttle_target_concurrency,
+            'PROXY_POOL': list(self.proxy_pool),
+            'PROXY_POOL_POLICY': self.proxy_pool_policy,
+            'PROXY_POOL_MAX_FAILURES': self.proxy_pool_max_failures,
+            'PROXY_POOL_COOLDOWN': self.proxy_pool_cooldown,
+            'HOST_HEALTH_ENABLED': self.host_health_enabled,
+            'HOST_HEALTH_FAILURES': self.host_health_failures,
+            'HOST_HEALTH_BACKOFF': self.host_health_backoff,
+            'HOST_HEALTH_MAX_BACKOFF': self.host_health_max_backoff,
+            'HOST_HEALTH_DB_PATH': self.host_health_db_path,
+            'DOWNLOAD_FILTER_ENABLED': self.download_filter_enabled,
+            'DOWNLOAD_ALLOWED_TYPES': list(self.download_allowed_types),
+            'DOWNLOAD_MAX_BYTES': self.download_max_bytes,
+            'OCR_ENABLED': self.ocr_enabled,
+            'OCR_MAX_BYTES': self.ocr_max_bytes,
+            'WRITE_BEHIND_BATCH_SIZE': self.write_behind_batch_size,
+            'WRITE_BEHIND_FLUSH_INTERVAL': self.write_behind_flush_interval,
+            'WRITE_BEHIND_MAX_PENDING': self.write_behind_max_pending,
+            'WRITE_BEHIND_MAX_OVERFLOW': self.write_behind_max_overflow,
+        }
+
+
+def _parse(raw: str, field_type):
+    if field_type is bool:
+        return raw.lower() in _TRUE
+    if field_type in (int, float):
+        return field_type(raw)
+    if field_type == Tuple[str, ...]:
+        return tuple(part.strip() for part in raw.split(',') if part.strip())
+    return raw
+
+
+class CrawlResources:
+    """Process-wide crawl resources, each built on first use and shared by every crawl given this object.
+
+    Args:
+        config: supplies the keywords path and matching mode and the AI switch
+    """
+
+    def __init__(self, config: CrawlConfig):
+        self.config = config
+        self._lock = threading.Lock()
+        self._keyword_matcher = None
+        self._link_matcher = None
+        self._ai_processor = None
+        self._ai_failed = False
+        self._ocr_processor = None
+        self._ocr_failed = False
+        self._database_ready = False
+
+    @property
+    def keyword_matcher(self) -> KeywordMatcher:
+        """keywords.json automaton for page text (KEYWORD_WHOLE_WORD decides the matching mode)."""
+        with self._lock:
+            if self._keyword_matcher is None:
+                self._keyword_matcher = KeywordMatcher(self.config.keywords_path,
+                                                       whole_word=self.config.keyword_whole_word)
+            return self._keyword_matcher
+
+    @property
+    def link_matcher(self) -> KeywordMatcher:
+        """Whole-word automaton for link scoring (the page matcher when that is whole-word too)."""
+        if self.config.keyword_whole_word:
+            return self.keyword_matcher
+        with self._lock:
+            if self._link_matcher is None:
+                self._link_matcher = KeywordMatcher(self.config.keywords_path, whole_word=True)
+            return self._link_matcher
+
+    @property
+    def ai_processor(self):
+        """Shared GeminiAIProcessor, or None when AI is disabled or the client cannot be built."""
+        if not self.config.ai_processing_enabled or self._ai_failed:
+            return None
+        with self._lock:
+            if self._ai_processor is None and not self._ai_failed:
+                try:
+                    # google.generativeai is slow to import; only crawls that reach Gemini pay for it
+                    from ai_utils import GeminiAIProcessor
+                    self._ai_processor = GeminiAIProcessor()
+                    print(f"🧠 AI processor initialized successfully")
+                except Exception as e:
+                    print(f"⚠ AI processor failed to initialize: {str(e)}")
+                    print("Continuing with basic regex-only detection...")
+                    self._ai_failed = True
+            return self._ai_processor
+
+    @property
+    def ocr_processor(self):
+        """Shared OCRDocumentProcessor, or None when OCR is disabled or Tesseract is not installed."""
+        if not self.config.ocr_enabled or self._ocr_failed:
+            return None
+        with self._lock:
+            if self._ocr_processor is None and not self._ocr_failed:
+                try:
+                    from ocr_parser import OCRDocumentProcessor
+                    self._ocr_processor = OCRDocumentProcessor()
+                    print(f"🖼️ OCR processor initialized for linked images and PDFs")
+                except Exception as e:
+                    print(f"⚠ OCR processor unavailable, linked images and PDFs are skipped: {str(e)}")
+                    self._ocr_failed = True
+            return self._ocr_processor
+
+    def ensure_database(self):
+        """Create or migrate the main database schema once per process."""
+        with self._lock:
+            if not self._database_ready:
+                initialize_database()
+                self._database_ready = True
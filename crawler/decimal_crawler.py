@@ -1,37 +1,56 @@
+"""
+Decimal Crawler
+Scrapy spider that crawls .onion seeds through Tor, scans pages for Indian PII and leak keywords, and stores them.
+
+The spider is an importable component: importing this module parses no
+arguments, changes no environment variables and loads nothing expensive.
+A crawl is described by an explicit CrawlConfig (CrawlConfig.from_env() gives
+the command-line behaviour), and the keyword automatons, Gemini client, OCR
+processor and database schema come from a CrawlResources object that builds
+them on first use. A long-lived service can keep one CrawlResources and start many crawls:
+
+    config = CrawlConfig.from_env(seeds=(Seed('http://example.onion/', max_pages=200),))
+    resources = CrawlResources(config)
+    runner = CrawlerRunner()
+    start_crawl(runner, config, resources)      # returns the crawl's Deferred
+
+Run as a script it keeps the usual command line (see main()).
+"""
+
 import sys
 import os
 import scrapy
-import re
-import json
-from bs4 import BeautifulSoup
+from scrapy import signals
 from scrapy.crawler import CrawlerProcess
+from scrapy.exceptions import DontCloseSpider
+from scrapy.http import TextResponse
+import re
 import uuid
 import time
+import argparse
+import subprocess
 from urllib.parse import urlparse, urlunparse
 
 # 🛠 Fix import path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from database.models import insert_data, initialize_database
-
-# ✅ Import AI and NER modules
-from ner_utils import extract_entities
-from ai_utils import GeminiAIProcessor, detect_and_classify_leaks
-import json
-
-# 🛡 Setup Proxy
-os.environ['http_proxy'] = 'http://127.0.0.1:8118'
-os.environ['https_proxy'] = 'http://127.0.0.1:8118'
-
-# 🚀 Read URL from argument
-if len(sys.argv) < 2:
-    print("❌ ERROR: Please provide a starting .onion URL as an argument.\nExample:\n  python3 crawler/decimal_crawler.py http://example.onion/")
-    sys.exit(1)
 
-start_url = sys.argv[1].strip()
-
-# 🌎 Track visited URLs (use canonical, queryless dedupe key)
-visited_urls = set()
-pages_scraped = 0
+# ✅ Import NER and crawl modules (Gemini is only imported once a crawl needs it)
+from crawler.ner_utils import extract_entities
+from crawler.html_extract import extract_page, BACKENDS as HTML_BACKENDS
+from crawler.frontier import CrawlFrontier, DONE, FAILED, ATTACHMENT, attachment_key
+from crawler.near_duplicate import NearDuplicateIndex
+from crawler.recrawl import PageVersionStore, content_hash, UNCHANGED
+from crawler.stream_scan import StreamScanner, is_html
+from crawler.metrics import CrawlMetrics
+from crawler.link_priority import LinkPrioritizer, leak_density
+from crawler.link_graph import LinkGraph
+from crawler.seeds import Seed, SeedTracker, load_seed_file, load_seed_table
+from crawler.ocr_stage import OCRStage, attachment_suffix, sniff_suffix
+from crawler.download_filter import OCR as OCR_ROUTE
+from crawler.crawl_config import CrawlConfig, CrawlResources, DEFAULT_PROXY
+from database.models import (initialize_database, update_ai_analysis, record_ocr_result, record_filtered_download,
+                             defer_ai_analysis, fetch_ai_pending, fetch_seed_stats)
+from leak_gate import LeakGate
 
 
 def make_dedupe_key(url: str) -> str:
@@ -51,184 +70,961 @@ def make_dedupe_key(url: str) -> str:
     except Exception:
         return url
 
-# 📄 Load keywords from keywords.json
-def load_keywords():
-    try:
-        with open('keywords.json', 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"❌ ERROR loading keywords.json: {e}")
-        return []
-
-keywords_list = load_keywords()
-
 def generate_run_id():
     return str(uuid.uuid4()) + "_" + str(int(time.time()))
 
+
+# 🌱 Seed roots are claimed before any discovered link (link scores stay below 100)
+SEED_PRIORITY = 1000
+
+
+def configured_seeds(config, start_url=None, seed_file=None, seed_table=False):
+    """Seeds for a new run: a start URL, a seed file and/or the crawl_seeds table.
+
+    config.seed_max_depth / seed_max_pages are the budgets of seeds that don't set their own (0 = unlimited).
+    """
+    max_depth = config.seed_max_depth or None
+    max_pages = config.seed_max_pages or None
+    seeds = [Seed(start_url, max_depth, max_pages)] if start_url else []
+    if seed_file:
+        seeds += load_seed_file(seed_file, max_depth, max_pages)
+    if seed_table:
+        seeds += load_seed_table(max_depth, max_pages)
+    unique = {}
+    for seed in seeds:
+        unique.setdefault(seed.url, seed)
+    return list(unique.values())
+
+
+def print_seed_report(run_id, limit=10):
+    """Per-seed results of a batch run, most leak pages first."""
+    stats = fetch_seed_stats(run_id)
+    if len(stats) < 2:
+        return
+    print(f"🌱 Seeds with the most leak pages ({len(stats)} seeds crawled):")
+    for row in stats[:limit]:
+        print(f"   {row['seed_url']}: {row['pages']} pages, {row['leak_pages']} with leaks, "
+              f"{row['entities']} entities, {row['failed']} failed, "
+              f"{row['skipped_depth'] + row['skipped_budget']} links over budget")
+
 class DecimalCrawlerSpider(scrapy.Spider):
     name = "decimal_crawler"
 
+    # Wiring only; tunables come from CrawlConfig.scrapy_settings() (see start_crawl)
     custom_settings = {
-        'DOWNLOAD_DELAY': 1.5,
-        'RETRY_TIMES': 5,
+        # Dequeue from the host with the fewest active downloads so slow onions don't starve the rest
+        'SCHEDULER_PRIORITY_QUEUE': 'scrapy.pqueues.DownloaderAwarePriorityQueue',
         'HTTPPROXY_ENABLED': True,
         'DOWNLOADER_MIDDLEWARES': {
+            # Picks the egress proxy; HttpProxyMiddleware then applies it
+            'crawler.middlewares.ProxyPoolMiddleware': 100,
             'scrapy.downloadermiddlewares.httpproxy.HttpProxyMiddleware': 110,
+            # Between RetryMiddleware (550) and the downloader, so they see every attempt
+            'crawler.middlewares.HostHealthMiddleware': 555,
+            'crawler.middlewares.AdaptiveHostThrottleMiddleware': 560,
+            # Aborts unusable bodies from the headers_received / bytes_received signals
+            'crawler.middlewares.DownloadFilterMiddleware': 570,
+        },
+        # The on-disk frontier de-duplicates URLs; Scrapy's in-memory fingerprint set would grow unbounded
+        'DUPEFILTER_CLASS': 'scrapy.dupefilters.BaseDupeFilter',
+        'ITEM_PIPELINES': {
+            'crawler.pipelines.WriteBehindPipeline': 300,
         },
         'LOG_LEVEL': 'WARNING',
         'REQUEST_FINGERPRINTER_IMPLEMENTATION': '2.7'
     }
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, config: CrawlConfig = None, resources: CrawlResources = None, run_id=None, *args, **kwargs):
+        """Cheap: files, sockets, the keyword index and Gemini are only opened once the crawl starts.
+
+        Args:
+            config: crawl settings and seeds (default: CrawlConfig.from_env(), which has no seeds)
+            resources: shared keyword index / Gemini client / DB schema (default: private to this spider)
+            run_id: crawl run to create or, if the frontier already has it, resume
+        """
         super(DecimalCrawlerSpider, self).__init__(*args, **kwargs)
-        initialize_database()
-        self.start_urls = [start_url]
-        self.run_id = generate_run_id()
-        
-        # Initialize AI processor (respect AI_PROCESSING_ENABLED)
-        self.ai_enabled = os.getenv('AI_PROCESSING_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
-        if self.ai_enabled:
-            try:
-                self.ai_processor = GeminiAIProcessor()
-                print(f"🧠 AI processor initialized successfully")
-            except Exception as e:
-                print(f"⚠ AI processor failed to initialize: {str(e)}")
-                print("Continuing with basic regex-only detection...")
-                self.ai_processor = None
-                self.ai_enabled = False
+        self.config = config or CrawlConfig.from_env()
+        self.resources = resources or CrawlResources(self.config)
+        self.run_id = run_id or generate_run_id()
+        self.shard_index = self.config.shard_index
+        self.frontier_batch = self.config.frontier_batch
+        self.in_flight = 0
+        self.pages_scraped = 0
+        self.streamed_pages = 0
+        self.streamed_bytes = 0
+        self.ai_enabled = self.config.ai_processing_enabled
+        self.ocr_enabled = self.config.ocr_enabled
+        self.ocr_downloads = 0
+        self.ocr_skipped = 0
+        self.ocr_rejected = 0
+
+        # 🧩 Title / text / links come from one pass over a C-parsed tree (see html_extract.py)
+        self.html_backend = self.config.html_extract_backend.lower()
+        if self.html_backend not in HTML_BACKENDS:
+            print(f"⚠ Unknown HTML_EXTRACT_BACKEND '{self.html_backend}', using lxml")
+            self.html_backend = 'lxml'
+
+        # ⏱️ Stage histograms + counters (the pipeline records into them from open_spider on)
+        self.metrics = CrawlMetrics(self.run_id, shard=self.shard_index)
+
+        # 🚪 Local leak-evidence score: only pages at or above AI_GATE_THRESHOLD are sent to Gemini
+        self.leak_gate = LeakGate(self.config.ai_gate_threshold)
+
+        # Opened by open_run() when the crawl starts
+        self.frontier = None
+        self.resumed = False
+        self.sharded = False
+        self.seed_tracker = None
+        self.seed_stats_saved = time.monotonic()
+        self.prioritizer = None
+        self.link_graph = None
+        self.near_dup = None
+        self.versions = None
+        self.ai_stage = None
+        self.ocr_stage = None
+        self._stream_scanner = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(DecimalCrawlerSpider, cls).from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(spider.spider_closed, signal=signals.spider_closed)
+        return spider
+
+    @property
+    def keyword_matcher(self):
+        """📄 keywords.json compiled once per CrawlResources; the matcher rebuilds itself when the file changes."""
+        return self.resources.keyword_matcher
+
+    @property
+    def stream_scanner(self):
+        """🌊 Large and non-HTML bodies are scanned in overlapping windows instead of through a DOM."""
+        if self._stream_scanner is None:
+            self._stream_scanner = StreamScanner(self.keyword_matcher, chunk_bytes=self.config.stream_chunk_bytes,
+                                                 overlap_chars=self.config.stream_overlap_chars)
+        return self._stream_scanner
+
+    def open_run(self):
+        """Open the database, frontier and per-run indexes, and create or resume the run."""
+        config = self.config
+        self.resources.ensure_database()
+
+        # 💽 Persistent frontier + visited set; an existing run_id resumes where it stopped
+        self.frontier = CrawlFrontier(config.frontier_db_path, commit_every=config.frontier_commit_every,
+                                      shard_index=self.shard_index, lease=config.frontier_lease)
+        label = config.run_label or (config.seeds[0].url if len(config.seeds) == 1 else f"seeds:{len(config.seeds)}")
+        self.resumed = self.frontier.open_run(self.run_id, label, shard_count=config.shard_count)
+        self.sharded = self.frontier.shard_count > 1
+
+        # 🌱 One run covers every seed; each has its own depth / page budget and stats row
+        if self.resumed:
+            seeds = [Seed(*row) for row in self.frontier.load_seeds()]
         else:
-            self.ai_processor = None
+            seeds = list(config.seeds)
+            self.frontier.save_seeds(seeds)
+        if not seeds:
+            raise ValueError(f"Run {self.run_id} has no seeds: set CrawlConfig.seeds or resume an existing run")
+        self.start_urls = [seed.url for seed in seeds]
+        self.seed_tracker = SeedTracker(self.run_id, seeds,
+                                        self.frontier.seed_counts() if self.resumed else None,
+                                        shard=self.shard_index or 0)
+        self.seed_stats_saved = time.monotonic()
+
+        # ⏱️ Appended to METRICS_FILE and optionally served on METRICS_PORT
+        self.metrics.start_flusher(config.metrics_file, config.metrics_flush_interval)
+        if config.metrics_port:
+            # One port per worker process: base port + shard index
+            metrics_port = self.metrics.serve(config.metrics_port + (self.shard_index or 0))
+            print(f"⏱️ Metrics at http://127.0.0.1:{metrics_port}/metrics")
+
+        # 🎯 Best-first: links scored by leak likelihood are claimed (and downloaded) first
+        if config.crawl_priority_enabled:
+            self.prioritizer = LinkPrioritizer(
+                config.keywords_path,
+                keyword_weight=config.crawl_priority_keyword_weight,
+                parent_weight=config.crawl_priority_parent_weight,
+                host_weight=config.crawl_priority_host_weight,
+                depth_penalty=config.crawl_priority_depth_penalty,
+                matcher=self.resources.link_matcher,
+                rank_weight=config.crawl_priority_rank_weight,
+            )
+
+        # 🕸️ Outbound link edges + host PageRank; fresh ranks feed back into link scores
+        if config.link_graph_enabled:
+            self.link_graph = LinkGraph(batch_size=config.link_graph_batch_size,
+                                        rank_every=config.link_graph_rank_every,
+                                        on_rank=self.prioritizer.set_host_ranks if self.prioritizer else None)
+
+        # 🪞 SimHash index so mirrored dumps link to the first copy instead of being re-analysed
+        if config.near_dup_enabled:
+            self.near_dup = NearDuplicateIndex(max_distance=config.near_dup_max_distance,
+                                               min_tokens=config.near_dup_min_tokens)
+
+        # ♻️ Validators + content hashes from earlier runs: unchanged pages are only marked as seen
+        if config.recrawl_incremental:
+            self.versions = PageVersionStore()
+
+        if not self.ai_enabled:
             print("ℹ️ AI processing disabled via AI_PROCESSING_ENABLED=false; running regex-only.")
-        
-        print(f"🚀 Starting crawl with run ID: {self.run_id}")
 
-    def parse(self, response):
-        global visited_urls, pages_scraped
+        # 🖼️ Decided up front: with OCR on, image / PDF links go to the OCR stage instead of the frontier
+        if self.ocr_enabled:
+            self.get_ocr_stage()
+
+        if self.shard_index is not None:
+            print(f"🧩 Worker for shard {self.shard_index}/{self.frontier.shard_count} of run ID: {self.run_id}")
+        elif self.resumed:
+            counts = self.frontier.counts()
+            print(f"♻️ Resuming crawl run ID: {self.run_id} ({counts['done']} done, {counts['pending']} pending)")
+        else:
+            print(f"🚀 Starting crawl with run ID: {self.run_id}")
+        if len(seeds) > 1:
+            print(f"🌱 Batch of {len(seeds)} seeds in one run")
+
+    def get_ai_stage(self):
+        """🧵 Gemini stage, built with the shared client when the first page needs it (None without AI)."""
+        if self.ai_stage is None and self.ai_enabled:
+            processor = self.resources.ai_processor
+            if processor is None:
+                self.ai_enabled = False
+                return None
+            from crawler.ai_stage import AIClassificationStage
+            # Gemini runs on worker threads; rows are stored with regex results and updated later
+            self.ai_stage = AIClassificationStage(
+                processor,
+                on_result=self._store_ai_result,
+                max_in_flight=self.config.ai_max_in_flight,
+                max_queue=self.config.ai_queue_size,
+                overflow_policy=self.config.ai_overflow_policy,
+                metrics=self.metrics,
+                max_batch=self.config.ai_batch_size,
+                on_pending=self._defer_ai_job,
+                max_retries=self.config.ai_max_retries,
+            )
+        return self.ai_stage
+
+    def get_ocr_stage(self):
+        """🖼️ OCR stage for images / PDFs linked from leak pages (None when OCR is off or unavailable)."""
+        if self.ocr_stage is None and self.ocr_enabled:
+            processor = self.resources.ocr_processor
+            if processor is None:
+                self.ocr_enabled = False
+                return None
+            self.ocr_stage = OCRStage(
+                processor,
+                on_result=self._store_ocr_result,
+                workers=self.config.ocr_workers,
+                max_queue=self.config.ocr_queue_size,
+                language=self.config.ocr_language,
+                max_pdf_pages=self.config.ocr_max_pdf_pages,
+                metrics=self.metrics,
+            )
+        return self.ocr_stage
+
+    def start_requests(self):
+        if self.frontier is None:
+            self.open_run()
+        if self.shard_index in (None, 0):
+            # One worker per run picks up pages an earlier run could not classify
+            self.resubmit_pending_ai()
+        if not self.resumed:
+            for seed_id, url in enumerate(self.start_urls):
+                if self.frontier.add(make_dedupe_key(url), url, depth=0, priority=SEED_PRIORITY, seed=seed_id):
+                    self.seed_tracker.admit(seed_id)
+        yield from self.schedule_from_frontier()
+
+    def schedule_from_frontier(self):
+        """Top up Scrapy's scheduler from the on-disk frontier, keeping at most frontier_batch in flight."""
+        if self.sharded and self.in_flight > self.frontier_batch // 2:
+            # Claim in batches from a low-water mark: each claim takes the write lock other workers share
+            return
+        claimed = self.frontier.claim(self.frontier_batch - self.in_flight)
+        if self.sharded:
+            # The claim also applied the buffered links, so this is every worker's use of each seed budget
+            self.seed_tracker.sync(self.frontier.seed_used)
+        for url, depth, priority, seed in claimed:
+            self.in_flight += 1
+            key = make_dedupe_key(url)
+            meta = {'frontier_key': key, 'frontier_depth': depth, 'frontier_seed': seed}
+            headers = self.versions.conditional_headers(key) if self.versions else {}
+            if headers:
+                meta['handle_httpstatus_list'] = [304]
+            yield scrapy.Request(
+                url=url,
+                callback=self.parse,
+                errback=self.on_fetch_error,
+                headers=headers,
+                meta=meta,
+                priority=priority,
+                dont_filter=True,
+            )
+
+    def on_fetch_error(self, failure):
+        request = failure.request
+        self.in_flight -= 1
+        frontier_key = request.meta.get('frontier_key') or make_dedupe_key(request.url)
+        if request.meta.get('download_filtered'):
+            # Fetched as far as needed: the link is known and recorded, not failed
+            self.frontier.mark(frontier_key, DONE, request.url)
+            self.record_filtered(request)
+            yield from self.schedule_from_frontier()
+            return
+        self.metrics.inc('fetch_errors')
+        self.seed_tracker.record_failure(request.meta.get('frontier_seed'))
+        self.frontier.mark(frontier_key, FAILED, request.url)
+        if request.meta.get('host_down'):
+            # 🪦 Skipped without a download: the host is in its back-off window
+            self.metrics.inc('host_down_skips')
+        else:
+            print(f"⚠ Fetch failed for {request.url}: {failure.getErrorMessage()}")
+        yield from self.schedule_from_frontier()
+
+    def record_filtered(self, request, page_url=None):
+        """🚫 Metadata-only record for a download DownloadFilterMiddleware aborted (archive, video, too large...)."""
+        filtered = request.meta['download_filtered']
+        self.metrics.inc('downloads_filtered')
+        self.metrics.inc('bytes_filtered', filtered['bytes_read'])
+        fields = dict(filtered, run_id=self.run_id, page_url=page_url)
+        url = make_dedupe_key(request.url) if page_url is None else request.url
+        writer = getattr(self, 'write_behind', None)
+        if writer is not None:
+            writer.submit_update(url, fields, apply=record_filtered_download)
+        else:
+            record_filtered_download(url=url, **fields)
+        if page_url is None:
+            size = f", {filtered['declared_bytes'] / 1e6:.1f} MB" if filtered['declared_bytes'] else ''
+            print(f"🚫 Skipped download ({filtered['reason']}: {filtered['content_type'] or 'untyped'}{size}): {url}")
+
+    def spider_idle(self, spider):
+        if self.frontier is None:
+            return
+        # Feed the next frontier batch; the scheduler itself only ever holds one batch
+        requests = list(self.schedule_from_frontier())
+        for request in requests:
+            self.crawler.engine.crawl(request)
+        if requests:
+            raise DontCloseSpider
+
+        # Other shards' workers may still discover links for this shard
+        if self.sharded:
+            self.frontier.flush()
+            if self.frontier.run_active():
+                raise DontCloseSpider
+
+        # Keep the spider (and the write-behind pipeline) open until queued AI / OCR work lands
+        if self.ai_stage and not self.ai_stage.is_idle():
+            self.publish_ai_stats()
+            raise DontCloseSpider
+        if self.ocr_stage and not self.ocr_stage.is_idle():
+            self.publish_ocr_stats()
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        if self.frontier is None:
+            # The run never opened (e.g. no seeds)
+            self.metrics.close()
+            return
+        self.frontier.close()
+        self.seed_tracker.save()
+        self.crawler.stats.set_value('seeds/count', len(self.seed_tracker.seeds))
+        self.crawler.stats.set_value('seeds/with_leaks', self.seed_tracker.with_leaks())
+        self.crawler.stats.set_value('seeds/budget_exhausted', self.seed_tracker.exhausted())
+        self.crawler.stats.set_value('stream_scan/pages', self.streamed_pages)
+        self.crawler.stats.set_value('stream_scan/bytes', self.streamed_bytes)
+        for key, value in self.gate_snapshot().items():
+            self.crawler.stats.set_value(f'ai_gate/{key}', value)
+        if self.versions:
+            for key, value in self.versions.snapshot().items():
+                self.crawler.stats.set_value(f'recrawl/{key}', value)
+            self.versions.close()
+        if self.link_graph:
+            self.link_graph.close()
+            for key, value in self.link_graph.snapshot().items():
+                self.crawler.stats.set_value(f'link_graph/{key}', value)
+        if self.prioritizer:
+            for key, value in self.prioritizer.snapshot().items():
+                self.crawler.stats.set_value(f'priority/{key}', value)
+        if self.near_dup:
+            for key, value in self.near_dup.snapshot().items():
+                self.crawler.stats.set_value(f'near_dup/{key}', value)
+            self.near_dup.close()
+        if self.ai_stage:
+            self.ai_stage.shutdown(wait=True, timeout=self.config.ai_drain_timeout)
+            self.publish_ai_stats()
+        if self.ocr_stage:
+            self.ocr_stage.shutdown(wait=True, timeout=self.config.ai_drain_timeout)
+            self.publish_ocr_stats()
+        self.metrics.close()
+
+    def publish_ai_stats(self):
+        """Expose the AI stage's queue depth, in-flight count and drop counters, and Gemini cache hit rates."""
+        if not self.ai_stage:
+            return
+        snapshot = self.ai_stage.snapshot()
+        cache = getattr(self.ai_stage.ai_processor, 'cache', None)
+        crawler = getattr(self, 'crawler', None)
+        if crawler is not None:
+            for key, value in snapshot.items():
+                crawler.stats.set_value(f'ai_stage/{key}', value)
+            if cache is not None:
+                for key, value in cache.snapshot().items():
+                    crawler.stats.set_value(f'gemini_cache/{key}', value)
+            if hasattr(self.ai_stage.ai_processor, 'batch_snapshot'):
+                for key, value in self.ai_stage.ai_processor.batch_snapshot().items():
+                    crawler.stats.set_value(f'gemini_batch/{key}', value)
+            client = getattr(self.ai_stage.ai_processor, 'client', None)
+            if client is not None:
+                for key, value in client.snapshot().items():
+                    crawler.stats.set_value(f'gemini_client/{key}', value)
+        return snapshot
+
+    def gate_snapshot(self):
+        """Leak gate decisions so far and the resulting Gemini submissions per analysed page."""
+        counters = self.metrics.snapshot()['counters']
+        passed = int(counters.get('ai_gate_passed', 0))
+        skipped = int(counters.get('ai_gate_skipped', 0))
+        analysed = int(counters.get('pages_analysed', 0))
+        return {
+            'threshold': self.leak_gate.threshold,
+            'passed': passed,
+            'skipped': skipped,
+            'sent_per_page': round(passed / analysed, 3) if analysed else 0.0,
+        }
 
+    def publish_ocr_stats(self):
+        """Expose the OCR stage's queue, download and skip counters."""
+        if not self.ocr_stage:
+            return
+        snapshot = self.ocr_stage.snapshot()
+        snapshot.update(downloading=self.ocr_downloads, skipped=self.ocr_skipped, rejected=self.ocr_rejected)
+        crawler = getattr(self, 'crawler', None)
+        if crawler is not None:
+            for key, value in snapshot.items():
+                crawler.stats.set_value(f'ocr_stage/{key}', value)
+        return snapshot
+
+    def _store_ocr_result(self, page_url, attachment_url, fields):
+        """Called from OCR worker threads: record the attachment and merge its entities into the page's row."""
+        fields = dict(fields, attachment_url=attachment_url, run_id=self.run_id)
+        writer = getattr(self, 'write_behind', None)
+        if writer is not None:
+            writer.submit_update(page_url, fields, apply=record_ocr_result)
+        else:
+            record_ocr_result(url=page_url, **fields)
+
+    def resubmit_pending_ai(self):
+        """⏸️ Queue pages left in the ai_pending table by earlier runs (up to one AI queue's worth)."""
+        if not self.ai_enabled:
+            return
+        pending = fetch_ai_pending(limit=self.config.ai_queue_size)
+        if not pending or self.get_ai_stage() is None:
+            return
+        queued = sum(self.ai_stage.submit(url, text, [term for term in keywords.split(',') if term])
+                     for url, text, keywords in pending)
+        print(f"⏸️ Re-queued {queued} pages deferred by an earlier run for Gemini")
+
+    def _defer_ai_job(self, url, job, reason):
+        """Called from AI worker threads (or at shutdown) for a page the AI stage will not classify now."""
+        fields = {'text': job.text, 'keywords': ','.join(job.keywords), 'run_id': self.run_id, 'reason': reason}
+        writer = getattr(self, 'write_behind', None)
+        if writer is not None:
+            writer.submit_update(url, fields, apply=defer_ai_analysis)
+        else:
+            defer_ai_analysis(url=url, **fields)
+
+    def _store_ai_result(self, url, fields):
+        """Called from AI worker threads once Gemini has classified a stored page."""
+        writer = getattr(self, 'write_behind', None)
+        if writer is not None:
+            writer.submit_update(url, fields)
+        else:
+            update_ai_analysis(url=url, **fields)
+
+    def parse(self, response):
+        self.in_flight -= 1
+        started = time.perf_counter()
+        metrics = self.metrics
+        metrics.inc('pages_fetched')
+        metrics.inc('bytes_fetched', len(response.body))
+        if 'download_latency' in response.meta:
+            metrics.observe('fetch', response.meta['download_latency'])
         url = response.url
         dedupe_key = make_dedupe_key(url)
-        if dedupe_key in visited_urls:
+        frontier_key = response.meta.get('frontier_key', dedupe_key)
+        depth = response.meta.get('frontier_depth', 0)
+        seed = response.meta.get('frontier_seed')
+        if frontier_key != dedupe_key:
+            # Redirected: the final URL may already have been crawled via another link
+            self.frontier.mark(frontier_key, DONE, url)
+            if self.frontier.is_visited(dedupe_key):
+                yield from self.schedule_from_frontier()
+                return
+        self.frontier.mark(dedupe_key, DONE, url)
+
+        if response.status == 304:
+            # ♻️ Server confirmed our stored version: record the sighting, re-seed the stored links
+            links = self.versions.not_modified(dedupe_key, self.run_id) if self.versions else None
+            print(f"♻️ Not modified since last run: {dedupe_key}")
+            links = links or []
+            self.follow_links(links, [''] * len(links), depth, seed, source=dedupe_key)
+            self.seed_tracker.record_page(seed, 0, 0)
+            metrics.inc('pages_not_modified')
+            yield from self.schedule_from_frontier()
+            return
+
+        if response.meta.get('download_route') == OCR_ROUTE:
+            # 🖼️ The link was an image / PDF after all: OCR it instead of parsing it as a page
+            yield from self.parse_routed_attachment(response, dedupe_key, seed)
+            yield from self.schedule_from_frontier()
             return
-        visited_urls.add(dedupe_key)
 
         print(f"🔍 Processing URL: {url} -> {dedupe_key}")
 
-        soup = BeautifulSoup(response.text, 'html.parser')
-        title = soup.title.string.strip() if soup.title else 'No Title'
-        text = soup.get_text()
+        content_type = response.headers.get('Content-Type', b'').decode('latin-1')
+        scan = None
+        if (not isinstance(response, TextResponse) or len(response.body) > self.config.stream_scan_threshold
+                or not is_html(content_type)):
+            # 🌊 Never materialize the decoded body or a DOM for dumps; windows are scanned as they decode.
+            # Bodies Scrapy did not recognise as text (no response.text) are scanned the same way
+            with metrics.time('stream_scan'):
+                scan = self.stream_scanner.scan(response.body, url, content_type)
+            metrics.inc('pages_streamed')
+            self.streamed_pages += 1
+            self.streamed_bytes += scan.bytes_scanned
+            print(f"🌊 Streamed {scan.bytes_scanned / 1e6:.1f} MB in {scan.windows} windows: {dedupe_key}")
+            title, text, links, anchors = scan.title, scan.ai_text, scan.links, scan.anchors
+            images = []
+            text_hash = scan.content_hash
+        else:
+            with metrics.time('extract'):
+                page = extract_page(response.text, url, self.html_backend,
+                                    selector=response.selector if self.html_backend == 'selector' else None)
+            title, text, links, anchors, images = page.title, page.text, page.links, page.anchors, page.images
+            text_hash = content_hash(text)
+
+        attachments = []
+        if self.ocr_enabled:
+            # 🖼️ Images / PDFs are never crawled as pages; a leak page hands its own to the OCR stage
+            attachments = images + [link for link in links if attachment_suffix(link)]
+            kept = [i for i, link in enumerate(links) if not attachment_suffix(link)]
+            if len(kept) < len(links):
+                links, anchors = [links[i] for i in kept], [anchors[i] for i in kept]
 
+        outcome = None
+        if self.versions:
+            with metrics.time('recrawl'):
+                outcome = self.versions.record(
+                    dedupe_key, self.run_id, text_hash, links,
+                    etag=response.headers.get('ETag', b'').decode('latin-1') or None,
+                    last_modified=response.headers.get('Last-Modified', b'').decode('latin-1') or None,
+                )
+
+        # 🪞 Mirror of a page we already analysed: store the link, skip regex + AI
+        density = 0.0
+        entity_count = 0
+        fingerprint = None
+        original = None
+        if self.near_dup and outcome != UNCHANGED:
+            with metrics.time('near_dup'):
+                fingerprint = (self.near_dup.fingerprint_builder(scan.simhash) if scan
+                               else self.near_dup.fingerprint(text))
+                if fingerprint is not None:
+                    original = self.near_dup.find(fingerprint, exclude_url=dedupe_key)
+        if outcome == UNCHANGED:
+            # ♻️ Same text as the last run: already analysed, just follow its links
+            print(f"♻️ Unchanged since last run: {dedupe_key}")
+            metrics.inc('pages_unchanged')
+        elif original:
+            print(f"🪞 Near-duplicate of {original}: {dedupe_key}")
+            metrics.inc('pages_near_duplicate')
+            yield {
+                'url': dedupe_key,
+                'title': title,
+                'matched_keywords': '',
+                'run_id': self.run_id,
+                'named_entities': '',
+                'detection_method': 'near_duplicate',
+                'duplicate_of': original,
+            }
+        else:
+            if fingerprint is not None:
+                self.near_dup.add(dedupe_key, fingerprint, self.run_id)
+            entity_count, keyword_count = yield from self.analyse_page(dedupe_key, url, title, text, scan)
+            density = leak_density(entity_count, scan.bytes_scanned if scan else len(text))
+            if self.prioritizer:
+                self.prioritizer.record_page(url, entity_count > 0)
+            if attachments and (entity_count or keyword_count):
+                yield from self.request_attachments(dedupe_key, attachments, depth, density)
+
+        self.seed_tracker.record_page(seed, len(response.body), entity_count)
+        self.pages_scraped += 1
+        print(f"✅ [{self.pages_scraped}] Scraped and queued for saving: {dedupe_key}")
+        if self.pages_scraped % 10 == 0:
+            self.heartbeat()
+
+        # Continue crawling links (already absolute, non-crawlable schemes dropped)
+        with metrics.time('frontier'):
+            self.follow_links(links, anchors, depth, seed, density, source=dedupe_key)
+        metrics.inc('links_found', len(links))
+        metrics.observe('parse', time.perf_counter() - started)
+
+        yield from self.schedule_from_frontier()
+
+    def request_attachments(self, page_key, attachments, depth, density):
+        """🖼️ Download a leak page's images / PDFs for the OCR stage, capped per page and by queue room.
+
+        Each attachment is fetched once per run: the frontier's visited set remembers it on disk.
+        """
+        requested = 0
+        for url in attachments:
+            key = attachment_key(url)
+            if self.frontier.state(key) is not None:
+                continue
+            if requested >= self.config.ocr_max_per_page or not self.ocr_stage.has_room(self.ocr_downloads):
+                self.ocr_skipped += 1
+                continue
+            self.frontier.mark(key, ATTACHMENT, url)
+            self.ocr_downloads += 1
+            requested += 1
+            yield scrapy.Request(
+                url=url,
+                callback=self.parse_attachment,
+                errback=self.on_attachment_error,
+                # Scrapy aborts the download once the body passes OCR_MAX_BYTES
+                meta={'ocr_page': page_key, 'download_maxsize': self.config.ocr_max_bytes},
+                priority=self.link_priority(url, '', density, depth + 1),
+                dont_filter=True,
+            )
+        self.metrics.inc('ocr_requested', requested)
+
+    def parse_attachment(self, response):
+        """Hand a downloaded image / PDF to the OCR stage; the reactor never waits for Tesseract."""
+        self.ocr_downloads -= 1
+        body = response.body
+        self.metrics.inc('ocr_bytes_fetched', len(body))
+        # Trust the bytes, not the URL: error pages and icons are not worth a Tesseract run
+        suffix = sniff_suffix(body)
+        if suffix is None or not self.config.ocr_min_bytes <= len(body) <= self.config.ocr_max_bytes:
+            self.ocr_rejected += 1
+            return
+        if not self.ocr_stage.submit(response.meta['ocr_page'], response.url, body, suffix):
+            self.ocr_skipped += 1
+
+    def parse_routed_attachment(self, response, dedupe_key, seed):
+        """OCR a crawled link that DownloadFilterMiddleware found to be an image / PDF, under its own row."""
+        body = response.body
+        self.seed_tracker.record_page(seed, len(body), 0)
+        self.metrics.inc('pages_routed_ocr')
+        stage = self.get_ocr_stage()
+        suffix = sniff_suffix(body)
+        if stage is None or suffix is None or len(body) < self.config.ocr_min_bytes:
+            self.ocr_rejected += 1
+            return
+        # The row exists before the OCR result is merged into it (both go through the write-behind buffer)
+        yield {
+            'url': dedupe_key,
+            'title': '',
+            'matched_keywords': '',
+            'run_id': self.run_id,
+            'named_entities': '',
+            'detection_method': 'ocr',
+        }
+        if stage.submit(dedupe_key, response.url, body, suffix):
+            print(f"🖼️ Routed to OCR ({suffix}, {len(body) / 1e3:.0f} KB): {dedupe_key}")
+        else:
+            self.ocr_skipped += 1
+
+    def on_attachment_error(self, failure):
+        request = failure.request
+        self.ocr_downloads -= 1
+        self.ocr_rejected += 1
+        if request.meta.get('download_filtered'):
+            # Not an image / PDF after all, or too large: aborted after its headers
+            self.record_filtered(request, page_url=request.meta['ocr_page'])
+            return
+        self.metrics.inc('ocr_fetch_errors')
+        if not request.meta.get('host_down'):
+            print(f"⚠ Attachment download failed for {request.url}: {failure.getErrorMessage()}")
+
+    def follow_links(self, links, anchors, depth, seed, density=0.0, source=None):
+        """Add a page's links to the frontier under its seed, within the seed's depth and page budget.
+
+        source: the page's dedupe key; its outbound edges go to the link graph even past the depth limit.
+        """
+        keys = [make_dedupe_key(next_link) for next_link in links]
+        if self.link_graph and source:
+            self.link_graph.add(source, keys, self.run_id)
+        if not self.seed_tracker.depth_allowed(seed, depth + 1, len(links)):
+            return
+        for i, (key, next_link, anchor) in enumerate(zip(keys, links, anchors)):
+            if not self.seed_tracker.has_budget(seed):
+                self.seed_tracker.skip_budget(seed, len(links) - i)
+                break
+            # New links wait on disk; only a bounded batch is ever handed to Scrapy.
+            priority = self.link_priority(next_link, anchor, density, depth + 1)
+            if self.sharded:
+                # Workers of a sharded run add links for the same seeds, so the frontier enforces the budget
+                # when it applies the buffered links; the usage comes back with the next claim
+                self.frontier.add(key, next_link, depth=depth + 1, priority=priority, seed=seed,
+                                  seed_budget=self.seed_tracker.budget(seed))
+            elif self.frontier.add(key, next_link, depth=depth + 1, priority=priority, seed=seed):
+                self.seed_tracker.admit(seed)
+
+    def link_priority(self, url, anchor, parent_density, depth):
+        """Frontier / request priority for a discovered link (0 when prioritization is off)."""
+        if not self.prioritizer:
+            return 0
+        return self.prioritizer.score(url, anchor, parent_density, depth)
+
+    def heartbeat(self):
+        """Progress line plus frontier, host, proxy and AI stage state."""
+        print(f"💓 Heartbeat: {self.pages_scraped} pages scraped so far...")
+        counts = self.frontier.counts()
+        print(f"💽 Frontier: {counts['pending']} pending, {counts['scheduled']} scheduled, "
+              f"{counts['done']} done, {counts['failed']} failed")
+        throttle = getattr(self, 'host_throttle', None)
+        if throttle is not None:
+            hosts = throttle.summary()
+            print(f"🐢 Hosts: {hosts['hosts']} seen, fair share {hosts['fair_share']}, "
+                  f"avg delay {hosts['avg_delay']}s, {hosts['backed_off_hosts']} backed off")
+        health = getattr(self, 'host_health', None)
+        if health is not None:
+            hosts = health.snapshot()
+            print(f"🪦 Dead hosts: {hosts['down_hosts']} in back-off, {hosts['skipped']} requests skipped, "
+                  f"{hosts['wasted_slot_seconds']}s of download slots spent on failures")
+        download_filter = getattr(self, 'download_filter', None)
+        if download_filter is not None:
+            filtered = download_filter.snapshot()
+            print(f"🚫 Download filter: {filtered['aborted']} aborted, {filtered['routed_ocr']} routed to OCR, "
+                  f"{filtered['bytes_saved'] / 1e6:.1f} MB saved")
+        pool = getattr(self, 'proxy_pool', None)
+        if pool is not None and len(pool.endpoints) > 1:
+            for proxy, counters in pool.snapshot().items():
+                state = 'up' if counters['healthy'] else 'DOWN'
+                print(f"🧅 {proxy} [{state}]: {counters['in_flight']} in flight, "
+                      f"{counters['pages_per_min']} pages/min, {counters['kb_per_sec']} KB/s")
+        if self.near_dup:
+            near_dup = self.near_dup.snapshot()
+            print(f"🪞 Near-duplicates: {near_dup['duplicates']} of {near_dup['checked']} pages linked to an earlier copy")
+        if self.link_graph:
+            graph = self.link_graph.snapshot()
+            top = ", ".join(host for host, _ in self.link_graph.top_hosts(3))
+            print(f"🕸️ Link graph: {graph['edges_written']} edges, {graph['hosts']} hosts, "
+                  f"{graph['rank_runs']} rankings" + (f", top: {top}" if top else ""))
+        if self.versions:
+            versions = self.versions.snapshot()
+            print(f"♻️ Recrawl: {versions['new']} new, {versions['changed']} changed, "
+                  f"{versions['unchanged']} unchanged, {versions['not_modified']} not modified (304)")
+        if self.streamed_pages:
+            print(f"🌊 Streamed scans: {self.streamed_pages} pages, {self.streamed_bytes / 1e6:.1f} MB")
+        if len(self.seed_tracker.seeds) > 1:
+            print(f"🌱 Seeds: {len(self.seed_tracker.seeds)} in batch, {self.seed_tracker.with_leaks()} with leaks, "
+                  f"{self.seed_tracker.exhausted()} page budgets used up")
+        if time.monotonic() - self.seed_stats_saved >= self.config.seed_stats_interval:
+            self.seed_tracker.save()
+            self.seed_stats_saved = time.monotonic()
+        gate = self.gate_snapshot()
+        if gate['passed'] or gate['skipped']:
+            print(f"🚪 AI gate: {gate['passed']} pages sent to Gemini, {gate['skipped']} with local hits skipped "
+                  f"below score {gate['threshold']:g} ({gate['sent_per_page']:.2f} per analysed page)")
+        stages = self.metrics.summary()
+        if stages:
+            print(f"⏱️ Stages p50/p95: {stages}")
+        ai_stats = self.publish_ai_stats()
+        if ai_stats:
+            print(f"🧵 AI stage: {ai_stats['queued']} queued, {ai_stats['in_flight']} in flight, "
+                  f"{ai_stats['completed']} done, {ai_stats['deferred']} deferred, {ai_stats['dropped']} dropped")
+            if hasattr(self.ai_stage.ai_processor, 'batch_snapshot'):
+                batches = self.ai_stage.ai_processor.batch_snapshot()
+                print(f"📦 Gemini batches: {batches['documents']} pages in "
+                      f"{batches['requests'] + batches['single_requests']} requests "
+                      f"({batches['documents_per_request']} per request), {batches['splits']} split")
+            client = getattr(self.ai_stage.ai_processor, 'client', None)
+            if client is not None:
+                calls = client.snapshot()
+                print(f"🚦 Gemini quota: breaker {calls['quota_state']}, {calls['quota_tokens']} tokens left, "
+                      f"{calls['retries']} retries, {calls['throttled_seconds']}s throttled, "
+                      f"{ai_stats['retried']} pages re-queued")
+            cache = getattr(self.ai_stage.ai_processor, 'cache', None)
+            if cache is not None:
+                cached = cache.snapshot()
+                print(f"🗃️ Gemini cache: {cached['hits']} hits, {cached['coalesced']} coalesced, "
+                      f"{cached['misses']} API calls (hit rate {cached['hit_rate']:.0%}), {cached['entries']} entries")
+        ocr_stats = self.publish_ocr_stats()
+        if ocr_stats:
+            print(f"🖼️ OCR stage: {ocr_stats['downloading']} downloading, {ocr_stats['queued']} queued, "
+                  f"{ocr_stats['in_flight']} in OCR, {ocr_stats['completed']} done, "
+                  f"{ocr_stats['entities']} entities, {ocr_stats['skipped']} skipped")
+
+    def analyse_page(self, dedupe_key, url, title, text, scan=None):
+        """Regex/keyword scan a page, queue its row and hand it to the AI stage.
+
+        A streamed page arrives already scanned (scan) with text holding only its windows with hits.
+        Returns (entities found, keywords matched): the page's leak signals for link prioritization and OCR.
+        """
         # 🔎 Enhanced Entity Extraction with AI
-        entities = extract_entities(text)
+        if scan:
+            entities = scan.entities
+        else:
+            with self.metrics.time('entities'):
+                entities = extract_entities(text)
         flat_entities = []
         for category, matches in entities.items():
             for value in matches:
                 flat_entities.append(f"{category}:{value}")
         entity_str = ",".join(flat_entities)
+        self.metrics.inc('entities', len(flat_entities))
+        self.metrics.inc('pages_analysed')
         
-        # Traditional keyword matching
-        matched_keywords = [kw for kw in keywords_list.get('terms', []) if kw.lower() in text.lower()]
-        
-        # AI-powered leak detection and classification
-        ai_classification = None
-        leak_severity = None
-        ai_confidence = 0.0
-        detection_method = "regex"
-        local_detection_results = None
-        gemini_detection_results = None
-        
-        if self.ai_enabled and (entities or matched_keywords):
-            try:
-                # Run AI detection workflow
-                ai_results = detect_and_classify_leaks(text, self.ai_processor)
-                
-                # Extract AI analysis results
-                if ai_results.get('detection_method') == 'hybrid':
-                    detection_method = "ai_hybrid"
-                    local_detection_results = json.dumps(ai_results.get('local_detection', {}))
-                    
-                    gemini_results = ai_results.get('ai_detection', {})
-                    gemini_detection_results = json.dumps(gemini_results)
-                    
-                    if gemini_results.get('leak_detected', False):
-                        ai_confidence = gemini_results.get('confidence_score', 0) / 100.0
-                        leak_severity = gemini_results.get('severity', 'LOW')
-                        
-                        # Determine primary classification based on detected entities
-                        detected_entities = gemini_results.get('detected_entities', {})
-                        if detected_entities.get('Aadhaar'):
-                            ai_classification = "Aadhaar"
-                        elif detected_entities.get('PAN'):
-                            ai_classification = "PAN"
-                        elif detected_entities.get('Banking'):
-                            ai_classification = "Banking/Financial"
-                        elif detected_entities.get('Telecom'):
-                            ai_classification = "Telecom"
-                        else:
-                            ai_classification = "General PII"
-                        
-                        print(f"🤖 AI Detection: {ai_classification} ({leak_severity}) - Confidence: {ai_confidence:.2f}")
-                    else:
-                        detection_method = "regex"
-                else:
-                    detection_method = "regex"
-                    local_detection_results = json.dumps(ai_results.get('local_detection', {}))
-                    
-            except Exception as e:
-                print(f"⚠ AI processing failed for {url}: {str(e)}")
-                detection_method = "regex"
+        # Traditional keyword matching (single pass over the page)
+        if scan:
+            matched_keywords = scan.matched_keywords
+        else:
+            with self.metrics.time('keywords'):
+                matched_keywords = self.keyword_matcher.match(text)
         
         print(f"🧠 Entities Found at {url}: {entity_str}")
-        if ai_classification:
-            print(f"🎯 AI Classification: {ai_classification} | Severity: {leak_severity} | Confidence: {ai_confidence:.2f}")
-
-        # Insert data with AI results (store canonical URL to avoid DB duplicates)
-        insert_data(
-            url=dedupe_key,
-            title=title,
-            matched_keywords=','.join(matched_keywords),
-            run_id=self.run_id,
-            named_entities=entity_str,
-            ai_classification=ai_classification,
-            leak_severity=leak_severity,
-            ai_confidence=ai_confidence,
-            detection_method=detection_method,
-            local_detection_results=local_detection_results,
-            gemini_detection_results=gemini_detection_results
-        )
-
-        pages_scraped += 1
-        print(f"✅ [{pages_scraped}] Scraped and saved: {dedupe_key}")
-
-        if pages_scraped % 10 == 0:
-            print(f"💓 Heartbeat: {pages_scraped} pages scraped so far...")
-
-        # Continue crawling links
-        for link in soup.find_all('a', href=True):
-            href = link['href'].strip()
-            if any(href.startswith(prefix) for prefix in ('javascript:', 'mailto:', '#', 'tel:', 'ftp:', '220:')):
-                continue
 
-            if href.startswith("http://") or href.startswith("https://"):
-                next_link = href
-            elif href.startswith("/"):
-                next_link = response.urljoin(href)
-            else:
-                continue
+        # 🚪 Generic hits (any long number, any e-mail) are on most pages; only strong local evidence costs a Gemini call
+        with self.metrics.time('leak_gate'):
+            gate = self.leak_gate.check(text, len(matched_keywords), scan.bytes_scanned if scan else None,
+                                        local_hits=bool(entities or matched_keywords))
+        if gate.passed:
+            self.metrics.inc('ai_gate_passed')
+        elif entities or matched_keywords:
+            self.metrics.inc('ai_gate_skipped')
 
-            try:
-                parsed = urlparse(next_link)
-                if not parsed.scheme or not parsed.netloc:
-                    continue
-            except Exception as e:
-                print(f"⚠ Skipping malformed URL: {href} — {e}")
-                continue
+        # Hand the row to the write-behind pipeline (canonical URL avoids DB duplicates)
+        yield {
+            'url': dedupe_key,
+            'title': title,
+            'matched_keywords': ','.join(matched_keywords),
+            'run_id': self.run_id,
+            'named_entities': entity_str,
+            'detection_method': 'regex',
+            'ai_gate_score': gate.score,
+            'ai_gate_decision': 'passed' if gate.passed else 'skipped',
+        }
 
-            next_key = make_dedupe_key(next_link)
-            if next_key not in visited_urls:
-                yield scrapy.Request(url=next_link, callback=self.parse)
+        # 🤖 AI-powered leak detection runs off the reactor thread and updates the row later
+        if gate.passed and self.get_ai_stage():
+            self.metrics.inc('ai_submitted')
+            if not self.ai_stage.submit(dedupe_key, text, matched_keywords) and self.ai_stage.overflow_policy != 'defer':
+                print(f"⚠ AI queue full, keeping regex-only result for {dedupe_key}")
+        return len(flat_entities), len(matched_keywords)
 
-if __name__ == "__main__":
+def start_crawl(runner, config: CrawlConfig, resources: CrawlResources = None, run_id=None):
+    """Start a crawl on a CrawlerRunner / CrawlerProcess; returns the Deferred that fires when it ends.
+
+    Crawls given the same resources share its keyword index, Gemini client and DB setup.
+    """
+    crawler = runner.create_crawler(DecimalCrawlerSpider)
+    # Per-crawl settings on top of the runner's, so one runner can host crawls with different configs
+    crawler.settings.setdict(config.scrapy_settings(), priority='spider')
+    return runner.crawl(crawler, config=config, resources=resources, run_id=run_id)
+
+
+def run_sharded(config: CrawlConfig, worker_count, run_id=None):
+    """Seed a sharded run and crawl it with one worker process per shard."""
+    initialize_database()
+    run_id = run_id or generate_run_id()
+    frontier = CrawlFrontier(config.frontier_db_path, lease=config.frontier_lease)
+    if not frontier.open_run(run_id, config.run_label, shard_count=worker_count):
+        # Workers join as resumers and read the seed list and budgets back from the frontier
+        frontier.save_seeds(config.seeds)
+        for seed_id, seed in enumerate(config.seeds):
+            frontier.add(make_dedupe_key(seed.url), seed.url, depth=0, priority=SEED_PRIORITY, seed=seed_id)
+    elif frontier.shard_count != worker_count:
+        print(f"⚠ Run {run_id} was started with {frontier.shard_count} shards; using that many workers")
+    worker_count = frontier.shard_count
+    # A worker that dies before its first claim only holds up the others for one lease
+    frontier.grant_leases()
+    frontier.close()
+
+    print(f"🧩 Crawling run ID {run_id} with {worker_count} worker processes")
+    started = time.time()
+    # Workers rebuild the same config from their environment
+    env = dict(os.environ, **config.to_env())
+    procs = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                          '--resume', run_id, '--shard', f'{k}/{worker_count}'], env=env)
+        for k in range(worker_count)
+    ]
+    try:
+        exit_codes = [proc.wait() for proc in procs]
+    except KeyboardInterrupt:
+        for proc in procs:
+            proc.terminate()
+        exit_codes = [proc.wait() for proc in procs]
+
+    frontier = CrawlFrontier(config.frontier_db_path)
+    frontier.run_id = run_id
+    counts = frontier.counts()
+    frontier.close()
+    elapsed = time.time() - started
+    print(f"🏁 Run {run_id}: {counts['done']} pages done, {counts['failed']} failed in {elapsed:.0f}s "
+          f"({counts['done'] * 60 / max(elapsed, 1e-6):.0f} pages/min, worker exit codes {exit_codes})")
+    print_seed_report(run_id)
+    return 0 if all(code == 0 for code in exit_codes) else 1
+
+
+def main(argv=None):
+    """Command line: crawl a start URL or a seed list, resume a run, or split it over worker processes."""
+    parser = argparse.ArgumentParser(
+        description="Crawl .onion sites for Indian PII leaks.",
+        epilog="examples:\n"
+               "  python3 crawler/decimal_crawler.py http://example.onion/ [--resume RUN_ID] [--workers N | --shard K/N]\n"
+               "  python3 crawler/decimal_crawler.py --seeds seeds.txt      (one 'url [max_depth] [max_pages]' per line)\n"
+               "  python3 crawler/decimal_crawler.py --seed-table           (enabled rows of the crawl_seeds table)",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('start_url', nargs='?', help='starting .onion URL')
+    parser.add_argument('--seeds', metavar='FILE', help="seed list, one 'url [max_depth] [max_pages]' per line")
+    parser.add_argument('--seed-table', action='store_true', help='crawl the enabled rows of the crawl_seeds table')
+    parser.add_argument('--resume', metavar='RUN_ID', help='continue an interrupted run')
+    parser.add_argument('--workers', type=int, default=1, help='fork N crawler processes, one per shard')
+    parser.add_argument('--shard', metavar='K/N', help='crawl only shard K of N (set by --workers)')
+    args = parser.parse_args(argv)
+    if not (args.start_url or args.seeds or args.seed_table or args.resume):
+        print("❌ ERROR: Please provide a starting .onion URL or a seed list as an argument.")
+        parser.print_usage()
+        return 1
+
+    # 🛡 Setup Proxy (non-Scrapy HTTP clients in this process)
+    os.environ['http_proxy'] = DEFAULT_PROXY
+    os.environ['https_proxy'] = DEFAULT_PROXY
+
+    # 🧩 --workers N forks N crawler processes; each one is started with --shard K/N
+    shard_index = None
+    shard_count = 1
+    if args.shard:
+        try:
+            shard_index, shard_count = (int(part) for part in args.shard.split('/'))
+        except ValueError:
+            print("❌ ERROR: --shard expects K/N, e.g. --shard 0/4")
+            return 1
+
+    config = CrawlConfig.from_env(shard_index=shard_index, shard_count=shard_count)
+    if not args.resume:
+        initialize_database()
+        seeds = configured_seeds(config, args.start_url.strip() if args.start_url else None,
+                                 args.seeds, args.seed_table)
+        if not seeds:
+            print("❌ ERROR: The seed list is empty.")
+            return 1
+        label = f"seeds:{args.seeds or 'crawl_seeds'}" if args.seeds or args.seed_table else seeds[0].url
+        config = config._replace(seeds=tuple(seeds), run_label=label)
+
+    if args.workers > 1 and shard_index is None:
+        return run_sharded(config, args.workers, args.resume)
     print("\n🚀 Starting Decimal Crawler...\n")
+    run_id = args.resume or generate_run_id()
     process = CrawlerProcess()
-    process.crawl(DecimalCrawlerSpider)
+    start_crawl(process, config, run_id=run_id)
     process.start()
+    if shard_index is None:
+        print_seed_report(run_id)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Download Filter
+Decides from the response headers and first body bytes whether a download is worth finishing.
+
+Over Tor every byte is slow, so a linked archive, video or binary should be
+dropped as soon as its headers arrive, not after it has been downloaded in
+full and found unparseable. Pages are kept when their Content-Type is on the
+allow-list and they stay under the size cap; images and PDFs are handed to the
+OCR stage instead of the page parser; generic types (application/octet-stream
+or none at all) are decided from their first bytes. DownloadFilterMiddleware
+applies these verdicts while the download is in progress.
+"""
+
+from typing import NamedTuple, Optional, Tuple
+
+# What to do with a download
+ACCEPT = 'accept'
+OCR = 'ocr'
+REJECT = 'reject'
+SNIFF = 'sniff'
+
+# Why a download was rejected
+REASON_TYPE = 'content_type'
+REASON_SIZE = 'too_large'
+REASON_BINARY = 'binary'
+
+# Page types the parser and stream scanner handle; 'type/*' matches a whole family
+DEFAULT_ALLOWED_TYPES = (
+    'text/*', 'application/xhtml+xml', 'application/xml', 'application/json', 'application/ld+json',
+    'application/rss+xml', 'application/atom+xml', 'application/javascript',
+    'application/sql', 'application/x-sql', 'application/csv',
+)
+
+# Types the OCR stage reads, with the suffix it decodes them as
+OCR_CONTENT_TYPES = {
+    'application/pdf': '.pdf',
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/tiff': '.tiff',
+    'image/bmp': '.bmp',
+    'image/x-ms-bmp': '.bmp',
+}
+
+# Types that say nothing about the body: decided from its first bytes
+GENERIC_TYPES = {
+    '', 'application/octet-stream', 'binary/octet-stream', 'application/unknown',
+    'application/download', 'application/force-download', 'application/x-download',
+}
+
+# Leading bytes of each OCR format; what was downloaded decides the decoder, not the URL
+_MAGIC = (
+    (b'%PDF-', '.pdf'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'II*\x00', '.tiff'),
+    (b'MM\x00*', '.tiff'),
+    (b'BM', '.bmp'),
+)
+
+
+class Verdict(NamedTuple):
+    action: str
+    reason: Optional[str] = None
+
+
+def sniff_suffix(body: bytes) -> Optional[str]:
+    """Extension matching the body's magic bytes, or None (e.g. an HTML error page)."""
+    for magic, suffix in _MAGIC:
+        if body.startswith(magic):
+            return suffix
+    return None
+
+
+def media_type(content_type: str) -> str:
+    """'text/html; charset=utf-8' -> 'text/html'."""
+    return content_type.split(';', 1)[0].strip().lower()
+
+
+def looks_textual(head: bytes) -> bool:
+    """Text dumps (SQL, CSV, logs) never contain NUL bytes; archives, media and executables almost always do."""
+    return b'\x00' not in head[:1024]
+
+
+class DownloadFilter:
+    """Content-type allow-list and size caps for pages and OCR attachments.
+
+    Args:
+        allowed_types: page media types ('text/*' style wildcards allowed)
+        max_bytes: largest page body worth downloading (0 = no cap)
+        ocr_max_bytes: largest image / PDF worth downloading; 0 rejects them (OCR off)
+    """
+
+    def __init__(self, allowed_types: Tuple[str, ...] = DEFAULT_ALLOWED_TYPES, max_bytes: int = 64 * 1024 * 1024,
+                 ocr_max_bytes: int = 0):
+        types = [media_type(t) for t in allowed_types if t.strip()]
+        self.allowed_types = frozenset(t for t in types if not t.endswith('/*'))
+        self.allowed_families = tuple(t[:-1] for t in types if t.endswith('/*'))
+        self.max_bytes = int(max_bytes)
+        self.ocr_max_bytes = int(ocr_max_bytes)
+
+    def is_allowed(self, media: str) -> bool:
+        return media in self.allowed_types or media.startswith(self.allowed_families)
+
+    def limit(self, action: str) -> int:
+        """Body size cap for a download that was accepted as a page (ACCEPT) or for OCR."""
+        return self.ocr_max_bytes if action == OCR else self.max_bytes
+
+    def check_headers(self, content_type: str, length: int = -1, attachment: bool = False) -> Verdict:
+        """Verdict from the headers alone; length is the declared Content-Length, -1 if unknown.
+
+        attachment: the request was made for the OCR stage, so only images and PDFs are wanted.
+        """
+        if length == 0:
+            return Verdict(ACCEPT)
+        media = media_type(content_type)
+        if media in OCR_CONTENT_TYPES:
+            if not self.ocr_max_bytes:
+                return Verdict(REJECT, REASON_TYPE)
+            if length > self.ocr_max_bytes:
+                return Verdict(REJECT, REASON_SIZE)
+            return Verdict(OCR)
+        limit = self.ocr_max_bytes if attachment else self.max_bytes
+        if media in GENERIC_TYPES:
+            if limit and length > limit:
+                return Verdict(REJECT, REASON_SIZE)
+            return Verdict(SNIFF)
+        if attachment or not self.is_allowed(media):
+            return Verdict(REJECT, REASON_TYPE)
+        if limit and length > limit:
+            return Verdict(REJECT, REASON_SIZE)
+        return Verdict(ACCEPT)
+
+    def check_head(self, head: bytes, attachment: bool = False) -> Verdict:
+        """Verdict for a generic-typed body from its first bytes."""
+        if sniff_suffix(head):
+            return Verdict(OCR) if self.ocr_max_bytes else Verdict(REJECT, REASON_TYPE)
+        if not attachment and looks_textual(head):
+            return Verdict(ACCEPT)
+        return Verdict(REJECT, REASON_BINARY)
@@ -0,0 +1,433 @@
+"""
+Persistent Crawl Frontier
+SQLite-backed frontier and visited set, keyed by run_id, so crawls can be stopped and resumed.
+
+URLs are identified by a 64-bit fingerprint of their canonical dedupe key; the
+unique (run_id, fingerprint) index is all that is consulted for "seen before?"
+checks, so memory use does not grow with the number of discovered URLs. The
+images and PDFs fetched for OCR are remembered the same way, under their own
+keys (attachment_key()), so each is downloaded once per run.
+
+Pending URLs are claimed highest priority first (see link_priority.py), oldest
+first among equal priorities, which with every priority at 0 is plain FIFO.
+
+A run can crawl many seeds at once (see seeds.py): the run's seed list and
+budgets are stored with it, and every entry records the seed it was reached
+from, so a resumed or sharded worker knows each seed's budget and usage.
+
+A run can be split into shards by host hash. Every worker process opens the
+same file and adds any URL it discovers, but only claims URLs from its own
+shard, so several crawler processes can share one run without handing the
+same host to two workers.
+
+Workers of a sharded run hold the file's single write lock as little as
+possible: discovered links and page outcomes are buffered in memory and
+applied, together with the next batch claim, in one short transaction
+(flush()). Seed budgets are kept as counters in run_seeds and checked in that
+transaction. Each worker renews a lease on its shard whenever it flushes; a
+shard whose lease has run out (its worker crashed or was stopped) no longer
+keeps the other workers from finishing, and is picked up again by --resume.
+"""
+
+import os
+import sys
+import sqlite3
+import time
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.models import BASE_DIR
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FRONTIER_DB_PATH = os.getenv('FRONTIER_DB_PATH', os.path.join(BASE_DIR, 'crawl_frontier.db'))
+
+# Frontier entry states
+PENDING = 0
+SCHEDULED = 1
+DONE = 2
+FAILED = 3
+# An image / PDF requested for OCR (never claimed, keyed by attachment_key())
+ATTACHMENT = 4
+
+
+def url_fingerprint(key: str) -> int:
+    """Signed 64-bit fingerprint of a canonical URL key (fits an SQLite INTEGER)."""
+    digest = hashlib.blake2b(key.encode('utf-8', 'surrogatepass'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def attachment_key(url: str) -> str:
+    """Frontier key of an OCR attachment, apart from the key of the same URL crawled as a page."""
+    return f"attachment:{url}"
+
+
+def host_shard(url: str, shard_count: int) -> int:
+    """Shard owning url's host (all pages of one onion stay with one worker)."""
+    if shard_count <= 1:
+        return 0
+    host = (urlparse(url).hostname or '').encode('utf-8', 'surrogatepass')
+    return int.from_bytes(hashlib.blake2b(host, digest_size=8).digest(), 'big') % shard_count
+
+
+class CrawlFrontier:
+    """On-disk frontier + visited set for one crawl run at a time.
+
+    Args:
+        path: SQLite file shared by all workers of a run
+        shard_index: the only shard this worker claims from (None = every shard)
+        commit_every / commit_interval: bound the work redone after a crash
+        lease: seconds a sharded worker's claim on its shard lasts without a flush()
+    """
+
+    def __init__(self, path: str = None, commit_every: int = 500, commit_interval: float = 5.0,
+                 shard_index: Optional[int] = None, lease: float = 300.0):
+        self.path = path or FRONTIER_DB_PATH
+        self.commit_every = max(1, int(commit_every))
+        self.commit_interval = float(commit_interval)
+        self.shard_index = shard_index
+        self.shard_count = 1
+        self.lease = float(lease)
+        self.run_id = None
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+        # Worker of a sharded run: writes wait in memory for the next flush()
+        self.buffered = False
+        self._adds = {}
+        self._marks = {}
+        # seed id -> frontier entries, as of the last flush()
+        self.seed_used = {}
+
+        # Other worker processes may hold the write lock briefly
+        self.conn = sqlite3.connect(self.path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        c = self.conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS crawl_runs (
+                run_id TEXT PRIMARY KEY,
+                start_url TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                resumed_count INTEGER DEFAULT 0,
+                shard_count INTEGER DEFAULT 1
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS frontier (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT NOT NULL,
+                fp INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                depth INTEGER DEFAULT 0,
+                state INTEGER DEFAULT 0,
+                shard INTEGER DEFAULT 0,
+                priority INTEGER DEFAULT 0,
+                seed INTEGER DEFAULT NULL
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS run_seeds (
+                run_id TEXT NOT NULL,
+                seed_id INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                max_depth INTEGER DEFAULT NULL,
+                max_pages INTEGER DEFAULT NULL,
+                used INTEGER DEFAULT 0,
+                PRIMARY KEY (run_id, seed_id)
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS shard_leases (
+                run_id TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                lease_until REAL NOT NULL,
+                PRIMARY KEY (run_id, shard)
+            )
+        ''')
+        # Frontier files created before sharding existed
+        if 'shard_count' not in [col[1] for col in c.execute("PRAGMA table_info(crawl_runs)")]:
+            c.execute("ALTER TABLE crawl_runs ADD COLUMN shard_count INTEGER DEFAULT 1")
+        frontier_columns = [col[1] for col in c.execute("PRAGMA table_info(frontier)")]
+        if 'shard' not in frontier_columns:
+            c.execute("ALTER TABLE frontier ADD COLUMN shard INTEGER DEFAULT 0")
+        if 'priority' not in frontier_columns:
+            c.execute("ALTER TABLE frontier ADD COLUMN priority INTEGER DEFAULT 0")
+        if 'seed' not in frontier_columns:
+            c.execute("ALTER TABLE frontier ADD COLUMN seed INTEGER DEFAULT NULL")
+        if 'used' not in [col[1] for col in c.execute("PRAGMA table_info(run_seeds)")]:
+            # Budget counters for runs started before them: count once, then keep them up to date
+            c.execute("ALTER TABLE run_seeds ADD COLUMN used INTEGER DEFAULT 0")
+            c.execute("UPDATE run_seeds SET used = (SELECT COUNT(*) FROM frontier "
+                      "WHERE frontier.run_id = run_seeds.run_id AND frontier.seed = run_seeds.seed_id)")
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_frontier_fp ON frontier(run_id, fp)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_frontier_state ON frontier(run_id, state, id)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_frontier_seed ON frontier(run_id, seed)")
+        # claim() reads these in order: best priority, then discovery order
+        c.execute("DROP INDEX IF EXISTS idx_frontier_shard")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_frontier_claim ON frontier(run_id, state, priority DESC, id)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_frontier_shard_claim "
+                  "ON frontier(run_id, shard, state, priority DESC, id)")
+        self.conn.commit()
+
+    def open_run(self, run_id: str, start_url: str = None, shard_count: int = 1) -> bool:
+        """Attach to run_id. Returns True if the run already existed (resume or joining worker).
+
+        shard_count only applies when the run is created; later workers use the stored value.
+        """
+        self.run_id = run_id
+        c = self.conn.cursor()
+        c.execute("SELECT shard_count FROM crawl_runs WHERE run_id = ?", (run_id,))
+        row = c.fetchone()
+        resumed = row is not None
+        if resumed:
+            self.shard_count = row[0] or 1
+            if self.shard_index is not None and self.shard_index >= self.shard_count:
+                raise ValueError(f"Run {run_id} has {self.shard_count} shards, no shard {self.shard_index}")
+            # Requests that were in flight when this shard's previous worker died go back to pending
+            query = "UPDATE frontier SET state = ? WHERE run_id = ? AND state = ?"
+            params = [PENDING, run_id, SCHEDULED]
+            if self.shard_index is not None:
+                query += " AND shard = ?"
+                params.append(self.shard_index)
+            c.execute(query, params)
+            requeued = c.rowcount
+            c.execute("UPDATE crawl_runs SET resumed_count = resumed_count + 1 WHERE run_id = ?", (run_id,))
+            logger.info(f"Resuming crawl run {run_id}: {requeued} interrupted requests re-queued")
+        else:
+            self.shard_count = max(1, int(shard_count))
+            c.execute("INSERT INTO crawl_runs (run_id, start_url, shard_count) VALUES (?, ?, ?)",
+                      (run_id, start_url, self.shard_count))
+        self.buffered = self.shard_index is not None and self.shard_count > 1
+        if self.buffered:
+            self._renew_lease(self.shard_index)
+        self.conn.commit()
+        self.seed_used = self._seed_used()
+        return resumed
+
+    def grant_leases(self):
+        """Give every shard of the run a fresh lease (before its workers start).
+
+        A worker that dies before it ever flushes then holds up its siblings for one lease at most.
+        """
+        for shard in range(self.shard_count):
+            self._renew_lease(shard)
+        self.conn.commit()
+
+    def _renew_lease(self, shard: int):
+        self.conn.execute("INSERT OR REPLACE INTO shard_leases (run_id, shard, lease_until) VALUES (?, ?, ?)",
+                          (self.run_id, shard, time.time() + self.lease))
+
+    def save_seeds(self, seeds):
+        """Store the run's (url, max_depth, max_pages) seeds; seed ids are list positions."""
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO run_seeds (run_id, seed_id, url, max_depth, max_pages) VALUES (?, ?, ?, ?, ?)",
+            [(self.run_id, seed_id, url, max_depth, max_pages)
+             for seed_id, (url, max_depth, max_pages) in enumerate(seeds)])
+        self.conn.commit()
+
+    def load_seeds(self) -> List[Tuple[str, Optional[int], Optional[int]]]:
+        """The run's seeds in seed-id order (runs started before seed lists: the start URL, unlimited)."""
+        rows = self.conn.execute("SELECT url, max_depth, max_pages FROM run_seeds WHERE run_id = ? "
+                                 "ORDER BY seed_id", (self.run_id,)).fetchall()
+        if not rows:
+            row = self.conn.execute("SELECT start_url FROM crawl_runs WHERE run_id = ?", (self.run_id,)).fetchone()
+            rows = [(row[0], None, None)] if row and row[0] else []
+        return rows
+
+    def seed_counts(self) -> Dict[int, int]:
+        """Frontier entries per seed id for the current run (each seed's page budget in use)."""
+        return dict(self.conn.execute("SELECT seed, COUNT(*) FROM frontier WHERE run_id = ? AND seed IS NOT NULL "
+                                      "GROUP BY seed", (self.run_id,)).fetchall())
+
+    def _seed_used(self) -> Dict[int, int]:
+        return dict(self.conn.execute("SELECT seed_id, used FROM run_seeds WHERE run_id = ?",
+                                      (self.run_id,)).fetchall())
+
+    def _touch(self, n: int = 1):
+        self._uncommitted += n
+        # Bounds how much progress a killed crawl has to redo on resume
+        if self._uncommitted >= self.commit_every or time.monotonic() - self._last_commit >= self.commit_interval:
+            self.commit()
+
+    def add(self, key: str, url: str, depth: int = 0, priority: int = 0, seed: Optional[int] = None,
+            seed_budget: Optional[int] = None) -> bool:
+        """Add a discovered URL as pending. Returns False if the run has seen it before.
+
+        A still-pending URL found again with a higher priority is promoted.
+        seed is the id of the seed the URL was reached from (kept from its first discovery); with
+        seed_budget the URL is only added while the seed has fewer entries than that (False otherwise).
+        A buffered worker only queues the URL: True means it was new to the buffer, and the run's
+        visited set and the seed budget are applied by the next flush().
+        """
+        fp = url_fingerprint(key)
+        if self.buffered:
+            queued = self._adds.get(fp)
+            if queued is None:
+                self._adds[fp] = (url, depth, priority, seed, seed_budget)
+            elif priority > queued[2]:
+                self._adds[fp] = (queued[0], queued[1], priority, queued[3], queued[4])
+            self._touch()
+            return queued is None
+        added = self._insert(fp, url, depth, priority, seed, seed_budget)
+        self._touch()
+        return added
+
+    def _insert(self, fp: int, url: str, depth: int, priority: int, seed: Optional[int],
+                seed_budget: Optional[int]) -> bool:
+        c = self.conn.execute(
+            "INSERT OR IGNORE INTO frontier (run_id, fp, url, depth, shard, priority, seed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (self.run_id, fp, url, depth, host_shard(url, self.shard_count), priority, seed))
+        added = c.rowcount > 0
+        if added and seed is not None:
+            entry_id = c.lastrowid
+            query = "UPDATE run_seeds SET used = used + 1 WHERE run_id = ? AND seed_id = ?"
+            params = [self.run_id, seed]
+            if seed_budget is not None:
+                # Checked inside the write transaction, so workers sharing the run cannot overshoot the budget
+                query += " AND used < ?"
+                params.append(seed_budget)
+            if self.conn.execute(query, params).rowcount == 0 and seed_budget is not None:
+                self.conn.execute("DELETE FROM frontier WHERE id = ?", (entry_id,))
+                added = False
+        if not added and priority > 0:
+            self.conn.execute("UPDATE frontier SET priority = ? WHERE run_id = ? AND fp = ? AND state = ? "
+                              "AND priority < ?", (priority, self.run_id, fp, PENDING, priority))
+        return added
+
+    def state(self, key: str):
+        """Return the entry state for key, or None if never discovered in this run."""
+        fp = url_fingerprint(key)
+        if fp in self._marks:
+            return self._marks[fp][1]
+        row = self.conn.execute("SELECT state FROM frontier WHERE run_id = ? AND fp = ?",
+                                (self.run_id, fp)).fetchone()
+        if row is None and fp in self._adds:
+            return PENDING
+        return row[0] if row else None
+
+    def is_visited(self, key: str) -> bool:
+        return self.state(key) in (DONE, FAILED)
+
+    def mark(self, key: str, state: int = DONE, url: str = None):
+        """Record the outcome for key, adding the entry if it was reached via a redirect."""
+        fp = url_fingerprint(key)
+        if self.buffered:
+            self._marks[fp] = (url or key, state)
+        else:
+            self._mark(fp, url or key, state)
+        self._touch()
+
+    def _mark(self, fp: int, url: str, state: int):
+        self.conn.execute(
+            "INSERT INTO frontier (run_id, fp, url, state, shard) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(run_id, fp) DO UPDATE SET state = excluded.state",
+            (self.run_id, fp, url, state, host_shard(url, self.shard_count)))
+
+    def claim(self, limit: int) -> List[Tuple[str, int, int, Optional[int]]]:
+        """Move up to limit pending URLs (best priority, then oldest) to scheduled.
+
+        Returns (url, depth, priority, seed) tuples. A buffered worker claims through flush().
+        """
+        if self.buffered:
+            return self.flush(limit)
+        claimed = self._claim(limit)
+        self._touch(len(claimed))
+        return claimed
+
+    def _claim(self, limit: int) -> List[Tuple[str, int, int, Optional[int]]]:
+        if limit <= 0:
+            return []
+        if self.shard_index is None:
+            rows = self.conn.execute(
+                "SELECT id, url, depth, priority, seed FROM frontier WHERE run_id = ? AND state = ? "
+                "ORDER BY priority DESC, id LIMIT ?", (self.run_id, PENDING, limit)).fetchall()
+        else:
+            rows = self.conn.execute(
+                "SELECT id, url, depth, priority, seed FROM frontier WHERE run_id = ? AND shard = ? AND state = ? "
+                "ORDER BY priority DESC, id LIMIT ?", (self.run_id, self.shard_index, PENDING, limit)).fetchall()
+        if rows:
+            self.conn.executemany("UPDATE frontier SET state = ? WHERE id = ?",
+                                  [(SCHEDULED, row[0]) for row in rows])
+        return [(url, depth, priority or 0, seed) for _, url, depth, priority, seed in rows]
+
+    def flush(self, claim: int = 0) -> List[Tuple[str, int, int, Optional[int]]]:
+        """Apply a buffered worker's outcomes and links, claim up to `claim` URLs and renew the
+        shard's lease, all in one write transaction. Refreshes seed_used; returns the claimed URLs.
+        """
+        if self.conn.in_transaction:
+            self.conn.commit()
+        marks, adds = self._marks, self._adds
+        self._marks, self._adds = {}, {}
+        try:
+            # Take the write lock up front: upgrading a read transaction fails instead of waiting
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany(
+                "INSERT INTO frontier (run_id, fp, url, state, shard) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(run_id, fp) DO UPDATE SET state = excluded.state",
+                [(self.run_id, fp, url, state, host_shard(url, self.shard_count))
+                 for fp, (url, state) in marks.items()])
+            for fp, entry in adds.items():
+                self._insert(fp, *entry)
+            claimed = self._claim(claim)
+            self._renew_lease(self.shard_index)
+            self.seed_used = self._seed_used()
+            self.conn.commit()
+        except Exception:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            # Nothing was written: keep the buffers (and anything added since) for the next flush
+            self._marks = {**marks, **self._marks}
+            self._adds = {**adds, **self._adds}
+            raise
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+        return claimed
+
+    def run_active(self) -> bool:
+        """True while any shard of the run still has pending or in-flight URLs.
+
+        Shards whose lease has run out are left out (other than this worker's own): their worker
+        is gone, and waiting for it would keep every other worker of the run open.
+        """
+        row = self.conn.execute(
+            "SELECT 1 FROM frontier WHERE run_id = ? AND state IN (?, ?) AND (shard = ? OR shard NOT IN "
+            "(SELECT shard FROM shard_leases WHERE run_id = ? AND lease_until < ?)) LIMIT 1",
+            (self.run_id, PENDING, SCHEDULED, -1 if self.shard_index is None else self.shard_index,
+             self.run_id, time.time())).fetchone()
+        return row is not None
+
+    def counts(self) -> Dict[str, int]:
+        """Number of page entries per state for the current run."""
+        names = {PENDING: 'pending', SCHEDULED: 'scheduled', DONE: 'done', FAILED: 'failed'}
+        counts = {name: 0 for name in names.values()}
+        for state, count in self.conn.execute(
+                "SELECT state, COUNT(*) FROM frontier WHERE run_id = ? AND state != ? GROUP BY state",
+                (self.run_id, ATTACHMENT)):
+            counts[names.get(state, str(state))] = count
+        return counts
+
+    def commit(self):
+        if self.buffered:
+            self.flush()
+            return
+        self.conn.commit()
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        self.commit()
+        if self.buffered:
+            # Stopped on purpose: the other workers need not wait for this shard's lease to run out
+            self.conn.execute("UPDATE shard_leases SET lease_until = 0 WHERE run_id = ? AND shard = ?",
+                              (self.run_id, self.shard_index))
+            self.conn.commit()
+        self.conn.close()
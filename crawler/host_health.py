@@ -0,0 +1,230 @@
+"""
+Host Health Cache
+Negative cache of onion hosts that stopped answering, kept across crawl runs.
+
+Each host has a count of consecutive connection failures / timeouts. After
+`failure_threshold` of them the host enters a back-off window; requests for it
+are skipped until the window ends, when a single probe request is let
+through. A failed probe doubles the window (up to `max_backoff`), any real
+response clears the host. State lives in the host_health table so the next run
+starts out knowing which hosts are dead.
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import logging
+from typing import Any, Dict, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.models import DB_PATH
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# What allow() decided for a request
+ALLOW = 'allow'
+PROBE = 'probe'
+SKIP = 'skip'
+
+
+class HostHealth:
+    """Failure history and back-off window of one host (times are epoch seconds)."""
+
+    __slots__ = ('consecutive', 'failures', 'successes', 'backoff', 'down_until', 'last_error',
+                 'last_failure', 'last_success', 'wasted_seconds', 'probing_since')
+
+    def __init__(self, consecutive=0, failures=0, successes=0, backoff=0.0, down_until=0.0, last_error=None,
+                 last_failure=None, last_success=None, wasted_seconds=0.0):
+        self.consecutive = consecutive
+        self.failures = failures
+        self.successes = successes
+        self.backoff = backoff
+        self.down_until = down_until
+        self.last_error = last_error
+        self.last_failure = last_failure
+        self.last_success = last_success
+        self.wasted_seconds = wasted_seconds
+        self.probing_since = None
+
+
+class HostHealthCache:
+    """Per-host failure counts and exponential back-off windows, persisted in SQLite.
+
+    Args:
+        path: SQLite file (default: the main database)
+        failure_threshold: consecutive failures before a host is backed off
+        base_backoff: first back-off window in seconds; each failed probe doubles it
+        max_backoff: longest back-off window
+        probe_timeout: seconds after which a probe that never finished no longer blocks a new one
+        flush_interval: seconds between writes of changed hosts to the table
+    """
+
+    def __init__(self, path: str = None, failure_threshold: int = 3, base_backoff: float = 300.0,
+                 max_backoff: float = 86400.0, probe_timeout: float = 180.0, flush_interval: float = 30.0):
+        self.path = path or DB_PATH
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.base_backoff = float(base_backoff)
+        self.max_backoff = max(self.base_backoff, float(max_backoff))
+        self.probe_timeout = float(probe_timeout)
+        self.flush_interval = float(flush_interval)
+        self.hosts: Dict[str, HostHealth] = {}
+        self._dirty = set()
+        self._flushed = time.monotonic()
+        # This run's counters
+        self.counts = {'failed_attempts': 0, 'skipped': 0, 'probes': 0, 'recovered': 0,
+                       'backed_off': 0, 'wasted_seconds': 0.0}
+
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS host_health (
+                host TEXT PRIMARY KEY,
+                consecutive_failures INTEGER DEFAULT 0,
+                failures INTEGER DEFAULT 0,
+                successes INTEGER DEFAULT 0,
+                backoff REAL DEFAULT 0,
+                down_until REAL DEFAULT 0,
+                last_error TEXT,
+                last_failure REAL,
+                last_success REAL,
+                wasted_seconds REAL DEFAULT 0
+            )
+        ''')
+        self.conn.commit()
+        for row in self.conn.execute(
+                "SELECT host, consecutive_failures, failures, successes, backoff, down_until, last_error, "
+                "last_failure, last_success, wasted_seconds FROM host_health"):
+            self.hosts[row[0]] = HostHealth(*row[1:])
+
+    def _host(self, host: str) -> HostHealth:
+        health = self.hosts.get(host)
+        if health is None:
+            health = self.hosts[host] = HostHealth()
+        return health
+
+    def allow(self, host: str, now: float = None) -> str:
+        """ALLOW, PROBE (first request after a back-off window) or SKIP for a request to host."""
+        health = self.hosts.get(host)
+        if health is None or health.down_until <= 0:
+            return ALLOW
+        now = time.time() if now is None else now
+        if now < health.down_until:
+            self.counts['skipped'] += 1
+            return SKIP
+        # Window over: one probe at a time decides whether the host is back
+        if health.probing_since is not None and now - health.probing_since < self.probe_timeout:
+            self.counts['skipped'] += 1
+            return SKIP
+        health.probing_since = now
+        self.counts['probes'] += 1
+        return PROBE
+
+    def record_failure(self, host: str, error: str, elapsed: float = 0.0, now: float = None) -> bool:
+        """A connection failure / timeout / gateway error for host. Returns True if it starts a back-off window."""
+        now = time.time() if now is None else now
+        health = self._host(host)
+        health.consecutive += 1
+        health.failures += 1
+        health.last_error = error
+        health.last_failure = now
+        health.wasted_seconds += elapsed
+        self.counts['failed_attempts'] += 1
+        self.counts['wasted_seconds'] += elapsed
+        probe_failed = health.probing_since is not None
+        health.probing_since = None
+        backed_off = probe_failed or (health.consecutive >= self.failure_threshold and health.down_until <= now)
+        if backed_off:
+            # Exponential re-probe: every failed probe doubles the window
+            health.backoff = (min(self.max_backoff, health.backoff * 2) if health.backoff
+                              else self.base_backoff)
+            health.down_until = now + health.backoff
+            self.counts['backed_off'] += 1
+            logger.warning(f"Host {host} backed off for {health.backoff:.0f}s after "
+                           f"{health.consecutive} consecutive failures ({error})")
+        self._changed(host)
+        return backed_off
+
+    def count_skipped(self, requests: int = 1):
+        """Requests failed without a download attempt outside allow() (e.g. already queued for the host)."""
+        self.counts['skipped'] += requests
+
+    def record_success(self, host: str, now: float = None):
+        """Any real response: the host is alive, forget its back-off."""
+        now = time.time() if now is None else now
+        health = self._host(host)
+        if health.down_until > 0:
+            self.counts['recovered'] += 1
+            logger.info(f"Host {host} is back after {health.consecutive} failures")
+        was_clean = health.consecutive == 0 and health.down_until <= 0
+        health.consecutive = 0
+        health.successes += 1
+        health.backoff = 0.0
+        health.down_until = 0.0
+        health.probing_since = None
+        health.last_success = now
+        if not was_clean or health.successes == 1:
+            # Healthy hosts are written once, not on every page
+            self._changed(host)
+
+    def _changed(self, host: str):
+        self._dirty.add(host)
+        if time.monotonic() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write changed hosts to the host_health table."""
+        self._flushed = time.monotonic()
+        if not self._dirty:
+            return
+        rows = []
+        for host in self._dirty:
+            h = self.hosts[host]
+            rows.append((host, h.consecutive, h.failures, h.successes, h.backoff, h.down_until, h.last_error,
+                         h.last_failure, h.last_success, h.wasted_seconds))
+        self._dirty.clear()
+        try:
+            self.conn.executemany('''
+                INSERT INTO host_health (host, consecutive_failures, failures, successes, backoff, down_until,
+                                         last_error, last_failure, last_success, wasted_seconds)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(host) DO UPDATE SET
+                    consecutive_failures = excluded.consecutive_failures, failures = excluded.failures,
+                    successes = excluded.successes, backoff = excluded.backoff, down_until = excluded.down_until,
+                    last_error = excluded.last_error, last_failure = excluded.last_failure,
+                    last_success = excluded.last_success, wasted_seconds = excluded.wasted_seconds
+            ''', rows)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Host health flush of {len(rows)} hosts failed: {str(e)}")
+
+    def down_hosts(self, now: float = None) -> int:
+        now = time.time() if now is None else now
+        return sum(1 for health in self.hosts.values() if health.down_until > now)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """This run's counters plus hosts tracked / currently backed off."""
+        failed = self.counts['failed_attempts']
+        if failed:
+            avg_failure = self.counts['wasted_seconds'] / failed
+        else:
+            # Nothing failed this run (dead hosts known from earlier ones): use the stored history
+            history = sum(health.failures for health in self.hosts.values())
+            avg_failure = sum(health.wasted_seconds for health in self.hosts.values()) / history if history else 0.0
+        return {
+            'hosts': len(self.hosts),
+            'down_hosts': self.down_hosts(),
+            'failed_attempts': failed,
+            'backed_off': self.counts['backed_off'],
+            'skipped': self.counts['skipped'],
+            'probes': self.counts['probes'],
+            'recovered': self.counts['recovered'],
+            'wasted_slot_seconds': round(self.counts['wasted_seconds'], 1),
+            # Skipped requests would each have held a slot about as long as a failed attempt
+            'saved_slot_seconds': round(self.counts['skipped'] * avg_failure, 1),
+        }
+
+    def close(self):
+        self.flush()
+        self.conn.close()
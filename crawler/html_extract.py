@@ -0,0 +1,156 @@
+"""
+HTML Extraction Layer
+Title, visible text, absolute links and image sources from a page in a single pass over a C-parsed tree.
+
+Backends (HTML_EXTRACT_BACKEND):
+    lxml      one walk over an lxml.html tree (default, fastest)
+    selector  Scrapy/parsel selectors (reuses response.selector when given one)
+    bs4       BeautifulSoup with html.parser, the original pure-Python path
+"""
+
+import logging
+from typing import List, NamedTuple, Optional
+from urllib.parse import urljoin, urlparse
+
+from lxml import etree
+from lxml import html as lxml_html
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('lxml', 'selector', 'bs4')
+
+# Elements whose text is never rendered
+INVISIBLE_TAGS = frozenset({'script', 'style', 'template', 'noscript'})
+
+# href prefixes that never lead to a crawlable page
+SKIP_HREF_PREFIXES = ('javascript:', 'mailto:', '#', 'tel:', 'ftp:', '220:', 'data:')
+
+_HTML_PARSER = lxml_html.HTMLParser(recover=True, encoding='utf-8')
+
+
+class PageContent(NamedTuple):
+    title: str
+    text: str
+    links: List[str]
+    anchors: List[str]  # anchor text of each link, same order as links
+    images: List[str] = []  # absolute <img src> URLs (OCR attachment candidates)
+
+
+def resolve_link(href: str, base_url: str) -> Optional[str]:
+    """Absolute http(s) URL for an href, or None if it can't be crawled."""
+    href = (href or '').strip()
+    if not href or href.lower().startswith(SKIP_HREF_PREFIXES):
+        return None
+    try:
+        url = urljoin(base_url, href)
+        parsed = urlparse(url)
+    except ValueError:
+        return None
+    if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+        return None
+    return url
+
+
+def _extract_lxml(html: str, base_url: str) -> PageContent:
+    body = html.replace('\x00', '').encode('utf-8', 'surrogatepass')
+    try:
+        root = etree.fromstring(body, parser=_HTML_PARSER) if body.strip() else None
+    except (etree.ParserError, ValueError):
+        root = None
+    if root is None:
+        return PageContent('No Title', '', [], [], [])
+
+    title = None
+    base = base_url
+    texts = []
+    links = []
+    anchors = []
+    images = []
+    for element in root.iter():
+        tag = element.tag
+        if isinstance(tag, str):
+            if tag == 'title' and title is None:
+                title = element.text_content().strip()
+            elif tag == 'a':
+                link = resolve_link(element.get('href'), base)
+                if link:
+                    links.append(link)
+                    anchor = ''.join(element.itertext()) if len(element) else element.text or ''
+                    anchors.append(' '.join(anchor.split()))
+            elif tag == 'img':
+                src = resolve_link(element.get('src'), base)
+                if src:
+                    images.append(src)
+            elif tag == 'base' and element.get('href'):
+                base = urljoin(base_url, element.get('href').strip())
+            if element.text and tag not in INVISIBLE_TAGS:
+                texts.append(element.text)
+        # Comments / processing instructions contribute only their tail
+        if element.tail and element is not root:
+            texts.append(element.tail)
+    return PageContent(title or 'No Title', ''.join(texts), links, anchors, images)
+
+
+def _extract_selector(html: str, base_url: str, selector=None) -> PageContent:
+    if selector is None:
+        from parsel import Selector
+        selector = Selector(text=html, base_url=base_url)
+    title = (selector.xpath('string(//title)').get() or '').strip()
+    text = ''.join(selector.xpath(
+        '//text()[not(ancestor::script or ancestor::style or ancestor::template or ancestor::noscript)]'
+        '[not(parent::comment())]').getall())
+    base = selector.xpath('//base/@href').get()
+    base = urljoin(base_url, base.strip()) if base else base_url
+    links = []
+    anchors = []
+    # Walk the underlying lxml tree: one XPath call per anchor would double the cost of this backend
+    for a in selector.root.iter('a') if selector.root is not None else ():
+        link = resolve_link(a.get('href'), base)
+        if link:
+            links.append(link)
+            anchors.append(' '.join(''.join(a.itertext()).split()))
+    images = []
+    for img in selector.root.iter('img') if selector.root is not None else ():
+        src = resolve_link(img.get('src'), base)
+        if src:
+            images.append(src)
+    return PageContent(title or 'No Title', text, links, anchors, images)
+
+
+def _extract_bs4(html: str, base_url: str) -> PageContent:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    for element in soup(list(INVISIBLE_TAGS)):
+        element.decompose()
+    title = soup.title.get_text().strip() if soup.title else ''
+    base = soup.find('base', href=True)
+    base = urljoin(base_url, base['href'].strip()) if base else base_url
+    links = []
+    anchors = []
+    for a in soup.find_all('a', href=True):
+        link = resolve_link(a['href'], base)
+        if link:
+            links.append(link)
+            anchors.append(' '.join(a.get_text().split()))
+    images = [src for src in (resolve_link(img['src'], base) for img in soup.find_all('img', src=True)) if src]
+    return PageContent(title or 'No Title', soup.get_text(), links, anchors, images)
+
+
+def extract_page(html: str, base_url: str, backend: str = 'lxml', selector=None) -> PageContent:
+    """Extract (title, visible text, absolute links, anchor texts, image sources) from an HTML document.
+
+    Args:
+        html: decoded page body
+        base_url: URL the page was fetched from, for resolving relative links
+        backend: one of BACKENDS
+        selector: optional ready-made Scrapy selector (response.selector) for the 'selector' backend
+    """
+    if backend == 'lxml':
+        return _extract_lxml(html, base_url)
+    if backend == 'selector':
+        return _extract_selector(html, base_url, selector)
+    if backend == 'bs4':
+        return _extract_bs4(html, base_url)
+    raise ValueError(f"HTML extract backend must be one of {BACKENDS}, got {backend!r}")
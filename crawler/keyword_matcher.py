@@ -0,0 +1,188 @@
+"""
+Keyword Matcher Module
+Compiled Aho-Corasick automaton for matching keywords.json terms against crawled pages.
+
+The automaton is built once from the keyword list and each page is scanned in a
+single pass, instead of lowercasing and searching the whole page once per term.
+"""
+
+import os
+import json
+import time
+import logging
+from typing import Dict, List, Tuple, Iterable, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_keyword_terms(path: str) -> List[str]:
+    """Load the keyword list from keywords.json (accepts {"terms": [...]} or a flat list)."""
+    with open(path, 'r') as f:
+        raw = json.load(f)
+    terms = raw.get('terms', []) if isinstance(raw, dict) else raw
+    return [str(term) for term in terms if str(term).strip()]
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over a fixed list of case-insensitive terms.
+
+    The goto/fail graph is flattened into a DFA (one dict of transitions per
+    state), so scanning costs a single dict lookup per character.
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        self.terms = []
+        self._term_index = {}
+        for term in terms:
+            key = term.lower()
+            if key and key not in self._term_index:
+                self._term_index[key] = len(self.terms)
+                self.terms.append(term)
+
+        # outputs[state] -> tuple of (term_id, lowered_term_length) ending at this state
+        self._delta: List[Dict[str, int]] = [{}]
+        self._outputs: List[Tuple[Tuple[int, int], ...]] = [()]
+        self._build()
+
+    def _build(self):
+        goto = [{}]
+        outputs = [[]]
+        for term_id, term in enumerate(self.terms):
+            key = term.lower()
+            state = 0
+            for ch in key:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    outputs.append([])
+                state = nxt
+            outputs[state].append((term_id, len(key)))
+
+        # Breadth-first construction of failure links and the full DFA
+        fail = [0] * len(goto)
+        delta = [dict() for _ in goto]
+        delta[0] = dict(goto[0])
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            # Inherit the fail state's transitions, then override with our own
+            transitions = dict(delta[fail[state]])
+            for ch, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state]].get(ch, 0) if state else 0
+                outputs[nxt].extend(outputs[fail[nxt]])
+                transitions[ch] = nxt
+                queue.append(nxt)
+            delta[state] = transitions
+
+        self._delta = delta
+        self._outputs = [tuple(out) for out in outputs]
+
+    def iter_matches(self, text: str, whole_word: bool = False):
+        """Yield (term, start, end) for every occurrence of a term in text.
+
+        Offsets always index the original text, even where lowercasing changed
+        a character's length (e.g. 'İ' -> 'i̇').
+        """
+        if not self.terms or not text:
+            return
+        lowered = text.lower()
+        # origin[i] -> index in text of the character that produced lowered[i]
+        origin = _lowered_origin(text) if len(lowered) != len(text) else None
+        delta = self._delta
+        outputs = self._outputs
+        terms = self.terms
+        state = 0
+        for end, ch in enumerate(lowered, 1):
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                for term_id, length in outputs[state]:
+                    start, stop = end - length, end
+                    if origin is not None:
+                        start, stop = origin[start], origin[stop - 1] + 1
+                    if whole_word and not _is_word_bounded(text, start, stop):
+                        continue
+                    yield terms[term_id], start, stop
+
+    def find(self, text: str, whole_word: bool = False) -> Dict[str, List[int]]:
+        """Return matched terms mapped to their start offsets, in keyword-list order."""
+        found = {}
+        for term, start, _ in self.iter_matches(text, whole_word=whole_word):
+            found.setdefault(term, []).append(start)
+        return {term: found[term] for term in self.terms if term in found}
+
+
+def _lowered_origin(text: str) -> List[int]:
+    """Map each index of text.lower() back to the index of its source character."""
+    origin = []
+    for index, ch in enumerate(text):
+        origin.extend([index] * len(ch.lower()))
+    return origin
+
+
+def _is_word_bounded(text: str, start: int, end: int) -> bool:
+    """Check that text[start:end] is not glued to surrounding word characters."""
+    if start > 0 and (text[start - 1].isalnum() or text[start - 1] == '_'):
+        return False
+    if end < len(text) and (text[end].isalnum() or text[end] == '_'):
+        return False
+    return True
+
+
+class KeywordMatcher:
+    """keywords.json-backed matcher that rebuilds its automaton when the file changes."""
+
+    def __init__(self, path: str = 'keywords.json', whole_word: bool = False,
+                 check_interval: float = 5.0):
+        self.path = path
+        self.whole_word = whole_word
+        self.check_interval = check_interval
+        self._automaton = KeywordAutomaton([])
+        self._mtime: Optional[float] = None
+        self._last_check = 0.0
+        self.reload()
+
+    @property
+    def terms(self) -> List[str]:
+        return self._automaton.terms
+
+    def reload(self) -> bool:
+        """(Re)build the automaton from disk. Keeps the previous automaton on error."""
+        try:
+            mtime = os.path.getmtime(self.path)
+            terms = load_keyword_terms(self.path)
+        except Exception as e:
+            print(f"❌ ERROR loading {self.path}: {e}")
+            return False
+
+        self._automaton = KeywordAutomaton(terms)
+        self._mtime = mtime
+        logger.info(f"Keyword automaton built with {len(self._automaton.terms)} terms from {self.path}")
+        return True
+
+    def _refresh_if_changed(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            print(f"🔄 {self.path} changed, rebuilding keyword automaton...")
+            self.reload()
+
+    def find(self, text: str) -> Dict[str, List[int]]:
+        """Return {term: [start offsets]} for every keyword present in text."""
+        self._refresh_if_changed()
+        return self._automaton.find(text, whole_word=self.whole_word)
+
+    def match(self, text: str) -> List[str]:
+        """Return the matched terms in keywords.json order."""
+        return list(self.find(text).keys())
@@ -0,0 +1,260 @@
+"""
+Link Graph and Host Ranking
+Outbound links of every crawled page, and a PageRank over the onion hosts they connect.
+
+Edges (source URL, target URL, run) are buffered and written to link_edges in
+batches. Every URL pair seen for the first time also adds one link to the
+weighted host -> host edge in host_links. Hosts are stored as small integer
+ids, so the ranking loads the host graph straight into NumPy arrays (never one
+Python object per edge) and runs a power iteration that is warm-started from
+the previous ranks. It converges in a few steps when only a batch of new edges
+arrived. Ranks are recomputed after every `rank_every` new host edges and
+written to host_rank for the dashboard; on_rank hands them to crawl
+scheduling.
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+try:
+    from scipy.sparse import csr_matrix
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.models import DB_PATH
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DAMPING = 0.85
+
+# Rows per fetchmany() when loading host_links into arrays
+LOAD_CHUNK = 100000
+
+
+def url_host(url: str) -> str:
+    """Host of a canonical URL ('http://abc.onion:80/x' -> 'abc.onion'); cheaper than urlparse per link."""
+    netloc = url.partition('://')[2].split('/', 1)[0].split('?', 1)[0].split('#', 1)[0].rpartition('@')[2]
+    if netloc.startswith('['):
+        return netloc[1:].split(']', 1)[0].lower()
+    return netloc.split(':', 1)[0].lower()
+
+
+def pagerank(source: np.ndarray, target: np.ndarray, weight: np.ndarray, size: int, start: np.ndarray = None,
+             damping: float = DAMPING, tolerance: float = 1e-6, max_iterations: int = 100) -> Tuple[np.ndarray, int]:
+    """Weighted PageRank by power iteration over edge arrays; returns (ranks summing to 1, iterations run).
+
+    Hosts without outgoing edges spread their rank evenly over all hosts.
+    start: previous ranks to warm-start from (any non-negative vector of length size).
+    """
+    if size == 0:
+        return np.zeros(0), 0
+    out_weight = np.bincount(source, weights=weight, minlength=size)
+    share = weight / out_weight[source]
+    dangling = out_weight == 0
+    if SCIPY_AVAILABLE:
+        # Column-stochastic transition matrix; duplicate (target, source) entries are summed
+        matrix = csr_matrix((share, (target, source)), shape=(size, size))
+        spread = matrix.dot
+    else:
+        spread = lambda rank: np.bincount(target, weights=rank[source] * share, minlength=size)
+
+    if start is None or start.sum() <= 0:
+        rank = np.full(size, 1.0 / size)
+    else:
+        rank = start / start.sum()
+    iterations = 0
+    while iterations < max_iterations:
+        iterations += 1
+        updated = damping * (spread(rank) + rank[dangling].sum() / size) + (1.0 - damping) / size
+        delta = np.abs(updated - rank).sum()
+        rank = updated
+        if delta < tolerance:
+            break
+    return rank, iterations
+
+
+class LinkGraph:
+    """Batched link_edges writer with an incrementally maintained host graph and its PageRank.
+
+    Args:
+        path: SQLite file (default: the main database)
+        batch_size: buffered edges per write transaction
+        rank_every: new host edges (or added links between known hosts) before ranks are recomputed
+        on_rank: called with {host: rank scaled so the top host is 1.0} after each recomputation
+    """
+
+    def __init__(self, path: str = None, batch_size: int = 1000, rank_every: int = 2000,
+                 on_rank: Optional[Callable[[Dict[str, float]], None]] = None):
+        self.path = path or DB_PATH
+        self.batch_size = max(1, int(batch_size))
+        self.rank_every = max(1, int(rank_every))
+        self.on_rank = on_rank
+        self.pending: List[Tuple[str, str, str, str, str]] = []
+        self.unranked = 0
+        self.counts = {'edges_written': 0, 'host_edge_updates': 0, 'rank_runs': 0, 'rank_iterations': 0,
+                       'rank_seconds': 0.0}
+
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS link_edges (
+                source_url TEXT,
+                target_url TEXT,
+                run_id TEXT,
+                PRIMARY KEY (source_url, target_url, run_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_link_edges_target ON link_edges(target_url);
+            CREATE TABLE IF NOT EXISTS graph_hosts (
+                id INTEGER PRIMARY KEY,
+                host TEXT UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS host_links (
+                source_id INTEGER,
+                target_id INTEGER,
+                links INTEGER DEFAULT 0,
+                PRIMARY KEY (source_id, target_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS host_rank (
+                host TEXT PRIMARY KEY,
+                rank REAL,
+                in_hosts INTEGER DEFAULT 0,
+                out_hosts INTEGER DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE TEMP TABLE IF NOT EXISTS staged_edges (
+                source_url TEXT, target_url TEXT, run_id TEXT, source_host TEXT, target_host TEXT
+            );
+        ''')
+        self.conn.commit()
+        self.host_ids: Dict[str, int] = dict(self.conn.execute("SELECT host, id FROM graph_hosts"))
+        # Ranks by host id - 1 (ids start at 1); the last stored ones warm-start this run's first ranking
+        self.rank = np.zeros(max(self.host_ids.values(), default=0))
+        for host, rank in self.conn.execute("SELECT host, rank FROM host_rank"):
+            if host in self.host_ids:
+                self.rank[self.host_ids[host] - 1] = rank
+
+    def add(self, source_url: str, target_urls: List[str], run_id: str):
+        """Buffer one page's outbound links (canonical URLs); written once batch_size edges are pending."""
+        source_host = url_host(source_url)
+        self.pending.extend((source_url, target_url, run_id, source_host, url_host(target_url))
+                            for target_url in target_urls if target_url != source_url)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered edges in one transaction; URL pairs not seen in any earlier run add to their host edge."""
+        if not self.pending:
+            return
+        edges, self.pending = self.pending, []
+        conn = self.conn
+        try:
+            conn.executemany("INSERT INTO staged_edges VALUES (?, ?, ?, ?, ?)", edges)
+            conn.execute('''
+                INSERT OR IGNORE INTO graph_hosts (host)
+                SELECT source_host FROM staged_edges UNION SELECT target_host FROM staged_edges
+            ''')
+            before = conn.total_changes
+            conn.execute('''
+                INSERT INTO host_links (source_id, target_id, links)
+                SELECT source.id, target.id, COUNT(*) FROM (
+                    SELECT DISTINCT s.source_url, s.target_url, s.source_host, s.target_host FROM staged_edges s
+                    WHERE s.source_host != s.target_host AND NOT EXISTS (
+                        SELECT 1 FROM link_edges e WHERE e.source_url = s.source_url AND e.target_url = s.target_url)
+                ) new_edges
+                JOIN graph_hosts source ON source.host = new_edges.source_host
+                JOIN graph_hosts target ON target.host = new_edges.target_host
+                WHERE true GROUP BY source.id, target.id
+                ON CONFLICT(source_id, target_id) DO UPDATE SET links = links + excluded.links
+            ''')
+            updates = conn.total_changes - before
+            before = conn.total_changes
+            conn.execute("INSERT OR IGNORE INTO link_edges SELECT source_url, target_url, run_id FROM staged_edges")
+            self.counts['edges_written'] += conn.total_changes - before
+            conn.execute("DELETE FROM staged_edges")
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"Link graph flush of {len(edges)} edges failed: {str(e)}")
+            return
+        # Ids of hosts added by this flush (or by other workers sharing the file)
+        self.host_ids.update(conn.execute("SELECT host, id FROM graph_hosts WHERE id > ?",
+                                          (max(self.host_ids.values(), default=0),)))
+        self.counts['host_edge_updates'] += updates
+        self.unranked += updates
+        if self.unranked >= self.rank_every:
+            self.update_ranks()
+
+    def _load_host_links(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        chunks = []
+        cursor = self.conn.execute("SELECT source_id, target_id, links FROM host_links")
+        while True:
+            rows = cursor.fetchmany(LOAD_CHUNK)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.int64))
+        edges = np.concatenate(chunks) if chunks else np.zeros((0, 3), dtype=np.int64)
+        return edges[:, 0], edges[:, 1], edges[:, 2].astype(np.float64)
+
+    def update_ranks(self) -> Dict[str, float]:
+        """Recompute host PageRank from host_links, store it in host_rank and pass it to on_rank."""
+        started = time.perf_counter()
+        source, target, weight = self._load_host_links()
+        source, target = source - 1, target - 1
+        size = max(self.host_ids.values(), default=0)
+        # Warm start: previous ranks, hosts added since at the uniform rank
+        start = np.full(size, 1.0 / max(size, 1))
+        known = min(len(self.rank), size)
+        start[:known] = np.where(self.rank[:known] > 0, self.rank[:known], start[:known])
+        self.rank, iterations = pagerank(source, target, weight, size, start=start)
+        self.unranked = 0
+
+        in_hosts = np.bincount(target, minlength=size)
+        out_hosts = np.bincount(source, minlength=size)
+        rows = [(host, float(self.rank[host_id - 1]), int(in_hosts[host_id - 1]), int(out_hosts[host_id - 1]))
+                for host, host_id in self.host_ids.items()]
+        self.conn.executemany('''
+            INSERT INTO host_rank (host, rank, in_hosts, out_hosts, updated_at) VALUES (?, ?, ?, ?, datetime('now'))
+            ON CONFLICT(host) DO UPDATE SET rank = excluded.rank, in_hosts = excluded.in_hosts,
+                out_hosts = excluded.out_hosts, updated_at = excluded.updated_at
+        ''', rows)
+        self.conn.commit()
+
+        elapsed = time.perf_counter() - started
+        self.counts['rank_runs'] += 1
+        self.counts['rank_iterations'] += iterations
+        self.counts['rank_seconds'] += elapsed
+        logger.info(f"Ranked {size} hosts over {len(weight)} host edges in {iterations} iterations "
+                    f"({elapsed * 1000:.0f} ms)")
+        top = float(self.rank.max()) if size else 0.0
+        ranks = {host: rank / top for host, rank, _, _ in rows} if top > 0 else {}
+        if self.on_rank is not None:
+            self.on_rank(ranks)
+        return ranks
+
+    def top_hosts(self, limit: int = 10) -> List[Tuple[str, float]]:
+        return self.conn.execute("SELECT host, rank FROM host_rank ORDER BY rank DESC LIMIT ?", (limit,)).fetchall()
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            'hosts': len(self.host_ids),
+            'edges_written': self.counts['edges_written'],
+            'host_edge_updates': self.counts['host_edge_updates'],
+            'rank_runs': self.counts['rank_runs'],
+            'rank_iterations': self.counts['rank_iterations'],
+            'rank_seconds': round(self.counts['rank_seconds'], 3),
+        }
+
+    def close(self):
+        """Write what is buffered and rank any edges added since the last recomputation."""
+        self.flush()
+        if self.unranked:
+            self.update_ranks()
+        self.conn.close()
@@ -0,0 +1,223 @@
+"""
+Crawl Metrics
+Per-stage timing histograms and counters for a crawl run, exported as a stats file and over HTTP.
+
+Every stage of a page's life (fetch, extraction, entity regexes, keywords,
+near-duplicate lookup, Gemini, SQLite writes) records its duration in a
+fixed-bucket histogram; pages, bytes, entities, AI calls and DB writes are
+plain counters. Recording is a bisect plus two additions under a lock, so it
+can stay on in production (scripts/benchmark_metrics.py measures the cost).
+
+    METRICS_FILE  JSON-lines file; one snapshot tagged with run_id per flush
+    METRICS_PORT  serve /metrics (Prometheus text) and /metrics.json on 127.0.0.1
+"""
+
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Sequence
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; the last bucket catches everything slower
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations (Prometheus style)."""
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation (max for the overflow bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'avg': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'max': round(self.max, 6),
+            'buckets': dict(zip([str(b) for b in self.bounds] + ['+Inf'], self.counts)),
+        }
+
+
+class _StageTimer:
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class CrawlMetrics:
+    """Thread-safe counters and stage histograms for one crawl process.
+
+    Args:
+        run_id: crawl run the numbers belong to
+        shard: worker shard index for --workers runs (None for a single process)
+    """
+
+    def __init__(self, run_id: str, shard: Optional[int] = None, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.run_id = run_id
+        self.shard = shard
+        self.buckets = tuple(buckets)
+        self.started = time.time()
+        self.counters: Dict[str, float] = {}
+        self.stages: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stop = threading.Event()
+        self._server = None
+        self.path = None
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def time(self, stage: str) -> _StageTimer:
+        """Context manager recording the duration of its block under stage."""
+        return _StageTimer(self, stage)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'run_id': self.run_id,
+                'shard': self.shard,
+                'timestamp': round(time.time(), 3),
+                'uptime': round(time.time() - self.started, 3),
+                'counters': dict(self.counters),
+                'stages': {stage: histogram.snapshot() for stage, histogram in self.stages.items()},
+            }
+
+    def summary(self) -> str:
+        """One heartbeat line: p50/p95 per stage in milliseconds."""
+        with self._lock:
+            parts = [f"{stage} {h.quantile(0.5) * 1000:g}/{h.quantile(0.95) * 1000:g}ms"
+                     for stage, h in self.stages.items()]
+        return ', '.join(parts)
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition of the current values."""
+        labels = f'run_id="{self.run_id}"' + (f',shard="{self.shard}"' if self.shard is not None else '')
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = f"crawler_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{{{labels}}} {value}")
+        lines.append("# TYPE crawler_stage_seconds histogram")
+        for stage, histogram in sorted(snapshot['stages'].items()):
+            cumulative = 0
+            for bound, count in histogram['buckets'].items():
+                cumulative += count
+                lines.append(f'crawler_stage_seconds_bucket{{{labels},stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'crawler_stage_seconds_sum{{{labels},stage="{stage}"}} {histogram["sum"]}')
+            lines.append(f'crawler_stage_seconds_count{{{labels},stage="{stage}"}} {histogram["count"]}')
+        lines.append(f"crawler_uptime_seconds{{{labels}}} {snapshot['uptime']}")
+        return '\n'.join(lines) + '\n'
+
+    def flush(self):
+        """Append the current snapshot to the stats file."""
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(self.snapshot()) + '\n')
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {self.path}: {str(e)}")
+
+    def start_flusher(self, path: str, interval: float = 30.0):
+        """Append a snapshot to path every interval seconds (and once more on close())."""
+        self.path = path
+        if not path or self._flusher is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.flush()
+
+        self._flusher = threading.Thread(target=loop, name='metrics-flush', daemon=True)
+        self._flusher.start()
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> int:
+        """Serve /metrics and /metrics.json on a background thread; returns the bound port."""
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] == '/metrics.json':
+                    body, content_type = json.dumps(metrics.snapshot()).encode(), 'application/json'
+                elif self.path.split('?')[0] == '/metrics':
+                    body, content_type = metrics.prometheus().encode(), 'text/plain; version=0.0.4'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *log_args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        return self._server.server_address[1]
+
+    def close(self):
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,630 @@
+"""
+Scrapy downloader middlewares for the Decimal crawler.
+
+AdaptiveHostThrottleMiddleware replaces the fixed global DOWNLOAD_DELAY and
+RETRY_TIMES with per-onion-host values: each host's download slot gets a delay
+and concurrency derived from that host's observed latency and error rate,
+capped so no single host can take more than its fair share of
+CONCURRENT_REQUESTS.
+
+ProxyPoolMiddleware spreads requests over several local Tor/Privoxy endpoints
+and takes failing ones out of rotation.
+
+HostHealthMiddleware fails requests for onion hosts that keep timing out fast,
+from a negative cache shared with later runs (see host_health.py).
+
+DownloadFilterMiddleware aborts archives, videos, binaries and oversized bodies
+as soon as their headers or first bytes arrive (see download_filter.py).
+"""
+
+import os
+import sys
+import math
+import hashlib
+import time
+import logging
+from typing import Any, Dict
+
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured, StopDownload
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet.error import ConnectionRefusedError as ProxyRefusedError
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler.host_health import HostHealthCache, PROBE, SKIP
+from crawler.download_filter import (DownloadFilter, DEFAULT_ALLOWED_TYPES, ACCEPT, OCR, REJECT, SNIFF,
+                                     REASON_SIZE, media_type)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Responses that mean "back off", not "page missing"
+BACKOFF_HTTP_CODES = {408, 429, 500, 502, 503, 504, 522, 524}
+
+# Privoxy / Tor answers for an onion it could not reach
+HOST_DOWN_HTTP_CODES = {502, 503, 504}
+
+
+class HostState:
+    """Latency / error-rate estimate and the current delay and concurrency for one host."""
+
+    def __init__(self, delay: float, concurrency: int):
+        self.delay = delay
+        self.concurrency = concurrency
+        self.latency = None
+        self.error_rate = 0.0
+        self.responses = 0
+        self.errors = 0
+        self.streak = 0
+        self.last_seen = time.monotonic()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'delay': round(self.delay, 3),
+            'concurrency': self.concurrency,
+            'latency': round(self.latency, 3) if self.latency is not None else None,
+            'error_rate': round(self.error_rate, 3),
+            'responses': self.responses,
+            'errors': self.errors,
+        }
+
+
+class AdaptiveHostThrottleMiddleware:
+    """Per-host AIMD throttle over Scrapy's download slots.
+
+    Healthy hosts earn one extra concurrent request after each run of
+    `concurrency` clean responses and their delay converges to
+    latency / HOST_THROTTLE_TARGET_CONCURRENCY. Timeouts, connection errors and
+    5xx/429 responses halve the host's concurrency and double its delay.
+    Retries are scaled down as a host's error rate rises so dead hosts stop
+    tying up slots: once an attempt's outcome is recorded, its max_retry_times
+    is set from the updated error rate, before RetryMiddleware (which runs after
+    this middleware on the way back) decides whether to retry. A max_retry_times
+    set by the caller is left alone.
+
+    Settings:
+        HOST_THROTTLE_ENABLED             default True
+        HOST_THROTTLE_START_DELAY         delay for a host we know nothing about (default DOWNLOAD_DELAY)
+        HOST_THROTTLE_MIN_DELAY           default 0.25s
+        HOST_THROTTLE_MAX_DELAY           default 30s
+        HOST_THROTTLE_MIN_CONCURRENCY     default 1
+        HOST_THROTTLE_MAX_CONCURRENCY     default 8
+        HOST_THROTTLE_TARGET_CONCURRENCY  requests a host should be serving in parallel (default 2.0)
+        HOST_THROTTLE_ACTIVE_WINDOW       seconds a host counts towards the fair share after its last request (default 60)
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('HOST_THROTTLE_ENABLED', True):
+            raise NotConfigured
+        self.crawler = crawler
+        self.min_delay = settings.getfloat('HOST_THROTTLE_MIN_DELAY', 0.25)
+        self.max_delay = settings.getfloat('HOST_THROTTLE_MAX_DELAY', 30.0)
+        self.start_delay = self._clamp_delay(
+            settings.getfloat('HOST_THROTTLE_START_DELAY', settings.getfloat('DOWNLOAD_DELAY', 1.5)))
+        self.min_concurrency = max(1, settings.getint('HOST_THROTTLE_MIN_CONCURRENCY', 1))
+        self.max_concurrency = max(self.min_concurrency, settings.getint('HOST_THROTTLE_MAX_CONCURRENCY', 8))
+        self.target_concurrency = max(0.1, settings.getfloat('HOST_THROTTLE_TARGET_CONCURRENCY', 2.0))
+        self.active_window = settings.getfloat('HOST_THROTTLE_ACTIVE_WINDOW', 60.0)
+        self.global_budget = max(1, settings.getint('CONCURRENT_REQUESTS', 16))
+        self.max_retries = settings.getint('RETRY_TIMES', 2)
+        self.hosts: Dict[str, HostState] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        # Lets the spider report per-host state in its heartbeat
+        spider.host_throttle = self
+        print(f"🐢 Adaptive host throttle on (delay {self.min_delay}-{self.max_delay}s, "
+              f"concurrency {self.min_concurrency}-{self.max_concurrency}, budget {self.global_budget})")
+
+    def spider_closed(self, spider):
+        summary = self.summary()
+        for key, value in summary.items():
+            self.crawler.stats.set_value(f'host_throttle/{key}', value)
+
+    def _clamp_delay(self, delay: float) -> float:
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def _host(self, request) -> str:
+        return request.meta.get('download_slot') or urlparse_cached(request).hostname or ''
+
+    def _state(self, host: str) -> HostState:
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostState(self.start_delay, self.min_concurrency)
+        return state
+
+    def fair_share(self) -> int:
+        """Per-host concurrency cap: the global budget split across recently active hosts."""
+        cutoff = time.monotonic() - self.active_window
+        active = sum(1 for state in self.hosts.values() if state.last_seen >= cutoff)
+        share = math.ceil(self.global_budget / max(1, active))
+        return max(self.min_concurrency, min(self.max_concurrency, share))
+
+    def _apply(self, host: str, state: HostState):
+        """Push the host's delay/concurrency onto its Scrapy download slot."""
+        state.concurrency = max(self.min_concurrency, min(state.concurrency, self.fair_share()))
+        engine = getattr(self.crawler, 'engine', None)
+        slot = engine.downloader.slots.get(host) if engine is not None else None
+        if slot is not None:
+            slot.delay = state.delay
+            slot.concurrency = state.concurrency
+
+    def process_request(self, request, spider):
+        host = self._host(request)
+        state = self._state(host)
+        state.last_seen = time.monotonic()
+        # Pin the slot key so _apply() and the downloader agree on which slot is this host's
+        request.meta.setdefault('download_slot', host)
+        self._apply(host, state)
+
+    def _scale_retries(self, request, state: HostState):
+        """Retry budget for the request, from the host's error rate including this attempt."""
+        if 'max_retry_times' in request.meta and not request.meta.get('host_throttle_retries'):
+            return  # Set by the caller
+        request.meta['max_retry_times'] = max(0, round(self.max_retries * (1.0 - state.error_rate)))
+        request.meta['host_throttle_retries'] = True
+
+    def process_response(self, request, response, spider):
+        host = self._host(request)
+        if response.status in BACKOFF_HTTP_CODES:
+            state = self._record_failure(host)
+        else:
+            state = self._record_success(host, request.meta.get('download_latency'))
+        self._scale_retries(request, state)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if isinstance(exception, IgnoreRequest):
+            return  # Never sent (e.g. skipped by HostHealthMiddleware)
+        if isinstance(exception, StopDownload):
+            # Cut short by DownloadFilterMiddleware: the host did answer
+            self.process_response(request, exception.response, spider)
+            return
+        self._scale_retries(request, self._record_failure(self._host(request)))
+
+    def _record_success(self, host: str, latency) -> HostState:
+        state = self._state(host)
+        state.responses += 1
+        state.error_rate *= 0.8
+        if latency is not None:
+            state.latency = latency if state.latency is None else 0.7 * state.latency + 0.3 * latency
+            target = state.latency / self.target_concurrency
+            state.delay = self._clamp_delay((state.delay + target) / 2.0)
+
+        # Additive increase: one more parallel request per window of clean responses
+        state.streak += 1
+        if state.streak >= state.concurrency and state.error_rate < 0.1:
+            state.concurrency = min(self.max_concurrency, state.concurrency + 1)
+            state.streak = 0
+        self._apply(host, state)
+        return state
+
+    def _record_failure(self, host: str) -> HostState:
+        state = self._state(host)
+        state.errors += 1
+        state.error_rate = 0.8 * state.error_rate + 0.2
+        state.streak = 0
+        # Multiplicative decrease
+        state.concurrency = max(self.min_concurrency, state.concurrency // 2)
+        state.delay = self._clamp_delay(state.delay * 2.0)
+        self._apply(host, state)
+        return state
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Per-host delay, concurrency, latency and error rate."""
+        return {host: state.to_dict() for host, state in self.hosts.items()}
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregate view across hosts for stats and heartbeats."""
+        states = list(self.hosts.values())
+        if not states:
+            return {'hosts': 0, 'fair_share': self.fair_share(), 'avg_delay': 0.0,
+                    'total_concurrency': 0, 'backed_off_hosts': 0}
+        return {
+            'hosts': len(states),
+            'fair_share': self.fair_share(),
+            'avg_delay': round(sum(s.delay for s in states) / len(states), 3),
+            'total_concurrency': sum(s.concurrency for s in states),
+            'backed_off_hosts': sum(1 for s in states if s.error_rate >= 0.5),
+        }
+
+
+class ProxyEndpoint:
+    """One local Privoxy/Tor egress and its health and throughput counters."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.in_flight = 0
+        self.requests = 0
+        self.responses = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.bytes = 0
+        self.latency_total = 0.0
+        self.down_until = 0.0
+        self.started = time.monotonic()
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.down_until
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = max(1e-6, time.monotonic() - self.started)
+        return {
+            'healthy': self.healthy(time.monotonic()),
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'responses': self.responses,
+            'failures': self.failures,
+            'bytes': self.bytes,
+            'pages_per_min': round(self.responses * 60.0 / elapsed, 2),
+            'kb_per_sec': round(self.bytes / 1024.0 / elapsed, 2),
+            'avg_latency': round(self.latency_total / self.responses, 3) if self.responses else None,
+        }
+
+
+class ProxyPoolMiddleware:
+    """Spread requests over several local Tor/Privoxy proxies instead of a single circuit.
+
+    Sets request.meta['proxy'] for HttpProxyMiddleware, so it must run before it.
+    An endpoint is taken out of rotation for PROXY_POOL_COOLDOWN seconds after
+    PROXY_POOL_MAX_FAILURES consecutive download errors; once the cooldown ends it
+    is tried again and a single success restores it. If every endpoint is down,
+    the one that has been down longest is used rather than stalling the crawl.
+
+    Settings:
+        PROXY_POOL            list (or comma-separated string) of proxy URLs
+        PROXY_POOL_POLICY     'least_loaded' (default) or 'host_hash' (keeps each onion on one circuit)
+        PROXY_POOL_MAX_FAILURES  default 3
+        PROXY_POOL_COOLDOWN      default 60s
+    """
+
+    POLICIES = ('least_loaded', 'host_hash')
+
+    def __init__(self, proxies, policy='least_loaded', max_failures=3, cooldown=60.0, stats=None):
+        if not proxies:
+            raise NotConfigured
+        if policy not in self.POLICIES:
+            raise ValueError(f"PROXY_POOL_POLICY must be one of {self.POLICIES}, got {policy!r}")
+        self.endpoints = [ProxyEndpoint(url) for url in dict.fromkeys(proxies)]
+        self.by_url = {endpoint.url: endpoint for endpoint in self.endpoints}
+        self.policy = policy
+        self.max_failures = max(1, int(max_failures))
+        self.cooldown = float(cooldown)
+        self.stats = stats
+        self._next = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        proxies = settings.getlist('PROXY_POOL')
+        middleware = cls(
+            [proxy.strip() for proxy in proxies if proxy.strip()],
+            policy=settings.get('PROXY_POOL_POLICY', 'least_loaded'),
+            max_failures=settings.getint('PROXY_POOL_MAX_FAILURES', 3),
+            cooldown=settings.getfloat('PROXY_POOL_COOLDOWN', 60.0),
+            stats=crawler.stats,
+        )
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        spider.proxy_pool = self
+        print(f"🧅 Proxy pool: {len(self.endpoints)} endpoints, policy={self.policy}")
+
+    def spider_closed(self, spider):
+        if self.stats is None:
+            return
+        for url, counters in self.snapshot().items():
+            for key, value in counters.items():
+                self.stats.set_value(f'proxy_pool/{url}/{key}', value)
+
+    def choose(self, host: str) -> ProxyEndpoint:
+        now = time.monotonic()
+        healthy = [endpoint for endpoint in self.endpoints if endpoint.healthy(now)]
+        if not healthy:
+            return min(self.endpoints, key=lambda endpoint: endpoint.down_until)
+        if self.policy == 'host_hash':
+            # Rendezvous hashing: a host only moves when its endpoint goes down
+            return max(healthy, key=lambda endpoint: hashlib.blake2b(
+                f'{endpoint.url}|{host}'.encode('utf-8'), digest_size=8).digest())
+        # Least loaded, round-robin among ties so idle endpoints all get traffic
+        self._next = (self._next + 1) % len(healthy)
+        rotated = healthy[self._next:] + healthy[:self._next]
+        return min(rotated, key=lambda endpoint: endpoint.in_flight)
+
+    def process_request(self, request, spider):
+        if 'proxy' in request.meta and 'proxy_pool_endpoint' not in request.meta:
+            return  # Explicit per-request proxy wins
+        endpoint = self.choose(urlparse_cached(request).hostname or '')
+        # Retries carry the previous attempt's meta; re-pick so they can leave a failing endpoint
+        request.meta['proxy'] = endpoint.url
+        request.meta['proxy_pool_endpoint'] = endpoint.url
+        request.meta.pop('_auth_proxy', None)
+        endpoint.in_flight += 1
+        endpoint.requests += 1
+
+    def _release(self, request):
+        endpoint = self.by_url.get(request.meta.get('proxy_pool_endpoint'))
+        if endpoint is not None:
+            endpoint.in_flight = max(0, endpoint.in_flight - 1)
+        return endpoint
+
+    def process_response(self, request, response, spider):
+        endpoint = self._release(request)
+        if endpoint is not None:
+            endpoint.responses += 1
+            endpoint.bytes += len(response.body)
+            endpoint.latency_total += request.meta.get('download_latency') or 0.0
+            endpoint.consecutive_failures = 0
+            endpoint.down_until = 0.0
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if isinstance(exception, StopDownload):
+            self.process_response(request, exception.response, spider)
+            return
+        endpoint = self._release(request)
+        if endpoint is None or isinstance(exception, IgnoreRequest):
+            return
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures >= self.max_failures:
+            endpoint.down_until = time.monotonic() + self.cooldown
+            endpoint.consecutive_failures = 0
+            logger.warning(f"Proxy {endpoint.url} marked unhealthy for {self.cooldown:.0f}s "
+                           f"after {self.max_failures} consecutive failures ({exception.__class__.__name__})")
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Health, load and throughput per proxy endpoint."""
+        return {endpoint.url: endpoint.to_dict() for endpoint in self.endpoints}
+
+
+class HostHealthMiddleware:
+    """Fast-fail requests for onion hosts in a back-off window instead of tying up download slots.
+
+    Connection errors, timeouts and Privoxy gateway errors (502/503/504) count
+    as failures; after HOST_HEALTH_FAILURES in a row the host is skipped for
+    HOST_HEALTH_BACKOFF seconds, then probed with a single request, doubling the
+    window each time the probe fails (up to HOST_HEALTH_MAX_BACKOFF). Requests
+    already waiting in the host's download slot when it goes down are failed
+    too, rather than each waiting out its own timeout. Skipped requests raise
+    IgnoreRequest with request.meta['host_down'] set, so the spider's errback
+    can tell them from real fetch errors. Connection refused is the local
+    proxy's fault and left to ProxyPoolMiddleware.
+
+    Must run after RetryMiddleware (550) so every failed attempt is counted
+    and queued retries to a host that just went down are dropped.
+
+    Settings:
+        HOST_HEALTH_ENABLED      default True
+        HOST_HEALTH_FAILURES     consecutive failures before back-off (default 3)
+        HOST_HEALTH_BACKOFF      first back-off window in seconds (default 300)
+        HOST_HEALTH_MAX_BACKOFF  default 86400
+        HOST_HEALTH_DB_PATH      SQLite file for the cache (default: the main database)
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('HOST_HEALTH_ENABLED', True):
+            raise NotConfigured
+        self.crawler = crawler
+        self.settings = settings
+        self.cache = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        settings = self.settings
+        self.cache = HostHealthCache(
+            settings.get('HOST_HEALTH_DB_PATH') or None,
+            failure_threshold=settings.getint('HOST_HEALTH_FAILURES', 3),
+            base_backoff=settings.getfloat('HOST_HEALTH_BACKOFF', 300.0),
+            max_backoff=settings.getfloat('HOST_HEALTH_MAX_BACKOFF', 86400.0),
+            probe_timeout=settings.getfloat('DOWNLOAD_TIMEOUT', 180.0),
+        )
+        spider.host_health = self
+        down = self.cache.down_hosts()
+        print(f"🪦 Host health cache: {len(self.cache.hosts)} hosts known, {down} in back-off")
+
+    def spider_closed(self, spider):
+        if self.cache is None:
+            return
+        for key, value in self.cache.snapshot().items():
+            self.crawler.stats.set_value(f'host_health/{key}', value)
+        self.cache.close()
+
+    def process_request(self, request, spider):
+        if self.cache is None:
+            return
+        host = urlparse_cached(request).hostname or ''
+        decision = self.cache.allow(host)
+        if decision == SKIP:
+            request.meta['host_down'] = True
+            raise IgnoreRequest(f"{host} is in back-off after repeated connection failures")
+        if decision == PROBE:
+            logger.info(f"Probing {host} after its back-off window")
+        request.meta['host_health_started'] = time.monotonic()
+
+    def process_response(self, request, response, spider):
+        if self.cache is not None and 'host_health_started' in request.meta:
+            host = urlparse_cached(request).hostname or ''
+            if response.status in HOST_DOWN_HTTP_CODES:
+                if self.cache.record_failure(host, f"HTTP {response.status}", self._elapsed(request)):
+                    self._drain_slot(request, host)
+            else:
+                self.cache.record_success(host)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if self.cache is None or isinstance(exception, (IgnoreRequest, ProxyRefusedError)):
+            return
+        if isinstance(exception, StopDownload):
+            self.process_response(request, exception.response, spider)
+            return
+        if 'host_health_started' in request.meta:
+            host = urlparse_cached(request).hostname or ''
+            if self.cache.record_failure(host, exception.__class__.__name__, self._elapsed(request)):
+                self._drain_slot(request, host)
+
+    def _elapsed(self, request) -> float:
+        return time.monotonic() - request.meta.pop('host_health_started')
+
+    def _drain_slot(self, request, host: str):
+        """Fail the requests queued in a host's download slot once it is backed off (after this callback returns)."""
+        engine = getattr(self.crawler, 'engine', None)
+        slot = engine.downloader.slots.get(request.meta.get('download_slot') or host) if engine is not None else None
+        if slot is not None and slot.queue:
+            from twisted.internet import reactor
+            reactor.callLater(0, self._fail_queued, slot, host)
+
+    def _fail_queued(self, slot, host: str):
+        # Each entry was admitted by process_request before the host went down; failing its
+        # Deferred runs the usual process_exception chain and the spider's errback
+        queued = list(slot.queue)
+        slot.queue.clear()
+        for request, deferred in queued:
+            request.meta['host_down'] = True
+            request.meta.pop('host_health_started', None)
+            deferred.errback(IgnoreRequest(f"{host} is in back-off after repeated connection failures"))
+        self.cache.count_skipped(len(queued))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return self.cache.snapshot() if self.cache is not None else {}
+
+
+class DownloadFilterMiddleware:
+    """Abort downloads the crawler cannot use as soon as their headers or first bytes arrive.
+
+    Pages must have an allowed Content-Type and stay under DOWNLOAD_MAX_BYTES.
+    Images and PDFs found while crawling pages are finished (up to
+    OCR_MAX_BYTES) and marked request.meta['download_route'] = 'ocr' for the
+    OCR stage; attachment requests (meta 'ocr_page') only accept those. Bodies
+    typed application/octet-stream, or not typed at all, are judged by their
+    first bytes. Aborted downloads raise StopDownload with
+    request.meta['download_filtered'] describing what was skipped, so the
+    spider's errback can keep a metadata-only record of it.
+
+    Works on the headers_received / bytes_received signals; process_request
+    only resets the per-attempt state a retried request copies along.
+
+    Settings:
+        DOWNLOAD_FILTER_ENABLED  default True
+        DOWNLOAD_ALLOWED_TYPES   page media types, 'text/*' wildcards allowed
+        DOWNLOAD_MAX_BYTES       largest page body (default 64 MiB, 0 = no cap)
+        OCR_ENABLED              route images / PDFs to OCR instead of rejecting them
+        OCR_MAX_BYTES            largest image / PDF (default 8 MiB)
+    """
+
+    _ATTEMPT_KEYS = ('download_route', 'download_sniff', 'download_limit', 'download_received', 'download_declared',
+                     'download_content_type', 'download_filtered')
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('DOWNLOAD_FILTER_ENABLED', True):
+            raise NotConfigured
+        self.crawler = crawler
+        ocr_max_bytes = settings.getint('OCR_MAX_BYTES', 8 * 1024 * 1024) if settings.getbool('OCR_ENABLED', True) else 0
+        self.filter = DownloadFilter(
+            tuple(settings.getlist('DOWNLOAD_ALLOWED_TYPES', list(DEFAULT_ALLOWED_TYPES))),
+            max_bytes=settings.getint('DOWNLOAD_MAX_BYTES', 64 * 1024 * 1024),
+            ocr_max_bytes=ocr_max_bytes,
+        )
+        self.counts = {'aborted': 0, 'routed_ocr': 0, 'bytes_read': 0, 'bytes_saved': 0}
+        self.reasons: Dict[str, int] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.headers_received, signal=signals.headers_received)
+        crawler.signals.connect(middleware.bytes_received, signal=signals.bytes_received)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        spider.download_filter = self
+
+    def spider_closed(self, spider):
+        for key, value in self.snapshot().items():
+            self.crawler.stats.set_value(f'download_filter/{key}', value)
+
+    def process_request(self, request, spider):
+        for key in self._ATTEMPT_KEYS:
+            request.meta.pop(key, None)
+
+    def headers_received(self, headers, body_length, request, spider):
+        if headers.get('Location'):
+            return  # Redirect: the target gets its own verdict
+        meta = request.meta
+        attachment = 'ocr_page' in meta
+        # Twisted's UNKNOWN_LENGTH is not an int
+        declared = body_length if isinstance(body_length, int) else -1
+        content_type = headers.get('Content-Type', b'').decode('latin-1')
+        verdict = self.filter.check_headers(content_type, declared, attachment)
+        if verdict.action == REJECT:
+            self._abort(request, verdict.reason, content_type, declared)
+        if verdict.action == SNIFF and headers.get('Content-Encoding'):
+            # Compressed bytes say nothing about the content; only the size cap applies
+            verdict = verdict._replace(action=ACCEPT)
+        if verdict.action == SNIFF:
+            meta['download_sniff'] = True
+        elif verdict.action == OCR and not attachment:
+            meta['download_route'] = OCR
+            self.counts['routed_ocr'] += 1
+        meta['download_limit'] = self.filter.limit(OCR if attachment else verdict.action)
+        meta['download_declared'] = declared
+        meta['download_content_type'] = content_type
+
+    def bytes_received(self, data, request, spider):
+        meta = request.meta
+        received = meta.get('download_received', 0) + len(data)
+        meta['download_received'] = received
+        if meta.pop('download_sniff', False):
+            attachment = 'ocr_page' in meta
+            verdict = self.filter.check_head(data, attachment)
+            if verdict.action == REJECT:
+                self._abort(request, verdict.reason, meta.get('download_content_type', ''),
+                            meta.get('download_declared', -1), received)
+            if verdict.action == OCR and not attachment:
+                meta['download_route'] = OCR
+                self.counts['routed_ocr'] += 1
+            meta['download_limit'] = self.filter.limit(OCR if attachment else verdict.action)
+        limit = meta.get('download_limit')
+        if limit and received > limit:
+            self._abort(request, REASON_SIZE, meta.get('download_content_type', ''),
+                        meta.get('download_declared', -1), received)
+
+    def _abort(self, request, reason: str, content_type: str, declared: int, received: int = 0):
+        self.counts['aborted'] += 1
+        self.counts['bytes_read'] += received
+        if declared > received:
+            # Chunked bodies have no declared size: what they would have cost is unknown
+            self.counts['bytes_saved'] += declared - received
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        request.meta['download_filtered'] = {
+            'reason': reason,
+            'content_type': media_type(content_type) or None,
+            'declared_bytes': declared if declared >= 0 else None,
+            'bytes_read': received,
+        }
+        raise StopDownload(fail=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        snapshot = dict(self.counts)
+        for reason, count in self.reasons.items():
+            snapshot[f'aborted_{reason}'] = count
+        return snapshot
@@ -0,0 +1,195 @@
+"""
+Near-Duplicate Page Detection
+64-bit SimHash over word shingles of the normalized page text, with a banded SQLite index.
+
+Leak dumps are mirrored across onion hosts with different chrome around the
+same records. A page whose SimHash is within NEAR_DUP_MAX_DISTANCE bits of an
+already analysed page is linked to that page instead of being scanned and
+sent to Gemini again. Each fingerprint is split into four 16-bit bands; two
+fingerprints at Hamming distance <= 3 always share at least one band, so a
+lookup only touches the rows that share a band.
+"""
+
+import os
+import re
+import sys
+import sqlite3
+import hashlib
+import logging
+from typing import Iterable, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.models import DB_PATH
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BANDS = 4
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+MAX_SUPPORTED_DISTANCE = BANDS - 1
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def _to_signed(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def shingle_hashes(text: str, size: int = 3) -> Iterable[int]:
+    """Distinct 64-bit hashes of the word shingles in lower-cased text."""
+    tokens = _TOKEN_RE.findall(text.lower())
+    if len(tokens) < size:
+        shingles = {' '.join(tokens)} if tokens else set()
+    else:
+        shingles = {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+    return [int.from_bytes(hashlib.blake2b(s.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little')
+            for s in shingles]
+
+
+def _bit_counts(hashes) -> list:
+    """For each of the 64 bit positions, how many of the hashes have it set."""
+    if NUMPY_AVAILABLE:
+        bits = np.unpackbits(np.array(hashes, dtype='<u8').view(np.uint8).reshape(-1, 8),
+                             axis=1, bitorder='little')
+        return bits.sum(axis=0, dtype=np.int64).tolist()
+    counts = [0] * 64
+    for value in hashes:
+        for position in range(64):
+            if value >> position & 1:
+                counts[position] += 1
+    return counts
+
+
+def simhash(hashes) -> int:
+    """Combine feature hashes into a 64-bit SimHash (each bit set where most features agree)."""
+    if not hashes:
+        return 0
+    half = len(hashes) / 2
+    return sum(1 << position for position, count in enumerate(_bit_counts(hashes)) if count > half)
+
+
+class SimHashBuilder:
+    """Incremental SimHash for text that arrives in pieces (streamed pages).
+
+    Shingles are de-duplicated per piece rather than per page, so a shingle
+    that recurs across pieces weighs more, and shingles that straddle two
+    pieces are not counted. Mirrors streamed with the same piece size still
+    land within a bit or two of each other.
+    """
+
+    def __init__(self):
+        self.counts = [0] * 64
+        self.features = 0
+        self.tokens = 0
+
+    def update(self, text: str):
+        self.tokens += len(_TOKEN_RE.findall(text))
+        hashes = shingle_hashes(text)
+        if not hashes:
+            return
+        self.features += len(hashes)
+        for position, count in enumerate(_bit_counts(hashes)):
+            self.counts[position] += count
+
+    def digest(self) -> int:
+        half = self.features / 2
+        return sum(1 << position for position, count in enumerate(self.counts) if count > half)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(_to_unsigned(a) ^ _to_unsigned(b)).count('1')
+
+
+def bands(fingerprint: int) -> Tuple[int, ...]:
+    fingerprint = _to_unsigned(fingerprint)
+    return tuple((fingerprint >> (i * BAND_BITS)) & BAND_MASK for i in range(BANDS))
+
+
+class NearDuplicateIndex:
+    """Persistent SimHash index mapping content fingerprints to the first URL seen with them.
+
+    Args:
+        path: SQLite file (defaults to the main scraped data database)
+        max_distance: Hamming distance that still counts as a duplicate (0-3)
+        min_tokens: pages with fewer words are never treated as duplicates
+    """
+
+    def __init__(self, path: str = None, max_distance: int = 3, min_tokens: int = 50):
+        self.path = path or DB_PATH
+        self.max_distance = max(0, min(MAX_SUPPORTED_DISTANCE, int(max_distance)))
+        self.min_tokens = int(min_tokens)
+        self.checked = 0
+        self.duplicates = 0
+        self.too_short = 0
+
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        c = self.conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS content_fingerprints (
+                url TEXT PRIMARY KEY,
+                simhash INTEGER NOT NULL,
+                band0 INTEGER, band1 INTEGER, band2 INTEGER, band3 INTEGER,
+                run_id TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        for i in range(BANDS):
+            c.execute(f"CREATE INDEX IF NOT EXISTS idx_fingerprint_band{i} ON content_fingerprints(band{i})")
+        self.conn.commit()
+
+    def fingerprint(self, text: str) -> Optional[int]:
+        """SimHash of the page text, or None if it is too short to compare safely."""
+        if len(_TOKEN_RE.findall(text)) < self.min_tokens:
+            self.too_short += 1
+            return None
+        return simhash(shingle_hashes(text))
+
+    def fingerprint_builder(self, builder: SimHashBuilder) -> Optional[int]:
+        """Like fingerprint(), for a page hashed piece by piece."""
+        if builder.tokens < self.min_tokens:
+            self.too_short += 1
+            return None
+        return builder.digest()
+
+    def find(self, fingerprint: int, exclude_url: str = None) -> Optional[str]:
+        """URL of the closest indexed page within max_distance, if any."""
+        self.checked += 1
+        where = ' OR '.join(f'band{i} = ?' for i in range(BANDS))
+        best = None
+        for url, other in self.conn.execute(
+                f"SELECT url, simhash FROM content_fingerprints WHERE {where}", bands(fingerprint)):
+            if url == exclude_url:
+                continue
+            distance = hamming_distance(fingerprint, other)
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, url)
+        if best is None:
+            return None
+        self.duplicates += 1
+        return best[1]
+
+    def add(self, url: str, fingerprint: int, run_id: str = None):
+        """Index url's fingerprint (replacing any earlier fingerprint for the same URL)."""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO content_fingerprints (url, simhash, band0, band1, band2, band3, run_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (url, _to_signed(_to_unsigned(fingerprint)), *bands(fingerprint), run_id))
+        self.conn.commit()
+
+    def snapshot(self):
+        return {'checked': self.checked, 'duplicates': self.duplicates, 'too_short': self.too_short}
+
+    def close(self):
+        self.conn.close()
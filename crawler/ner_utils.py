@@ -1,185 +1,359 @@
 import re
 import logging
-from typing import Dict, List, Set
+from typing import Dict, List, Set, Optional
+
+try:
+    import re._parser as _parser
+    import re._constants as _sre
+except ImportError:  # Python < 3.11
+    import sre_parse as _parser
+    import sre_constants as _sre
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def extract_entities(text: str) -> Dict[str, List[str]]:
-    """Enhanced entity extraction with comprehensive Indian PII patterns."""
+# Enhanced regex patterns for Indian PII data
+ENTITY_PATTERNS = {
+    # Aadhaar number patterns (enhanced for better detection)
+    "Aadhaar": [
+        r'\b\d{4}[\s\-]?\d{4}[\s\-]?\d{4}\b',  # Standard format with/without separators
+        r'\b\d{12}\b',  # Continuous 12 digits (excluding phone numbers)
+        r'(?i)(?:aadhaar|aadhar)[\s\-]?(?:number|no|id|card)?[\s\-]*:?[\s]*(\d{4}[\s\-]?\d{4}[\s\-]?\d{4})',
+        r'(?i)(?:uid|unique[\s]+id|unique[\s]+identification)[\s\-]*:?[\s]*(\d{4}[\s\-]?\d{4}[\s\-]?\d{4})',
+        r'(?i)aadhaar[\s]*card[\s]*number[\s]*:?[\s]*(\d{4}[\s\-]?\d{4}[\s\-]?\d{4})',
+        r'(?i)aadhar[\s]*no[\s]*:?[\s]*(\d{4}[\s\-]?\d{4}[\s\-]?\d{4})',
+        r'\b(?:UID|uid)[\s]*[:\-]?[\s]*(\d{4}[\s\-]?\d{4}[\s\-]?\d{4})\b',
+    ],
     
-    # Enhanced regex patterns for Indian PII data
-    patterns = {
-        # Aadhaar number patterns (enhanced for better detection)
-        "Aadhaar": [
-            r'\b\d{4}[\s\-]?\d{4}[\s\-]?\d{4}\b',  # Standard format with/without separators
-            r'\b\d{12}\b',  # Continuous 12 digits (excluding phone numbers)
-            r'(?i)(?:aadhaar|aadhar)[\s\-]?(?:number|no|id|card)?[\s\-]*:?[\s]*(\d{4}[\s\-]?\d{4}[\s\-]?\d{4})',
-            r'(?i)(?:uid|unique[\s]+id|unique[\s]+identification)[\s\-]*:?[\s]*(\d{4}[\s\-]?\d{4}[\s\-]?\d{4})',
-            r'(?i)aadhaar[\s]*card[\s]*number[\s]*:?[\s]*(\d{4}[\s\-]?\d{4}[\s\-]?\d{4})',
-            r'(?i)aadhar[\s]*no[\s]*:?[\s]*(\d{4}[\s\-]?\d{4}[\s\-]?\d{4})',
-            r'\b(?:UID|uid)[\s]*[:\-]?[\s]*(\d{4}[\s\-]?\d{4}[\s\-]?\d{4})\b',
-        ],
-        
-        # PAN card patterns (enhanced)
-        "PAN": [
-            r'\b[A-Z]{5}\d{4}[A-Z]\b',  # Standard PAN format
-            r'(?i)(?:pan|permanent[\s]+account)[\s\-]?(?:number|no|card)?[\s\-]*:?[\s]*([A-Z]{5}\d{4}[A-Z])',
-            r'(?i)(?:tax[\s]+id|income[\s]+tax)[\s\-]*:?[\s]*([A-Z]{5}\d{4}[A-Z])',
-            r'(?i)pan[\s]*card[\s]*number[\s]*:?[\s]*([A-Z]{5}\d{4}[A-Z])',
-            r'(?i)pan[\s]*no[\s]*:?[\s]*([A-Z]{5}\d{4}[A-Z])',
-            r'(?i)permanent[\s]*account[\s]*no[\s]*:?[\s]*([A-Z]{5}\d{4}[A-Z])',
-        ],
-        
-        # Phone number patterns (comprehensive)
-        "Phone": [
-            r'\b(?:\+91[\s\-]?)?[6-9]\d{9}\b',  # Indian mobile numbers
-            r'\b(?:0\d{2,4}[\s\-]?\d{6,8})\b',  # Landline numbers
-            r'(?i)(?:phone|mobile|contact|cell)[\s\-]?(?:number|no)?[\s\-]*:?[\s]*(\+?91[\s\-]?[6-9]\d{9})',
-            r'(?i)(?:whatsapp|wa)[\s\-]*:?[\s]*(\+?91[\s\-]?[6-9]\d{9})',
-            r'\b(?:\+91)?[\s\-]?[789]\d{9}\b',  # Alternative mobile pattern
-        ],
-        
-        # Email patterns (enhanced)
-        "Email": [
-            r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b',
-            r'(?i)(?:email|e-mail|mail)[\s\-]*:?[\s]*([A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,})',
-            r'\b[A-Za-z0-9._%+-]+@(?:gmail|yahoo|hotmail|outlook|rediffmail|sify)\.(?:com|in|co\.in)\b',
-        ],
-        
-        # Banking information
-        "Bank_Account": [
-            r'\b\d{9,18}\b',  # Generic bank account pattern
-            r'(?i)(?:account|a/c)[\s\-]?(?:number|no)?[\s\-]*:?[\s]*(\d{9,18})',
-            r'(?i)(?:savings|current)[\s\-]?(?:account|a/c)?[\s\-]*:?[\s]*(\d{9,18})',
-        ],
-        
-        # IFSC codes (enhanced)
-        "IFSC": [
-            r'\b[A-Z]{4}0[A-Z0-9]{6}\b',
-            r'(?i)(?:ifsc|bank[\s]+code|routing[\s]+code)[\s\-]*:?[\s]*([A-Z]{4}0[A-Z0-9]{6})',
-            r'(?i)(?:swift|branch)[\s\-]?(?:code)?[\s\-]*:?[\s]*([A-Z]{4}0[A-Z0-9]{6})',
-        ],
-        
-        # Credit/Debit card patterns
-        "Credit_Card": [
-            r'\b(?:\d{4}[\s\-]?){3}\d{4}\b',
-            r'(?i)(?:card|cc|debit|credit)[\s\-]?(?:number|no)?[\s\-]*:?[\s]*(\d{4}[\s\-]?\d{4}[\s\-]?\d{4}[\s\-]?\d{4})',
-            r'\b(?:4\d{3}|5[1-5]\d{2}|6011|3[47]\d{2})[\s\-]?\d{4}[\s\-]?\d{4}[\s\-]?\d{4}\b',  # Visa, MC, Amex patterns
-        ],
-        
-        # Telecom data patterns
-        "Telecom_Data": [
-            r'(?i)(?:imei)[\s\-]*:?[\s]*(\d{15})',  # IMEI numbers
-            r'(?i)(?:imsi)[\s\-]*:?[\s]*(\d{15,16})',  # IMSI numbers
-            r'(?i)(?:msisdn)[\s\-]*:?[\s]*(\d{10,15})',  # MSISDN
-            r'(?i)(?:sim)[\s\-]?(?:id|number)?[\s\-]*:?[\s]*(\d{10,20})',
-            r'(?i)(?:subscriber)[\s\-]?(?:id|number)?[\s\-]*:?[\s]*(\d{10,20})',
-            r'\b(?:IMEI|imei)\s*[:\-]?\s*(\d{15})\b',
-        ],
-        
-        # Government ID patterns (enhanced)
-        "Government_ID": [
-            r'(?i)(?:passport)[\s\-]?(?:number|no)?[\s\-]*:?[\s]*([A-Z]\d{7}|[A-Z]{2}\d{7})',  # Indian passport
-            r'(?i)(?:driving[\s]+license|dl|license)[\s\-]?(?:number|no)?[\s\-]*:?[\s]*([A-Z]{2}\d{13})',  # Driving license
-            r'(?i)(?:voter[\s]+id|election[\s]+id|epic[\s]+no)[\s\-]*:?[\s]*([A-Z]{3}\d{7})',  # Voter ID
-            r'(?i)(?:ration[\s]+card|ration[\s]+card[\s]+number)[\s\-]*:?[\s]*([A-Z0-9]{10,15})',  # Ration card
-            r'(?i)(?:passport[\s]+no|passport[\s]+number)[\s\-]*:?[\s]*([A-Z]\d{7}|[A-Z]{2}\d{7})',
-            r'(?i)(?:dl[\s]+no|license[\s]+no)[\s\-]*:?[\s]*([A-Z]{2}\d{13})',
-            r'(?i)(?:epic)[\s\-]*:?[\s]*([A-Z]{3}\d{7})',
-        ],
-        
-        # KYC document references (enhanced)
-        "KYC_Documents": [
-            r'(?i)(?:kyc|know[\s]+your[\s]+customer)',
-            r'(?i)(?:identity[\s]+proof|id[\s]+proof|identity[\s]+document)',
-            r'(?i)(?:address[\s]+proof|residential[\s]+proof)',
-            r'(?i)(?:income[\s]+proof|salary[\s]+slip|income[\s]+certificate)',
-            r'(?i)(?:bank[\s]+statement|account[\s]+statement)',
-            r'(?i)(?:kyc[\s]+documents|kyc[\s]+papers)',
-            r'(?i)(?:verification[\s]+documents|verification[\s]+papers)',
-            r'(?i)(?:document[\s]+verification|paper[\s]+verification)',
-            r'(?i)(?:customer[\s]+verification|customer[\s]+documents)',
-        ],
-        
-        # IP addresses
-        "IP_Address": [
-            r'\b(?:\d{1,3}\.){3}\d{1,3}\b',  # IPv4
-            r'\b(?:[0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}\b',  # IPv6
-        ],
-        
-        # Cryptocurrency wallets
-        "Crypto_Wallet": [
-            r'\b[13][a-km-zA-HJ-NP-Z1-9]{25,34}\b',  # Bitcoin
-            r'\b0x[a-fA-F0-9]{40}\b',  # Ethereum
-            r'\b4[0-9AB][1-9A-HJ-NP-Za-km-z]{93}\b',  # Monero
-        ],
-        
-        # UPI IDs
-        "UPI_ID": [
-            r'\b[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\b',  # Generic UPI pattern
-            r'(?i)[a-z0-9._%+-]+@(?:paytm|phonepe|googlepay|amazonpay|ybl|okhdfcbank|oksbi|okaxis)\b',
-        ],
-        
-        # GST numbers
-        "GST_Number": [
-            r'\b\d{2}[A-Z]{5}\d{4}[A-Z]\d[A-Z]\d\b',  # GST format
-            r'(?i)(?:gstin|gst[\s]+number)[\s\-]*:?[\s]*(\d{2}[A-Z]{5}\d{4}[A-Z]\d[A-Z]\d)',
-        ],
-        
-        # EPF/PF numbers
-        "EPF_Number": [
-            r'(?i)(?:epf|pf|provident[\s]+fund)[\s\-]?(?:number|no)?[\s\-]*:?[\s]*([A-Z]{2}/[A-Z]{3}/\d{7}/\d{3}/\d{7})',
-            r'\b[A-Z]{2}/[A-Z]{3}/\d{7}/\d{3}/\d{7}\b',
-        ],
-    }
+    # PAN card patterns (enhanced)
+    "PAN": [
+        r'\b[A-Z]{5}\d{4}[A-Z]\b',  # Standard PAN format
+        r'(?i)(?:pan|permanent[\s]+account)[\s\-]?(?:number|no|card)?[\s\-]*:?[\s]*([A-Z]{5}\d{4}[A-Z])',
+        r'(?i)(?:tax[\s]+id|income[\s]+tax)[\s\-]*:?[\s]*([A-Z]{5}\d{4}[A-Z])',
+        r'(?i)pan[\s]*card[\s]*number[\s]*:?[\s]*([A-Z]{5}\d{4}[A-Z])',
+        r'(?i)pan[\s]*no[\s]*:?[\s]*([A-Z]{5}\d{4}[A-Z])',
+        r'(?i)permanent[\s]*account[\s]*no[\s]*:?[\s]*([A-Z]{5}\d{4}[A-Z])',
+    ],
     
-    detected_entities = {}
+    # Phone number patterns (comprehensive)
+    "Phone": [
+        r'\b(?:\+91[\s\-]?)?[6-9]\d{9}\b',  # Indian mobile numbers
+        r'\b(?:0\d{2,4}[\s\-]?\d{6,8})\b',  # Landline numbers
+        r'(?i)(?:phone|mobile|contact|cell)[\s\-]?(?:number|no)?[\s\-]*:?[\s]*(\+?91[\s\-]?[6-9]\d{9})',
+        r'(?i)(?:whatsapp|wa)[\s\-]*:?[\s]*(\+?91[\s\-]?[6-9]\d{9})',
+        r'\b(?:\+91)?[\s\-]?[789]\d{9}\b',  # Alternative mobile pattern
+    ],
     
-    for entity_type, pattern_list in patterns.items():
-        matches = set()  # Use set to avoid duplicates
-        
-        for pattern in pattern_list:
-            try:
-                found_matches = re.findall(pattern, text, re.IGNORECASE | re.MULTILINE)
-                if found_matches:
-                    # Handle both string matches and tuple matches (from groups)
-                    for match in found_matches:
-                        if isinstance(match, tuple):
-                            # Extract non-empty groups
-                            for group in match:
-                                if group.strip():
-                                    matches.add(group.strip())
-                        else:
-                            matches.add(match.strip())
-            except re.error as e:
-                logger.warning(f"Regex error for pattern {pattern}: {e}")
+    # Email patterns (enhanced)
+    "Email": [
+        r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b',
+        r'(?i)(?:email|e-mail|mail)[\s\-]*:?[\s]*([A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,})',
+        r'\b[A-Za-z0-9._%+-]+@(?:gmail|yahoo|hotmail|outlook|rediffmail|sify)\.(?:com|in|co\.in)\b',
+    ],
+    
+    # Banking information
+    "Bank_Account": [
+        r'\b\d{9,18}\b',  # Generic bank account pattern
+        r'(?i)(?:account|a/c)[\s\-]?(?:number|no)?[\s\-]*:?[\s]*(\d{9,18})',
+        r'(?i)(?:savings|current)[\s\-]?(?:account|a/c)?[\s\-]*:?[\s]*(\d{9,18})',
+    ],
+    
+    # IFSC codes (enhanced)
+    "IFSC": [
+        r'\b[A-Z]{4}0[A-Z0-9]{6}\b',
+        r'(?i)(?:ifsc|bank[\s]+code|routing[\s]+code)[\s\-]*:?[\s]*([A-Z]{4}0[A-Z0-9]{6})',
+        r'(?i)(?:swift|branch)[\s\-]?(?:code)?[\s\-]*:?[\s]*([A-Z]{4}0[A-Z0-9]{6})',
+    ],
+    
+    # Credit/Debit card patterns
+    "Credit_Card": [
+        r'\b(?:\d{4}[\s\-]?){3}\d{4}\b',
+        r'(?i)(?:card|cc|debit|credit)[\s\-]?(?:number|no)?[\s\-]*:?[\s]*(\d{4}[\s\-]?\d{4}[\s\-]?\d{4}[\s\-]?\d{4})',
+        r'\b(?:4\d{3}|5[1-5]\d{2}|6011|3[47]\d{2})[\s\-]?\d{4}[\s\-]?\d{4}[\s\-]?\d{4}\b',  # Visa, MC, Amex patterns
+    ],
+    
+    # Telecom data patterns
+    "Telecom_Data": [
+        r'(?i)(?:imei)[\s\-]*:?[\s]*(\d{15})',  # IMEI numbers
+        r'(?i)(?:imsi)[\s\-]*:?[\s]*(\d{15,16})',  # IMSI numbers
+        r'(?i)(?:msisdn)[\s\-]*:?[\s]*(\d{10,15})',  # MSISDN
+        r'(?i)(?:sim)[\s\-]?(?:id|number)?[\s\-]*:?[\s]*(\d{10,20})',
+        r'(?i)(?:subscriber)[\s\-]?(?:id|number)?[\s\-]*:?[\s]*(\d{10,20})',
+        r'\b(?:IMEI|imei)\s*[:\-]?\s*(\d{15})\b',
+    ],
+    
+    # Government ID patterns (enhanced)
+    "Government_ID": [
+        r'(?i)(?:passport)[\s\-]?(?:number|no)?[\s\-]*:?[\s]*([A-Z]\d{7}|[A-Z]{2}\d{7})',  # Indian passport
+        r'(?i)(?:driving[\s]+license|dl|license)[\s\-]?(?:number|no)?[\s\-]*:?[\s]*([A-Z]{2}\d{13})',  # Driving license
+        r'(?i)(?:voter[\s]+id|election[\s]+id|epic[\s]+no)[\s\-]*:?[\s]*([A-Z]{3}\d{7})',  # Voter ID
+        r'(?i)(?:ration[\s]+card|ration[\s]+card[\s]+number)[\s\-]*:?[\s]*([A-Z0-9]{10,15})',  # Ration card
+        r'(?i)(?:passport[\s]+no|passport[\s]+number)[\s\-]*:?[\s]*([A-Z]\d{7}|[A-Z]{2}\d{7})',
+        r'(?i)(?:dl[\s]+no|license[\s]+no)[\s\-]*:?[\s]*([A-Z]{2}\d{13})',
+        r'(?i)(?:epic)[\s\-]*:?[\s]*([A-Z]{3}\d{7})',
+    ],
+    
+    # KYC document references (enhanced)
+    "KYC_Documents": [
+        r'(?i)(?:kyc|know[\s]+your[\s]+customer)',
+        r'(?i)(?:identity[\s]+proof|id[\s]+proof|identity[\s]+document)',
+        r'(?i)(?:address[\s]+proof|residential[\s]+proof)',
+        r'(?i)(?:income[\s]+proof|salary[\s]+slip|income[\s]+certificate)',
+        r'(?i)(?:bank[\s]+statement|account[\s]+statement)',
+        r'(?i)(?:kyc[\s]+documents|kyc[\s]+papers)',
+        r'(?i)(?:verification[\s]+documents|verification[\s]+papers)',
+        r'(?i)(?:document[\s]+verification|paper[\s]+verification)',
+        r'(?i)(?:customer[\s]+verification|customer[\s]+documents)',
+    ],
+    
+    # IP addresses
+    "IP_Address": [
+        r'\b(?:\d{1,3}\.){3}\d{1,3}\b',  # IPv4
+        r'\b(?:[0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}\b',  # IPv6
+    ],
+    
+    # Cryptocurrency wallets
+    "Crypto_Wallet": [
+        r'\b[13][a-km-zA-HJ-NP-Z1-9]{25,34}\b',  # Bitcoin
+        r'\b0x[a-fA-F0-9]{40}\b',  # Ethereum
+        r'\b4[0-9AB][1-9A-HJ-NP-Za-km-z]{93}\b',  # Monero
+    ],
+    
+    # UPI IDs
+    "UPI_ID": [
+        r'\b[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\b',  # Generic UPI pattern
+        r'(?i)[a-z0-9._%+-]+@(?:paytm|phonepe|googlepay|amazonpay|ybl|okhdfcbank|oksbi|okaxis)\b',
+    ],
+    
+    # GST numbers
+    "GST_Number": [
+        r'\b\d{2}[A-Z]{5}\d{4}[A-Z]\d[A-Z]\d\b',  # GST format
+        r'(?i)(?:gstin|gst[\s]+number)[\s\-]*:?[\s]*(\d{2}[A-Z]{5}\d{4}[A-Z]\d[A-Z]\d)',
+    ],
+    
+    # EPF/PF numbers
+    "EPF_Number": [
+        r'(?i)(?:epf|pf|provident[\s]+fund)[\s\-]?(?:number|no)?[\s\-]*:?[\s]*([A-Z]{2}/[A-Z]{3}/\d{7}/\d{3}/\d{7})',
+        r'\b[A-Z]{2}/[A-Z]{3}/\d{7}/\d{3}/\d{7}\b',
+    ],
+}
+
+# Characters that re.IGNORECASE folds onto ASCII letters although str.lower() keeps them apart
+_CASEFOLD_ALIASES = ('\u0131', '\u017f')  # dotless i, long s
+
+_DIGIT_ANCHOR = re.compile(r'\b\d')
+
+
+def _literal_prefixes(items) -> Optional[Set[str]]:
+    """Return the literal strings every match of a parsed pattern must start with.
+
+    Only patterns that open with literal text (optionally a branch of literal
+    alternatives, as in ``(?i)(?:phone|mobile|...)``) qualify; anything else
+    returns None. Leading word boundaries are skipped since they do not move the
+    match start.
+    """
+    items = list(items)
+    while items and items[0] == (_sre.AT, _sre.AT_BOUNDARY):
+        items.pop(0)
+    prefixes = _leading_literals(items)
+    prefixes = {prefix.lower() for prefix in prefixes}
+    if '' in prefixes or not all(prefix.isascii() for prefix in prefixes):
+        return None
+    return prefixes
+
+
+def _leading_literals(items) -> Set[str]:
+    """Literal text at the start of a parsed (sub)pattern; '' marks a non-literal start."""
+    prefixes = {''}
+    for op, arg in items:
+        if op is _sre.LITERAL:
+            prefixes = {prefix + chr(arg) for prefix in prefixes}
+            continue
+        if op is _sre.BRANCH:
+            branch_prefixes = set()
+            for branch in arg[1]:
+                branch_prefixes.update(_leading_literals(branch))
+            prefixes = {prefix + found for prefix in prefixes for found in branch_prefixes}
+        break
+    return prefixes
+
+
+def _starts_with_digit(items) -> bool:
+    """Check whether every match of a parsed (sub)pattern starts with a digit."""
+    if not items:
+        return False
+    op, arg = items[0]
+    if op is _sre.LITERAL:
+        return chr(arg).isdigit()
+    if op is _sre.IN:
+        for set_op, set_arg in arg:
+            if set_op is _sre.CATEGORY and set_arg is _sre.CATEGORY_DIGIT:
+                continue
+            if set_op is _sre.LITERAL and chr(set_arg).isdigit():
                 continue
+            if set_op is _sre.RANGE and ord('0') <= set_arg[0] <= set_arg[1] <= ord('9'):
+                continue
+            return False
+        return True
+    if op in (_sre.MAX_REPEAT, _sre.MIN_REPEAT):
+        return arg[0] >= 1 and _starts_with_digit(list(arg[2]))
+    if op is _sre.SUBPATTERN:
+        return _starts_with_digit(list(arg[3]))
+    if op is _sre.BRANCH:
+        return all(_starts_with_digit(list(branch)) for branch in arg[1])
+    return False
+
+
+class _PatternScanner:
+    """One compiled entity pattern plus the anchor used to find its candidate start positions."""
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.regex = re.compile(pattern, re.IGNORECASE | re.MULTILINE)
+        self.literals = None
+        self.digit_anchored = False
+
+        items = list(_parser.parse(pattern, re.IGNORECASE | re.MULTILINE))
+        if items and items[0] == (_sre.AT, _sre.AT_BOUNDARY):
+            self.digit_anchored = _starts_with_digit(items[1:])
+        if not self.digit_anchored:
+            self.literals = _literal_prefixes(items)
+
+    def findall(self, text: str, positions: Optional[List[int]]) -> List:
+        """Equivalent of re.findall(), optionally only trying the given start positions."""
+        if positions is None:
+            return self.regex.findall(text)
+        results = []
+        groups = self.regex.groups
+        end = 0
+        for pos in positions:
+            if pos < end:
+                continue  # findall() never returns overlapping matches
+            m = self.regex.match(text, pos)
+            if m is None:
+                continue
+            end = m.end() if m.end() > pos else pos + 1
+            if groups == 0:
+                results.append(m.group(0))
+            elif groups == 1:
+                results.append(m.group(1) or '')
+            else:
+                results.append(m.groups(''))
+        return results
+
+
+class EntityEngine:
+    """Precompiled entity scanner.
+
+    Patterns are compiled once. Instead of letting each of the ~60 patterns walk
+    the whole page, the engine makes one cheap pass to collect anchor positions
+    (keyword literals in the lowercased text, and word-initial digits) and only
+    runs a pattern where one of its anchors occurs. Patterns without a usable
+    anchor fall back to a full re.findall() scan. Results are identical to
+    running every pattern with re.findall().
+    """
+
+    def __init__(self, patterns: Dict[str, List[str]] = None):
+        patterns = ENTITY_PATTERNS if patterns is None else patterns
+        self.scanners: Dict[str, List[_PatternScanner]] = {}
+        for entity_type, pattern_list in patterns.items():
+            scanners = []
+            for pattern in pattern_list:
+                try:
+                    scanners.append(_PatternScanner(pattern))
+                except re.error as e:
+                    logger.warning(f"Regex error for pattern {pattern}: {e}")
+            self.scanners[entity_type] = scanners
+
+        self.literals = sorted({lit for scanners in self.scanners.values()
+                                for scanner in scanners if scanner.literals
+                                for lit in scanner.literals})
+
+    def _anchor_positions(self, text: str):
+        """Collect candidate start positions for every anchored pattern in one pass."""
+        lowered = text.lower()
+        literal_positions = None
+        if len(lowered) == len(text) and not any(ch in text for ch in _CASEFOLD_ALIASES):
+            literal_positions = {}
+            for literal in self.literals:
+                found = []
+                index = lowered.find(literal)
+                while index != -1:
+                    found.append(index)
+                    index = lowered.find(literal, index + 1)
+                literal_positions[literal] = found
+        digit_positions = [m.start() for m in _DIGIT_ANCHOR.finditer(text)]
+        return literal_positions, digit_positions
+
+    def scan(self, entity_type: str, text: str, anchors=None) -> Set[str]:
+        """Return the raw (unfiltered) matches for one category."""
+        literal_positions, digit_positions = anchors or self._anchor_positions(text)
+        matches = set()
+        for scanner in self.scanners.get(entity_type, []):
+            positions = None
+            if scanner.literals and literal_positions is not None:
+                positions = sorted({pos for lit in scanner.literals for pos in literal_positions[lit]})
+            elif scanner.digit_anchored:
+                positions = digit_positions
+            for match in scanner.findall(text, positions):
+                # Handle both string matches and tuple matches (from groups)
+                if isinstance(match, tuple):
+                    # Extract non-empty groups
+                    for group in match:
+                        if group.strip():
+                            matches.add(group.strip())
+                else:
+                    matches.add(match.strip())
+        return matches
+
+    def extract(self, text: str) -> Dict[str, List[str]]:
+        anchors = self._anchor_positions(text)
+        detected_entities = {}
         
-        # Filter out very short or invalid matches
-        filtered_matches = []
-        for match in matches:
-            if len(match) >= 3:  # Minimum length filter
-    # Additional validation for specific entity types
-                if entity_type == "Aadhaar":
-                    clean_match = match.replace(' ', '').replace('-', '')
-                    if len(clean_match) != 12 or not clean_match.isdigit():
-                        continue
-                    # Basic validation - exclude phone numbers (starting with 6-9)
-                    if clean_match.startswith(('0', '1', '2', '3', '4', '5')):
-                        continue
-                if entity_type == "PAN":
-                    if len(match) != 10:
-                        continue
-                    # Enhanced PAN validation
-                    if not re.match(r'^[A-Z]{5}[0-9]{4}[A-Z]$', match.upper()):
-                        continue
-                filtered_matches.append(match)
+        for entity_type in self.scanners:
+            matches = self.scan(entity_type, text, anchors)
+            
+            # Filter out very short or invalid matches
+            filtered_matches = []
+            for match in matches:
+                if len(match) >= 3:  # Minimum length filter
+                    # Additional validation for specific entity types
+                    if entity_type == "Aadhaar":
+                        clean_match = match.replace(' ', '').replace('-', '')
+                        if len(clean_match) != 12 or not clean_match.isdigit():
+                            continue
+                        # Basic validation - exclude phone numbers (starting with 6-9)
+                        if clean_match.startswith(('0', '1', '2', '3', '4', '5')):
+                            continue
+                    if entity_type == "PAN":
+                        if len(match) != 10:
+                            continue
+                        # Enhanced PAN validation
+                        if not re.match(r'^[A-Z]{5}[0-9]{4}[A-Z]$', match.upper()):
+                            continue
+                    filtered_matches.append(match)
+            
+            if filtered_matches:
+                detected_entities[entity_type] = filtered_matches
         
-        if filtered_matches:
-            detected_entities[entity_type] = filtered_matches
-    
+        return detected_entities
+
+
+_engine = None
+
+
+def get_entity_engine() -> EntityEngine:
+    """Return the shared EntityEngine, compiling it on first use."""
+    global _engine
+    if _engine is None:
+        _engine = EntityEngine()
+    return _engine
+
+
+def extract_entities(text: str) -> Dict[str, List[str]]:
+    """Enhanced entity extraction with comprehensive Indian PII patterns."""
+    detected_entities = get_entity_engine().extract(text)
     logger.info(f"Entity extraction completed. Found {len(detected_entities)} entity types.")
     return detected_entities
 
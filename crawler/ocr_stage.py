@@ -0,0 +1,124 @@
+"""
+OCR Attachment Stage
+Runs Tesseract over images and PDFs linked from leak pages on worker threads, off the crawl reactor.
+
+The spider downloads attachments through Scrapy (same proxies and host
+throttling as pages, capped at OCR_MAX_BYTES) and submits the bytes here.
+Tesseract and pdftoppm run as child processes, so a few threads keep several
+documents in OCR at once while the reactor goes on fetching pages. Entities
+found in an attachment are handed to on_result(page_url, attachment_url, fields)
+to be written against the row of the page that linked it.
+"""
+
+import time
+import logging
+from typing import Any, Callable, Dict, NamedTuple, Optional
+from urllib.parse import urlparse
+
+from crawler.ner_utils import extract_entities
+from crawler.download_filter import sniff_suffix
+from crawler.worker_stage import BoundedWorkerStage
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# URL extensions worth downloading (ocr_parser.get_supported_formats() plus .tif)
+ATTACHMENT_SUFFIXES = {
+    '.pdf': '.pdf',
+    '.png': '.png',
+    '.jpg': '.jpg',
+    '.jpeg': '.jpg',
+    '.tif': '.tiff',
+    '.tiff': '.tiff',
+    '.bmp': '.bmp',
+}
+
+
+class OCRJob(NamedTuple):
+    page_url: str
+    attachment_url: str
+    body: bytes
+    suffix: str
+
+
+def attachment_suffix(url: str) -> Optional[str]:
+    """Normalized file extension if url looks like an image or PDF the OCR stage can read."""
+    try:
+        path = urlparse(url).path.lower()
+    except ValueError:
+        return None
+    dot = path.rfind('.')
+    if dot == -1 or '/' in path[dot:]:
+        return None
+    return ATTACHMENT_SUFFIXES.get(path[dot:])
+
+
+class OCRStage(BoundedWorkerStage):
+    """Bounded queue of downloaded attachments, OCR'd and scanned for entities by worker threads.
+
+    Memory is bounded by max_queue x the download cap: a full queue drops new attachments.
+
+    Args:
+        ocr_processor: OCRDocumentProcessor shared by all workers
+        on_result: called as on_result(page_url, attachment_url, fields) from a worker thread
+        workers: documents OCR'd concurrently
+        max_queue: downloaded attachments allowed to wait for a free worker
+        language: Tesseract language code(s), e.g. 'eng' or 'eng+hin'
+        max_pdf_pages: pages OCR'd per PDF
+        metrics: optional CrawlMetrics; each document is timed under the 'ocr' stage
+    """
+
+    def __init__(self, ocr_processor, on_result: Callable[[str, str, Dict[str, Any]], None],
+                 workers: int = 2, max_queue: int = 20, language: str = 'eng', max_pdf_pages: int = 5,
+                 metrics=None):
+        self.ocr_processor = ocr_processor
+        self.on_result = on_result
+        self.language = language
+        self.max_pdf_pages = max(1, int(max_pdf_pages))
+        self.metrics = metrics
+        self.entities_found = 0
+        super().__init__(workers, max_queue, 'drop', name='ocr-stage')
+
+    def submit(self, page_url: str, attachment_url: str, body: bytes, suffix: str) -> bool:
+        """Queue a downloaded attachment. Returns False if the queue was full."""
+        return super().submit(attachment_url, OCRJob(page_url, attachment_url, body, suffix))
+
+    def process(self, attachment_url: str, job: OCRJob):
+        started = time.perf_counter()
+        result = self.ocr_processor.extract_text_from_bytes(job.body, job.suffix, self.language,
+                                                            max_pages=self.max_pdf_pages)
+        if self.metrics:
+            self.metrics.observe('ocr', time.perf_counter() - started)
+            self.metrics.inc('ocr_documents')
+
+        text = result.get('cleaned_text', '')
+        entities = extract_entities(text) if text else {}
+        flat_entities = [f"{category}:{value}" for category, values in entities.items() for value in values]
+        with self._cond:
+            self.entities_found += len(flat_entities)
+        if self.metrics:
+            self.metrics.inc('ocr_entities', len(flat_entities))
+
+        self.on_result(job.page_url, attachment_url, {
+            'kind': job.suffix.lstrip('.'),
+            'size': len(job.body),
+            'text_chars': len(text),
+            'confidence': result.get('confidence', 0),
+            'entities': ','.join(flat_entities),
+            'error': result.get('error'),
+        })
+        if not result.get('processing_successful'):
+            raise RuntimeError(result.get('error', 'OCR failed'))
+        if flat_entities:
+            print(f"🖼️ OCR found {len(flat_entities)} entities in {attachment_url} (linked from {job.page_url})")
+
+    def on_failure(self, attachment_url: str, error: Exception):
+        if self.metrics:
+            self.metrics.inc('ocr_failures')
+        print(f"⚠ OCR failed for {attachment_url}: {str(error)}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        snapshot = super().snapshot()
+        snapshot['entities'] = self.entities_found
+        return snapshot
@@ -0,0 +1,299 @@
+"""
+Scrapy item pipelines for the Decimal crawler.
+
+WriteBehindPipeline keeps SQLite commits out of the crawl's hot path: items are
+handed to a background writer thread through a bounded buffer and group-committed
+with insert_data_batch() once a batch fills up or the flush interval expires.
+Late AI verdicts and OCR results go through the same writer and are applied in
+the same transaction as the rows queued before them, so each batch is one commit.
+The reactor thread never waits on the writer: when the buffer is full, entries
+spill to a bounded overflow list that the writer drains in order, and the crawl
+engine is paused until it is empty. Responses already in flight can still fill
+the overflow; entries beyond it are dropped, counted and logged.
+"""
+
+import os
+import sys
+import time
+import queue
+import signal
+import sqlite3
+import logging
+import threading
+from collections import deque
+
+from scrapy import signals
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.models import connect_database, insert_data_batch, update_ai_analysis
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_FLUSH = object()
+_STOP = object()
+
+
+class _Update:
+    """Buffered update (update_ai_analysis() by default) for an already queued row."""
+
+    def __init__(self, url, fields, apply=update_ai_analysis):
+        self.url = url
+        self.fields = fields
+        self.apply = apply
+
+
+class WriteBehindPipeline:
+    """Bounded write-behind buffer that group-commits crawled pages.
+
+    Settings:
+        WRITE_BEHIND_BATCH_SIZE      rows per transaction (default 100)
+        WRITE_BEHIND_FLUSH_INTERVAL  max seconds a row may wait in the buffer (default 5)
+        WRITE_BEHIND_MAX_PENDING     buffer capacity; further entries overflow (default 5000)
+        WRITE_BEHIND_MAX_OVERFLOW    overflow capacity; further entries are dropped (default 5000)
+        WRITE_BEHIND_FLUSH_SIGNAL    OS signal name that forces a flush (default SIGUSR1)
+    """
+
+    def __init__(self, batch_size=100, flush_interval=5.0, max_pending=5000,
+                 flush_signal='SIGUSR1', stats=None, max_overflow=5000, engine=None):
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.flush_signal = flush_signal
+        self.stats = stats
+        self.queue = queue.Queue(maxsize=max(1, int(max_pending)))
+        self.rows_written = 0
+        self.rows_received = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.updates_applied = 0
+        self.overflowed = 0
+        self.dropped = 0
+        self.max_overflow = max(0, int(max_overflow))
+        # Returns the crawl engine to pause while entries overflow (None: nothing to pause)
+        self.engine = engine
+        self.paused = False
+        # Entries that arrived while the buffer was full, oldest first (guarded by _lock)
+        self._overflow = deque()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = None
+        self.metrics = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        pipeline = cls(
+            batch_size=settings.getint('WRITE_BEHIND_BATCH_SIZE', 100),
+            flush_interval=settings.getfloat('WRITE_BEHIND_FLUSH_INTERVAL', 5.0),
+            max_pending=settings.getint('WRITE_BEHIND_MAX_PENDING', 5000),
+            flush_signal=settings.get('WRITE_BEHIND_FLUSH_SIGNAL', 'SIGUSR1'),
+            stats=crawler.stats,
+            max_overflow=settings.getint('WRITE_BEHIND_MAX_OVERFLOW', 5000),
+            # The engine is created after the pipelines
+            engine=lambda: crawler.engine,
+        )
+        crawler.signals.connect(pipeline.spider_idle, signal=signals.spider_idle)
+        return pipeline
+
+    def open_spider(self, spider):
+        self._thread = threading.Thread(target=self._writer_loop, name='write-behind', daemon=True)
+        self._thread.start()
+        # Lets other crawl stages (AI, OCR) queue row updates behind the inserts
+        spider.write_behind = self
+        # Commit timings land in the spider's stage histograms (see metrics.py)
+        self.metrics = getattr(spider, 'metrics', None)
+
+        sig = getattr(signal, self.flush_signal or '', None)
+        if sig is not None and threading.current_thread() is threading.main_thread():
+            signal.signal(sig, lambda signum, frame: self.flush())
+        print(f"💾 Write-behind buffer started (batch={self.batch_size}, interval={self.flush_interval}s)")
+
+    def process_item(self, item, spider):
+        self.rows_received += 1
+        with self._lock:
+            self._enqueue(dict(item))
+        return item
+
+    def submit_update(self, url, fields, apply=update_ai_analysis):
+        """Queue apply(url=url, **fields) for url's row; applied after the rows queued before it."""
+        with self._lock:
+            if not self._closed:
+                self._enqueue(_Update(url, fields, apply))
+                return
+        # Writer already stopped: wait for its final commit, then update directly
+        if self._thread is not None:
+            self._thread.join()
+        apply(url=url, **fields)
+
+    def _enqueue(self, entry):
+        """Hand entry to the writer without blocking; caller holds _lock.
+
+        Once anything has overflowed, later entries overflow too until the writer
+        has drained the list, so updates never overtake the rows they refer to.
+        The crawl is paused meanwhile; entries beyond max_overflow are dropped.
+        """
+        if not self._overflow:
+            try:
+                self.queue.put_nowait(entry)
+                return
+            except queue.Full:
+                logger.warning(f"Write-behind buffer full ({self.queue.maxsize} entries); "
+                               f"overflowing in memory and pausing the crawl")
+        if len(self._overflow) >= self.max_overflow and entry is not _STOP:
+            self.dropped += 1
+            url = entry.url if isinstance(entry, _Update) else entry.get('url')
+            logger.error(f"Write-behind overflow full ({self.max_overflow} entries); dropped "
+                         f"{'update' if isinstance(entry, _Update) else 'row'} for {url} ({self.dropped} so far)")
+            return
+        self._overflow.append(entry)
+        self.overflowed += 1
+        self._pause(True)
+
+    def _pause(self, paused):
+        """Pause the crawl engine while entries overflow, resume it once they are written; caller holds _lock."""
+        if paused == self.paused:
+            return
+        self.paused = paused
+        engine = self.engine() if self.engine is not None else None
+        if engine is None:
+            return
+        from twisted.internet import reactor
+        reactor.callFromThread(engine.pause if paused else engine.unpause)
+        print(f"💾 Write-behind overflow {'full of pending writes, crawl paused' if paused else 'drained, crawl resumed'}")
+
+    def flush(self):
+        """Ask the writer to commit everything buffered so far."""
+        try:
+            self.queue.put_nowait(_FLUSH)
+        except queue.Full:
+            pass  # A full buffer is flushed by the writer anyway
+
+    def spider_idle(self, spider):
+        self.flush()
+
+    def close_spider(self, spider):
+        with self._lock:
+            self._closed = True
+            self._enqueue(_STOP)
+        if self._thread is not None:
+            self._thread.join()
+        if self.stats is not None:
+            self.stats.set_value('write_behind/rows_received', self.rows_received)
+            self.stats.set_value('write_behind/rows_written', self.rows_written)
+            self.stats.set_value('write_behind/batches', self.batches)
+            self.stats.set_value('write_behind/failed_batches', self.failed_batches)
+            self.stats.set_value('write_behind/updates_applied', self.updates_applied)
+            self.stats.set_value('write_behind/overflowed', self.overflowed)
+            self.stats.set_value('write_behind/dropped', self.dropped)
+        print(f"💾 Write-behind buffer closed: {self.rows_written} rows in {self.batches} batches")
+
+    def _take(self, timeout):
+        """Next entries for the writer: one from the buffer, else the whole overflow list."""
+        try:
+            return [self.queue.get_nowait()]
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._overflow:
+                spilled = list(self._overflow)
+                self._overflow.clear()
+                self._pause(False)
+                return spilled
+        # Nothing overflows while the buffer has room, so waiting on it alone is safe
+        try:
+            return [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return [_FLUSH]
+
+    def _writer_loop(self):
+        # Rows and _Update entries in arrival order, committed together
+        pending = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            flush = stop = False
+            for entry in self._take(timeout):
+                if entry is _STOP:
+                    stop = True
+                elif entry is _FLUSH:
+                    flush = True
+                else:
+                    pending.append(entry)
+
+            if stop:
+                for attempt in range(3):
+                    if self._commit(pending):
+                        break
+                    time.sleep(1 + attempt)
+                return
+            if pending and deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if not flush and len(pending) < self.batch_size:
+                continue
+
+            # A failed batch is retried every interval before anything more is taken, so a
+            # slow or locked disk fills the bounded buffer and overflow rather than this list
+            while not self._commit(pending):
+                if self._closed:
+                    break
+                time.sleep(self.flush_interval)
+            else:
+                pending = []
+            deadline = None
+
+    def _apply_update(self, update, conn):
+        """Apply one buffered update inside the batch transaction; a failing update is dropped alone."""
+        conn.execute("SAVEPOINT write_behind_update")
+        try:
+            applied = update.apply(url=update.url, conn=conn, **update.fields)
+        except Exception as e:
+            if isinstance(e, sqlite3.OperationalError) and 'locked' in str(e):
+                raise  # The whole batch is retried
+            conn.execute("ROLLBACK TO write_behind_update")
+            logger.error(f"Write-behind {update.apply.__name__} for {update.url} failed: {str(e)}")
+            applied = 0
+        conn.execute("RELEASE write_behind_update")
+        return applied
+
+    def _commit(self, pending):
+        if not pending:
+            return True
+        started = time.perf_counter()
+        rows_written = updates_applied = updates = 0
+        conn = connect_database()
+        try:
+            # Explicit BEGIN so the update savepoints nest inside one transaction
+            conn.execute("BEGIN")
+            rows = []
+            for entry in pending:
+                if isinstance(entry, _Update):
+                    # Rows queued before the update go in first, in the same transaction
+                    rows_written += insert_data_batch(rows, conn=conn)
+                    rows = []
+                    updates_applied += self._apply_update(entry, conn)
+                    updates += 1
+                else:
+                    rows.append(entry)
+            rows_written += insert_data_batch(rows, conn=conn)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            self.failed_batches += 1
+            if self.metrics:
+                self.metrics.inc('db_failed_batches')
+            logger.error(f"Write-behind commit of {len(pending)} entries failed: {str(e)}")
+            return False
+        finally:
+            conn.close()
+
+        self.rows_written += rows_written
+        self.updates_applied += updates_applied
+        self.batches += 1
+        if self.metrics:
+            self.metrics.observe('db_write', time.perf_counter() - started)
+            self.metrics.inc('db_rows', rows_written)
+            self.metrics.inc('db_batches')
+            if updates:
+                self.metrics.inc('db_updates', updates)
+        return True
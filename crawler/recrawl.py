@@ -0,0 +1,130 @@
+"""
+Incremental Recrawl Support
+Per-URL HTTP validators and content hashes so unchanged pages are not re-analysed.
+
+For every canonical URL the store keeps the ETag / Last-Modified the server
+sent, a hash of the page's visible text and the page's outlinks. Later runs
+send those validators as If-None-Match / If-Modified-Since; a 304, or a 200
+whose text hashes the same, only records that the page was seen in this run
+and re-seeds its stored links, skipping extraction, regex and Gemini.
+"""
+
+import os
+import sys
+import zlib
+import sqlite3
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.models import DB_PATH
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Outcomes of PageVersionStore.record()
+NEW = 'new'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+
+
+def content_hash(text: str) -> str:
+    """Hash of the whitespace-normalized visible text (markup churn and spacing don't count as changes)."""
+    normalized = ' '.join(text.split())
+    return hashlib.blake2b(normalized.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+def _pack_links(links: List[str]) -> bytes:
+    return zlib.compress('\n'.join(links).encode('utf-8', 'surrogatepass'))
+
+
+def _unpack_links(blob) -> List[str]:
+    if not blob:
+        return []
+    return zlib.decompress(blob).decode('utf-8', 'surrogatepass').split('\n')
+
+
+class PageVersionStore:
+    """SQLite table of the last known version of each canonical URL."""
+
+    def __init__(self, path: str = None):
+        self.path = path or DB_PATH
+        self.counts = {NEW: 0, CHANGED: 0, UNCHANGED: 0, 'not_modified': 0}
+
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS page_versions (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                links BLOB,
+                first_run_id TEXT,
+                last_run_id TEXT,
+                changed_run_id TEXT,
+                seen_count INTEGER DEFAULT 1,
+                last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_changed TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.conn.commit()
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """If-None-Match / If-Modified-Since headers for url, if the server gave us validators."""
+        row = self.conn.execute("SELECT etag, last_modified FROM page_versions WHERE url = ?", (url,)).fetchone()
+        headers = {}
+        if row and row[0]:
+            headers['If-None-Match'] = row[0]
+        if row and row[1]:
+            headers['If-Modified-Since'] = row[1]
+        return headers
+
+    def not_modified(self, url: str, run_id: str) -> Optional[List[str]]:
+        """Record a 304 for url in run_id and return its stored outlinks (None if unknown)."""
+        row = self.conn.execute("SELECT links FROM page_versions WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        self._seen(url, run_id)
+        self.counts['not_modified'] += 1
+        return _unpack_links(row[0])
+
+    def record(self, url: str, run_id: str, text_hash: str, links: List[str],
+               etag: str = None, last_modified: str = None) -> str:
+        """Store a fetched version of url; returns NEW, CHANGED or UNCHANGED."""
+        row = self.conn.execute("SELECT content_hash FROM page_versions WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            outcome = NEW
+            self.conn.execute(
+                "INSERT INTO page_versions (url, etag, last_modified, content_hash, links, "
+                "first_run_id, last_run_id, changed_run_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, text_hash, _pack_links(links), run_id, run_id, run_id))
+        elif row[0] == text_hash:
+            outcome = UNCHANGED
+            self.conn.execute(
+                "UPDATE page_versions SET etag = ?, last_modified = ?, last_run_id = ?, "
+                "seen_count = seen_count + 1, last_seen = CURRENT_TIMESTAMP WHERE url = ?",
+                (etag, last_modified, run_id, url))
+        else:
+            outcome = CHANGED
+            self.conn.execute(
+                "UPDATE page_versions SET etag = ?, last_modified = ?, content_hash = ?, links = ?, "
+                "last_run_id = ?, changed_run_id = ?, seen_count = seen_count + 1, "
+                "last_seen = CURRENT_TIMESTAMP, last_changed = CURRENT_TIMESTAMP WHERE url = ?",
+                (etag, last_modified, text_hash, _pack_links(links), run_id, run_id, url))
+        self.conn.commit()
+        self.counts[outcome] += 1
+        return outcome
+
+    def _seen(self, url: str, run_id: str):
+        self.conn.execute(
+            "UPDATE page_versions SET last_run_id = ?, seen_count = seen_count + 1, "
+            "last_seen = CURRENT_TIMESTAMP WHERE url = ?", (run_id, url))
+        self.conn.commit()
+
+    def snapshot(self) -> Dict[str, int]:
+        return dict(self.counts)
+
+    def close(self):
+        self.conn.close()
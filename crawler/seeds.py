@@ -0,0 +1,162 @@
+"""
+Seed Lists and Per-Seed Budgets
+Batch crawls of many onion seeds in one process, each with its own depth and page budget.
+
+Seeds come from a text file (``url [max_depth] [max_pages]`` per line, ``#``
+comments, 0 or - for the default limit) or from the crawl_seeds table of the
+main database. Every frontier
+entry remembers the seed it was discovered from, so a seed's budget only
+counts URLs reached through it and stats can be reported per seed.
+"""
+
+import os
+import re
+import sys
+import logging
+from typing import Dict, List, NamedTuple, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.models import fetch_crawl_seeds, fetch_seed_stats, save_seed_stats
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STAT_FIELDS = ('pages', 'failed', 'bytes', 'entities', 'leak_pages', 'skipped_depth', 'skipped_budget')
+
+
+class Seed(NamedTuple):
+    url: str
+    max_depth: Optional[int] = None  # None = unlimited
+    max_pages: Optional[int] = None
+
+
+def _limit(value, default: Optional[int]) -> Optional[int]:
+    """A per-seed limit; empty, '-' or 0 means the default."""
+    if value is None or str(value).strip() in ('', '-'):
+        return default
+    value = int(value)
+    return value if value > 0 else default
+
+
+def load_seed_file(path: str, max_depth: Optional[int] = None, max_pages: Optional[int] = None) -> List[Seed]:
+    """Seeds from a text file; per-line depth / page limits override the defaults."""
+    seeds = []
+    seen = set()
+    with open(path, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            fields = re.split(r'[\s,]+', line)
+            try:
+                seed = Seed(fields[0], _limit(fields[1] if len(fields) > 1 else None, max_depth),
+                            _limit(fields[2] if len(fields) > 2 else None, max_pages))
+            except ValueError:
+                logger.warning(f"Skipping malformed seed line {line_number} in {path}: {line}")
+                continue
+            if seed.url not in seen:
+                seen.add(seed.url)
+                seeds.append(seed)
+    return seeds
+
+
+def load_seed_table(max_depth: Optional[int] = None, max_pages: Optional[int] = None) -> List[Seed]:
+    """Enabled seeds from the crawl_seeds table; NULL limits fall back to the defaults."""
+    return [Seed(url, _limit(depth, max_depth), _limit(pages, max_pages))
+            for url, depth, pages in fetch_crawl_seeds()]
+
+
+class SeedTracker:
+    """Budgets and counters for the seeds of one run (one worker's share when sharded).
+
+    Args:
+        run_id: crawl run the stats are recorded under
+        seeds: seed list, indexed by position (the frontier's seed column)
+        admitted: URLs already in the frontier per seed (on resume)
+        shard: worker shard, so parallel workers record separate rows
+    """
+
+    def __init__(self, run_id: str, seeds: List[Seed], admitted: Dict[int, int] = None, shard: int = 0):
+        self.run_id = run_id
+        self.seeds = list(seeds)
+        self.shard = shard
+        self.admitted = [0] * len(self.seeds)
+        for seed_id, count in (admitted or {}).items():
+            if seed_id is not None and 0 <= seed_id < len(self.seeds):
+                self.admitted[seed_id] = count
+        self.stats = [dict.fromkeys(STAT_FIELDS, 0) for _ in self.seeds]
+        # A resumed worker carries on from the counters it saved before it stopped
+        index = {seed.url: i for i, seed in enumerate(self.seeds)}
+        for row in fetch_seed_stats(run_id, shard):
+            if row['seed_url'] in index:
+                self.stats[index[row['seed_url']]].update({field: row[field] for field in STAT_FIELDS})
+
+    def _known(self, seed_id: Optional[int]) -> bool:
+        return seed_id is not None and 0 <= seed_id < len(self.seeds)
+
+    def depth_allowed(self, seed_id: Optional[int], depth: int, links: int = 1) -> bool:
+        """Whether links at depth may be queued for seed_id (counts them as skipped if not)."""
+        if not self._known(seed_id):
+            return True
+        max_depth = self.seeds[seed_id].max_depth
+        if max_depth is not None and depth > max_depth:
+            self.stats[seed_id]['skipped_depth'] += links
+            return False
+        return True
+
+    def budget(self, seed_id: Optional[int]) -> Optional[int]:
+        """seed_id's page budget (None = unlimited)."""
+        return self.seeds[seed_id].max_pages if self._known(seed_id) else None
+
+    def has_budget(self, seed_id: Optional[int]) -> bool:
+        """Whether seed_id may still add URLs to the frontier."""
+        if not self._known(seed_id):
+            return True
+        max_pages = self.seeds[seed_id].max_pages
+        return max_pages is None or self.admitted[seed_id] < max_pages
+
+    def admit(self, seed_id: Optional[int]):
+        """Count a URL newly added to the frontier against seed_id's page budget."""
+        if self._known(seed_id):
+            self.admitted[seed_id] += 1
+
+    def skip_budget(self, seed_id: Optional[int], links: int):
+        """Record links left unfollowed because seed_id's page budget is used up."""
+        if self._known(seed_id):
+            self.stats[seed_id]['skipped_budget'] += links
+
+    def sync(self, admitted: Dict[int, int]):
+        """Take in frontier-wide per-seed counts (URLs other workers added under the same seeds)."""
+        for seed_id, count in admitted.items():
+            if self._known(seed_id) and count > self.admitted[seed_id]:
+                self.admitted[seed_id] = count
+
+    def record_page(self, seed_id: Optional[int], size: int, entities: int):
+        if not self._known(seed_id):
+            return
+        stats = self.stats[seed_id]
+        stats['pages'] += 1
+        stats['bytes'] += size
+        stats['entities'] += entities
+        stats['leak_pages'] += entities > 0
+
+    def record_failure(self, seed_id: Optional[int]):
+        if self._known(seed_id):
+            self.stats[seed_id]['failed'] += 1
+
+    def with_leaks(self) -> int:
+        """Seeds with at least one page where entities were found."""
+        return sum(1 for stats in self.stats if stats['leak_pages'])
+
+    def exhausted(self) -> int:
+        """Seeds whose page budget is used up."""
+        return sum(1 for seed, admitted in zip(self.seeds, self.admitted)
+                   if seed.max_pages is not None and admitted >= seed.max_pages)
+
+    def save(self):
+        """Upsert this worker's per-seed counters into the seed_stats table."""
+        rows = [dict(stats, seed_url=seed.url) for seed, stats in zip(self.seeds, self.stats)
+                if any(stats.values())]
+        if rows:
+            save_seed_stats(self.run_id, rows, self.shard)
@@ -0,0 +1,256 @@
+"""
+Streaming Page Scan
+Regex, keyword and fingerprint scan of large or non-HTML bodies in bounded windows.
+
+Multi-megabyte dumps (CSV pastes, SQL exports, text listings) are the pages
+most likely to hold leaks, and also the ones where decoding the whole body,
+building a DOM and joining its text costs several copies of the page in
+memory. Bodies above STREAM_SCAN_THRESHOLD bytes, and every non-HTML text
+body, skip the DOM: the body is decoded STREAM_CHUNK_BYTES at a time, markup
+is stripped with a tokenizer-free regex, and each window is scanned with the
+text of the previous window's last STREAM_OVERLAP_CHARS characters in front
+of it, so a match that straddles a chunk boundary is still found.
+
+Streamed pages get their own content hash and SimHash (markup is stripped
+without a parser, so the text differs slightly from html_extract's). A page
+that stays above the threshold compares like for like across runs and mirrors.
+"""
+
+import re
+import codecs
+import hashlib
+import logging
+from html import unescape
+from typing import Dict, List, NamedTuple, Optional
+
+from w3lib.encoding import html_body_declared_encoding, http_content_type_encoding, read_bom, resolve_encoding
+
+from crawler.html_extract import resolve_link
+from crawler.ner_utils import get_entity_engine
+from crawler.near_duplicate import SimHashBuilder
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+# A '<' more than this far from the end of a chunk is literal text, not the start of a cut-off tag
+MAX_TAG_CHARS = 4096
+MAX_ANCHOR_CHARS = 512
+
+_TAG_RE = re.compile(r'<[^>]*>')
+# Block-level tags become a space so cells and paragraphs don't run together into one fake number
+_BLOCK_TAG_RE = re.compile(r'</?(?:p|div|br|hr|tr|td|th|li|dd|dt|table|thead|tbody|ul|ol|dl|h[1-6]|pre|'
+                           r'blockquote|section|article|header|footer|title|option|form)\b[^>]*>', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s')
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+_INVISIBLE_OPEN_RE = re.compile(r'<(script|style|template|noscript)\b', re.IGNORECASE)
+_INVISIBLE_CLOSE_RE = {tag: re.compile(r'</' + tag + r'\s*>', re.IGNORECASE)
+                       for tag in ('script', 'style', 'template', 'noscript')}
+_TITLE_RE = re.compile(r'<title\b[^>]*>(.*?)</title\s*>', re.IGNORECASE | re.DOTALL)
+_BASE_RE = re.compile(r'<base\s[^>]*?href\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.IGNORECASE)
+_ANCHOR_CLOSE_RE = re.compile(r'</a\s*>', re.IGNORECASE)
+_HREF_RE = re.compile(r'<a\s[^>]*?href\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.IGNORECASE)
+
+
+class StreamScanResult(NamedTuple):
+    title: str
+    links: List[str]
+    anchors: List[str]
+    entities: Dict[str, List[str]]
+    matched_keywords: List[str]
+    content_hash: str
+    simhash: SimHashBuilder
+    ai_text: str
+    bytes_scanned: int
+    windows: int
+
+
+def is_html(content_type: str) -> bool:
+    media_type = (content_type or '').split(';', 1)[0].strip().lower()
+    return not media_type or media_type in HTML_CONTENT_TYPES
+
+
+def body_encoding(body: bytes, content_type: str = None) -> str:
+    """Encoding from the BOM, the Content-Type header or a <meta> tag in the first 4 KB (utf-8 otherwise)."""
+    bom_encoding, _ = read_bom(body[:4])
+    encoding = (bom_encoding
+                or http_content_type_encoding(content_type)
+                or html_body_declared_encoding(body[:4096])
+                or 'utf-8')
+    return resolve_encoding(encoding) or 'utf-8'
+
+
+class StreamScanner:
+    """Windowed scan of one response body.
+
+    Args:
+        keyword_matcher: KeywordMatcher used for keywords.json terms
+        chunk_bytes: raw bytes decoded per window
+        overlap_chars: characters of the previous window rescanned in front of the next one
+        max_links: outlinks kept per page
+        ai_text_chars: size of the excerpt (windows with hits) handed to the AI stage
+    """
+
+    def __init__(self, keyword_matcher, chunk_bytes: int = 1 << 20, overlap_chars: int = 512,
+                 max_links: int = 5000, ai_text_chars: int = 16000):
+        self.keyword_matcher = keyword_matcher
+        self.chunk_bytes = max(4096, int(chunk_bytes))
+        self.overlap_chars = max(0, int(overlap_chars))
+        self.max_links = int(max_links)
+        self.ai_text_chars = int(ai_text_chars)
+        self.engine = get_entity_engine()
+
+    def scan(self, body: bytes, base_url: str, content_type: str = None) -> StreamScanResult:
+        html = is_html(content_type)
+        decoder = codecs.getincrementaldecoder(body_encoding(body, content_type))(errors='replace')
+        view = memoryview(body)
+
+        title = None
+        base = base_url
+        links = []
+        anchors = []
+        entities = {}
+        keywords = set()
+        fingerprint = SimHashBuilder()
+        digest = hashlib.blake2b(digest_size=16)
+        ai_parts = []
+        ai_chars = 0
+        ai_last = None
+        windows = 0
+
+        raw_carry = ''       # cut-off tag waiting for the rest of its markup
+        invisible = None     # open <script>/<style>/... whose closing tag is in a later chunk
+        text_carry = ''      # cut-off word waiting for the rest of its characters
+        overlap = ''
+        hashed = False
+        space_owed = False   # whitespace separated the last hashed word from whatever comes next
+
+        for offset in range(0, len(body) + 1, self.chunk_bytes):
+            final = offset + self.chunk_bytes >= len(body)
+            raw = raw_carry + decoder.decode(bytes(view[offset:offset + self.chunk_bytes]), final=final)
+            raw_carry = ''
+
+            if html:
+                if not final:
+                    cut = raw.rfind('<')
+                    if cut != -1 and raw.find('>', cut) == -1 and len(raw) - cut <= MAX_TAG_CHARS:
+                        raw, raw_carry = raw[:cut], raw[cut:]
+                if title is None:
+                    found = _TITLE_RE.search(raw)
+                    if found:
+                        title = ' '.join(unescape(_TAG_RE.sub('', found.group(1))).split())
+                if base is base_url:
+                    found = _BASE_RE.search(raw)
+                    if found:
+                        base = resolve_link(unescape(next(g for g in found.groups() if g is not None)), base_url) or base_url
+                for found in _HREF_RE.finditer(raw):
+                    if len(links) >= self.max_links:
+                        break
+                    link = resolve_link(unescape(next(g for g in found.groups() if g is not None)), base)
+                    if link:
+                        links.append(link)
+                        anchors.append(self._anchor_text(raw, found.end()))
+                text, invisible = self._strip_markup(raw, invisible)
+            else:
+                text = raw
+
+            text = text_carry + text
+            text_carry = ''
+            if not final:
+                # Hold back a trailing partial word so no pattern sees half a number at a window edge
+                cut = max(text.rfind(' '), text.rfind('\n'), text.rfind('\t'))
+                if cut != -1 and len(text) - cut <= MAX_TAG_CHARS:
+                    text, text_carry = text[:cut + 1], text[cut + 1:]
+            if not text:
+                continue
+
+            windows += 1
+            window = overlap + text
+            hits = False
+            for category, matches in self.engine.extract(window).items():
+                entities.setdefault(category, set()).update(matches)
+                hits = True
+            for term in self.keyword_matcher.match(window):
+                keywords.add(term)
+                hits = True
+
+            fingerprint.update(text)
+            # Whitespace-normalized like recrawl.content_hash(), so spacing churn is not a change
+            words = text.split()
+            if words:
+                if hashed and (space_owed or text[0].isspace()):
+                    digest.update(b' ')
+                digest.update(' '.join(words).encode('utf-8', 'surrogatepass'))
+                hashed = True
+                space_owed = text[-1].isspace()
+            else:
+                space_owed = hashed
+
+            if hits and ai_chars < self.ai_text_chars:
+                # Consecutive windows continue the previous excerpt instead of repeating its overlap
+                excerpt = (text if ai_last == windows - 1 else window)[:self.ai_text_chars - ai_chars]
+                if ai_last == windows - 1:
+                    ai_parts[-1] += excerpt
+                else:
+                    ai_parts.append(excerpt)
+                ai_chars += len(excerpt)
+                ai_last = windows
+
+            overlap = self._tail(window)
+
+        order = {term: i for i, term in enumerate(self.keyword_matcher.terms)}
+        return StreamScanResult(
+            title=title or 'No Title',
+            links=links,
+            anchors=anchors,
+            entities={category: sorted(matches) for category, matches in entities.items()},
+            matched_keywords=sorted(keywords, key=lambda term: order.get(term, len(order))),
+            content_hash=digest.hexdigest(),
+            simhash=fingerprint,
+            ai_text='\n...\n'.join(ai_parts),
+            bytes_scanned=len(body),
+            windows=windows,
+        )
+
+    def _anchor_text(self, raw: str, pos: int) -> str:
+        """Text between the end of an <a ...> tag starting before pos and its </a> (short anchors only)."""
+        start = raw.find('>', pos)
+        close = _ANCHOR_CLOSE_RE.search(raw, start, start + MAX_ANCHOR_CHARS) if start != -1 else None
+        if close is None:
+            return ''
+        return ' '.join(unescape(_TAG_RE.sub('', raw[start + 1:close.start()])).split())
+
+    def _strip_markup(self, raw: str, invisible: Optional[str]):
+        """Visible text of a chunk of markup, plus the invisible element still open at its end."""
+        parts = []
+        pos = 0
+        while pos < len(raw):
+            if invisible:
+                close = _INVISIBLE_CLOSE_RE[invisible].search(raw, pos)
+                if close is None:
+                    return ''.join(parts), invisible
+                pos = close.end()
+                invisible = None
+                continue
+            opened = _INVISIBLE_OPEN_RE.search(raw, pos)
+            end = opened.start() if opened else len(raw)
+            markup = _BLOCK_TAG_RE.sub(' ', _COMMENT_RE.sub('', raw[pos:end]))
+            parts.append(unescape(_TAG_RE.sub('', markup)))
+            if opened is None:
+                break
+            invisible = opened.group(1).lower()
+            pos = opened.end()
+        return ''.join(parts), invisible
+
+    def _tail(self, window: str) -> str:
+        """Last overlap_chars of a window, starting on a word boundary."""
+        if not self.overlap_chars:
+            return ''
+        tail = window[-self.overlap_chars:]
+        if len(window) > self.overlap_chars:
+            space = _SPACE_RE.search(tail)
+            if space:
+                tail = tail[space.end():]
+        return tail
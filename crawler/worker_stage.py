@@ -0,0 +1,258 @@
+"""
+Bounded Worker Stage
+A queue of crawl jobs drained by a fixed pool of worker threads, off the Scrapy reactor.
+
+Slow per-page work (Gemini calls, OCR) is handed to a stage so that fetching
+never waits on it, and submit() never blocks. The queue is bounded; what happens
+when it is full is the stage's overflow policy. Subclasses implement
+process(key, payload), and process_batch(jobs) when a worker may take up to
+max_batch queued jobs at once. Raising RetryLater from either puts the jobs back
+at the end of the queue, up to max_retries times per job. Stages using the 'defer'
+policy implement on_defer(jobs, reason) to persist jobs they cannot hold or that ran
+out of retries (e.g. in the database for a later run).
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop', 'drop_oldest', 'defer')
+
+# Longest a worker pauses after RetryLater before taking the next job
+MAX_RETRY_PAUSE = 5.0
+
+
+class RetryLater(Exception):
+    """Raised by process() when a job cannot be done yet (e.g. its API is down); it is re-queued, not failed."""
+
+    def __init__(self, message: str = '', delay: float = 1.0):
+        super().__init__(message)
+        self.delay = delay
+
+
+class BoundedWorkerStage:
+    """Bounded job queue drained by a fixed pool of worker threads.
+
+    Args:
+        max_in_flight: number of worker threads (jobs processed concurrently)
+        max_queue: jobs allowed to wait for a free worker
+        overflow_policy: what submit() does when the queue is full:
+            'drop'        reject the new job
+            'drop_oldest' evict the longest-waiting job to make room
+            'defer'       hand the new job to on_defer(); jobs still queued at shutdown go there too
+        name: prefix for worker thread names and log lines
+        max_batch: jobs a free worker takes from the queue at once (only what is already waiting;
+            workers never hold back to fill a batch)
+        max_retries: times a job is re-queued after RetryLater before it is deferred (policy
+            'defer') or failed; None retries until shutdown
+    """
+
+    def __init__(self, max_in_flight: int = 4, max_queue: int = 200, overflow_policy: str = 'drop',
+                 name: str = 'stage', max_batch: int = 1, max_retries: Optional[int] = None):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy must be one of {OVERFLOW_POLICIES}, got {overflow_policy!r}")
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_queue = max(1, int(max_queue))
+        self.overflow_policy = overflow_policy
+        self.name = name
+        self.max_batch = max(1, int(max_batch))
+        self.max_retries = None if max_retries is None else max(0, int(max_retries))
+
+        self._pending = deque()
+        self._retries: Dict[str, int] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.deferred = 0
+        self.retried = 0
+
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f'{name}-{i}', daemon=True)
+            for i in range(self.max_in_flight)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def process(self, key: str, payload: Any):
+        """Handle one job on a worker thread; an exception counts the job as failed."""
+        raise NotImplementedError
+
+    def process_batch(self, jobs: List[Tuple[str, Any]]):
+        """Handle several (key, payload) jobs together; an exception counts all of them as failed."""
+        for key, payload in jobs:
+            self.process(key, payload)
+
+    def on_defer(self, jobs: List[Tuple[str, Any]], reason: str):
+        """Persist jobs the stage will not process (policy 'defer'); called without the queue lock."""
+        raise NotImplementedError
+
+    def submit(self, key: str, payload: Any) -> bool:
+        """Queue a job without ever waiting. Returns False if it was dropped or deferred instead."""
+        with self._cond:
+            if not self._closed and len(self._pending) >= self.max_queue and self.overflow_policy == 'drop_oldest':
+                evicted_key, _ = self._pending.popleft()
+                self.dropped += 1
+                logger.warning(f"{self.name} queue full, dropped oldest job: {evicted_key}")
+            if not self._closed and len(self._pending) < self.max_queue:
+                self._pending.append((key, payload))
+                self.submitted += 1
+                self._cond.notify_all()
+                return True
+            if self.overflow_policy != 'defer':
+                self.dropped += 1
+                return False
+            reason = 'stage closed' if self._closed else 'queue full'
+        self._defer([(key, payload)], reason)
+        return False
+
+    def _defer(self, jobs: List[Tuple[str, Any]], reason: str):
+        """Hand jobs to on_defer(); if that fails they are counted as dropped."""
+        if not jobs:
+            return
+        try:
+            self.on_defer(jobs, reason)
+        except Exception as e:
+            logger.error(f"{self.name} could not defer {len(jobs)} jobs ({reason}): {str(e)}")
+            with self._cond:
+                self.dropped += len(jobs)
+            return
+        with self._cond:
+            self.deferred += len(jobs)
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                jobs = [self._pending.popleft()]
+                while self._pending and len(jobs) < self.max_batch:
+                    jobs.append(self._pending.popleft())
+                self.in_flight += len(jobs)
+                self._cond.notify_all()
+
+            try:
+                if len(jobs) == 1:
+                    self.process(*jobs[0])
+                else:
+                    self.process_batch(jobs)
+                with self._cond:
+                    self.completed += len(jobs)
+                    self._forget(jobs)
+            except RetryLater as e:
+                # Already admitted, so re-queued past max_queue; max_retries bounds how often
+                requeued, exhausted = [], []
+                with self._cond:
+                    for job in jobs:
+                        tries = self._retries.get(job[0], 0) + 1
+                        if self.max_retries is not None and tries > self.max_retries:
+                            self._retries.pop(job[0], None)
+                            exhausted.append(job)
+                        else:
+                            self._retries[job[0]] = tries
+                            requeued.append(job)
+                    self._pending.extend(requeued)
+                    self.retried += len(requeued)
+                    self._cond.notify_all()
+                if requeued:
+                    self.on_retry(requeued, e)
+                if exhausted:
+                    self._give_up(exhausted, e)
+                time.sleep(min(max(e.delay, 0.0), MAX_RETRY_PAUSE))
+            except Exception as e:
+                with self._cond:
+                    self.failed += len(jobs)
+                    self._forget(jobs)
+                for key, _ in jobs:
+                    self.on_failure(key, e)
+            finally:
+                with self._cond:
+                    self.in_flight -= len(jobs)
+                    self._cond.notify_all()
+
+    def _forget(self, jobs: List[Tuple[str, Any]]):
+        """Drop the retry counts of jobs that are done with (caller holds the lock)."""
+        if self._retries:
+            for key, _ in jobs:
+                self._retries.pop(key, None)
+
+    def _give_up(self, jobs: List[Tuple[str, Any]], error: RetryLater):
+        """Jobs out of retries: deferred (policy 'defer') or failed."""
+        if self.overflow_policy == 'defer':
+            self._defer(jobs, f"retried {self.max_retries} times: {str(error)}")
+            return
+        with self._cond:
+            self.failed += len(jobs)
+        for key, _ in jobs:
+            self.on_failure(key, error)
+
+    def on_failure(self, key: str, error: Exception):
+        print(f"⚠ {self.name} failed for {key}: {str(error)}")
+
+    def on_retry(self, jobs: List[Tuple[str, Any]], error: RetryLater):
+        logger.info(f"{self.name} re-queued {len(jobs)} jobs: {str(error)}")
+
+    @property
+    def queued(self) -> int:
+        return len(self._pending)
+
+    def has_room(self, extra: int = 0) -> bool:
+        """Whether `extra` more jobs would still fit in the queue right now."""
+        with self._cond:
+            return len(self._pending) + extra < self.max_queue
+
+    def is_idle(self) -> bool:
+        with self._cond:
+            return not self._pending and self.in_flight == 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current queue depth, in-flight count and counters."""
+        with self._cond:
+            return {
+                'queued': len(self._pending),
+                'in_flight': self.in_flight,
+                'max_queue': self.max_queue,
+                'max_in_flight': self.max_in_flight,
+                'max_batch': self.max_batch,
+                'overflow_policy': self.overflow_policy,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'deferred': self.deferred,
+                'retried': self.retried,
+            }
+
+    def shutdown(self, wait: bool = True, timeout: Optional[float] = None):
+        """Stop accepting jobs; with wait=True, finish queued work first (up to timeout).
+
+        Jobs still queued after that are deferred (policy 'defer') or dropped.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if wait:
+                while self._pending or self.in_flight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            leftover = list(self._pending)
+            self._pending.clear()
+            self._retries.clear()
+            if self.overflow_policy != 'defer':
+                self.dropped += len(leftover)
+            self._closed = True
+            self._cond.notify_all()
+        if self.overflow_policy == 'defer':
+            self._defer(leftover, 'shutdown')
@@ -16,7 +16,8 @@ sys.path.append(os.path.join(BASE_DIR, '..'))
 from models import (fetch_all_run_ids, fetch_all_data, count_total_sites, 
                     count_total_alerts, clear_all_data, fetch_all_data_ai, 
                     search_by_identifier_db, get_leak_statistics, export_leaks_json,
-                    search_indian_data, get_indian_leak_statistics, search_by_entity_type)
+                    search_indian_data, get_indian_leak_statistics, search_by_entity_type,
+                    fetch_host_ranks)
 try:
     from threat_score import calculate_threat_score
 except ImportError:
@@ -24,6 +25,7 @@ except ImportError:
 # Try to import AI utilities, but continue without them if not available
 try:
     from ai_utils import search_by_identifier, GeminiAIProcessor
+    from gemini_client import shared_client
     AI_AVAILABLE = True
 except ImportError:
     AI_AVAILABLE = False
@@ -375,6 +377,7 @@ def api_search_identifier():
         
         # If AI is enabled and we have ambiguous results, use Gemini for fuzzy matching
         ai_results = []
+        ai_error = None
         if use_ai and (len(formatted_results) == 0 or len(formatted_results) > 10):
             try:
                 ai_processor = GeminiAIProcessor()
@@ -383,13 +386,16 @@ def api_search_identifier():
                     if match.get('match_type') == 'ai_fuzzy':
                         ai_results.append(match)
             except Exception as e:
-                print(f"AI search failed: {str(e)}")
+                # e.g. GeminiUnavailable while the crawler has the shared quota's breaker open
+                ai_error = str(e)
+                print(f"AI search failed: {ai_error}")
         
         return jsonify({
             'success': True,
             'identifier': identifier,
             'database_results': len(formatted_results),
             'ai_results': len(ai_results),
+            'ai_error': ai_error,
             'total_results': len(formatted_results) + len(ai_results),
             'results': formatted_results + ai_results
         })
@@ -411,6 +417,37 @@ def api_statistics():
     except Exception as e:
         return jsonify({'error': f'Failed to get statistics: {str(e)}'}), 500
 
+@app.route('/api/gemini_quota')
+def api_gemini_quota():
+    """Gemini rate limit and circuit breaker state shared by the crawler, OCR and dashboard."""
+    if not AI_AVAILABLE:
+        return jsonify({'error': 'AI utilities not available'}), 503
+
+    try:
+        return jsonify({
+            'success': True,
+            'quota': shared_client().snapshot()
+        })
+    except Exception as e:
+        return jsonify({'error': f'Failed to get Gemini quota: {str(e)}'}), 500
+
+@app.route('/api/host_ranks')
+def api_host_ranks():
+    """Onion hosts ranked by PageRank over the crawler's link graph."""
+    limit = int(request.args.get('limit', 50))
+
+    try:
+        ranks = [
+            {'host': host, 'rank': rank, 'in_hosts': in_hosts, 'out_hosts': out_hosts, 'updated_at': updated_at}
+            for host, rank, in_hosts, out_hosts, updated_at in fetch_host_ranks(limit)
+        ]
+        return jsonify({
+            'success': True,
+            'ranks': ranks
+        })
+    except Exception as e:
+        return jsonify({'error': f'Failed to get host ranks: {str(e)}'}), 500
+
 @app.route('/api/export_json')
 def api_export_json():
     """Export leak data as structured JSON."""
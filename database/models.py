@@ -7,6 +7,18 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(BASE_DIR, 'decimal_scraped_data.db')
 
 
+def connect_database():
+    """Open a connection to the scraped data database (for callers that batch several writes)."""
+    return sqlite3.connect(DB_PATH)
+
+
+def _connection(conn):
+    """Return (connection, owned): conn itself, or a new connection the caller must commit and close."""
+    if conn is not None:
+        return conn, False
+    return connect_database(), True
+
+
 def initialize_database():
     """Create the database and scraped_data table if not exists."""
     conn = sqlite3.connect(DB_PATH)
@@ -30,7 +42,8 @@ def initialize_database():
             processed_at TIMESTAMP DEFAULT NULL,
             detection_method TEXT DEFAULT 'regex',
             local_detection_results TEXT DEFAULT NULL,
-            gemini_detection_results TEXT DEFAULT NULL
+            gemini_detection_results TEXT DEFAULT NULL,
+            duplicate_of TEXT DEFAULT NULL
         )
     ''')
 
@@ -80,8 +93,106 @@ def initialize_database():
         print("🔧 Adding missing 'gemini_detection_results' column...")
         c.execute("ALTER TABLE scraped_data ADD COLUMN gemini_detection_results TEXT DEFAULT NULL")
 
+    # Near-duplicate mirrors point at the row that holds the analysis
+    if 'duplicate_of' not in columns:
+        print("🔧 Adding missing 'duplicate_of' column...")
+        c.execute("ALTER TABLE scraped_data ADD COLUMN duplicate_of TEXT DEFAULT NULL")
+
+    # Entities OCR'd from images / PDFs the page links to (also merged into named_entities)
+    if 'ocr_entities' not in columns:
+        print("🔧 Adding missing 'ocr_entities' column...")
+        c.execute("ALTER TABLE scraped_data ADD COLUMN ocr_entities TEXT DEFAULT NULL")
+
+    # Local leak gate score and whether the page was sent to Gemini ('passed' / 'skipped')
+    if 'ai_gate_score' not in columns:
+        print("🔧 Adding missing 'ai_gate_score' column...")
+        c.execute("ALTER TABLE scraped_data ADD COLUMN ai_gate_score REAL DEFAULT NULL")
+    if 'ai_gate_decision' not in columns:
+        print("🔧 Adding missing 'ai_gate_decision' column...")
+        c.execute("ALTER TABLE scraped_data ADD COLUMN ai_gate_decision TEXT DEFAULT NULL")
+
     # Index to speed up duplicate checks by URL
     c.execute("CREATE INDEX IF NOT EXISTS idx_scraped_url ON scraped_data(url)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_scraped_duplicate_of ON scraped_data(duplicate_of)")
+
+    # Unique canonical URL so batched writes can upsert; legacy databases may hold
+    # duplicate rows, which are only ever removed by scripts/clean_duplicates.py
+    try:
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_scraped_url_unique ON scraped_data(url)")
+    except sqlite3.IntegrityError:
+        print("⚠ Duplicate URLs found; run scripts/clean_duplicates.py so batched writes can upsert by URL.")
+
+    # Seed list for batch crawls (crawler --seed-table); NULL limits use SEED_MAX_DEPTH / SEED_MAX_PAGES
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_seeds (
+            url TEXT PRIMARY KEY,
+            max_depth INTEGER DEFAULT NULL,
+            max_pages INTEGER DEFAULT NULL,
+            enabled INTEGER DEFAULT 1,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Per-seed crawl counters; one row per worker shard, summed by fetch_seed_stats()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS seed_stats (
+            run_id TEXT,
+            seed_url TEXT,
+            shard INTEGER DEFAULT 0,
+            pages INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            bytes INTEGER DEFAULT 0,
+            entities INTEGER DEFAULT 0,
+            leak_pages INTEGER DEFAULT 0,
+            skipped_depth INTEGER DEFAULT 0,
+            skipped_budget INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (run_id, seed_url, shard)
+        )
+    ''')
+
+    # One row per OCR'd attachment, keyed by the page that linked it
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS ocr_attachments (
+            page_url TEXT,
+            attachment_url TEXT,
+            run_id TEXT,
+            kind TEXT,
+            bytes INTEGER DEFAULT 0,
+            text_chars INTEGER DEFAULT 0,
+            confidence REAL DEFAULT 0.0,
+            entities TEXT DEFAULT '',
+            error TEXT DEFAULT NULL,
+            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (page_url, attachment_url)
+        )
+    ''')
+
+    # Pages waiting for a Gemini verdict the crawl could not get (AI queue full, Gemini down at shutdown)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS ai_pending (
+            url TEXT PRIMARY KEY,
+            run_id TEXT,
+            text TEXT,
+            keywords TEXT DEFAULT '',
+            reason TEXT,
+            deferred_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Metadata-only record of links whose download was aborted (archives, media, oversized bodies)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS filtered_downloads (
+            url TEXT PRIMARY KEY,
+            run_id TEXT,
+            page_url TEXT DEFAULT NULL,
+            content_type TEXT,
+            declared_bytes INTEGER DEFAULT NULL,
+            bytes_read INTEGER DEFAULT 0,
+            reason TEXT,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
 
     conn.commit()
     conn.close()
@@ -125,6 +236,81 @@ def insert_data(url, title, matched_keywords, run_id, named_entities="",
     print(f"✅ Data inserted with AI classification: {url} - {ai_classification}")
 
 
+INSERT_COLUMNS = (
+    'url', 'title', 'matched_keywords', 'run_id', 'named_entities',
+    'ai_classification', 'leak_severity', 'ai_confidence', 'detection_method',
+    'local_detection_results', 'gemini_detection_results', 'duplicate_of', 'ai_gate_score', 'ai_gate_decision'
+)
+
+
+def _has_unique_url(cursor):
+    """Whether scraped_data has its unique URL index (initialize_database() skips it while duplicates remain)."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_scraped_url_unique'")
+    return cursor.fetchone() is not None
+
+
+def insert_data_batch(rows, conn=None):
+    """Insert many rows of scraped data in a single transaction.
+
+    Each row is a dict with the same fields as insert_data(). A row whose URL is
+    already stored replaces the stored analysis (the page changed since it was
+    last crawled); created_at is kept. Returns the number of rows inserted or
+    updated. With conn the rows join the caller's transaction, which the caller
+    commits.
+    """
+    if not rows:
+        return 0
+
+    params = []
+    for row in rows:
+        values = []
+        for column in INSERT_COLUMNS:
+            value = row.get(column)
+            if column in ('local_detection_results', 'gemini_detection_results') and isinstance(value, dict):
+                value = str(value)
+            if value is None and column == 'named_entities':
+                value = ''
+            if value is None and column == 'ai_confidence':
+                value = 0.0
+            if value is None and column == 'detection_method':
+                value = 'regex'
+            values.append(value)
+        params.append(values)
+
+    insert = f'''
+        INSERT INTO scraped_data (
+            {', '.join(INSERT_COLUMNS)}, processed_at
+        ) VALUES ({', '.join('?' for _ in INSERT_COLUMNS)}, datetime('now'))
+    '''
+    reanalysed = ', '.join(f"{column} = excluded.{column}" for column in INSERT_COLUMNS if column != 'url')
+
+    conn, owned = _connection(conn)
+    c = conn.cursor()
+    before = conn.total_changes
+    try:
+        # The page's attachments are OCR'd again along with it
+        if _has_unique_url(c):
+            c.executemany(f"{insert} ON CONFLICT(url) DO UPDATE SET {reanalysed}, "
+                          f"ai_summary = NULL, ocr_entities = NULL, processed_at = datetime('now')", params)
+            inserted = conn.total_changes - before
+        else:
+            # Duplicates kept the unique index from being built: update every copy, insert new URLs
+            reanalysed = ', '.join(f"{column} = ?" for column in INSERT_COLUMNS if column != 'url')
+            for values in params:
+                c.execute(f"UPDATE scraped_data SET {reanalysed}, ai_summary = NULL, ocr_entities = NULL, "
+                          f"processed_at = datetime('now') WHERE url = ?", values[1:] + values[:1])
+                if not c.rowcount:
+                    c.execute(insert, values)
+            inserted = len(params)
+        if owned:
+            conn.commit()
+    finally:
+        if owned:
+            conn.close()
+    print(f"✅ Batch stored {inserted}/{len(rows)} rows")
+    return inserted
+
+
 def fetch_all_data(run_id=None, limit=None, offset=None, search=None):
     """Fetch all data with optional pagination and search filtering."""
     conn = sqlite3.connect(DB_PATH)
@@ -280,10 +466,14 @@ def fetch_all_data_ai(run_id=None, limit=None, offset=None, search=None):
     return data
 
 
-def update_ai_analysis(row_id, ai_classification=None, leak_severity=None, 
-                      ai_confidence=None, ai_summary=None):
-    """Update AI analysis results for a specific row."""
-    conn = sqlite3.connect(DB_PATH)
+def update_ai_analysis(row_id=None, ai_classification=None, leak_severity=None, 
+                      ai_confidence=None, ai_summary=None, url=None,
+                      detection_method=None, local_detection_results=None,
+                      gemini_detection_results=None, conn=None):
+    """Update AI analysis results for a specific row (by id, or by canonical URL).
+    Returns the number of rows updated. With conn the update joins the caller's transaction.
+    """
+    conn, owned = _connection(conn)
     c = conn.cursor()
     
     updates = []
@@ -305,14 +495,270 @@ def update_ai_analysis(row_id, ai_classification=None, leak_severity=None,
         updates.append("ai_summary = ?")
         params.append(ai_summary)
     
+    if detection_method is not None:
+        updates.append("detection_method = ?")
+        params.append(detection_method)
+    
+    if local_detection_results is not None:
+        updates.append("local_detection_results = ?")
+        params.append(local_detection_results)
+    
+    if gemini_detection_results is not None:
+        updates.append("gemini_detection_results = ?")
+        params.append(gemini_detection_results)
+    
     updates.append("processed_at = datetime('now')")
-    params.append(row_id)
     
-    query = f"UPDATE scraped_data SET {', '.join(updates)} WHERE id = ?"
+    if row_id is not None:
+        where = "id = ?"
+        params.append(row_id)
+    else:
+        where = "url = ?"
+        params.append(url)
+    
+    query = f"UPDATE scraped_data SET {', '.join(updates)} WHERE {where}"
     c.execute(query, params)
+    updated = c.rowcount
+    # A verdict settles any deferred classification of the page
+    if row_id is not None:
+        c.execute("DELETE FROM ai_pending WHERE url = (SELECT url FROM scraped_data WHERE id = ?)", (row_id,))
+    else:
+        c.execute("DELETE FROM ai_pending WHERE url = ?", (url,))
+    if owned:
+        conn.commit()
+        conn.close()
+    print(f"🧠 AI analysis updated for {'ID ' + str(row_id) if row_id is not None else url}: {ai_classification} - {leak_severity}")
+    return updated
+
+
+def defer_ai_analysis(url, text, keywords='', run_id=None, reason=None, conn=None):
+    """Keep a page's AI input for a later run and mark its row detection_method = 'ai_pending'.
+
+    keywords is the comma-separated list of keywords.json terms matched on the page.
+    Returns the number of page rows marked. With conn the writes join the caller's transaction.
+    """
+    conn, owned = _connection(conn)
+    c = conn.cursor()
+    c.execute("""
+        INSERT OR REPLACE INTO ai_pending (url, run_id, text, keywords, reason, deferred_at)
+        VALUES (?, ?, ?, ?, ?, datetime('now'))
+    """, (url, run_id, text, keywords, reason))
+    c.execute("UPDATE scraped_data SET detection_method = 'ai_pending' WHERE url = ?", (url,))
+    marked = c.rowcount
+    if owned:
+        conn.commit()
+        conn.close()
+    return marked
+
+
+def fetch_ai_pending(limit=100):
+    """Return (url, text, keywords) of pages waiting for a Gemini verdict, oldest first."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    try:
+        c.execute("SELECT url, text, keywords FROM ai_pending ORDER BY deferred_at LIMIT ?", (limit,))
+        pending = c.fetchall()
+    except sqlite3.OperationalError:
+        pending = []
+    conn.close()
+    return pending
+
+
+def fetch_mirrors(url):
+    """Return (url, run_id, created_at) of pages linked to url as near-duplicate mirrors."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("""
+        SELECT url, run_id, created_at FROM scraped_data
+        WHERE duplicate_of = ? ORDER BY created_at DESC
+    """, (url,))
+    mirrors = c.fetchall()
+    conn.close()
+    return mirrors
+
+
+def _merge_entity_lists(existing, added):
+    """Comma-separated category:value lists combined without repeats, existing entries first."""
+    merged = [entity for entity in (existing or '').split(',') if entity]
+    seen = set(merged)
+    for entity in added.split(','):
+        if entity and entity not in seen:
+            seen.add(entity)
+            merged.append(entity)
+    return ','.join(merged)
+
+
+def record_ocr_result(url, attachment_url, run_id=None, kind=None, size=0, text_chars=0,
+                      confidence=0.0, entities='', error=None, conn=None):
+    """Store an OCR'd attachment and merge its entities into the row of the page (url) that linked it.
+
+    entities is a comma-separated category:value list, like named_entities.
+    Returns the number of page rows updated. With conn the writes join the caller's transaction.
+    """
+    conn, owned = _connection(conn)
+    c = conn.cursor()
+    c.execute("""
+        INSERT OR REPLACE INTO ocr_attachments
+            (page_url, attachment_url, run_id, kind, bytes, text_chars, confidence, entities, error, processed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+    """, (url, attachment_url, run_id, kind, size, text_chars, confidence, entities, error))
+
+    updated = 0
+    if entities:
+        c.execute("SELECT id, named_entities, ocr_entities FROM scraped_data WHERE url = ?", (url,))
+        for row_id, named_entities, ocr_entities in c.fetchall():
+            c.execute("UPDATE scraped_data SET named_entities = ?, ocr_entities = ? WHERE id = ?",
+                      (_merge_entity_lists(named_entities, entities),
+                       _merge_entity_lists(ocr_entities, entities), row_id))
+            updated += 1
+    if owned:
+        conn.commit()
+        conn.close()
+    return updated
+
+
+def fetch_ocr_attachments(url):
+    """Return (attachment_url, kind, bytes, confidence, entities, error, processed_at) OCR'd for a page."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    try:
+        c.execute("""
+            SELECT attachment_url, kind, bytes, confidence, entities, error, processed_at
+            FROM ocr_attachments WHERE page_url = ? ORDER BY processed_at
+        """, (url,))
+        attachments = c.fetchall()
+    except sqlite3.OperationalError:
+        attachments = []
+    conn.close()
+    return attachments
+
+
+def record_filtered_download(url, run_id=None, page_url=None, content_type=None, declared_bytes=None,
+                             bytes_read=0, reason=None, conn=None):
+    """Store what is known about a link whose download was aborted instead of its content.
+
+    page_url is the page that linked an aborted attachment (None for pages).
+    Returns the number of rows written. With conn the write joins the caller's transaction.
+    """
+    conn, owned = _connection(conn)
+    c = conn.cursor()
+    c.execute("""
+        INSERT OR REPLACE INTO filtered_downloads
+            (url, run_id, page_url, content_type, declared_bytes, bytes_read, reason, recorded_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
+    """, (url, run_id, page_url, content_type, declared_bytes, bytes_read, reason))
+    if owned:
+        conn.commit()
+        conn.close()
+    return 1
+
+
+def fetch_filtered_downloads(run_id=None, limit=100):
+    """Return (url, page_url, content_type, declared_bytes, bytes_read, reason, recorded_at), newest first."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    query = """
+        SELECT url, page_url, content_type, declared_bytes, bytes_read, reason, recorded_at
+        FROM filtered_downloads
+    """
+    params = []
+    if run_id:
+        query += " WHERE run_id = ?"
+        params.append(run_id)
+    query += " ORDER BY recorded_at DESC LIMIT ?"
+    params.append(limit)
+    try:
+        c.execute(query, params)
+        rows = c.fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    conn.close()
+    return rows
+
+
+def fetch_host_ranks(limit=50):
+    """Return (host, rank, in_hosts, out_hosts, updated_at) from the link graph, highest PageRank first."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    try:
+        c.execute("""
+            SELECT host, rank, in_hosts, out_hosts, updated_at
+            FROM host_rank ORDER BY rank DESC LIMIT ?
+        """, (limit,))
+        rows = c.fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    conn.close()
+    return rows
+
+
+def add_crawl_seeds(seeds):
+    """Insert or update (url, max_depth, max_pages) seeds for --seed-table batch crawls."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.executemany("""
+        INSERT INTO crawl_seeds (url, max_depth, max_pages, enabled) VALUES (?, ?, ?, 1)
+        ON CONFLICT(url) DO UPDATE SET max_depth = excluded.max_depth,
+                                       max_pages = excluded.max_pages, enabled = 1
+    """, seeds)
+    conn.commit()
+    conn.close()
+
+
+def fetch_crawl_seeds():
+    """Return (url, max_depth, max_pages) of enabled seeds in insertion order."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT url, max_depth, max_pages FROM crawl_seeds WHERE enabled = 1 ORDER BY rowid")
+    seeds = c.fetchall()
+    conn.close()
+    return seeds
+
+
+def save_seed_stats(run_id, rows, shard=0):
+    """Upsert one worker's per-seed counters (dicts with seed_url and the seed_stats columns)."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.executemany("""
+        INSERT INTO seed_stats (run_id, seed_url, shard, pages, failed, bytes, entities,
+                                leak_pages, skipped_depth, skipped_budget, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(run_id, seed_url, shard) DO UPDATE SET
+            pages = excluded.pages, failed = excluded.failed, bytes = excluded.bytes,
+            entities = excluded.entities, leak_pages = excluded.leak_pages,
+            skipped_depth = excluded.skipped_depth, skipped_budget = excluded.skipped_budget,
+            updated_at = CURRENT_TIMESTAMP
+    """, [(run_id, row['seed_url'], shard, row['pages'], row['failed'], row['bytes'], row['entities'],
+           row['leak_pages'], row['skipped_depth'], row['skipped_budget']) for row in rows])
     conn.commit()
     conn.close()
-    print(f"🧠 AI analysis updated for ID {row_id}: {ai_classification} - {leak_severity}")
+
+
+def fetch_seed_stats(run_id, shard=None):
+    """Per-seed counters of a run as dicts, summed over worker shards unless shard is given."""
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    query = """
+        SELECT seed_url, SUM(pages) AS pages, SUM(failed) AS failed, SUM(bytes) AS bytes,
+               SUM(entities) AS entities, SUM(leak_pages) AS leak_pages,
+               SUM(skipped_depth) AS skipped_depth, SUM(skipped_budget) AS skipped_budget,
+               MAX(updated_at) AS updated_at
+        FROM seed_stats WHERE run_id = ?
+    """
+    params = [run_id]
+    if shard is not None:
+        query += " AND shard = ?"
+        params.append(shard)
+    query += " GROUP BY seed_url ORDER BY leak_pages DESC, entities DESC, seed_url"
+    try:
+        c.execute(query, params)
+        stats = [dict(row) for row in c.fetchall()]
+    except sqlite3.OperationalError:
+        # Table not created yet (database predates batch crawls)
+        stats = []
+    conn.close()
+    return stats
 
 
 def search_by_identifier_db(identifier, limit=100):
@@ -519,11 +965,19 @@ def get_leak_statistics():
     c.execute("SELECT AVG(ai_confidence) FROM scraped_data WHERE ai_confidence > 0")
     avg_confidence = c.fetchone()[0] or 0
     
+    # Pages still waiting for a Gemini verdict (see fetch_ai_pending)
+    try:
+        c.execute("SELECT COUNT(*) FROM ai_pending")
+        ai_pending = c.fetchone()[0]
+    except sqlite3.OperationalError:
+        ai_pending = 0
+    
     conn.close()
     
     return {
         "total_records": total_records,
         "ai_analyzed": ai_analyzed,
+        "ai_pending": ai_pending,
         "severity_distribution": severity_stats,
         "classification_distribution": classification_stats,
         "average_confidence": round(avg_confidence, 2)
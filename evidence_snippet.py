@@ -0,0 +1,111 @@
+"""
+Evidence Snippets
+Builds the text sent to Gemini from the parts of a page around its local hits.
+
+Long pages used to be cut to their first 4000 characters. On forum and market
+pages those are mostly navigation, and the PII sits further down. The builder
+instead takes a window of context around every local regex match, leak cue and
+keyword hit, and merges windows that overlap. It packs the windows with the
+most hits per character into the caller's budget, then joins them in page
+order with a "..." line between them. Pages that fit the budget are sent
+whole, and pages without any hit, or budgets too small for one window, fall
+back to their beginning.
+"""
+
+import re
+from typing import Iterable, List, Tuple
+
+from leak_gate import evidence_spans
+
+# Characters of context kept on each side of a hit
+WINDOW_CHARS = 200
+# Smallest piece of a window worth filling the rest of the budget with
+MIN_PART_CHARS = 80
+SEPARATOR = "\n...\n"
+# Smallest budget that can hold one window; tighter budgets get the page's beginning
+MIN_BUDGET_CHARS = MIN_PART_CHARS + len(SEPARATOR)
+
+_WHITESPACE = re.compile(r'\s')
+
+
+def keyword_spans(text: str, keywords: Iterable[str]) -> List[Tuple[int, int, int]]:
+    """(start, end, weight 1) of every case-insensitive occurrence of the given terms."""
+    spans = []
+    for term in keywords:
+        if term.strip():
+            spans.extend((match.start(), match.end(), 1) for match in re.finditer(re.escape(term), text, re.IGNORECASE))
+    return spans
+
+
+def merge_windows(spans: List[Tuple[int, int, int]], text_length: int, context: int) -> List[List[int]]:
+    """[start, end, hit weight, first hit] windows of context characters around position-sorted spans, overlaps merged."""
+    windows = []
+    for start, end, weight in spans:
+        low, high = max(0, start - context), min(text_length, end + context)
+        if windows and low <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], high)
+            windows[-1][2] += weight
+        else:
+            windows.append([low, high, weight, start])
+    return windows
+
+
+def _last_space(text: str, start: int, end: int) -> int:
+    return max(text.rfind(' ', start, end), text.rfind('\n', start, end))
+
+
+def _snap(text: str, start: int, end: int, context: int) -> Tuple[int, int]:
+    """Move window edges onto whitespace within their context margins, so no word or number is cut."""
+    if start > 0:
+        space = _WHITESPACE.search(text, start, start + context)
+        if space:
+            start = space.end()
+    if end < len(text):
+        space = _last_space(text, end - context, end)
+        if space != -1:
+            end = space
+    return start, end
+
+
+def build_evidence_snippet(text: str, max_chars: int, keywords: Iterable[str] = (),
+                           context: int = WINDOW_CHARS) -> str:
+    """At most about max_chars of text: the windows around its hits, densest first, in page order.
+
+    keywords: terms the caller already matched on the page (e.g. keywords.json hits); local
+    entity patterns, leak cues and record field labels are always looked for.
+    """
+    if len(text) <= max_chars:
+        return text
+    spans = evidence_spans(text) + keyword_spans(text, keywords)
+    if not spans:
+        return text[:max_chars] + "..."
+    spans.sort()
+
+    chosen = []
+    room = max_chars
+    windows = merge_windows(spans, len(text), context)
+    for start, end, weight, first_hit in sorted(windows, key=lambda window: window[2] / (window[1] - window[0]),
+                                                reverse=True):
+        if room < MIN_BUDGET_CHARS:
+            break
+        start, end = _snap(text, start, end, context)
+        if end - start > room - len(SEPARATOR):
+            # A long run of hits (a dump) or little room left: keep its beginning, with less context before it
+            if first_hit - start > room // 4:
+                space = _WHITESPACE.search(text, first_hit - room // 4, first_hit)
+                start = space.end() if space else first_hit
+            end = start + room - len(SEPARATOR)
+            space = _last_space(text, first_hit + 1, end)
+            end = space if space != -1 else end
+        chosen.append((start, end))
+        room -= end - start + len(SEPARATOR)
+    if not chosen:
+        return text[:max_chars] + "..."
+
+    chosen.sort()
+    snippet = SEPARATOR.join(text[start:end] for start, end in chosen)
+    if chosen[0][0] > 0:
+        snippet = "..." + snippet
+    if chosen[-1][1] < len(text):
+        snippet += "..."
+    return snippet
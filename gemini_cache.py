@@ -0,0 +1,193 @@
+"""
+Gemini Response Cache
+Persistent, content-addressed cache of Gemini JSON responses.
+
+Entries are keyed by a SHA-256 of (prompt type, model name, normalized input),
+so the same dump seen on a mirror, or the same dashboard search repeated, is
+answered from SQLite instead of the API. Entries expire after a TTL. When the
+cache is over its size bound, the least recently used entries are evicted.
+Identical requests that arrive while the first one is still waiting on
+Gemini share its single API call. Only successful responses are cached:
+failures fall through to each method's usual fallback.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gemini_cache.db')
+
+
+def normalize_input(text: str) -> str:
+    """Unicode NFKC and collapsed whitespace: inputs that differ only in layout share an entry."""
+    return " ".join(unicodedata.normalize('NFKC', text).split())
+
+
+def cache_key(prompt_type: str, model: str, text: str) -> str:
+    """Content address of one Gemini request."""
+    digest = hashlib.sha256()
+    for part in (prompt_type, model, normalize_input(text)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class GeminiResponseCache:
+    """SQLite-backed Gemini response cache with TTL, LRU eviction and in-flight call coalescing.
+
+    Args:
+        path: SQLite file (default: gemini_cache.db in the project root)
+        ttl: seconds an entry is served before the API is asked again (0 = never expires)
+        max_entries: entries kept; beyond this the least recently used are evicted
+    """
+
+    def __init__(self, path: str = None, ttl: float = 7 * 86400, max_entries: int = 50000):
+        self.path = path or DEFAULT_CACHE_PATH
+        self.ttl = float(ttl)
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        self.counts = {'hits': 0, 'misses': 0, 'coalesced': 0, 'stored': 0, 'expired': 0, 'evicted': 0}
+
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS gemini_cache (
+                key TEXT PRIMARY KEY,
+                prompt_type TEXT,
+                model TEXT,
+                response TEXT,
+                created_at REAL,
+                last_used REAL,
+                hits INTEGER DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_gemini_cache_last_used ON gemini_cache(last_used);
+        ''')
+        self.conn.commit()
+        self.entries = self.conn.execute("SELECT COUNT(*) FROM gemini_cache").fetchone()[0]
+
+    @classmethod
+    def from_env(cls) -> 'GeminiResponseCache':
+        """GEMINI_CACHE_PATH / GEMINI_CACHE_TTL / GEMINI_CACHE_MAX_ENTRIES."""
+        return cls(os.getenv('GEMINI_CACHE_PATH') or None,
+                   ttl=float(os.getenv('GEMINI_CACHE_TTL', 7 * 86400)),
+                   max_entries=int(os.getenv('GEMINI_CACHE_MAX_ENTRIES', 50000)))
+
+    def _lookup(self, key: str, now: float):
+        """Stored response text for key, or None when absent or expired (caller holds the lock)."""
+        row = self.conn.execute("SELECT response, created_at FROM gemini_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        response, created_at = row
+        if self.ttl and now - created_at > self.ttl:
+            self.entries -= self.conn.execute("DELETE FROM gemini_cache WHERE key = ?", (key,)).rowcount
+            self.conn.commit()
+            self.counts['expired'] += 1
+            return None
+        self.conn.execute("UPDATE gemini_cache SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        self.conn.commit()
+        return response
+
+    def _store(self, key: str, prompt_type: str, model: str, response: str):
+        now = time.time()
+        with self._lock:
+            added = self.conn.execute('''
+                INSERT OR IGNORE INTO gemini_cache (key, prompt_type, model, response, created_at, last_used, hits)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+            ''', (key, prompt_type, model, response, now, now)).rowcount
+            if not added:
+                # Refreshing an entry (e.g. stored by another process meanwhile) does not grow the cache
+                self.conn.execute('''
+                    UPDATE gemini_cache SET prompt_type = ?, model = ?, response = ?, created_at = ?, last_used = ?,
+                        hits = 0
+                    WHERE key = ?
+                ''', (prompt_type, model, response, now, now, key))
+            self.conn.commit()
+            self.entries += added
+            self.counts['stored'] += 1
+            if self.entries > self.max_entries:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        """Drop expired entries, then the least recently used down to 90% of max_entries (caller holds the lock)."""
+        if self.ttl:
+            expired = self.conn.execute("DELETE FROM gemini_cache WHERE created_at < ?", (now - self.ttl,)).rowcount
+            self.counts['expired'] += expired
+        # Other processes (dashboard, crawl shards) write to the same file, so recount
+        self.entries = self.conn.execute("SELECT COUNT(*) FROM gemini_cache").fetchone()[0]
+        if self.entries > self.max_entries:
+            keep = self.max_entries - self.max_entries // 10
+            evicted = self.conn.execute('''
+                DELETE FROM gemini_cache WHERE key IN (
+                    SELECT key FROM gemini_cache ORDER BY last_used LIMIT ?)
+            ''', (self.entries - keep,)).rowcount
+            self.entries -= evicted
+            self.counts['evicted'] += evicted
+        self.conn.commit()
+
+    def get(self, prompt_type: str, model: str, text: str) -> Optional[Any]:
+        """Cached response, or None (counted as a miss: the caller is expected to ask Gemini and put())."""
+        with self._lock:
+            cached = self._lookup(cache_key(prompt_type, model, text), time.time())
+            self.counts['misses' if cached is None else 'hits'] += 1
+        return None if cached is None else json.loads(cached)
+
+    def put(self, prompt_type: str, model: str, text: str, response: Any):
+        """Store a successful response obtained outside get_or_call() (e.g. one document of a batch)."""
+        self._store(cache_key(prompt_type, model, text), prompt_type, model, json.dumps(response))
+
+    def get_or_call(self, prompt_type: str, model: str, text: str, call: Callable[[], Any]) -> Any:
+        """Cached response for (prompt_type, model, text), else call() once for all concurrent identical requests.
+
+        call() must return a JSON-serializable response or raise; exceptions reach every
+        waiting caller and nothing is cached.
+        """
+        key = cache_key(prompt_type, model, text)
+        with self._lock:
+            cached = self._lookup(key, time.time())
+            if cached is not None:
+                self.counts['hits'] += 1
+                return json.loads(cached)
+            pending = self._in_flight.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._in_flight[key] = Future()
+                self.counts['misses'] += 1
+            else:
+                self.counts['coalesced'] += 1
+        if not leader:
+            # Another thread is already asking Gemini; each waiter gets its own copy
+            return json.loads(pending.result())
+
+        try:
+            result = call()
+            response = json.dumps(result)
+            self._store(key, prompt_type, model, response)
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        else:
+            pending.set_result(response)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+        return result
+
+    def snapshot(self) -> Dict[str, float]:
+        lookups = self.counts['hits'] + self.counts['misses'] + self.counts['coalesced']
+        return dict(self.counts, entries=self.entries,
+                    hit_rate=round((self.counts['hits'] + self.counts['coalesced']) / lookups, 3) if lookups else 0.0)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,277 @@
+"""
+Gemini Client Layer
+Rate limiting, retries and a circuit breaker shared by every Gemini caller.
+
+All GeminiAIProcessor calls (crawler AI stage, OCR post-processing, dashboard
+searches) go through one GeminiClient per process. Its quota state lives in
+SQLite, so crawl shards and the dashboard process draw from the same token
+bucket and see the same breaker:
+
+    token bucket     GEMINI_RPM_LIMIT requests per minute, bursts of GEMINI_BURST
+    retries          retryable errors (429, 5xx, timeouts) are retried up to GEMINI_MAX_RETRIES
+                     times with exponential backoff and full jitter
+    circuit breaker  GEMINI_BREAKER_THRESHOLD consecutive retryable failures open it for
+                     GEMINI_BREAKER_COOLDOWN seconds; calls then fail fast with GeminiUnavailable
+                     (the crawler re-queues that work) until one probe call succeeds
+
+Other errors (bad request, bad API key) are raised as they are and do not trip the breaker.
+"""
+
+import os
+import time
+import random
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from gemini_cache import DEFAULT_CACHE_PATH
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    RETRYABLE_ERRORS = (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted,
+                        google_exceptions.ServiceUnavailable, google_exceptions.InternalServerError,
+                        google_exceptions.DeadlineExceeded, google_exceptions.GatewayTimeout)
+except ImportError:
+    RETRYABLE_ERRORS = ()
+RETRYABLE_ERRORS += (ConnectionError, TimeoutError)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class GeminiUnavailable(Exception):
+    """Gemini is not being called right now (breaker open or retries exhausted); retry after retry_after seconds."""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class GeminiQuota:
+    """Token bucket + circuit breaker stored in one SQLite row, shared by every process using the file.
+
+    Args:
+        path: SQLite file (default: the Gemini cache file)
+        rpm: requests per minute the bucket refills at
+        burst: bucket capacity (requests that may go out back to back)
+        failure_threshold: consecutive retryable failures that open the breaker
+        cooldown: seconds the breaker stays open before a probe call is let through
+        name: quota row (one per API key / project if several share the file)
+    """
+
+    def __init__(self, path: str = None, rpm: float = 60, burst: int = 10, failure_threshold: int = 5,
+                 cooldown: float = 60.0, name: str = 'gemini'):
+        self.path = path or DEFAULT_CACHE_PATH
+        self.rate = max(float(rpm), 0.01) / 60.0
+        self.burst = max(1, int(burst))
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown = float(cooldown)
+        self.name = name
+        self._lock = threading.Lock()
+
+        # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS gemini_quota (
+                name TEXT PRIMARY KEY,
+                tokens REAL,
+                refilled_at REAL,
+                failures INTEGER DEFAULT 0,
+                open_until REAL DEFAULT 0,
+                calls INTEGER DEFAULT 0,
+                failed_calls INTEGER DEFAULT 0,
+                rejected INTEGER DEFAULT 0,
+                breaker_trips INTEGER DEFAULT 0
+            )
+        ''')
+        self.conn.execute("INSERT OR IGNORE INTO gemini_quota (name, tokens, refilled_at) VALUES (?, ?, ?)",
+                          (name, self.burst, time.time()))
+
+    def _row(self) -> Dict[str, Any]:
+        """The quota row as a dict (caller holds the lock)."""
+        cursor = self.conn.execute("SELECT * FROM gemini_quota WHERE name = ?", (self.name,))
+        return dict(zip([column[0] for column in cursor.description], cursor.fetchone()))
+
+    def _update(self, change: Callable[[Dict[str, Any], float], Any]) -> Any:
+        """Run change(row, now) on the quota row in one write transaction; changed row values are saved."""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._row()
+                before = dict(row)
+                result = change(row, time.time())
+                changed = {column: value for column, value in row.items() if value != before[column]}
+                if changed:
+                    self.conn.execute(f"UPDATE gemini_quota SET {', '.join(f'{column} = ?' for column in changed)} "
+                                      f"WHERE name = ?", (*changed.values(), self.name))
+                self.conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def acquire(self) -> float:
+        """Take a request token: 0 when granted, else seconds until the next one.
+
+        Raises GeminiUnavailable while the breaker is open. Once the cooldown is over,
+        the first caller is let through as the probe and the breaker stays open for the rest.
+        """
+        def take(row, now):
+            if row['failures'] >= self.failure_threshold and now < row['open_until']:
+                row['rejected'] += 1
+                # Returned, not raised, so the rejection is committed
+                return GeminiUnavailable(f"Gemini circuit breaker open ({row['failures']} consecutive failures)",
+                                         retry_after=row['open_until'] - now)
+            row['tokens'] = min(self.burst, row['tokens'] + (now - row['refilled_at']) * self.rate)
+            row['refilled_at'] = now
+            if row['tokens'] < 1:
+                return (1 - row['tokens']) / self.rate
+            row['tokens'] -= 1
+            row['calls'] += 1
+            if row['failures'] >= self.failure_threshold:
+                # Half-open: this call is the probe
+                row['open_until'] = now + self.cooldown
+            return 0.0
+        wait = self._update(take)
+        if isinstance(wait, GeminiUnavailable):
+            raise wait
+        return wait
+
+    def record_success(self):
+        def close(row, now):
+            row['failures'] = 0
+            row['open_until'] = 0
+        self._update(close)
+
+    def record_failure(self) -> bool:
+        """Count a retryable failure; True when it opened (or re-opened) the breaker."""
+        def fail(row, now):
+            row['failures'] += 1
+            row['failed_calls'] += 1
+            if row['failures'] >= self.failure_threshold:
+                row['open_until'] = now + self.cooldown
+                row['breaker_trips'] += 1
+                return True
+            return False
+        return self._update(fail)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Breaker state and counters, read without taking the write lock other processes need."""
+        with self._lock:
+            row = self._row()
+        now = time.time()
+        state = CLOSED
+        if row['failures'] >= self.failure_threshold:
+            state = OPEN if now < row['open_until'] else HALF_OPEN
+        return {
+            'state': state,
+            'tokens': round(min(self.burst, row['tokens'] + (now - row['refilled_at']) * self.rate), 2),
+            'rpm': round(self.rate * 60, 2),
+            'burst': self.burst,
+            'consecutive_failures': row['failures'],
+            'open_for': round(max(0.0, row['open_until'] - now), 1) if state == OPEN else 0.0,
+            'calls': row['calls'],
+            'failed_calls': row['failed_calls'],
+            'rejected': row['rejected'],
+            'breaker_trips': row['breaker_trips'],
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class GeminiClient:
+    """Runs Gemini calls under a shared GeminiQuota, retrying retryable errors with jittered backoff.
+
+    Args:
+        quota: shared token bucket and breaker
+        max_retries: retries after the first attempt for retryable errors
+        backoff_base / backoff_max: retry n waits uniform(0, min(backoff_max, backoff_base * 2**n)) seconds
+    """
+
+    def __init__(self, quota: GeminiQuota, max_retries: int = 3, backoff_base: float = 1.0, backoff_max: float = 60.0):
+        self.quota = quota
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self._lock = threading.Lock()
+        self.counts = {'calls': 0, 'retries': 0, 'unavailable': 0, 'throttled_seconds': 0.0, 'backoff_seconds': 0.0}
+
+    @classmethod
+    def from_env(cls) -> 'GeminiClient':
+        quota = GeminiQuota(os.getenv('GEMINI_QUOTA_PATH') or None,
+                            rpm=float(os.getenv('GEMINI_RPM_LIMIT', 60)),
+                            burst=int(os.getenv('GEMINI_BURST', 10)),
+                            failure_threshold=int(os.getenv('GEMINI_BREAKER_THRESHOLD', 5)),
+                            cooldown=float(os.getenv('GEMINI_BREAKER_COOLDOWN', 60)))
+        return cls(quota, max_retries=int(os.getenv('GEMINI_MAX_RETRIES', 3)),
+                   backoff_base=float(os.getenv('GEMINI_BACKOFF_BASE', 1.0)),
+                   backoff_max=float(os.getenv('GEMINI_BACKOFF_MAX', 60)))
+
+    def _count(self, key: str, value: float = 1):
+        with self._lock:
+            self.counts[key] += value
+
+    def _wait_for_token(self):
+        while True:
+            wait = self.quota.acquire()
+            if not wait:
+                return
+            self._count('throttled_seconds', wait)
+            time.sleep(wait)
+
+    def call(self, request: Callable[[], Any]) -> Any:
+        """request() under the rate limit; retryable errors are retried, then raised as GeminiUnavailable."""
+        self._count('calls')
+        attempt = 0
+        while True:
+            try:
+                self._wait_for_token()
+            except GeminiUnavailable:
+                self._count('unavailable')
+                raise
+            try:
+                result = request()
+            except RETRYABLE_ERRORS as e:
+                opened = self.quota.record_failure()
+                if opened:
+                    logger.warning(f"Gemini circuit breaker opened for {self.quota.cooldown:g}s: {str(e)}")
+                if opened or attempt >= self.max_retries:
+                    self._count('unavailable')
+                    raise GeminiUnavailable(f"Gemini unavailable after {attempt + 1} attempts: {str(e)}",
+                                            retry_after=self.quota.cooldown if opened else self.backoff_base) from e
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                attempt += 1
+                self._count('retries')
+                self._count('backoff_seconds', delay)
+                logger.info(f"Gemini call failed ({type(e).__name__}), retry {attempt} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self.quota.record_success()
+            return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        """This process's call counters plus the shared quota view."""
+        with self._lock:
+            counts = {key: round(value, 2) if isinstance(value, float) else value for key, value in self.counts.items()}
+        return dict(counts, **{f'quota_{key}': value for key, value in self.quota.snapshot().items()})
+
+
+_shared_client: Optional[GeminiClient] = None
+_shared_lock = threading.Lock()
+
+
+def shared_client() -> GeminiClient:
+    """The process-wide GeminiClient (built from the environment on first use)."""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = GeminiClient.from_env()
+        return _shared_client
@@ -37,8 +37,8 @@ echo -e "\033[0m"
 
 echo " "
 
-# ✍️ Ask user for onion URL
-read -p "🔗 Enter the starting .onion URL (with http:// or https://) : " START_URL
+# ✍️ Ask user for onion URL (or a seed list file)
+read -p "🔗 Enter the starting .onion URL (with http:// or https://) or a seed list file : " START_URL
 
 # If no input, exit
 if [ -z "$START_URL" ]; then
@@ -46,13 +46,20 @@ if [ -z "$START_URL" ]; then
   exit 1
 fi
 
+# 🌱 A file crawls all of its seeds in one process
+if [ -f "$START_URL" ]; then
+  CRAWL_ARGS=(--seeds "$START_URL")
+else
+  CRAWL_ARGS=("$START_URL")
+fi
+
 echo ""
 echo "🚀 Starting Decimal Darkweb Monitoring..."
 echo ""
 
 # Start crawler
 echo "🔎 Starting crawler..."
-python3 crawler/decimal_crawler.py "$START_URL" &
+python3 crawler/decimal_crawler.py "${CRAWL_ARGS[@]}" &
 CRAWLER_PID=$!
 
 # Start Flask dashboard
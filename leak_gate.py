@@ -0,0 +1,304 @@
+"""
+Local Leak Gate
+Scores a page's local leak evidence so that only likely leaks are sent to Gemini.
+
+Any local regex hit used to send a page to Gemini, and the generic patterns
+(9-18 digit numbers, e-mail addresses) match almost every page. The gate adds
+up points for four kinds of evidence instead:
+
+    validated entities  values right after their label ("Aadhaar:", "A/c no", "IMEI", ...), or in a
+                        column under a short header line naming it ("Name | Aadhar no | Mobile"),
+                        count in full; unlabelled ones count half if they pass their check (Verhoeff
+                        for Aadhaar, PAN holder type, Luhn for cards and IMEIs, no timestamps or
+                        mobile numbers for accounts)
+    record rows         lines holding a credited value, from three of them on (tabular records)
+    keyword density     distinct keywords.json terms per KB of text (when the caller matched them)
+    context cues        leak vocabulary (dump, leaked, combolist, ...) and record field labels
+                        (Name:, D.O.B, Father's name, S/o, ...) that mark personal data
+
+Every signal saturates, so a score is 0-100. Pages that score at or above the
+threshold (AI_GATE_THRESHOLD; 0 turns the gate off) go to Gemini if the
+caller's scan or the gate's own entity rules found something. Cues and field
+labels alone never pass: they only add weight to a page with a hit. The
+default threshold is the highest at which scripts/benchmark_ai_gate.py still
+catches more of its labelled sample's leaks than the old rule.
+"""
+
+import os
+import re
+import logging
+from bisect import bisect_right
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 25.0
+
+# Characters before a value searched for its label
+LABEL_WINDOW = 40
+
+# A label on a short line (at most HEADER_WORDS words and HEADER_CHARS characters) heads the
+# values below it when they fill at least MIN_COLUMN_ROWS lines
+HEADER_WORDS = 10
+HEADER_CHARS = 120
+MIN_COLUMN_ROWS = 2
+
+# Share of a value's points when it has no label: about 1 in 10 random numbers passes a check digit
+UNLABELLED_SHARE = 0.5
+
+# Keyword density (distinct terms per KB) that earns all KEYWORD_POINTS
+KEYWORD_POINTS = 15.0
+KEYWORD_SATURATION = 2.0
+
+# Lines holding a credited value, from MIN_RECORD_ROWS of them: tabular personal records
+ROW_POINTS = 5.0
+MIN_RECORD_ROWS = 3
+MAX_ROW_POINTS = 25.0
+
+CUE_POINTS = 4.0
+MAX_CUE_POINTS = 20.0
+FIELD_POINTS = 5.0
+MAX_FIELD_POINTS = 25.0
+
+# Verhoeff dihedral group tables (used for the Aadhaar check digit)
+_VERHOEFF_D = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9), (1, 2, 3, 4, 0, 6, 7, 8, 9, 5), (2, 3, 4, 0, 1, 7, 8, 9, 5, 6),
+    (3, 4, 0, 1, 2, 8, 9, 5, 6, 7), (4, 0, 1, 2, 3, 9, 5, 6, 7, 8), (5, 9, 8, 7, 6, 0, 4, 3, 2, 1),
+    (6, 5, 9, 8, 7, 1, 0, 4, 3, 2), (7, 6, 5, 9, 8, 2, 1, 0, 4, 3), (8, 7, 6, 5, 9, 3, 2, 1, 0, 4),
+    (9, 8, 7, 6, 5, 4, 3, 2, 1, 0),
+)
+_VERHOEFF_P = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9), (1, 5, 7, 6, 2, 8, 3, 0, 9, 4), (5, 8, 0, 3, 7, 9, 6, 1, 4, 2),
+    (8, 9, 1, 6, 0, 4, 3, 5, 2, 7), (9, 4, 5, 3, 1, 2, 7, 6, 0, 8), (4, 2, 8, 6, 5, 7, 3, 9, 0, 1),
+    (2, 7, 9, 3, 8, 0, 6, 4, 1, 5), (7, 0, 4, 6, 9, 1, 3, 2, 5, 8),
+)
+
+# 4th character of a PAN: the holder type (person, company, HUF, firm, AOP, trust, ...)
+PAN_HOLDER_TYPES = frozenset('ABCFGHJLPT')
+
+
+def verhoeff_valid(digits: str) -> bool:
+    check = 0
+    for i, digit in enumerate(reversed(digits)):
+        check = _VERHOEFF_D[check][_VERHOEFF_P[i % 8][int(digit)]]
+    return check == 0
+
+
+def luhn_valid(digits: str) -> bool:
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        value = int(digit)
+        if i % 2:
+            value = value * 2 - 9 if value > 4 else value * 2
+        total += value
+    return total % 10 == 0
+
+
+def valid_aadhaar(value: str) -> bool:
+    """12 digits, not starting with 0 or 1, with a valid Verhoeff check digit."""
+    digits = re.sub(r'\D', '', value)
+    return len(digits) == 12 and digits[0] not in '01' and verhoeff_valid(digits)
+
+
+def valid_pan(value: str) -> bool:
+    return value[3] in PAN_HOLDER_TYPES
+
+
+def valid_card(value: str) -> bool:
+    digits = re.sub(r'\D', '', value)
+    return 13 <= len(digits) <= 19 and len(set(digits)) > 1 and luhn_valid(digits)
+
+
+def valid_account(value: str) -> bool:
+    """Not a Unix timestamp (seconds or milliseconds), an Indian mobile number or a run of one or two digits."""
+    if len(value) in (10, 13) and value[0] == '1':
+        return False
+    if (len(value) == 10 and value[0] in '6789') or (len(value) == 12 and value[:2] == '91' and value[2] in '6789'):
+        return False
+    return len(set(value)) > 2
+
+
+def valid_telecom(value: str) -> bool:
+    """A Luhn-valid IMEI, or an IMSI from an Indian network (MCC 404 / 405)."""
+    return (len(value) == 15 and luhn_valid(value)) or value[:3] in ('404', '405')
+
+
+def any_value(value: str) -> bool:
+    return True
+
+
+class EntityRule(NamedTuple):
+    pattern: str
+    label: str                                  # label expected right before a value
+    validator: Optional[Callable[[str], bool]]  # check for unlabelled values; None: they do not count
+    points: float                               # per distinct labelled value
+    max_points: float
+
+
+ENTITY_RULES: Dict[str, EntityRule] = {
+    'Aadhaar': EntityRule(r'(?<![\d-])\d{4}[ -]?\d{4}[ -]?\d{4}(?![\d-]| \d{4}\b)', r'aa?dh?aa?r|\buid\b',
+                          valid_aadhaar, 25, 75),
+    'PAN': EntityRule(r'\b[A-Z]{5}\d{4}[A-Z]\b', r'\bpan\b|permanent\s+account', valid_pan, 25, 75),
+    'Credit_Card': EntityRule(r'(?<![\d-])\d{4}[ -]?\d{4}[ -]?\d{4}[ -]?\d{1,7}(?![\d-])',
+                              r'\bcard\b|\bcc\b|\bcvv\b|debit|credit', valid_card, 20, 60),
+    'Government_ID': EntityRule(r'\b(?:[A-Z]{3}\d{7}|[A-Z]\d{7}|[A-Z]{2}[ -]?\d{2}[ -]?\d{11})\b',
+                                r'passport|voter|\bepic\b|driving|licen[cs]e|\bdl\b', any_value, 20, 60),
+    'Telecom_Data': EntityRule(r'(?<!\d)\d{15,16}(?!\d)', r'\bimei\b|\bimsi\b|msisdn|\biccid\b',
+                               valid_telecom, 15, 45),
+    'Bank_Account': EntityRule(r'(?<!\d)\d{9,18}(?!\d)', r'account|\ba/c\b|\bacc\b|\bacct\b',
+                               valid_account, 10, 30),
+    'IFSC': EntityRule(r'\b[A-Z]{4}0[A-Z0-9]{6}\b', r'ifsc', any_value, 10, 20),
+    'Phone': EntityRule(r'(?<![\d+])(?:\+91[ -]?)?[6-9]\d{4} ?\d{5}(?!\d)', r'phone|mobile|contact',
+                        any_value, 6, 30),
+    'Email': EntityRule(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b', r'e-?mail', any_value, 3, 30),
+}
+
+# Words that describe leaked data, and column / field labels of personal records
+LEAK_CUES = (
+    r'leak(?:ed|s)?', r'dump(?:ed|s)?', r'breach(?:ed|es)?', r'combo\s?list', r'fullz', r'dox(?:x?ed)?',
+    r'kyc', r'passwords?', r'database', r'sell(?:ing)?|for\s+sale', r'records|entries', r'samples?',
+)
+RECORD_FIELDS = (
+    r'name\s*[:|,=]', r'd\.?o\.?b\b|date\s+of\s+birth', r'father\'?s?(?:\s+name)?\s*[:|,=]|[sdw]/o\b',
+    r'address\s*[:|,=]', r'(?:mobile|phone)(?:\s*(?:no\.?|number))?\s*[:|,=]', r'gender|age\s*/\s*sex',
+    r'pin\s?code', r'(?:aa?dh?aa?r|pan)\s*(?:no\.?|number)?\s*[:|,=]',
+)
+
+
+def _column_heading(text: str, label, newlines: List[int]) -> int:
+    """End of the first short line holding the label (a table header such as "Name | Aadhar no"), else past the text."""
+    for match in label.finditer(text):
+        line = bisect_right(newlines, match.start())
+        start = newlines[line - 1] + 1 if line else 0
+        end = newlines[line] if line < len(newlines) else len(text)
+        if end - start <= HEADER_CHARS and len(text[start:end].split()) <= HEADER_WORDS:
+            return end
+    return len(text)
+
+
+def _alternation(prefix: str, patterns) -> str:
+    return '|'.join(f'(?P<{prefix}{i}>\\b(?:{pattern}))' for i, pattern in enumerate(patterns))
+
+
+_COMPILED_RULES = {entity_type: (re.compile(rule.pattern), re.compile(rule.label, re.IGNORECASE))
+                   for entity_type, rule in ENTITY_RULES.items()}
+_NEWLINE = re.compile(r'\n')
+# One pass over the text finds every cue and field label
+_CONTEXT_RE = re.compile(f"{_alternation('cue', LEAK_CUES)}|{_alternation('field', RECORD_FIELDS)}", re.IGNORECASE)
+
+
+def evidence_spans(text: str) -> List[Tuple[int, int, int]]:
+    """(start, end, weight) of every entity pattern match (weight 2) and cue / field label (weight 1), by position."""
+    spans = [(match.start(), match.end(), 2) for pattern, _ in _COMPILED_RULES.values() for match in pattern.finditer(text)]
+    spans.extend((match.start(), match.end(), 1) for match in _CONTEXT_RE.finditer(text))
+    spans.sort()
+    return spans
+
+
+class GateDecision(NamedTuple):
+    score: float
+    passed: bool
+    signals: Dict[str, float]  # points per entity type, 'rows', 'keywords', 'cues' and 'fields'
+
+
+class LeakGate:
+    """Local leak-evidence score deciding which pages are worth a Gemini call.
+
+    Args:
+        threshold: minimum score (0-100) sent to Gemini; 0 sends every page with a local hit
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD):
+        self.threshold = max(0.0, float(threshold))
+
+    @classmethod
+    def from_env(cls) -> 'LeakGate':
+        return cls(float(os.getenv('AI_GATE_THRESHOLD', DEFAULT_THRESHOLD)))
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def entity_counts(self, text: str) -> Dict[str, Tuple[int, int]]:
+        """(labelled, unlabelled but checked) distinct values per entity type."""
+        return self._entities(text)[0]
+
+    def _entities(self, text: str) -> Tuple[Dict[str, Tuple[int, int]], int]:
+        """entity_counts(), and the number of lines holding a credited value (record rows)."""
+        counts, rows = {}, set()
+        newlines = [match.start() for match in _NEWLINE.finditer(text)]
+        for entity_type, rule in ENTITY_RULES.items():
+            pattern, label = _COMPILED_RULES[entity_type]
+            heading = _column_heading(text, label, newlines)
+            labelled, checked, column = set(), set(), {}
+            for match in pattern.finditer(text):
+                value = match.group()
+                line = bisect_right(newlines, match.start())
+                if label.search(text, max(0, match.start() - LABEL_WINDOW), match.start()):
+                    labelled.add(value)
+                elif match.start() > heading:
+                    column.setdefault(value, line)
+                    continue
+                elif rule.validator is not None and rule.validator(value):
+                    checked.add(value)
+                else:
+                    continue
+                rows.add(line)
+            # Values under a column heading count as labelled when they fill a column (one per line)
+            if len(set(column.values())) >= MIN_COLUMN_ROWS:
+                labelled.update(column)
+                rows.update(column.values())
+            else:
+                credited = [value for value in column if rule.validator is not None and rule.validator(value)]
+                checked.update(credited)
+                rows.update(column[value] for value in credited)
+            checked -= labelled
+            if labelled or checked:
+                counts[entity_type] = (len(labelled), len(checked))
+        return counts, len(rows)
+
+    def signals(self, text: str, keyword_count: int = 0, text_chars: int = None) -> Dict[str, float]:
+        """Points earned by each kind of evidence.
+
+        keyword_count: distinct keywords.json terms the caller matched on the page
+        text_chars: page length when text holds only part of it (streamed scans)
+        """
+        signals = {}
+        counts, rows = self._entities(text)
+        for entity_type, (labelled, checked) in counts.items():
+            rule = ENTITY_RULES[entity_type]
+            signals[entity_type] = min(rule.max_points, rule.points * (labelled + UNLABELLED_SHARE * checked))
+        if rows >= MIN_RECORD_ROWS:
+            signals['rows'] = min(MAX_ROW_POINTS, ROW_POINTS * rows)
+
+        if keyword_count:
+            per_kb = keyword_count * 1000.0 / max(text_chars or len(text), 1000)
+            signals['keywords'] = round(KEYWORD_POINTS * min(1.0, per_kb / KEYWORD_SATURATION), 1)
+
+        found = {match.lastgroup for match in _CONTEXT_RE.finditer(text)}
+        cues = sum(1 for group in found if group.startswith('cue'))
+        fields = len(found) - cues
+        if cues:
+            signals['cues'] = min(MAX_CUE_POINTS, CUE_POINTS * cues)
+        if fields:
+            signals['fields'] = min(MAX_FIELD_POINTS, FIELD_POINTS * fields)
+        return signals
+
+    def check(self, text: str, keyword_count: int = 0, text_chars: int = None, local_hits: bool = True) -> GateDecision:
+        """Score a page and decide whether it goes to Gemini.
+
+        local_hits: whether the caller's own regex / keyword scan found anything. A page passes
+        only with such a hit or a value credited by the gate's own entity rules, so cues and
+        field labels alone never send it; with the gate off (threshold 0) any page with a hit does
+        """
+        signals = self.signals(text, keyword_count, text_chars)
+        score = round(min(100.0, sum(signals.values())), 1)
+        hit = bool(local_hits) or any(signal in ENTITY_RULES for signal in signals)
+        return GateDecision(score, hit and score >= self.threshold, signals)
+
+
+# Gate that is off: detect_and_classify_leaks() uses it unless given one, and the crawler
+# passes it for pages it already scored before queuing them for AI
+UNGATED = LeakGate(0)
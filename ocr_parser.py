@@ -30,8 +30,6 @@ except ImportError:
     REQUESTS_AVAILABLE = False
     logging.warning("Requests not available. Install: pip install requests")
 
-from ai_utils import GeminiAIProcessor
-
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -39,16 +37,24 @@ logger = logging.getLogger(__name__)
 class OCRDocumentProcessor:
     """OCR document processor with Gemini AI integration."""
     
-    def __init__(self, gemini_processor: GeminiAIProcessor = None):
-        """Initialize OCR processor with Gemini AI."""
+    def __init__(self, gemini_processor=None):
+        """Initialize OCR processor; the Gemini client is created when AI post-processing first needs it."""
         if not TESSERACT_AVAILABLE:
             raise ImportError("OCR dependencies missing. Install: tesseract-ocr, pytesseract, pdf2image, pillow")
         
-        self.gemini_processor = gemini_processor or GeminiAIProcessor()
+        self._gemini_processor = gemini_processor
         self.temp_dir = tempfile.mkdtemp(prefix="ocr_processing_")
         
         # Configure Tesseract (adjust path if needed)
         self.configure_tesseract()
+    
+    @property
+    def gemini_processor(self):
+        """GeminiAIProcessor for process_with_gemini_ai() (OCR-only callers never build one)."""
+        if self._gemini_processor is None:
+            from ai_utils import GeminiAIProcessor
+            self._gemini_processor = GeminiAIProcessor()
+        return self._gemini_processor
         
     def configure_tesseract(self):
         """Configure Tesseract OCR settings."""
@@ -149,15 +155,16 @@ class OCRDocumentProcessor:
             total_words = 0
             
             for i, image in enumerate(images):
-                # Save temporary image
-                temp_image_path = os.path.join(self.temp_dir, f"page_{i+1}.png")
+                # Save temporary image (unique name: several documents may be processed concurrently)
+                fd, temp_image_path = tempfile.mkstemp(suffix=f"_page_{i+1}.png", dir=self.temp_dir)
+                os.close(fd)
                 image.save(temp_image_path)
                 
                 # Extract text from page
                 page_result = self.extract_text_from_image(temp_image_path, language)
                 
                 if page_result['processing_successful']:
-                    all_text.append(f"[Page {i+1}]\\n{page_result['cleaned_text']}")
+                    all_text.append(f"[Page {i+1}]\n{page_result['cleaned_text']}")
                     all_confidences.append(page_result['confidence'])
                     total_words += page_result['word_count']
                 
@@ -167,7 +174,7 @@ class OCRDocumentProcessor:
                 except:
                     pass
             
-            combined_text = "\\n\\n".join(all_text)
+            combined_text = "\n\n".join(all_text)
             avg_confidence = sum(all_confidences) / len(all_confidences) if all_confidences else 0
             
             result = {
@@ -251,6 +258,33 @@ class OCRDocumentProcessor:
                 'error': str(e)
             }
     
+    def extract_text_from_bytes(self, data: bytes, suffix: str, language: str = 'eng',
+                                max_pages: int = 10) -> Dict[str, Any]:
+        """
+        OCR an already downloaded image or PDF (e.g. a crawled attachment).
+        
+        Args:
+            data: file contents
+            suffix: file extension, '.pdf' or an image extension
+            language: Language code for OCR
+            max_pages: Maximum number of PDF pages to process
+        
+        Returns:
+            Dictionary with extracted text and metadata
+        """
+        fd, temp_path = tempfile.mkstemp(suffix=suffix, dir=self.temp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            if suffix == '.pdf':
+                return self.extract_text_from_pdf(temp_path, language, max_pages=max_pages)
+            return self.extract_text_from_image(temp_path, language)
+        finally:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+    
     def process_with_gemini_ai(self, ocr_result: Dict[str, Any]) -> Dict[str, Any]:
         """
         Process OCR text with Gemini AI for cleaning and entity extraction.
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Measure how many Gemini calls the local leak gate saves, and what it misses, on labelled pages.
+
+Call volume comes from pages generated from templates: leak pages (Aadhaar / PAN
+/ card dumps, combolists, dox records, bank and telecom records, sale ads with a
+sample) and ordinary onion pages that still trip the generic local regexes
+(order numbers, contact e-mails and phones, timestamps, market listings full of
+keywords). Each page is checked the old way (any run_local_regex_detection() hit
+goes to Gemini) and through LeakGate at each threshold.
+
+The generated leak pages are built with the gate's own check digits, so they
+cannot tell what the gate misses. Recall and false passes are measured on a
+hand-labelled sample instead (--sample, one {"leak": bool, "text": ...} JSON
+object per line; default scripts/gate_sample.jsonl), written without the
+validators: misspelled labels, numbers without valid check digits, sale ads
+without a sample, and benign pages about leaks or with empty form fields.
+
+    python3 scripts/benchmark_ai_gate.py --pages 2000 --leak-rate 0.05 [--sample labelled.jsonl]
+"""
+import json
+import os
+import sys
+import re
+import random
+import logging
+import argparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+from leak_gate import LeakGate, verhoeff_valid, luhn_valid, PAN_HOLDER_TYPES
+from crawler.keyword_matcher import KeywordMatcher
+
+logging.disable(logging.INFO)
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gate_sample.jsonl')
+
+FIRST_NAMES = ["Ravi", "Priya", "Amit", "Sunita", "Rahul", "Anjali", "Vikram", "Neha", "Arjun", "Pooja"]
+LAST_NAMES = ["Sharma", "Verma", "Patel", "Singh", "Kumar", "Gupta", "Reddy", "Nair", "Iyer", "Das"]
+CITIES = ["Mumbai", "Delhi", "Pune", "Chennai", "Kolkata", "Jaipur", "Lucknow", "Indore"]
+WORDS = ("the of and to in is for on with that this by from at as be are was it an or have not you they "
+         "forum thread reply post user admin market vendor order shipping escrow price review rating "
+         "update news guide tutorial link mirror service hosting privacy anonymous network").split()
+
+
+def aadhaar(rng):
+    body = str(rng.randint(2, 9)) + ''.join(str(rng.randint(0, 9)) for _ in range(10))
+    digits = next(body + str(d) for d in range(10) if verhoeff_valid(body + str(d)))
+    return rng.choice([digits, f"{digits[:4]} {digits[4:8]} {digits[8:]}", f"{digits[:4]}-{digits[4:8]}-{digits[8:]}"])
+
+
+def pan(rng):
+    letters = ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(3))
+    return f"{letters}{rng.choice(sorted(PAN_HOLDER_TYPES))}{rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ')}" \
+           f"{rng.randint(1000, 9999)}{rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ')}"
+
+
+def card(rng):
+    body = rng.choice(['4', '51', '52', '55']) + ''.join(str(rng.randint(0, 9)) for _ in range(14))
+    digits = (body + '0')[:15]
+    digits = next(digits + str(d) for d in range(10) if luhn_valid(digits + str(d)))
+    return ' '.join(digits[i:i + 4] for i in range(0, 16, 4)) if rng.random() < 0.5 else digits
+
+
+def phone(rng):
+    return str(rng.randint(6, 9)) + ''.join(str(rng.randint(0, 9)) for _ in range(9))
+
+
+def name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def email(rng):
+    return f"{rng.choice(FIRST_NAMES).lower()}.{rng.choice(LAST_NAMES).lower()}{rng.randint(1, 999)}@" \
+           f"{rng.choice(['gmail.com', 'yahoo.co.in', 'rediffmail.com', 'protonmail.com'])}"
+
+
+def filler(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def leak_page(rng):
+    kind = rng.randrange(8)
+    rows = rng.randint(3, 60)
+    if kind == 0:
+        lines = [f"{name(rng)} | {aadhaar(rng)} | {phone(rng)} | {rng.choice(CITIES)}" for _ in range(rows)]
+        return "Full aadhaar dump, fresh\nName | Aadhaar | Mobile | City\n" + "\n".join(lines)
+    if kind == 1:
+        lines = [f"{name(rng)},{pan(rng)},{rng.randint(1, 28)}/{rng.randint(1, 12)}/19{rng.randint(60, 99)}"
+                 for _ in range(rows)]
+        return "name,pan,dob\n" + "\n".join(lines) + f"\n{filler(rng, 40)}"
+    if kind == 2:
+        lines = [f"{card(rng)}|{rng.randint(1, 12):02d}/{rng.randint(25, 30)}|{rng.randint(100, 999)}|{name(rng)}"
+                 for _ in range(rows)]
+        return "Fresh fullz, valid rate 80%\n" + "\n".join(lines)
+    if kind == 3:
+        lines = [f"{email(rng)}:{filler(rng, 1)}{rng.randint(10, 9999)}" for _ in range(rng.randint(20, 300))]
+        return "combolist mail:pass private\n" + "\n".join(lines)
+    if kind == 4:
+        return (f"Name: {name(rng)}\nFather's name: {name(rng)}\nDOB: 12/04/1991\n"
+                f"Address: {rng.randint(1, 300)} MG Road, {rng.choice(CITIES)}\nAadhaar: {aadhaar(rng)}\n"
+                f"Mobile: {phone(rng)}\n{filler(rng, 80)}")
+    if kind == 5:
+        lines = [f"{name(rng)} A/c no: {rng.randint(10 ** 10, 10 ** 14)} IFSC: SBIN000{rng.randint(1000, 9999)}"
+                 for _ in range(rows)]
+        return "\n".join(lines) + f"\n{filler(rng, 30)}"
+    if kind == 6:
+        lines = [f"MSISDN: 91{phone(rng)} IMEI: {rng.randint(10 ** 14, 10 ** 15 - 1)} {name(rng)}" for _ in range(rows)]
+        return "subscriber records\n" + "\n".join(lines)
+    return (f"{filler(rng, 120)}\nSelling Aadhaar database, {rng.randint(1, 9)}M entries, "
+            f"sample: {aadhaar(rng)} {aadhaar(rng)} contact {email(rng)}\n{filler(rng, 120)}")
+
+
+def benign_page(rng):
+    kind = rng.randrange(6)
+    if kind == 0:
+        return (f"{filler(rng, 300)}\nOrder #{rng.randint(10 ** 9, 10 ** 12)} shipped. "
+                f"Questions: {email(rng)}\n{filler(rng, 200)}")
+    if kind == 1:
+        return (f"Vendor listing: {rng.choice(['weed', 'mdma', 'lsd', 'ketamine'])} for sale, "
+                f"{filler(rng, 150)} escrow id {rng.randint(10 ** 11, 10 ** 13)} support {email(rng)} "
+                f"{filler(rng, 150)}")
+    if kind == 2:
+        return (f"{filler(rng, 400)}\nPosted {rng.randint(1600000000, 1700000000)}{rng.randint(100, 999)} "
+                f"by {rng.choice(FIRST_NAMES).lower()}{rng.randint(1, 99)}\n{filler(rng, 200)}")
+    if kind == 3:
+        return (f"Login\nUsername\nPassword\nForgot password? Mail {email(rng)}\n{filler(rng, 60)}\n"
+                f"Mirror {rng.randint(10 ** 9, 10 ** 10)}")
+    if kind == 4:
+        return (f"{filler(rng, 250)}\nCall {phone(rng)} or write to {email(rng)} for hosting. "
+                f"Invoice {rng.randint(10 ** 8, 10 ** 11)}\n{filler(rng, 250)}")
+    return (f"hacking tutorial: sql injection, phishing and malware basics. {filler(rng, 300)} "
+            f"Build {rng.randint(10 ** 12, 10 ** 15)} contact {email(rng)}")
+
+
+def old_rule_hits(text):
+    """run_local_regex_detection()'s generic patterns: any of them sends the page to Gemini."""
+    return bool(re.search(r'\b\d{9,18}\b|\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b'
+                          r'|\b[A-Z]{5}\d{4}[A-Z]\b|\b[6-9]\d{9}\b', text))
+
+
+def load_sample(path):
+    """(is_leak, text) pairs from a labelled JSON-lines file."""
+    with open(path, encoding='utf-8') as f:
+        return [(bool(row['leak']), row['text']) for row in map(json.loads, f) if row]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--leak-rate', type=float, default=0.05)
+    parser.add_argument('--thresholds', default='10,15,20,25,30,40')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--sample', default=DEFAULT_SAMPLE, help='labelled pages for recall (JSON lines)')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    matcher = KeywordMatcher(os.path.join(ROOT, 'keywords.json'))
+    pages = []
+    for _ in range(args.pages):
+        is_leak = rng.random() < args.leak_rate
+        text = leak_page(rng) if is_leak else benign_page(rng)
+        pages.append((is_leak, text, len(matcher.match(text)), old_rule_hits(text)))
+    sample = [(is_leak, text, len(matcher.match(text)), old_rule_hits(text))
+              for is_leak, text in load_sample(args.sample)]
+
+    old_calls = sum(1 for *_, hit in pages if hit)
+    sample_leaks = sum(1 for is_leak, *_ in sample if is_leak)
+    sample_benign = len(sample) - sample_leaks
+    old_caught = sum(1 for is_leak, _, keyword_count, hit in sample if is_leak and (hit or keyword_count))
+    print(f"{args.pages} generated pages; old rule: {old_calls} Gemini calls ({old_calls / args.pages:.2f} per page)")
+    print(f"{len(sample)} labelled pages ({sample_leaks} leaks) from {args.sample}; "
+          f"old rule recall {old_caught / max(sample_leaks, 1):.1%}")
+    print(f"{'threshold':>9} {'calls':>6} {'per page':>8} {'reduction':>9} {'recall':>6} {'missed':>6} {'false':>5}")
+    for threshold in (float(t) for t in args.thresholds.split(',')):
+        gate = LeakGate(threshold)
+
+        def passed(text, keyword_count, hit):
+            return gate.check(text, keyword_count, local_hits=hit or keyword_count > 0).passed
+
+        calls = sum(passed(text, keyword_count, hit) for _, text, keyword_count, hit in pages)
+        caught = false_passes = 0
+        for is_leak, text, keyword_count, hit in sample:
+            if passed(text, keyword_count, hit):
+                caught += is_leak
+                false_passes += not is_leak
+        print(f"{threshold:>9g} {calls:>6} {calls / args.pages:>8.3f} {old_calls / max(calls, 1):>8.1f}x "
+              f"{caught / max(sample_leaks, 1):>6.1%} {sample_leaks - caught:>6} "
+              f"{false_passes:>2}/{sample_benign}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Benchmark crawler/html_extract backends against the BeautifulSoup path parse() used before.
+
+Builds synthetic forum-style pages and times title + text + link extraction
+per backend, reporting pages/sec and CPU ms per page.
+
+    python3 scripts/benchmark_extract.py --pages 300 --posts 200
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from crawler.html_extract import BACKENDS, extract_page
+
+logging.disable(logging.INFO)
+
+WORDS = ("fresh dump verified seller escrow database leak combo list aadhaar pan "
+         "bank statement kyc telecom records sample download mirror").split()
+
+
+def make_page(rng, posts):
+    parts = ["<html><head><title>Market thread</title>",
+             "<style>body{font:12px monospace}</style><script>var t=1;</script></head><body>",
+             "<div class='nav'>" + "".join(f"<a href='/section/{i}'>Section {i}</a> " for i in range(20)) + "</div>"]
+    for i in range(posts):
+        words = " ".join(rng.choice(WORDS) for _ in range(40))
+        parts.append(f"<div class='post'><span class='author'>user{rng.randrange(999)}</span>"
+                     f"<p>{words}</p><a href='/thread/{rng.randrange(10000)}'>reply</a> "
+                     f"<a href='http://mirror{rng.randrange(50)}.onion/t/{i}'>mirror</a></div>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def legacy_extract(html, base_url):
+    """The previous parse() path: html.parser tree walked three times."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    title = soup.title.string.strip() if soup.title else 'No Title'
+    text = soup.get_text()
+    links = [a['href'] for a in soup.find_all('a', href=True)]
+    return title, text, links
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=200, help='number of synthetic pages')
+    parser.add_argument('--posts', type=int, default=150, help='forum posts per page')
+    parser.add_argument('--seed', type=int, default=1337)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pages = [make_page(rng, args.posts) for _ in range(args.pages)]
+    base_url = 'http://market.onion/thread/1'
+    print(f"Corpus: {len(pages)} pages, {sum(len(p) for p in pages) / 1e6:.1f} MB")
+
+    runs = [('legacy bs4 (3 walks)', lambda page: legacy_extract(page, base_url))]
+    runs += [(backend, lambda page, backend=backend: extract_page(page, base_url, backend)) for backend in BACKENDS]
+
+    baseline = None
+    for name, extract in runs:
+        start = time.process_time()
+        for page in pages:
+            extract(page)
+        elapsed = time.process_time() - start
+        baseline = baseline or elapsed
+        print(f"{name:22s} {len(pages) / elapsed:8.1f} pages/sec  {1000 * elapsed / len(pages):7.2f} ms/page  "
+              f"{baseline / elapsed:5.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Measure link graph write throughput and host ranking time on a synthetic onion web.
+
+Writes --edges URL edges between --hosts hosts (pages link mostly within
+their host, sometimes to a popular few) in the crawler's batch size, then
+times a cold host ranking and a warm-started re-ranking after one more batch.
+
+    python3 scripts/benchmark_link_graph.py --edges 2000000 --hosts 20000
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from crawler.link_graph import LinkGraph, SCIPY_AVAILABLE
+
+logging.disable(logging.INFO)
+
+
+def pages(hosts, links_per_page, seed=7):
+    """Endless (source URL, [target URLs]) pages; host popularity is heavy-tailed."""
+    rng = random.Random(seed)
+    while True:
+        host = rng.randrange(hosts)
+        targets = []
+        for _ in range(links_per_page):
+            if rng.random() < 0.7:
+                target_host = host
+            else:
+                target_host = min(hosts - 1, int(rng.paretovariate(1.2)) - 1)
+            targets.append(f"http://site{target_host}.onion/page/{rng.randrange(10000)}")
+        yield f"http://site{host}.onion/page/{rng.randrange(10000)}", targets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--edges', type=int, default=1000000)
+    parser.add_argument('--hosts', type=int, default=10000)
+    parser.add_argument('--links', type=int, default=20, help='links per page')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = LinkGraph(os.path.join(tmp, 'graph.db'), batch_size=args.batch_size, rank_every=10 ** 12)
+        source = pages(args.hosts, args.links)
+        start = time.perf_counter()
+        added = 0
+        while added < args.edges:
+            url, targets = next(source)
+            graph.add(url, targets, 'benchmark')
+            added += len(targets)
+        graph.flush()
+        elapsed = time.perf_counter() - start
+        print(f"write    {added} edges in {elapsed:.1f}s ({added / elapsed:,.0f} edges/s), "
+              f"{graph.counts['host_edge_updates']} host edge updates, {len(graph.host_ids)} hosts")
+
+        start = time.perf_counter()
+        graph.update_ranks()
+        print(f"rank     cold: {graph.counts['rank_iterations']} iterations in {time.perf_counter() - start:.2f}s "
+              f"({'scipy.sparse' if SCIPY_AVAILABLE else 'numpy bincount'})")
+
+        for _ in range(args.batch_size // args.links):
+            url, targets = next(source)
+            graph.add(url, targets, 'benchmark')
+        graph.flush()
+        iterations = graph.counts['rank_iterations']
+        start = time.perf_counter()
+        graph.update_ranks()
+        print(f"rank     warm after one batch: {graph.counts['rank_iterations'] - iterations} iterations "
+              f"in {time.perf_counter() - start:.2f}s")
+        print("top      " + ", ".join(f"{host} {rank:.4f}" for host, rank in graph.top_hosts(5)))
+        graph.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
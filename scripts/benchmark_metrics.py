@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Measure the cost of crawler/metrics instrumentation against the work it instruments.
+
+Times a timed block, a counter increment and a bare observe() in a tight loop,
+then prices one page's worth of instrumentation (the stage timers and
+counters parse() records) against extracting and scanning a synthetic page.
+
+    python3 scripts/benchmark_metrics.py --iterations 200000
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from crawler.metrics import CrawlMetrics
+from benchmark_extract import make_page
+
+logging.disable(logging.INFO)
+
+# What parse() + analyse_page() record for an ordinary analysed page
+TIMERS_PER_PAGE = 7     # extract, recrawl, near_dup, entities, keywords, frontier, parse (+ fetch observe)
+OBSERVES_PER_PAGE = 1
+COUNTERS_PER_PAGE = 6
+
+
+def per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200000)
+    parser.add_argument('--pages', type=int, default=50, help='synthetic pages for the per-page baseline')
+    args = parser.parse_args()
+
+    metrics = CrawlMetrics('benchmark')
+
+    def timed():
+        with metrics.time('stage'):
+            pass
+
+    baseline = per_call(lambda: None, args.iterations)
+    timer_cost = per_call(timed, args.iterations) - baseline
+    inc_cost = per_call(lambda: metrics.inc('pages'), args.iterations) - baseline
+    observe_cost = per_call(lambda: metrics.observe('fetch', 0.2), args.iterations) - baseline
+    print(f"timed block  {timer_cost * 1e9:7.0f} ns")
+    print(f"inc()        {inc_cost * 1e9:7.0f} ns")
+    print(f"observe()    {observe_cost * 1e9:7.0f} ns")
+
+    from crawler.html_extract import extract_page
+    from crawler.ner_utils import extract_entities
+    from crawler.keyword_matcher import KeywordMatcher
+    matcher = KeywordMatcher(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'keywords.json'))
+    rng = random.Random(1337)
+    pages = [make_page(rng, 150) for _ in range(args.pages)]
+    start = time.perf_counter()
+    for page in pages:
+        text = extract_page(page, 'http://market.onion/').text
+        extract_entities(text)
+        matcher.match(text)
+    page_cost = (time.perf_counter() - start) / len(pages)
+
+    instrumentation = TIMERS_PER_PAGE * timer_cost + OBSERVES_PER_PAGE * observe_cost + COUNTERS_PER_PAGE * inc_cost
+    print(f"per page: instrumentation {instrumentation * 1e6:.1f} us vs extract+scan {page_cost * 1e3:.1f} ms "
+          f"({100 * instrumentation / page_cost:.3f}% overhead)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Compare the text sent to Gemini by head truncation and by evidence-window snippets.
+
+Leak and ordinary pages from benchmark_ai_gate.py are wrapped in forum / market
+navigation (menus, sidebars, footers) with the post at a random depth, as crawled
+onion pages are. Every page the leak gate passes is cut to its Gemini input
+twice: the first --head-chars characters (the old behaviour) and
+build_evidence_snippet() at each token budget. The report shows tokens per call
+and the share of leak pages whose input still holds a validated entity value.
+
+    python3 scripts/benchmark_snippets.py --pages 2000 --budgets 250,500,750,1000
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+from leak_gate import LeakGate, ENTITY_RULES, _COMPILED_RULES
+from evidence_snippet import build_evidence_snippet
+from crawler.keyword_matcher import KeywordMatcher
+from benchmark_ai_gate import leak_page, benign_page, filler
+
+logging.disable(logging.INFO)
+
+CHARS_PER_TOKEN = 4
+MENU = ["Home", "Forums", "Market", "Vendors", "Escrow", "Rules", "Support", "FAQ", "Mirrors", "Members",
+        "Search", "New posts", "Latest threads", "Staff", "Donate", "Rules & guidelines", "Onion links"]
+
+
+def navigation(rng, items):
+    return '\n'.join(f"{rng.choice(MENU)} | {rng.choice(MENU)} | {rng.choice(MENU)}  {filler(rng, 6)}"
+                     for _ in range(items))
+
+
+def wrap(rng, post):
+    """A crawled page: header menus and sidebar, the post, then related threads and footer."""
+    before = navigation(rng, rng.randint(20, 160))
+    after = navigation(rng, rng.randint(10, 80))
+    return f"{before}\n{filler(rng, rng.randint(20, 200))}\n{post}\n{filler(rng, rng.randint(20, 200))}\n{after}"
+
+
+def validated_values(text):
+    """Entity values the gate would credit: labelled ones, or unlabelled ones passing their check."""
+    values = set()
+    for entity_type, rule in ENTITY_RULES.items():
+        if rule.validator is None:
+            continue
+        for match in _COMPILED_RULES[entity_type][0].finditer(text):
+            if rule.validator(match.group()):
+                values.add(match.group())
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--leak-rate', type=float, default=0.2)
+    parser.add_argument('--head-chars', type=int, default=4000)
+    parser.add_argument('--budgets', default='250,500,750,1000')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    matcher = KeywordMatcher(os.path.join(ROOT, 'keywords.json'))
+    gate = LeakGate()
+    sent = []
+    for _ in range(args.pages):
+        is_leak = rng.random() < args.leak_rate
+        text = wrap(rng, leak_page(rng) if is_leak else benign_page(rng))
+        keywords = matcher.match(text)
+        if gate.check(text, len(keywords)).passed:
+            sent.append((is_leak, text, keywords, validated_values(text)))
+
+    leaks = [page for page in sent if page[0] and page[3]]
+    mean_chars = sum(len(text) for _, text, _, _ in sent) / max(len(sent), 1)
+    print(f"{args.pages} pages, {len(sent)} sent to Gemini ({len(leaks)} leaks with validated values), "
+          f"{mean_chars:.0f} chars per sent page")
+    print(f"{'input':>14} {'tokens/call':>11} {'vs head':>7} {'evidence kept':>13} {'ms/page':>7}")
+
+    def report(name, cut, head_tokens=None):
+        started = time.perf_counter()
+        inputs = [cut(text, keywords) for _, text, keywords, _ in sent]
+        elapsed = (time.perf_counter() - started) * 1000 / max(len(sent), 1)
+        tokens = sum(len(snippet) // CHARS_PER_TOKEN + 1 for snippet in inputs) / max(len(inputs), 1)
+        kept = sum(1 for (is_leak, _, _, values), snippet in zip(sent, inputs)
+                   if is_leak and values and any(value in snippet for value in values))
+        print(f"{name:>14} {tokens:>11.0f} {tokens / (head_tokens or tokens):>6.2f}x "
+              f"{kept / max(len(leaks), 1):>13.1%} {elapsed:>7.2f}")
+        return tokens
+
+    head_tokens = report(f"head {args.head_chars}",
+                         lambda text, keywords: text[:args.head_chars] + "..." if len(text) > args.head_chars else text)
+    for budget in (int(b) for b in args.budgets.split(',')):
+        report(f"snippet {budget}",
+               lambda text, keywords: build_evidence_snippet(text, budget * CHARS_PER_TOKEN, keywords), head_tokens)
+
+
+if __name__ == '__main__':
+    main()
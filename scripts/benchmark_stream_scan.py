@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Benchmark the streaming scan against the DOM path parse() uses for ordinary pages.
+
+Builds a synthetic leak dump (an HTML table of records) of each requested size
+and scans it both ways in a fresh process, reporting wall time and peak RSS
+above the process's footprint with the raw body already loaded (that body is
+held by Scrapy either way). Entity and keyword results are compared so the
+windowing can be checked for lost matches.
+
+    python3 scripts/benchmark_stream_scan.py --sizes 5 20 50
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+logging.disable(logging.INFO)
+
+RECORDS = [
+    "Aadhaar: {d4} {d4} {d4}", "PAN card number ABCDE{d4}F", "mobile: +91 9{d4}{d4}0",
+    "email: user{d4}@gmail.com", "IFSC: SBIN000{d4}", "card 4111 {d4} {d4} 1111",
+]
+WORDS = "fresh dump verified seller escrow database leak combo list kyc telecom records".split()
+KEYWORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'keywords.json')
+
+
+def make_dump(size_mb, seed):
+    rng = random.Random(seed)
+    parts = ["<html><head><title>Fresh combo dump</title><style>td{font:10px monospace}</style></head>"
+             "<body><table>\n"]
+    size = 0
+    while size < size_mb * 1024 * 1024:
+        cells = []
+        for _ in range(6):
+            if rng.random() < 0.02:
+                cells.append(rng.choice(RECORDS).format(d4=rng.randrange(1000, 9999)))
+            else:
+                cells.append(" ".join(rng.choice(WORDS) for _ in range(3)))
+        # Whitespace between cells: the DOM text would otherwise glue neighbouring cells into one token
+        row = "<tr>" + "".join(f"<td>{cell}</td> " for cell in cells) + \
+              f"<td><a href='/row/{rng.randrange(100000)}'>view</a></td></tr>\n"
+        parts.append(row)
+        size += len(row)
+    parts.append("</table></body></html>")
+    return "".join(parts).encode('utf-8')
+
+
+def rss_mb(field='VmHWM'):
+    """Peak (VmHWM) or current (VmRSS) resident set size from /proc, in MB."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_peak_rss():
+    """Start VmHWM again from the current RSS (Linux 4.0+); allocations made while loading don't count."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def run_child(mode, path, chunk_bytes):
+    from crawler.keyword_matcher import KeywordMatcher
+    from crawler.ner_utils import get_entity_engine
+    matcher = KeywordMatcher(KEYWORDS_PATH)
+    get_entity_engine()
+    with open(path, 'rb') as f:
+        body = f.read()
+    reset_peak_rss()
+    baseline = rss_mb('VmRSS')
+
+    start = time.perf_counter()
+    if mode == 'dom':
+        from crawler.html_extract import extract_page
+        from crawler.ner_utils import extract_entities
+        page = extract_page(body.decode('utf-8'), 'http://dump.onion/')
+        entities = {category: sorted(set(values)) for category, values in extract_entities(page.text).items()}
+        keywords = matcher.match(page.text)
+    else:
+        from crawler.stream_scan import StreamScanner
+        scan = StreamScanner(matcher, chunk_bytes=chunk_bytes).scan(body, 'http://dump.onion/', 'text/html')
+        entities, keywords = scan.entities, scan.matched_keywords
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({'seconds': elapsed, 'peak_mb': rss_mb() - baseline,
+                      'entities': entities, 'keywords': keywords}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[5, 20], help='dump sizes in MB')
+    parser.add_argument('--chunk-bytes', type=int, default=1024 * 1024)
+    parser.add_argument('--seed', type=int, default=1337)
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.chunk_bytes)
+        return 0
+
+    failures = 0
+    for size in args.sizes:
+        results = {}
+        with tempfile.NamedTemporaryFile(suffix='.html') as dump:
+            dump.write(make_dump(size, args.seed))
+            dump.flush()
+            for mode in ('dom', 'stream'):
+                output = subprocess.run([sys.executable, __file__, '--child', mode, dump.name,
+                                         '--chunk-bytes', str(args.chunk_bytes)],
+                                        capture_output=True, text=True, check=True).stdout
+                results[mode] = json.loads(output.strip().splitlines()[-1])
+        dom, stream = results['dom'], results['stream']
+        same = dom['entities'] == stream['entities'] and dom['keywords'] == stream['keywords']
+        failures += not same
+        matches = sum(len(values) for values in dom['entities'].values())
+        print(f"{size:5.0f} MB  dom {dom['seconds']:6.2f}s {dom['peak_mb']:7.1f} MB peak  |  "
+              f"stream {stream['seconds']:6.2f}s {stream['peak_mb']:7.1f} MB peak  |  "
+              f"{matches} entities, {'identical' if same else 'MISMATCH'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
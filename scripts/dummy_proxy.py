@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""Local stand-in for Tor/Privoxy: HTTP proxies that serve a synthetic onion web.
+
+Each port behaves like one Privoxy endpoint. Any http:// URL requested through
+it gets a deterministic fake page with links to other pages and hosts, so the
+crawler, proxy pool and host throttle can be exercised without Tor.
+
+    python3 scripts/dummy_proxy.py --ports 8118 8119 8120 --latency 0.2
+    PROXY_POOL=http://127.0.0.1:8118,http://127.0.0.1:8119,http://127.0.0.1:8120 \\
+        python3 crawler/decimal_crawler.py http://site0.onion/
+"""
+import sys
+import time
+import random
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LEAK_SAMPLES = [
+    "Aadhaar: 2345 6789 0123", "PAN card number ABCDE1234F", "mobile: +91 9876543210",
+    "email: john.doe@gmail.com", "IFSC: SBIN0001234", "card 4111 1111 1111 1111",
+]
+
+
+def make_attachment(url, size_kb):
+    """Bytes for /scan/N.png or /doc/N.pdf: the right magic number, a PII sample as "text", zero padding.
+
+    Not a decodable image: it exercises downloads, size caps and queueing, not Tesseract.
+    """
+    rng = random.Random(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest())
+    magic = b'%PDF-1.4\n' if url.endswith('.pdf') else b'\x89PNG\r\n\x1a\n'
+    body = magic + rng.choice(LEAK_SAMPLES).encode('utf-8') + b'\n'
+    # Every 10th attachment is 32x larger, to hit OCR_MAX_BYTES
+    size = size_kb * 1024 * (32 if rng.random() < 0.1 else 1)
+    return body + b'\0' * max(0, size - len(body))
+
+
+def make_binary(url, size_kb):
+    """(content type, bytes) for /files/N.zip, /video/N.mp4 and /dl/N, the downloads a crawler cannot parse.
+
+    /dl/N is untyped (application/octet-stream): mostly an archive, sometimes a
+    text dump or a scanned image, so only its first bytes tell them apart.
+    """
+    rng = random.Random(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest())
+    path = urlparse(url).path
+    if path.startswith('/files/'):
+        return 'application/zip', b'PK\x03\x04' + b'\0' * (size_kb * 1024)
+    if path.startswith('/video/'):
+        return 'video/mp4', b'\0\0\0\x18ftypmp42' + b'\0' * (size_kb * 1024)
+    kind = rng.random()
+    if kind < 0.2:
+        dump = "\n".join(f"INSERT INTO users VALUES ({i}, '{rng.choice(LEAK_SAMPLES)}');" for i in range(200))
+        return 'application/octet-stream', dump.encode('utf-8')
+    if kind < 0.4:
+        return 'application/octet-stream', make_attachment(url + '.png', 16)
+    return 'application/octet-stream', b'7z\xbc\xaf\x27\x1c' + b'\0' * (size_kb * 1024)
+
+
+def make_page(url, hosts, pages_per_host, links, leak_ratio, mirror_hosts=0, words_per_page=300, attachments=0,
+              binaries=0):
+    """Deterministic HTML for url: same URL, same page.
+
+    The last mirror_hosts hosts re-publish site0's posts under their own title.
+    attachments: <img> / PDF links per page, served by make_attachment().
+    binaries: archive / video / untyped download links per page, served by make_binary().
+    """
+    parsed = urlparse(url)
+    content_url = url
+    host_number = parsed.hostname[4:-6] if parsed.hostname.startswith('site') else ''
+    if mirror_hosts and host_number.isdigit() and int(host_number) >= hosts - mirror_hosts:
+        content_url = f"http://site0.onion{parsed.path}"
+    rng = random.Random(hashlib.blake2b(content_url.encode('utf-8'), digest_size=8).digest())
+    words = ["market", "forum", "escrow", "vendor", "dump", "fresh", "database", "verified", "listing"]
+    body = " ".join(rng.choice(LEAK_SAMPLES) if rng.random() < leak_ratio else rng.choice(words)
+                    for _ in range(words_per_page))
+    anchors = []
+    for _ in range(links):
+        host = parsed.hostname if rng.random() < 0.7 else f"site{rng.randrange(hosts)}.onion"
+        anchors.append(f'<a href="http://{host}/page/{rng.randrange(pages_per_host)}">more</a>')
+    for _ in range(binaries):
+        number = rng.randrange(pages_per_host)
+        anchors.append(rng.choice([f'<a href="/files/{number}.zip">archive</a>',
+                                   f'<a href="/video/{number}.mp4">video</a>',
+                                   f'<a href="/dl/{number}">download</a>']))
+    for _ in range(attachments):
+        number = rng.randrange(pages_per_host)
+        anchors.append(f'<img src="/scan/{number}.png">' if rng.random() < 0.5
+                       else f'<a href="/doc/{number}.pdf">scan</a>')
+    return (f"<html><head><title>{parsed.hostname} {parsed.path}</title></head>"
+            f"<body><p>{body}</p>{' '.join(anchors)}</body></html>").encode('utf-8')
+
+
+def make_handler(port, args, counters):
+    class DummyProxyHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            counters[port] += 1
+            if args.latency:
+                time.sleep(random.uniform(0.5, 1.5) * args.latency)
+            if random.random() < args.fail_rate:
+                self.send_error(503, "Dummy proxy failure")
+                return
+            if not self.path.startswith('http://'):
+                self.send_error(400, "Expected an absolute proxy request URL")
+                return
+            host = urlparse(self.path).hostname or ''
+            number = host[4:-6] if host.startswith('site') else ''
+            if args.dead_hosts and number.isdigit() and int(number) >= args.hosts - args.dead_hosts:
+                # Like Privoxy when Tor cannot reach the onion: a long wait, then a gateway timeout
+                time.sleep(args.dead_latency)
+                self.send_error(504, "Connection timeout")
+                return
+            path = urlparse(self.path).path
+            if path.startswith(('/scan/', '/doc/')):
+                body = make_attachment(self.path, args.attachment_kb)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/pdf' if path.endswith('.pdf') else 'image/png')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if path.startswith(('/files/', '/video/', '/dl/')):
+                content_type, body = make_binary(self.path, args.binary_kb)
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                if not path.startswith('/dl/'):
+                    # Untyped downloads are also unsized: the body runs until the connection closes
+                    self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # The crawler hung up after the headers
+                return
+            page = make_page(self.path, args.hosts, args.pages_per_host, args.links, args.leak_ratio,
+                             args.mirror_hosts, args.page_words, args.attachments, args.binaries)
+            etag = '"' + hashlib.blake2b(page, digest_size=8).hexdigest() + '"'
+            if args.etags and self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            if args.etags:
+                self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+
+        def do_CONNECT(self):
+            self.send_error(501, "HTTPS tunnelling is not simulated")
+
+        def log_message(self, format, *log_args):
+            pass
+
+    return DummyProxyHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ports', type=int, nargs='+', default=[8118], help='one dummy proxy per port')
+    parser.add_argument('--latency', type=float, default=0.0, help='mean seconds added to every response')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--hosts', type=int, default=20, help='number of fake onion hosts')
+    parser.add_argument('--pages-per-host', type=int, default=200)
+    parser.add_argument('--links', type=int, default=10, help='links per page')
+    parser.add_argument('--page-words', type=int, default=300, help='words of body text per page')
+    parser.add_argument('--mirror-hosts', type=int, default=0, help='hosts that mirror site0 content')
+    parser.add_argument('--dead-hosts', type=int, default=0, help='last N hosts never answer (504 after --dead-latency)')
+    parser.add_argument('--dead-latency', type=float, default=5.0, help='seconds a dead host keeps a request hanging')
+    parser.add_argument('--etags', action='store_true', help='send ETags and answer If-None-Match with 304')
+    parser.add_argument('--attachments', type=int, default=0, help='image / PDF links per page (OCR pipeline)')
+    parser.add_argument('--attachment-kb', type=int, default=64, help='size of a served image / PDF')
+    parser.add_argument('--binaries', type=int, default=0, help='archive / video / untyped download links per page')
+    parser.add_argument('--binary-kb', type=int, default=4096, help='size of a served archive or video')
+    parser.add_argument('--leak-ratio', type=float, default=0.02, help='fraction of words that are PII samples')
+    args = parser.parse_args()
+
+    counters = {port: 0 for port in args.ports}
+    servers = []
+    for port in args.ports:
+        server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(port, args, counters))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        print(f"🧅 Dummy proxy listening on http://127.0.0.1:{port}")
+
+    try:
+        while True:
+            time.sleep(10)
+            print("📊 Requests served: " + ", ".join(f"{port}={count}" for port, count in counters.items()))
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,8 +9,10 @@ Author: H4$HCR4CK$ Team
 import os
 import sys
 import json
+import sqlite3
 import tempfile
 import logging
+import pytest
 from datetime import datetime
 from typing import Dict, List, Any
 
@@ -90,6 +92,578 @@ def test_ai_utils():
         print(f"❌ AI Utils test failed: {str(e)}")
         return False
 
+def test_gemini_cache():
+    """Test the Gemini response cache: normalized keys, TTL, LRU eviction and call coalescing."""
+    print("🗃️ Testing Gemini Response Cache...")
+    pytest.importorskip("google.generativeai")
+    import time
+    import threading
+    from gemini_cache import GeminiResponseCache
+    from gemini_client import GeminiClient, GeminiQuota
+    from ai_utils import GeminiAIProcessor
+    
+    class FakeModel:
+        def __init__(self):
+            self.calls = 0
+        
+        def generate_content(self, prompt):
+            self.calls += 1
+            time.sleep(0.05)
+            
+            class Response:
+                text = json.dumps({"leak_detected": "9876543210" in prompt, "confidence_score": 80})
+            return Response()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = GeminiResponseCache(os.path.join(tmp, "cache.db"), ttl=3600, max_entries=10)
+        client = GeminiClient(GeminiQuota(os.path.join(tmp, "cache.db"), rpm=6000, burst=100))
+        processor = GeminiAIProcessor(api_key="test-key", cache=cache, client=client)
+        processor.model = model = FakeModel()
+        
+        first = processor.detect_leaks_with_gemini("call   9876543210\nnow")
+        repeat = processor.detect_leaks_with_gemini("call 9876543210 now")
+        processor.process_ocr_text("call 9876543210 now")
+        assert model.calls == 2 and first == repeat and repeat["leak_detected"]
+        print("✅ Whitespace-only differences hit the cache; other prompt types do not")
+        
+        # Storing a key again replaces the entry without counting a new one
+        entries = cache.entries
+        cache.put("detect_leaks", processor.model_name, "call 9876543210 now", repeat)
+        assert cache.entries == entries
+        assert cache.conn.execute("SELECT COUNT(*) FROM gemini_cache").fetchone()[0] == entries
+        
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(processor.detect_leaks_with_gemini("mirror dump")))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert model.calls == 3 and len(results) == 8
+        print("✅ 8 concurrent identical requests made 1 API call")
+        
+        def failing():
+            raise ValueError("quota exceeded")
+        with pytest.raises(ValueError):
+            cache.get_or_call("detect_leaks", "m", "boom", failing)
+        assert cache.get_or_call("detect_leaks", "m", "boom", lambda: {"ok": True}) == {"ok": True}
+        
+        cache.conn.execute("UPDATE gemini_cache SET created_at = created_at - 7200 WHERE prompt_type = 'process_ocr_text'")
+        processor.process_ocr_text("call 9876543210 now")
+        for i in range(12):
+            cache.get_or_call("fuzzy", "m", f"input {i}", lambda: {"i": 1})
+            # Keep the first leak-detection entry recently used
+            processor.detect_leaks_with_gemini("call 9876543210 now")
+        stats = cache.snapshot()
+        assert model.calls == 4
+        assert stats['expired'] == 1 and stats['evicted'] > 0 and stats['entries'] <= 10
+        processor.detect_leaks_with_gemini("call 9876543210 now")
+        assert model.calls == 4, "recently used entry was evicted"
+        print(f"✅ Expired and least recently used entries dropped: hit rate {stats['hit_rate']:.0%}, {stats}")
+        cache.close()
+
+def test_gemini_batching():
+    """Test batched leak detection: per-document ids, splitting malformed answers, token budget and the AI stage."""
+    print("📦 Testing Gemini Batch Classification...")
+    pytest.importorskip("google.generativeai")
+    import re
+    import time
+    from ai_utils import GeminiAIProcessor, parse_batch_answers
+    from gemini_client import GeminiClient, GeminiQuota
+    from crawler.ai_stage import AIClassificationStage
+    
+    class BatchModel:
+        """Answers each <document>; more than 4 documents come back cut off, and doc1 is always skipped once."""
+        def __init__(self):
+            self.prompts = []
+            self.skipped = False
+        
+        def generate_content(self, prompt):
+            self.prompts.append(prompt)
+            time.sleep(0.02)
+            documents = re.findall(r'<document id="(doc\d+)">\n(.*?)\n</document>', prompt, re.S)
+            
+            def answer(text):
+                return {"leak_detected": "PAN" in text, "confidence_score": 90, "detected_entities": {}, "severity": "HIGH"}
+            
+            class Response:
+                text = None
+            if not documents:
+                Response.text = json.dumps(answer(prompt.split('"""')[1]))
+            elif len(documents) > 4:
+                Response.text = json.dumps([dict(answer(text), id=doc_id) for doc_id, text in documents])[:200]
+            else:
+                answers = [dict(answer(text), id=doc_id) for doc_id, text in documents]
+                if not self.skipped and len(documents) > 1:
+                    answers = answers[1:]
+                    self.skipped = True
+                Response.text = json.dumps(answers)
+            return Response()
+    
+    assert parse_batch_answers('[{"id": "doc0", "leak_detected": true}, {"id": "x", "leak_detected": true}]',
+                               {"doc0": None}) == {"doc0": {"leak_detected": True}}
+    assert parse_batch_answers('[{"id": "doc0"', {"doc0": None}) is None
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['GEMINI_CACHE_PATH'] = os.path.join(tmp, "cache.db")
+        try:
+            client = GeminiClient(GeminiQuota(os.path.join(tmp, "cache.db"), rpm=6000, burst=100))
+            processor = GeminiAIProcessor(api_key="test-key", client=client)
+            processor.model = model = BatchModel()
+            documents = {f"http://a.onion/{i}": (f"PAN ABCDE123{i}F" if i % 2 else f"note {i}") for i in range(8)}
+            results = processor.detect_leaks_batch(documents)
+            wrong = [key for key, text in documents.items() if results[key]["leak_detected"] != ("PAN" in text)]
+            stats = processor.batch_snapshot()
+            assert not wrong, f"wrong batch results for {wrong}"
+            assert stats['splits'] == 1 and stats['retried'] == 1 and 0 < stats['batch_limit'] < 8
+            print(f"✅ 8 documents in {len(model.prompts)} requests: malformed answer split, unanswered document retried")
+            
+            calls = len(model.prompts)
+            processor.detect_leaks_batch(documents)
+            assert len(model.prompts) == calls, "batched results not served from the response cache"
+            
+            processor.batch_limit = None
+            processor.batch_token_budget = 2500
+            batches = processor._pack_batches([(str(i), "x" * 2000) for i in range(6)])
+            assert [len(batch) for batch in batches] == [2, 2, 2]
+            print("✅ Documents per request follow the token budget")
+            
+            processor.batch_token_budget = 16000
+            delivered = {}
+            stage = AIClassificationStage(processor, on_result=lambda url, fields: delivered.update({url: fields}),
+                                          max_in_flight=1, max_batch=8)
+            for i in range(10):
+                stage.submit(f"http://b.onion/{i}", f"Contact 98765432{i:02d} PAN ABCDE12{i:02d}F")
+            stage.shutdown(wait=True, timeout=10)
+            stats = processor.batch_snapshot()
+            processor.cache.close()
+        finally:
+            del os.environ['GEMINI_CACHE_PATH']
+    assert len(delivered) == 10
+    assert all(fields['ai_classification'] == "General PII" for fields in delivered.values())
+    print(f"✅ AI stage classified 10 queued pages, {stats['documents_per_request']} documents per request overall")
+
+def test_gemini_client():
+    """Test the shared Gemini token bucket, retry with backoff, circuit breaker and AI stage deferral."""
+    print("🚦 Testing Gemini Client Layer...")
+    pytest.importorskip("google.generativeai")
+    google_exceptions = pytest.importorskip("google.api_core.exceptions")
+    import time
+    from gemini_client import GeminiClient, GeminiQuota, GeminiUnavailable
+    from ai_utils import GeminiAIProcessor
+    from crawler.ai_stage import AIClassificationStage
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "quota.db")
+        quota = GeminiQuota(path, rpm=60, burst=2, failure_threshold=3, cooldown=0.3)
+        # A second process (e.g. the dashboard) sharing the file sees the same bucket
+        other = GeminiQuota(path, rpm=60, burst=2, failure_threshold=3, cooldown=0.3)
+        waits = [quota.acquire(), other.acquire(), quota.acquire()]
+        assert waits[:2] == [0.0, 0.0] and 0.5 < waits[2] <= 1.0, waits
+        print(f"✅ Shared token bucket: third request waits {waits[2]:.2f}s")
+        
+        # Reading the state must not need the write lock another process may be holding
+        writer = sqlite3.connect(path, isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")
+        quota.conn.execute("PRAGMA busy_timeout = 0")
+        assert quota.snapshot()['calls'] == 2
+        writer.execute("ROLLBACK")
+        writer.close()
+        
+        quota = GeminiQuota(os.path.join(tmp, "breaker.db"), rpm=6000, burst=100, failure_threshold=3, cooldown=0.3)
+        client = GeminiClient(quota, max_retries=2, backoff_base=0.01)
+        attempts = []
+        
+        def flaky():
+            attempts.append(1)
+            if len(attempts) <= 2:
+                raise google_exceptions.ServiceUnavailable("overloaded")
+            return "ok"
+        assert client.call(flaky) == "ok"
+        assert client.counts['retries'] == 2 and quota.snapshot()['consecutive_failures'] == 0
+        with pytest.raises(ValueError):
+            client.call(lambda: int("not a number"))
+        
+        def quota_exhausted():
+            attempts.append(1)
+            raise google_exceptions.ResourceExhausted("quota")
+        with pytest.raises(GeminiUnavailable):
+            client.call(quota_exhausted)
+        calls = len(attempts)
+        with pytest.raises(GeminiUnavailable) as raised:
+            client.call(quota_exhausted)
+        assert len(attempts) == calls, "open breaker still called the API"
+        assert quota.snapshot()['state'] == "open" and raised.value.retry_after > 0
+        time.sleep(0.35)
+        assert client.call(lambda: "probe ok") == "probe ok"
+        assert quota.snapshot()['state'] == "closed"
+        print("✅ Retries with backoff, breaker opened after 3 failures and closed after a probe")
+        
+        class OutageModel:
+            down = True
+            
+            def generate_content(self, prompt):
+                if self.down:
+                    raise google_exceptions.ServiceUnavailable("outage")
+                
+                class Response:
+                    text = json.dumps({"leak_detected": True, "confidence_score": 70, "severity": "HIGH",
+                                       "detected_entities": {"PAN": ["ABCDE1234F"]}})
+                return Response()
+        
+        quota = GeminiQuota(os.path.join(tmp, "outage.db"), rpm=6000, burst=100, failure_threshold=1, cooldown=0.2)
+        processor = GeminiAIProcessor(api_key="test-key", cache=False,
+                                      client=GeminiClient(quota, max_retries=0))
+        processor.model = model = OutageModel()
+        with pytest.raises(GeminiUnavailable):
+            processor.detect_leaks_with_gemini("PAN ABCDE1234F")
+        
+        # A short outage: pages are re-queued and classified once Gemini is back
+        delivered = {}
+        stage = AIClassificationStage(processor, on_result=lambda url, fields: delivered.update({url: fields}),
+                                      max_in_flight=2, max_batch=4, max_retries=50)
+        stage.submit("http://c.onion/1", "PAN ABCDE1234F")
+        stage.submit("http://c.onion/2", "PAN ABCDE1235F")
+        time.sleep(0.5)
+        model.down = False
+        stage.shutdown(wait=True, timeout=15)
+        stats = stage.snapshot()
+        assert len(delivered) == 2 and all(fields['ai_classification'] == "PAN" for fields in delivered.values())
+        assert stats['retried'] > 0 and stats['failed'] == 0
+        print(f"✅ AI stage re-queued pages {stats['retried']} times during the outage, then classified them")
+        
+        # A long outage: after max_retries the pages are deferred and the stage goes idle on its own
+        model.down = True
+        pending = []
+        stage = AIClassificationStage(processor, on_result=lambda url, fields: delivered.update({url: fields}),
+                                      max_in_flight=2, max_batch=4, max_retries=2,
+                                      on_pending=lambda url, job, reason: pending.append((url, reason)))
+        for i in range(3, 6):
+            stage.submit(f"http://c.onion/{i}", f"PAN ABCDE123{i}F")
+        deadline = time.monotonic() + 10
+        while not stage.is_idle() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        stats = stage.snapshot()
+        stage.shutdown(wait=True, timeout=1)
+        assert stage.is_idle(), f"stage still busy during the outage: {stats}"
+        assert sorted(url for url, _ in pending) == [f"http://c.onion/{i}" for i in range(3, 6)]
+        assert all(reason.startswith("retried 2 times") for _, reason in pending)
+        assert stats['deferred'] == 3 and stats['failed'] == 0 and stats['dropped'] == 0
+    print(f"✅ Pages still unclassified after {stage.max_retries} retries were deferred: {stats}")
+
+def test_leak_gate():
+    """Test the local leak gate: recall on labelled leak pages, skipped generic hits and the Gemini calls saved."""
+    print("🚪 Testing Local Leak Gate...")
+    pytest.importorskip("google.generativeai")
+    import re
+    from leak_gate import LeakGate, UNGATED, verhoeff_valid, luhn_valid, valid_aadhaar
+    from ai_utils import GeminiAIProcessor, detect_and_classify_leaks, detect_and_classify_leaks_batch
+    from gemini_client import GeminiClient, GeminiQuota
+    
+    def with_check_digit(body, valid):
+        return next(body + str(digit) for digit in range(10) if valid(body + str(digit)))
+    
+    aadhaars = [with_check_digit(body, verhoeff_valid) for body in ("49182736450", "73625184920", "58203719462")]
+    card = with_check_digit("453201511283036", luhn_valid)
+    assert all(valid_aadhaar(number) for number in aadhaars) and not valid_aadhaar("123456789012")
+    
+    leaks = [
+        f"Name | Aadhaar | Mobile\nRavi Kumar | {aadhaars[0]} | 9876543210\nPriya Das | {aadhaars[1]} | 8765432109",
+        "Name: Amit Shah\nFather's name: R Shah\nDOB: 01/02/1985\nAddress: 12 MG Road, Pune\nAadhaar: 2345 6789 0123",
+        "pan,name,dob\nABCPK1234Q,Neha Iyer,1990-02-11\nBKLPR5678M,Rahul Nair,1988-07-30\nCXZPT4321L,Sunita Rao,1979-12-01",
+        f"fresh fullz dump, valid cards\n{card}|09/27|123|Vikram Singh\nA/c no: 123456789012 IFSC: SBIN0001234",
+        "combolist mail:pass\n" + "\n".join(f"user{i}@gmail.com:hunter{i}" for i in range(25)),
+        f"Selling Aadhaar database, 2M records. Sample: {aadhaars[2]}, contact seller@protonmail.com",
+        "MSISDN: 919876543210 IMEI: 356938035643809 subscriber records export",
+    ]
+    benign = [
+        "Order #4827163590 shipped, questions to support@market.onion. Thanks for your order.",
+        "Welcome to the forum. Rules: be nice. Contact admin@forum.onion. Posted 1697040000123 by mod.",
+        "Login\nUsername\nPassword\nForgot password? Mail help@site.onion\nMirror 3728194056",
+        "Vendor listing: lsd for sale, escrow id 918273645512, ships worldwide, support vendor@mail.onion",
+        "Hosting plans from $5. Call 9123456780 or write to sales@host.onion. Invoice 582910374",
+        "Tutorial: sql injection and phishing basics for pentesting. Build 20231011123456 by dev@lab.onion",
+        "News: the exchange processed 1234567890 transactions this year; report 99887766554 attached.",
+    ]
+    
+    gate = LeakGate(25)
+    missed = [page[:30] for page in leaks if not gate.check(page).passed]
+    passed = [page[:30] for page in benign if gate.check(page).passed]
+    assert not missed and not passed, f"gate missed leaks {missed} or passed benign pages {passed}"
+    print(f"✅ Labelled set: {len(leaks)}/{len(leaks)} leaks pass, 0/{len(benign)} generic-hit pages pass")
+    
+    decision = gate.check(benign[0])
+    assert not decision.passed and decision.score < 25 and 'Email' in decision.signals, decision
+    assert LeakGate(0).check(benign[0]).passed and not LeakGate(0).check("nothing here", local_hits=False).passed
+    
+    # Leak vocabulary and empty field labels score, but without a local hit the page never passes
+    cues_only = ("Huge leak! Fresh dump of the leaked database, full records below\n"
+                 "Name:\nFather's name:\nDOB:\nAddress:\nMobile:\n")
+    decision = gate.check(cues_only, local_hits=False)
+    assert decision.score >= gate.threshold and not decision.passed, decision
+    
+    class CountingModel:
+        def __init__(self):
+            self.calls = 0
+        
+        def generate_content(self, prompt):
+            self.calls += 1
+            answer = {"leak_detected": True, "confidence_score": 90, "detected_entities": {}, "severity": "HIGH"}
+            documents = re.findall(r'<document id="(doc\d+)">', prompt)
+            class Response:
+                text = json.dumps([dict(answer, id=doc_id) for doc_id in documents] if documents else answer)
+            return Response()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        client = GeminiClient(GeminiQuota(os.path.join(tmp, "quota.db"), rpm=6000, burst=100))
+        processor = GeminiAIProcessor(api_key="test-key", cache=False, client=client)
+        processor.model = model = CountingModel()
+        
+        result = detect_and_classify_leaks(cues_only, processor, gate=gate)
+        batch = detect_and_classify_leaks_batch({"cues": cues_only}, processor, gate=gate)
+        assert model.calls == 0 and result["detection_method"] == "local_only", result
+        assert batch["cues"]["detection_method"] == "local_only" and not batch["cues"]["gate"]["passed"]
+        print(f"✅ A page with only leak words and field labels (score {decision.score:g}) is not sent to Gemini")
+        
+        pages = leaks + benign * 3
+        # Without a gate argument detect_and_classify_leaks() stays ungated
+        ungated = [detect_and_classify_leaks(page, processor) for page in pages]
+        ungated_calls, model.calls = model.calls, 0
+        gated = [detect_and_classify_leaks(page, processor, gate=gate) for page in pages]
+        gated_calls = model.calls
+        recall = sum(result["detection_method"] == "hybrid" for result in gated[:len(leaks)]) / len(leaks)
+        assert recall == 1.0 and gated_calls == len(leaks) and ungated_calls == len(pages), \
+            (gated_calls, ungated_calls, recall)
+        assert "gate" not in ungated[0]
+        assert not gated[-1]["gate"]["passed"] and gated[-1]["detection_method"] == "local_only", gated[-1]
+        print(f"✅ Gemini calls: {ungated_calls} -> {gated_calls} ({ungated_calls / gated_calls:.1f}x fewer) at 100% recall")
+        
+        batch = detect_and_classify_leaks_batch({str(i): page for i, page in enumerate(pages)}, processor, gate=gate)
+        flagged = sorted(int(key) for key, result in batch.items() if result["detection_method"] == "hybrid")
+        assert flagged == list(range(len(leaks))) and all("gate" in result for result in batch.values()), flagged
+        print("✅ Batched detection sends the same pages")
+
+def test_leak_gate_sample_recall():
+    """Test that the default leak gate catches at least the old rule's share of the labelled sample's leaks."""
+    print("🎯 Testing Leak Gate Recall on the Labelled Sample...")
+    from leak_gate import LeakGate
+    from crawler.keyword_matcher import KeywordMatcher
+    from scripts.benchmark_ai_gate import DEFAULT_SAMPLE, load_sample, old_rule_hits
+    
+    matcher = KeywordMatcher(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keywords.json'))
+    gate = LeakGate()
+    sample = load_sample(DEFAULT_SAMPLE)
+    old_caught = caught = false_passes = 0
+    for is_leak, text in sample:
+        keyword_count = len(matcher.match(text))
+        hit = old_rule_hits(text) or keyword_count > 0
+        passed = gate.check(text, keyword_count, local_hits=hit).passed
+        old_caught += is_leak and hit
+        caught += is_leak and passed
+        false_passes += passed and not is_leak
+    leaks = sum(is_leak for is_leak, _ in sample)
+    assert caught >= old_caught, f"gate recall {caught}/{leaks} fell below the old rule's {old_caught}/{leaks}"
+    assert false_passes <= 1, f"{false_passes} benign sample pages passed"
+    print(f"✅ Threshold {gate.threshold:g}: {caught}/{leaks} leaks (old rule {old_caught}/{leaks}), "
+          f"{false_passes} benign pages passed")
+
+def test_evidence_snippets():
+    """Test evidence-window snippets: evidence past the old 4 KB cut, merged windows, the budget and fallbacks."""
+    print("✂️ Testing Evidence Snippets...")
+    pytest.importorskip("google.generativeai")
+    import re
+    from evidence_snippet import build_evidence_snippet, merge_windows, SEPARATOR, MIN_BUDGET_CHARS
+    from ai_utils import GeminiAIProcessor, CHARS_PER_TOKEN
+    from gemini_client import GeminiClient, GeminiQuota
+
+    nav = "\n".join(f"Home | Forums | Market | Rules | thread {i} reply by member{i}" for i in range(150))
+    footer = "\n".join(f"Related thread {i} | Support | Mirrors" for i in range(60))
+    page = (f"{nav}\nSelling Aadhaar database, sample: 4918 2736 4506 contact seller@protonmail.com\n"
+            f"{footer}\nLatest: fresh fullz going cheap\n{footer}")
+    assert "4918 2736 4506" not in page[:4000], "Test page should hide its evidence past the first 4000 characters"
+
+    snippet = build_evidence_snippet(page, 1200, keywords=["fullz"])
+    assert len(snippet) <= 1200 + 6, f"Snippet overran its budget ({len(snippet)} chars)"
+    assert "4918 2736 4506" in snippet and "seller@protonmail.com" in snippet
+    assert "fullz" in snippet and snippet.count(SEPARATOR) == 1, snippet
+    print(f"✅ {len(page)}-char page cut to {len(snippet)} chars around its hits (head cut kept none of them)")
+
+    small = build_evidence_snippet(page, 300)
+    assert "4918 2736 4506" in small and len(small) <= 306, small
+
+    # Budgets too small for one window fall back to the page's beginning instead of failing
+    for budget in (0, 1, 21 * CHARS_PER_TOKEN, MIN_BUDGET_CHARS - 1):
+        assert build_evidence_snippet(page, budget) == page[:budget] + "..."
+    assert "4918 2736 4506" in build_evidence_snippet(page, MIN_BUDGET_CHARS)
+
+    windows = merge_windows([(100, 110, 2), (150, 160, 1), (900, 910, 2)], 1000, 50)
+    assert [window[:3] for window in windows] == [[50, 210, 3], [850, 960, 2]], windows
+
+    assert build_evidence_snippet("short page, PAN ABCDE1234F", 100) == "short page, PAN ABCDE1234F"
+    plain = "nothing to see " * 100
+    assert build_evidence_snippet(plain, 200) == plain[:200] + "..."
+    print("✅ Windows merge, short pages are sent whole, hitless pages and tiny budgets fall back to the head")
+
+    prompts = []
+    class CapturingModel:
+        def generate_content(self, prompt):
+            prompts.append(prompt)
+            answer = {"leak_detected": True, "confidence_score": 90, "detected_entities": {}, "severity": "HIGH"}
+            documents = re.findall(r'<document id="(doc\d+)">', prompt)
+            class Response:
+                text = json.dumps([dict(answer, id=doc_id) for doc_id in documents] if documents else answer)
+            return Response()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client = GeminiClient(GeminiQuota(os.path.join(tmp, "quota.db"), rpm=6000, burst=100))
+        processor = GeminiAIProcessor(api_key="test-key", cache=False, client=client)
+        processor.model = CapturingModel()
+        processor.snippet_token_budget = 300
+        processor.detect_leaks_with_gemini(page, keywords=["fullz"])
+        processor.detect_leaks_batch({"a": page, "b": page.replace("4506", "4507")})
+        assert len(prompts) == 2 and "4918 2736 4506" in prompts[0] and prompts[1].count("4918 2736 450") == 2
+        assert len(prompts[0]) <= len(processor._leak_detection_prompt("")) + 300 * 4 + 6, \
+            f"Single prompt exceeds the snippet budget ({len(prompts[0])} chars)"
+
+        # GEMINI_SNIPPET_TOKEN_BUDGET below one window is raised at load
+        saved = os.environ.get('GEMINI_SNIPPET_TOKEN_BUDGET')
+        os.environ['GEMINI_SNIPPET_TOKEN_BUDGET'] = '5'
+        try:
+            tiny = GeminiAIProcessor(api_key="test-key", cache=False, client=client)
+        finally:
+            if saved is None:
+                del os.environ['GEMINI_SNIPPET_TOKEN_BUDGET']
+            else:
+                os.environ['GEMINI_SNIPPET_TOKEN_BUDGET'] = saved
+        assert tiny.snippet_token_budget * CHARS_PER_TOKEN >= MIN_BUDGET_CHARS
+        tiny.model = CapturingModel()
+        assert tiny.detect_leaks_with_gemini(page)["leak_detected"]
+    print("✅ Single and batched Gemini prompts carry the evidence within GEMINI_SNIPPET_TOKEN_BUDGET")
+
+def test_worker_stage():
+    """Test the bounded worker stage: FIFO order, non-blocking overflow policies and the shutdown drain."""
+    print("🧵 Testing Worker Stage...")
+    
+    import time
+    import threading
+    from crawler.worker_stage import BoundedWorkerStage, RetryLater, OVERFLOW_POLICIES
+    
+    class RecordingStage(BoundedWorkerStage):
+        def __init__(self, *args, **kwargs):
+            self.done = []
+            self.parked = []
+            self.gate = threading.Event()
+            super().__init__(*args, **kwargs)
+        
+        def process(self, key, payload):
+            self.gate.wait(5)
+            self.done.append(key)
+        
+        def on_defer(self, jobs, reason):
+            self.parked.extend((key, reason) for key, _ in jobs)
+    
+    assert 'block' not in OVERFLOW_POLICIES, "A policy that waits on the caller's thread is still offered"
+    
+    # One worker: jobs finish in submission order
+    stage = RecordingStage(max_in_flight=1, max_queue=10, overflow_policy='drop')
+    stage.gate.set()
+    for i in range(5):
+        stage.submit(f"job{i}", None)
+    stage.shutdown(wait=True, timeout=5)
+    assert stage.done == [f"job{i}" for i in range(5)], f"Jobs out of order: {stage.done}"
+    print("✅ Jobs processed in submission order")
+    
+    # The worker is held on job0, job1-2 fill the queue; submit() must return at once for every policy
+    results = {}
+    for policy in ('drop', 'drop_oldest', 'defer'):
+        stage = RecordingStage(max_in_flight=1, max_queue=2, overflow_policy=policy)
+        stage.submit("job0", None)
+        while stage.snapshot()['in_flight'] != 1:
+            time.sleep(0.01)
+        started = time.monotonic()
+        accepted = [stage.submit(f"job{i}", None) for i in range(1, 5)]
+        assert time.monotonic() - started < 0.5, f"submit() waited with policy {policy}"
+        stage.gate.set()
+        stage.shutdown(wait=True, timeout=5)
+        results[policy] = (accepted, stage.done, stage.parked, stage.snapshot())
+    
+    accepted, done, _, stats = results['drop']
+    assert accepted == [True, True, False, False] and done == ["job0", "job1", "job2"] and stats['dropped'] == 2, results['drop']
+    accepted, done, _, stats = results['drop_oldest']
+    assert accepted == [True, True, True, True] and done == ["job0", "job3", "job4"] and stats['dropped'] == 2, results['drop_oldest']
+    accepted, done, parked, stats = results['defer']
+    assert done == ["job0", "job1", "job2"] and parked == [("job3", "queue full"), ("job4", "queue full")], results['defer']
+    assert stats['deferred'] == 2 and stats['dropped'] == 0, stats
+    print("✅ Full queue: drop, drop_oldest and defer never block the caller")
+    
+    # Work still queued when the drain timeout expires is deferred, not lost; late submits too
+    stage = RecordingStage(max_in_flight=1, max_queue=10, overflow_policy='defer')
+    for i in range(3):
+        stage.submit(f"job{i}", None)
+    stage.shutdown(wait=True, timeout=0.2)
+    stage.gate.set()
+    stage.submit("late", None)
+    stats = stage.snapshot()
+    assert [key for key, _ in stage.parked] == ["job1", "job2", "late"], f"Queued jobs not deferred at shutdown: {stage.parked}"
+    assert stage.parked[0][1] == "shutdown" and stats['deferred'] == 3 and stats['dropped'] == 0, stats
+    print("✅ Shutdown drain defers whatever is still queued")
+    
+    # Without a working on_defer the jobs are counted as dropped rather than raising into the caller
+    stage = BoundedWorkerStage(max_in_flight=1, max_queue=1, overflow_policy='defer')
+    stage.shutdown(wait=True, timeout=1)
+    assert stage.submit("orphan", None) is False and stage.snapshot()['dropped'] == 1
+    print("✅ A failing on_defer counts the job as dropped")
+    
+    # A job that keeps asking to be retried is failed after max_retries re-queues
+    class AlwaysLater(BoundedWorkerStage):
+        def process(self, key, payload):
+            raise RetryLater("down", delay=0)
+    
+    stage = AlwaysLater(max_in_flight=1, max_queue=5, overflow_policy='drop', max_retries=2)
+    stage.submit("stuck", None)
+    stage.shutdown(wait=True, timeout=5)
+    stats = stage.snapshot()
+    assert stats['retried'] == 2 and stats['failed'] == 1 and stats['queued'] == 0, stats
+    print("✅ Retries are bounded per job")
+
+def test_ai_stage():
+    """Test the AI stage: verdicts routed to on_result and overflow deferred to on_pending."""
+    print("🤖 Testing AI Classification Stage...")
+    
+    pytest.importorskip("google.generativeai")
+    import time
+    import threading
+    from crawler.ai_stage import AIClassificationStage, AIJob
+    
+    release = threading.Event()
+    
+    class FakeProcessor:
+        """detect_and_classify_leaks() only needs the local regex pass and Gemini's answer."""
+        def run_local_regex_detection(self, text):
+            return {"PAN": ["ABCDE1234F"]} if "ABCDE1234F" in text else {}
+        
+        def detect_leaks_with_gemini(self, text, local_hits=None, keywords=()):
+            release.wait(5)
+            return {"leak_detected": True, "confidence_score": 90, "severity": "HIGH",
+                    "detected_entities": {"PAN": ["ABCDE1234F"]}}
+    
+    delivered, pending = [], []
+    stage = AIClassificationStage(FakeProcessor(), on_result=lambda url, fields: delivered.append((url, fields)),
+                                  max_in_flight=1, max_queue=1,
+                                  on_pending=lambda url, job, reason: pending.append((url, job, reason)))
+    assert stage.overflow_policy == 'defer', "defer-to-DB is not the default overflow policy"
+    stage.submit("http://a.onion/1", "PAN ABCDE1234F", ["pan"])
+    while stage.snapshot()['in_flight'] != 1:
+        time.sleep(0.01)
+    stage.submit("http://a.onion/2", "PAN ABCDE1234F")
+    stage.submit("http://a.onion/3", "PAN ABCDE1234F dump", ["dump"])
+    release.set()
+    stage.shutdown(wait=True, timeout=10)
+    assert pending == [("http://a.onion/3", AIJob("PAN ABCDE1234F dump", ("dump",)), "queue full")], pending
+    assert [url for url, _ in delivered] == ["http://a.onion/1", "http://a.onion/2"], delivered
+    assert delivered[0][1]['ai_classification'] == "PAN" and delivered[0][1]['detection_method'] == "ai_hybrid"
+    print("✅ Verdicts delivered in order; the overflowing page was deferred with its text and keywords")
+
 def test_ner_utils():
     """Test enhanced NER utilities."""
     print("🔍 Testing Enhanced NER Utils...")
@@ -125,6 +699,887 @@ def test_ner_utils():
         print(f"❌ NER Utils test failed: {str(e)}")
         return False
 
+def test_entity_engine():
+    """Test that the precompiled entity engine matches per-pattern re.findall()."""
+    print("⚙️  Testing Entity Engine...")
+    
+    try:
+        import re
+        from crawler.ner_utils import ENTITY_PATTERNS, EntityEngine
+        
+        engine = EntityEngine()
+        test_text = """
+        Aadhaar card number: 9876 5432 1098, UID: 8765-4321-0987
+        pan no ABCDE1234F, tax id fghij5678k
+        mobile: +91 9876543210 whatsapp 7012345678 landline 022-24567890
+        email: john.doe@gmail.com a/c no 123456789012 IFSC: SBIN0001234
+        card 4111 1111 1111 1111 IMEI: 356938035643809 ration cardRC12345678AB
+        passport no: K1234567 192.168.1.1 ravi@paytm GSTIN 27ABCDE1234F1Z5
+        """
+        
+        for entity_type, pattern_list in ENTITY_PATTERNS.items():
+            expected = set()
+            for pattern in pattern_list:
+                for match in re.findall(pattern, test_text, re.IGNORECASE | re.MULTILINE):
+                    if isinstance(match, tuple):
+                        expected.update(group.strip() for group in match if group.strip())
+                    else:
+                        expected.add(match.strip())
+            
+            found = engine.scan(entity_type, test_text)
+            if found != expected:
+                print(f"❌ {entity_type} mismatch: {found ^ expected}")
+                return False
+        
+        print(f"✅ Entity engine matches per-pattern scan for {len(ENTITY_PATTERNS)} categories")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Entity Engine test failed: {str(e)}")
+        return False
+
+def test_keyword_matcher():
+    """Test the compiled keyword automaton used by the crawler."""
+    print("🔑 Testing Keyword Matcher...")
+    
+    from crawler.keyword_matcher import KeywordAutomaton
+    
+    automaton = KeywordAutomaton(["meth", "crystal meth", "DDoS attack", "acid"])
+    text = "Selling Crystal Meth and DDoS attacks, methods inside"
+    
+    found = automaton.find(text)
+    assert list(found.keys()) == ["meth", "crystal meth", "DDoS attack"], f"Unexpected substring matches: {found}"
+    assert found["crystal meth"] == [8], f"Unexpected offsets: {found['crystal meth']}"
+    print(f"✅ Substring matching: {list(found.keys())}")
+    
+    whole = automaton.find(text, whole_word=True)
+    assert list(whole.keys()) == ["meth", "crystal meth"] and whole["meth"] == [16], f"Unexpected whole-word matches: {whole}"
+    print(f"✅ Whole-word matching: {list(whole.keys())}")
+    
+    # 'İ' lowercases to two characters; offsets must still index the original text
+    text = "İİ dump from İzmir"
+    matches = list(KeywordAutomaton(["dump", "İzmir"]).iter_matches(text, whole_word=True))
+    assert [text[start:end] for _, start, end in matches] == ["dump", "İzmir"], f"Offsets drifted after 'İ': {matches}"
+    print("✅ Offsets map back to the original text when lowercasing changes length")
+
+def test_write_behind_pipeline():
+    """Test write-behind batching: overflow without blocking, updates in the batch transaction, legacy duplicates."""
+    print("💾 Testing Write-Behind Pipeline...")
+    
+    pytest.importorskip("scrapy")
+    import time
+    import sqlite3
+    import threading
+    from unittest import mock
+    import database.models as models
+    from crawler.pipelines import WriteBehindPipeline
+    
+    class Spider:
+        metrics = None
+    
+    def failing_update(url, conn=None, **fields):
+        raise ValueError("bad update")
+    
+    saved_path = models.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        models.DB_PATH = os.path.join(tmp, "scraped.db")
+        try:
+            # A legacy database with duplicate URLs keeps every row; the unique index waits for clean_duplicates.py
+            conn = sqlite3.connect(models.DB_PATH)
+            conn.execute("CREATE TABLE scraped_data (id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT, title TEXT, "
+                         "matched_keywords TEXT, run_id TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+            conn.executemany("INSERT INTO scraped_data (url, title) VALUES (?, ?)",
+                             [("http://old.onion/", "first"), ("http://old.onion/", "copy"), ("http://other.onion/", "x")])
+            conn.commit()
+            conn.close()
+            models.initialize_database()
+            models.initialize_database()
+            conn = sqlite3.connect(models.DB_PATH)
+            kept = conn.execute("SELECT title FROM scraped_data WHERE url = 'http://old.onion/' ORDER BY id").fetchall()
+            unique = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_scraped_url_unique'").fetchone()
+            conn.close()
+            assert kept == [("first",), ("copy",)] and not unique, f"Legacy rows deleted on startup: {kept}"
+            
+            # Batched writes still upsert by URL without the index
+            stored = models.insert_data_batch([{'url': "http://old.onion/", 'title': "recrawled"},
+                                               {'url': "http://new.onion/", 'title': "new"}])
+            conn = sqlite3.connect(models.DB_PATH)
+            titles = conn.execute("SELECT url, title FROM scraped_data ORDER BY id").fetchall()
+            conn.execute("DELETE FROM scraped_data WHERE id = 2")
+            conn.commit()
+            conn.close()
+            assert stored == 2 and titles == [("http://old.onion/", "recrawled"), ("http://old.onion/", "recrawled"),
+                                              ("http://other.onion/", "x"), ("http://new.onion/", "new")], titles
+            models.initialize_database()
+            conn = sqlite3.connect(models.DB_PATH)
+            unique = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_scraped_url_unique'").fetchone()
+            conn.close()
+            assert unique, "Unique index not created once the duplicates were gone"
+            print("✅ Legacy duplicate URLs kept on startup, batched writes upsert without the unique index")
+            
+            # With the writer not yet running, a full buffer overflows instead of blocking the caller
+            pipeline = WriteBehindPipeline(batch_size=100, flush_interval=60, max_pending=2, flush_signal=None)
+            for i in range(5):
+                pipeline.process_item({'url': f"http://wb{i}.onion/", 'title': str(i), 'run_id': 'wb_test'}, Spider())
+            pipeline.submit_update("http://wb1.onion/", {'ai_classification': 'leak', 'leak_severity': 'high'})
+            pipeline.submit_update("http://wb2.onion/", {}, apply=failing_update)
+            pipeline.submit_update("http://wb3.onion/", {'ai_classification': 'benign'})
+            assert pipeline.queue.qsize() == 2 and pipeline.overflowed == 6, f"Unexpected overflow: {pipeline.overflowed}"
+            print(f"✅ Full buffer overflowed {pipeline.overflowed} entries without blocking")
+            
+            pipeline.open_spider(Spider())
+            pipeline.close_spider(Spider())
+            conn = sqlite3.connect(models.DB_PATH)
+            rows = dict(conn.execute("SELECT url, ai_classification FROM scraped_data WHERE run_id = 'wb_test'").fetchall())
+            conn.close()
+            assert pipeline.batches == 1 and pipeline.rows_written == 5, \
+                f"Rows and updates not committed together: {pipeline.batches} batches, {pipeline.rows_written} rows"
+            assert pipeline.updates_applied == 2 and pipeline.failed_batches == 0, f"Updates: {pipeline.updates_applied}"
+            assert rows["http://wb1.onion/"] == "leak" and rows["http://wb3.onion/"] == "benign" and len(rows) == 5, rows
+            print("✅ Rows and updates applied in order in a single commit; a failing update is dropped alone")
+            
+            # A stalled writer fills the buffer and the capped overflow: the crawl pauses, the rest is dropped
+            stall = threading.Event()
+            class StalledPipeline(WriteBehindPipeline):
+                def _commit(self, pending):
+                    stall.wait()
+                    return super()._commit(pending)
+            
+            class Engine:
+                def __init__(self):
+                    self.calls = []
+                def pause(self):
+                    self.calls.append('pause')
+                def unpause(self):
+                    self.calls.append('unpause')
+            
+            engine = Engine()
+            pipeline = StalledPipeline(batch_size=10, flush_interval=60, max_pending=20, flush_signal=None,
+                                       max_overflow=30, engine=lambda: engine)
+            with mock.patch('twisted.internet.reactor.callFromThread', side_effect=lambda f, *args: f(*args)):
+                pipeline.open_spider(Spider())
+                held = []
+                for i in range(400):
+                    pipeline.process_item({'url': f"http://stall{i}.onion/", 'run_id': 'stall_test'}, Spider())
+                    held.append(pipeline.queue.qsize() + len(pipeline._overflow))
+                assert max(held) <= 20 + 30 and pipeline.paused and engine.calls == ['pause'], (max(held), engine.calls)
+                assert pipeline.dropped >= 400 - 10 - 20 - 30, pipeline.dropped
+                print(f"✅ Stalled writer: at most {max(held)} entries held, crawl paused, {pipeline.dropped} dropped")
+                
+                stall.set()
+                deadline = time.monotonic() + 10
+                while (pipeline.paused or pipeline.queue.qsize()) and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                pipeline.close_spider(Spider())
+            conn = sqlite3.connect(models.DB_PATH)
+            written = conn.execute("SELECT COUNT(*) FROM scraped_data WHERE run_id = 'stall_test'").fetchone()[0]
+            conn.close()
+            assert engine.calls == ['pause', 'unpause'] and written == 400 - pipeline.dropped, (engine.calls, written)
+            print(f"✅ Crawl resumed once the overflow drained; {written} rows written")
+        finally:
+            models.DB_PATH = saved_path
+
+def test_crawl_frontier():
+    """Test the persistent frontier: de-duplication, claiming and resume."""
+    print("💽 Testing Crawl Frontier...")
+    
+    try:
+        from crawler.frontier import CrawlFrontier, DONE
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "frontier.db")
+            frontier = CrawlFrontier(path)
+            frontier.open_run("test_run", "http://example.onion/")
+            
+            if not frontier.add("http://a.onion/", "http://a.onion/") or frontier.add("http://a.onion/", "http://a.onion/"):
+                print("❌ Duplicate URL was not rejected")
+                return False
+            frontier.add("http://b.onion/", "http://b.onion/", depth=1)
+            
+            claimed = frontier.claim(10)
+            frontier.mark("http://a.onion/", DONE)
+            frontier.close()
+            print(f"✅ Claimed {len(claimed)} URLs, marked one done")
+            
+            # Reopening the same run re-queues the URL that was in flight
+            frontier = CrawlFrontier(path)
+            if not frontier.open_run("test_run"):
+                print("❌ Existing run was not resumed")
+                return False
+            counts = frontier.counts()
+            resumed = frontier.claim(10)
+            frontier.close()
+            if counts["done"] != 1 or resumed != [("http://b.onion/", 1, 0, None)]:
+                print(f"❌ Unexpected resume state: {counts}, {resumed}")
+                return False
+            print(f"✅ Resume re-queued: {resumed}")
+            
+            # Best-first: higher priority is claimed first, and a rediscovered pending URL is promoted
+            frontier = CrawlFrontier(path)
+            frontier.open_run("priority_run")
+            frontier.add("http://nav.onion/", "http://nav.onion/", priority=5)
+            frontier.add("http://leak.onion/", "http://leak.onion/", priority=40)
+            frontier.add("http://old.onion/", "http://old.onion/")
+            frontier.add("http://old.onion/", "http://old.onion/", priority=60)
+            order = [url for url, _, _, _ in frontier.claim(10)]
+            frontier.close()
+            if order != ["http://old.onion/", "http://leak.onion/", "http://nav.onion/"]:
+                print(f"❌ Unexpected claim order: {order}")
+                return False
+            print(f"✅ Claimed by priority: {order}")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Crawl Frontier test failed: {str(e)}")
+        return False
+
+def test_frontier_sharding():
+    """Test sharded workers: buffered writes, one transaction per claim, shared seed budgets and shard leases."""
+    print("🧩 Testing Sharded Frontier...")
+    from crawler.frontier import CrawlFrontier, DONE, host_shard
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "frontier.db")
+        seeder = CrawlFrontier(path, lease=60)
+        seeder.open_run("sharded_run", shard_count=2)
+        seeder.save_seeds([("http://seed.onion/", None, 3)])
+        seeder.grant_leases()
+        urls = [f"http://host{i}.onion/" for i in range(12)]
+        by_shard = {shard: [url for url in urls if host_shard(url, 2) == shard] for shard in (0, 1)}
+        assert by_shard[0] and by_shard[1]
+        
+        workers = [CrawlFrontier(path, shard_index=k, lease=60) for k in (0, 1)]
+        for worker in workers:
+            assert worker.open_run("sharded_run") and worker.buffered
+        
+        # Links and outcomes stay in memory until the next claim applies them in one transaction
+        first, second = workers
+        for url in urls[:6]:
+            first.add(url, url, depth=1, seed=0, seed_budget=3)
+        first.mark("http://seed.onion/", DONE)
+        assert seeder.counts() == {"pending": 0, "scheduled": 0, "done": 0, "failed": 0}
+        assert first.is_visited("http://seed.onion/")
+        claimed = first.claim(10)
+        assert seeder.counts()["pending"] + seeder.counts()["scheduled"] == 3
+        assert {url for url, _, _, _ in claimed} <= set(by_shard[0])
+        
+        # The budget counter is shared: the second worker's links for the same seed are refused
+        for url in urls[6:]:
+            second.add(url, url, depth=1, seed=0, seed_budget=3)
+        second.flush()
+        assert second.seed_used == {0: 3} and seeder.seed_counts() == {0: 3}
+        assert seeder.conn.execute("SELECT COUNT(*) FROM frontier WHERE seed = 0").fetchone()[0] == 3
+        
+        # A live sibling with work keeps a worker open; a sibling whose lease ran out does not
+        second.claim(10)
+        for url, _, _, _ in claimed:
+            first.mark(url, DONE)
+        first.flush()
+        active = second.conn.execute("SELECT COUNT(*) FROM frontier WHERE shard = 1 AND state IN (0, 1)").fetchone()[0]
+        assert first.run_active() == (active > 0)
+        seeder.conn.execute("INSERT OR REPLACE INTO shard_leases VALUES ('sharded_run', 0, 0)")
+        seeder.conn.execute("INSERT INTO frontier (run_id, fp, url, shard) VALUES ('sharded_run', 1, 'x', 0)")
+        seeder.conn.commit()
+        second.conn.execute("UPDATE frontier SET state = 2 WHERE shard = 1")
+        second.conn.commit()
+        assert not second.run_active() and first.run_active()
+        
+        # A clean close releases the lease right away
+        first.close()
+        second.close()
+        leases = dict(seeder.conn.execute("SELECT shard, lease_until FROM shard_leases").fetchall())
+        assert leases == {0: 0, 1: 0}
+        seeder.close()
+        print(f"✅ {len(claimed)} URLs claimed in one flush, seed budget held at 3 across workers")
+        
+        # Frontier files from before the budget counters get them counted once
+        conn = sqlite3.connect(os.path.join(tmp, "legacy.db"))
+        conn.execute("CREATE TABLE run_seeds (run_id TEXT NOT NULL, seed_id INTEGER NOT NULL, url TEXT NOT NULL, "
+                     "max_depth INTEGER, max_pages INTEGER, PRIMARY KEY (run_id, seed_id))")
+        conn.execute("CREATE TABLE frontier (id INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT NOT NULL, "
+                     "fp INTEGER NOT NULL, url TEXT NOT NULL, depth INTEGER DEFAULT 0, state INTEGER DEFAULT 0)")
+        conn.execute("INSERT INTO run_seeds VALUES ('old', 0, 'http://seed.onion/', NULL, 5)")
+        conn.execute("ALTER TABLE frontier ADD COLUMN seed INTEGER")
+        conn.executemany("INSERT INTO frontier (run_id, fp, url, seed) VALUES ('old', ?, ?, 0)",
+                         [(i, f"http://seed.onion/{i}") for i in range(4)])
+        conn.commit()
+        conn.close()
+        legacy = CrawlFrontier(os.path.join(tmp, "legacy.db"))
+        legacy.run_id = "old"
+        assert legacy._seed_used() == {0: 4}
+        legacy.close()
+
+def test_host_throttle():
+    """Test per-host AIMD delay / concurrency, the fair-share cap and retry scaling on a fake crawler."""
+    print("🐢 Testing Adaptive Host Throttle...")
+    
+    pytest.importorskip("scrapy")
+    from scrapy import Request
+    from scrapy.http import Response
+    from scrapy.settings import Settings
+    from twisted.internet.error import TimeoutError as DownloadTimeout
+    from crawler.middlewares import AdaptiveHostThrottleMiddleware
+    
+    class Slot:
+        delay = None
+        concurrency = None
+    
+    class Crawler:
+        def __init__(self, **settings):
+            self.settings = Settings(dict({'DOWNLOAD_DELAY': 2.0, 'RETRY_TIMES': 4, 'CONCURRENT_REQUESTS': 16,
+                                           'HOST_THROTTLE_MIN_DELAY': 0.25, 'HOST_THROTTLE_MAX_DELAY': 30.0,
+                                           'HOST_THROTTLE_MAX_CONCURRENCY': 8}, **settings))
+            self.engine = type('Engine', (), {})()
+            self.engine.downloader = type('Downloader', (), {'slots': {}})()
+    
+    def fetch(middleware, url, status=200, latency=1.0, meta=None):
+        request = Request(url, meta=dict(meta or {}))
+        middleware.process_request(request, None)
+        request.meta['download_latency'] = latency
+        middleware.process_response(request, Response(url, status=status), None)
+        return request
+    
+    crawler = Crawler()
+    middleware = AdaptiveHostThrottleMiddleware(crawler)
+    slot = crawler.engine.downloader.slots["a.onion"] = Slot()
+    
+    # Additive increase: +1 concurrency after `concurrency` clean responses; delay moves towards latency / 2
+    for _ in range(3):
+        fetch(middleware, "http://a.onion/")
+    state = middleware.hosts["a.onion"]
+    assert state.concurrency == 3 and slot.concurrency == 3, f"Concurrency not increased: {state.to_dict()}"
+    assert 0.5 < state.delay < 2.0 and slot.delay == state.delay, f"Delay not pulled towards latency: {state.to_dict()}"
+    print(f"✅ Clean responses raised concurrency to {state.concurrency}, delay {state.delay:.2f}s")
+    
+    # Multiplicative decrease on a timeout and on a 503
+    delay = state.delay
+    request = Request("http://a.onion/slow")
+    middleware.process_request(request, None)
+    middleware.process_exception(request, DownloadTimeout(), None)
+    assert state.concurrency == 1 and abs(state.delay - delay * 2) < 1e-9, f"Timeout not backed off: {state.to_dict()}"
+    fetch(middleware, "http://a.onion/busy", status=503)
+    assert state.concurrency == 1 and abs(state.delay - delay * 4) < 1e-9 and slot.concurrency == 1
+    print(f"✅ Timeout and 503 halved concurrency and doubled the delay to {state.delay:.2f}s")
+    
+    # Retries shrink with the error rate including the attempt that just failed; a caller's value is kept
+    assert request.meta['max_retry_times'] == round(4 * (1 - 0.2)), request.meta
+    failing = fetch(middleware, "http://a.onion/again", status=503)
+    assert failing.meta['max_retry_times'] == round(4 * (1 - state.error_rate)) < 4, failing.meta
+    own = fetch(middleware, "http://a.onion/own", status=503, meta={'max_retry_times': 9})
+    assert own.meta['max_retry_times'] == 9, own.meta
+    assert fetch(middleware, "http://healthy.onion/").meta['max_retry_times'] == 4
+    print(f"✅ Retries scaled to {failing.meta['max_retry_times']} for the failing host, 4 for a healthy one")
+    
+    # Fair share: CONCURRENT_REQUESTS split over active hosts caps each host's concurrency
+    middleware = AdaptiveHostThrottleMiddleware(Crawler(CONCURRENT_REQUESTS=4))
+    for _ in range(10):
+        fetch(middleware, "http://busy.onion/")
+    assert middleware.hosts["busy.onion"].concurrency == 4, middleware.hosts["busy.onion"].to_dict()
+    for host in ("b", "c", "d"):
+        fetch(middleware, f"http://{host}.onion/")
+    fetch(middleware, "http://busy.onion/")
+    assert middleware.fair_share() == 1 and middleware.hosts["busy.onion"].concurrency == 1, middleware.summary()
+    print("✅ Concurrency capped at the fair share once more hosts are active")
+
+def test_proxy_pool():
+    """Test proxy selection (least loaded, rendezvous hashing) and endpoint cooldown."""
+    print("🧅 Testing Proxy Pool...")
+    
+    pytest.importorskip("scrapy")
+    import time
+    from scrapy import Request
+    from scrapy.http import Response
+    from twisted.internet.error import TimeoutError as DownloadTimeout
+    from crawler.middlewares import ProxyPoolMiddleware
+    
+    proxies = ["http://127.0.0.1:8118", "http://127.0.0.1:8119", "http://127.0.0.1:8120"]
+    
+    # Least loaded: in-flight requests spread evenly, completions free their endpoint
+    pool = ProxyPoolMiddleware(proxies)
+    requests = [Request(f"http://h{i}.onion/") for i in range(6)]
+    for request in requests:
+        pool.process_request(request, None)
+    assert sorted(endpoint.in_flight for endpoint in pool.endpoints) == [2, 2, 2], pool.snapshot()
+    pool.process_response(requests[0], Response(requests[0].url, body=b"x" * 10), None)
+    freed = requests[0].meta['proxy']
+    follow_up = Request("http://h9.onion/")
+    pool.process_request(follow_up, None)
+    assert follow_up.meta['proxy'] == freed, "New request did not go to the least-loaded endpoint"
+    pinned = Request("http://x.onion/", meta={'proxy': "http://10.0.0.1:3128"})
+    pool.process_request(pinned, None)
+    assert pinned.meta['proxy'] == "http://10.0.0.1:3128", "Explicit per-request proxy overridden"
+    print("✅ Least-loaded balancing; explicit proxies left alone")
+    
+    # Cooldown after max_failures consecutive errors; the endpoint returns once it is over
+    pool = ProxyPoolMiddleware(proxies, policy='host_hash', max_failures=2, cooldown=60)
+    hosts = [f"host{i}.onion" for i in range(30)]
+    before = {host: pool.choose(host).url for host in hosts}
+    assert before == {host: pool.choose(host).url for host in hosts}, "Rendezvous choice not stable"
+    assert len(set(before.values())) == 3, f"Hosts not spread over the pool: {before}"
+    failing = pool.by_url[before["host0.onion"]]
+    for _ in range(2):
+        request = Request("http://host0.onion/")
+        pool.process_request(request, None)
+        pool.process_exception(request, DownloadTimeout(), None)
+    assert not failing.healthy(time.monotonic()), "Endpoint not put in cooldown"
+    after = {host: pool.choose(host).url for host in hosts}
+    moved = {host for host in hosts if after[host] != before[host]}
+    assert moved == {host for host in hosts if before[host] == failing.url}, "Hosts on healthy endpoints moved"
+    assert failing.url not in after.values()
+    print(f"✅ Endpoint cooled down after 2 failures; only its {len(moved)} hosts moved")
+    
+    failing.down_until = time.monotonic() - 1
+    assert {host: pool.choose(host).url for host in hosts} == before, "Hosts did not return after the cooldown"
+    for endpoint in pool.endpoints:
+        endpoint.down_until = time.monotonic() + 60
+    assert pool.choose("host0.onion") is not None, "No endpoint chosen with the whole pool down"
+    print("✅ Hosts return to their endpoint after the cooldown; a fully-down pool still answers")
+
+def test_seed_batch():
+    """Test seed-list parsing and per-seed depth / page budgets."""
+    print("🌱 Testing Seed Batches...")
+    
+    try:
+        from database.models import initialize_database
+        from crawler.seeds import Seed, SeedTracker, load_seed_file
+        from crawler.frontier import CrawlFrontier
+        
+        initialize_database()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "seeds.txt")
+            with open(path, "w") as f:
+                f.write("# monitored forums\n"
+                        "http://a.onion/ 1\n"
+                        "http://b.onion/, -, 2   # page budget only\n"
+                        "\n"
+                        "http://c.onion/\n"
+                        "http://a.onion/ 5\n")
+            seeds = load_seed_file(path, max_depth=3, max_pages=100)
+            expected = [Seed("http://a.onion/", 1, 100), Seed("http://b.onion/", 3, 2), Seed("http://c.onion/", 3, 100)]
+            if seeds != expected:
+                print(f"❌ Unexpected seeds: {seeds}")
+                return False
+            print(f"✅ Parsed {len(seeds)} seeds with per-seed budgets")
+            
+            tracker = SeedTracker("test_seed_batch", seeds)
+            if tracker.depth_allowed(0, 2, links=4) or not tracker.depth_allowed(1, 2):
+                print("❌ Depth budget not applied per seed")
+                return False
+            
+            # The frontier enforces a page budget atomically (workers of a sharded run share it)
+            frontier = CrawlFrontier(os.path.join(tmp, "frontier.db"))
+            frontier.open_run("seed_run")
+            frontier.save_seeds(seeds)
+            added = [frontier.add(url, url, depth=1, seed=1, seed_budget=2)
+                     for url in ("http://b.onion/1", "http://b.onion/2", "http://b.onion/3")]
+            for url in ("http://b.onion/1", "http://b.onion/2"):
+                tracker.admit(1)
+            if added != [True, True, False] or tracker.has_budget(1) or not tracker.has_budget(0):
+                print(f"❌ Page budget not enforced: {added}")
+                return False
+            if frontier.load_seeds() != [tuple(seed) for seed in seeds] or frontier.seed_counts() != {1: 2}:
+                print(f"❌ Seeds not stored with the run: {frontier.load_seeds()}, {frontier.seed_counts()}")
+                return False
+            claimed = frontier.claim(10)
+            frontier.close()
+            if {seed for _, _, _, seed in claimed} != {1}:
+                print(f"❌ Claimed URLs lost their seed: {claimed}")
+                return False
+            tracker.record_page(1, 2048, 3)
+            print(f"✅ Budgets enforced: {tracker.stats[0]['skipped_depth']} links over depth, "
+                  f"seed b at {tracker.admitted[1]}/{seeds[1].max_pages} pages")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Seed Batch test failed: {str(e)}")
+        return False
+
+def test_link_priority():
+    """Test that leak-looking links outrank navigation links."""
+    print("🎯 Testing Link Prioritization...")
+    
+    try:
+        from crawler.link_priority import LinkPrioritizer, leak_density
+        
+        prioritizer = LinkPrioritizer(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keywords.json'))
+        nav = prioritizer.score("http://market.onion/rules", "forum rules", 0.0, 1)
+        leak = prioritizer.score("http://market.onion/t/9/credit-card-dumps", "fresh cvv dumps", 0.0, 1)
+        from_leaky_parent = prioritizer.score("http://market.onion/rules", "forum rules", leak_density(30, 4000), 1)
+        if not leak > from_leaky_parent > nav:
+            print(f"❌ Unexpected scores: leak={leak} leaky parent={from_leaky_parent} nav={nav}")
+            return False
+        
+        for i in range(10):
+            prioritizer.record_page(f"http://dumps.onion/t/{i}", leaky=True)
+            prioritizer.record_page(f"http://blog.onion/p/{i}", leaky=False)
+        if not prioritizer.score("http://dumps.onion/next", "next") > prioritizer.score("http://blog.onion/next", "next"):
+            print("❌ Host history did not affect priority")
+            return False
+        print(f"✅ Priorities: leak link {leak}, link on leaky page {from_leaky_parent}, navigation {nav}")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Link Prioritization test failed: {str(e)}")
+        return False
+
+def test_html_extract():
+    """Test that every HTML extraction backend returns the same title, text, links and images."""
+    print("🧩 Testing HTML Extraction...")
+    import importlib.util
+    pytest.importorskip("lxml")
+    from crawler.html_extract import BACKENDS, extract_page
+    
+    html = """<html><head><title> Fresh dump </title><script>var leak = 1;</script></head>
+    <body><p>Aadhaar: 2345 6789 0123</p><a href="/thread/2">next</a>
+    <a href="http://mirror.onion/t">mirror</a><a href="mailto:x@y.z">mail</a>
+    <img src="/scans/pan.jpg"><img src="data:image/png;base64,AAAA"></body></html>"""
+    expected_links = ["http://market.onion/thread/2", "http://mirror.onion/t"]
+    
+    # Backends whose parser is not installed here are left out
+    modules = {'lxml': 'lxml', 'selector': 'parsel', 'bs4': 'bs4'}
+    backends = [backend for backend in BACKENDS if importlib.util.find_spec(modules[backend])]
+    results = {backend: extract_page(html, "http://market.onion/thread/1", backend) for backend in backends}
+    for backend, page in results.items():
+        assert page.title == "Fresh dump", f"{backend}: {page.title!r}"
+        assert page.links == expected_links and page.anchors == ["next", "mirror"], f"{backend}: {page.links}"
+        assert page.images == ["http://market.onion/scans/pan.jpg"], f"{backend}: {page.images}"
+        assert "2345 6789 0123" in page.text and "var leak" not in page.text, f"{backend}: {page.text!r}"
+    # Parsers place inter-element whitespace differently; the words must match
+    assert len({" ".join(page.text.split()) for page in results.values()}) == 1, "Backends disagree on visible text"
+    print(f"✅ Backends agree: {', '.join(results)}")
+
+def test_stream_scan():
+    """Test that the windowed scan of large bodies finds matches that straddle window edges."""
+    print("🌊 Testing Streaming Scan...")
+    pytest.importorskip("w3lib")
+    from crawler.keyword_matcher import KeywordMatcher
+    from crawler.ner_utils import extract_entities
+    from crawler.stream_scan import StreamScanner
+    
+    matcher = KeywordMatcher(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keywords.json'))
+    rows = [f"row {i} vendor escrow listing fresh" for i in range(3000)]
+    for i in range(0, 3000, 7):
+        rows[i] += f" Aadhaar: 8345 6789 {i:04d} PAN card number ABCDE{i:04d}F"
+    dump = "\n".join(rows)
+    scanner = StreamScanner(matcher, chunk_bytes=4096, overlap_chars=256)
+    
+    scan = scanner.scan(dump.encode('utf-8'), "http://market.onion/dump.txt", "text/plain")
+    expected = {category: sorted(set(values)) for category, values in extract_entities(dump).items()}
+    assert scan.entities == expected, "Windowed scan disagrees with a whole-text scan"
+    assert scan.matched_keywords == matcher.match(dump)
+    
+    html = ("<html><head><title>Dump</title><script>var fake = 'ZYXWV9999Z';</script></head><body>"
+            + "".join(f"<p>{row}</p><a href='/r/{i}'>r</a>" for i, row in enumerate(rows)) + "</body></html>")
+    scan = scanner.scan(html.encode('utf-8'), "http://market.onion/dump", "text/html; charset=utf-8")
+    assert scan.title == "Dump" and len(scan.links) == len(rows), f"{scan.title!r} {len(scan.links)}"
+    assert scan.links[1] == "http://market.onion/r/1", scan.links[:2]
+    assert "ZYXWV9999Z" not in scan.entities.get("PAN", []), "Script text leaked into the scan"
+    assert scan.entities == expected, "Markup leaked into the scan"
+    print(f"✅ {scan.windows} windows, {sum(len(v) for v in scan.entities.values())} entities, none lost at edges")
+    
+    # A body Scrapy did not recognise as text (no response.text) is stream-scanned, not parsed as HTML
+    pytest.importorskip("scrapy")
+    from scrapy.http import Request, Response
+    from database import models
+    from crawler.decimal_crawler import DecimalCrawlerSpider
+    from crawler.crawl_config import CrawlConfig, CrawlResources
+    from crawler.seeds import Seed
+    
+    saved_path = models.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        models.DB_PATH = os.path.join(tmp, "scraped.db")
+        try:
+            config = CrawlConfig(seeds=(Seed('http://bin.onion/'),), frontier_db_path=os.path.join(tmp, "frontier.db"),
+                                 metrics_file=os.path.join(tmp, "metrics.jsonl"), ai_processing_enabled=False,
+                                 ocr_enabled=False, link_graph_enabled=False, near_dup_enabled=False,
+                                 recrawl_incremental=False, download_filter_enabled=False)
+            spider = DecimalCrawlerSpider(config=config, resources=CrawlResources(config))
+            spider.open_run()
+            body = b"\x00\x01PK\x03\x04 PAN card number ABCDE1234F fullz \xff\xfe" * 10
+            response = Response("http://bin.onion/dump.bin", body=body, request=Request("http://bin.onion/dump.bin"),
+                                headers={'Content-Type': 'application/octet-stream'})
+            items = [item for item in spider.parse(response) if isinstance(item, dict)]
+            spider.frontier.close()
+            spider.metrics.close()
+        finally:
+            models.DB_PATH = saved_path
+    assert len(items) == 1 and items[0]['named_entities'] == "PAN:ABCDE1234F", items
+    assert spider.streamed_pages == 1
+    print("✅ Binary response stream-scanned instead of failing on response.text")
+
+def test_near_duplicate():
+    """Test SimHash near-duplicate detection on a mirrored page."""
+    print("🪞 Testing Near-Duplicate Detection...")
+    
+    try:
+        from crawler.near_duplicate import NearDuplicateIndex
+        
+        dump = " ".join(f"record {i} name user{i} aadhaar {2345_6789_0000 + i} city pune" for i in range(200))
+        mirror = "Mirror of the original market. Login Register. " + dump + " Contact the admin."
+        unrelated = " ".join(f"listing {i} vendor escrow price {i * 7} btc shipping worldwide" for i in range(200))
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            index = NearDuplicateIndex(os.path.join(tmp, "fingerprints.db"))
+            index.add("http://original.onion/dump", index.fingerprint(dump))
+            
+            if index.find(index.fingerprint(mirror)) != "http://original.onion/dump":
+                print("❌ Mirrored page was not detected")
+                return False
+            if index.find(index.fingerprint(unrelated)) is not None:
+                print("❌ Unrelated page matched")
+                return False
+            if index.fingerprint("short login page") is not None:
+                print("❌ Short page was fingerprinted")
+                return False
+            index.close()
+        print("✅ Mirror linked to original, unrelated page kept")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Near-Duplicate test failed: {str(e)}")
+        return False
+
+def test_incremental_recrawl():
+    """Test page version tracking used for conditional recrawls."""
+    print("♻️ Testing Incremental Recrawl...")
+    
+    try:
+        from crawler.recrawl import PageVersionStore, content_hash, NEW, UNCHANGED, CHANGED
+        
+        url = "http://market.onion/dump"
+        links = ["http://market.onion/page/2"]
+        with tempfile.TemporaryDirectory() as tmp:
+            store = PageVersionStore(os.path.join(tmp, "versions.db"))
+            outcomes = [
+                store.record(url, "run1", content_hash("Aadhaar 2345 6789 0123"), links, etag='"v1"'),
+                store.record(url, "run2", content_hash("Aadhaar  2345 6789 0123\n"), links, etag='"v1"'),
+                store.record(url, "run3", content_hash("Aadhaar 9876 5432 1098"), links, etag='"v2"'),
+            ]
+            if outcomes != [NEW, UNCHANGED, CHANGED]:
+                print(f"❌ Unexpected outcomes: {outcomes}")
+                return False
+            if store.conditional_headers(url) != {"If-None-Match": '"v2"'}:
+                print(f"❌ Unexpected conditional headers: {store.conditional_headers(url)}")
+                return False
+            if store.not_modified(url, "run4") != links:
+                print("❌ Stored links not returned for 304")
+                return False
+            store.close()
+        print(f"✅ Version outcomes: {outcomes}, 304 re-seeds {len(links)} link(s)")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Incremental Recrawl test failed: {str(e)}")
+        return False
+
+def test_crawl_metrics():
+    """Test stage histograms, counters and the stats file / Prometheus export."""
+    print("⏱️ Testing Crawl Metrics...")
+    
+    try:
+        from crawler.metrics import CrawlMetrics
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            metrics = CrawlMetrics("run-42", shard=1)
+            metrics.start_flusher(os.path.join(tmp, "metrics.jsonl"), interval=60)
+            for seconds in (0.002, 0.002, 0.004, 0.3):
+                metrics.observe("entities", seconds)
+            with metrics.time("extract"):
+                pass
+            metrics.inc("pages_fetched")
+            metrics.inc("bytes_fetched", 2048)
+            metrics.close()
+            
+            with open(os.path.join(tmp, "metrics.jsonl")) as f:
+                snapshot = json.loads(f.readlines()[-1])
+        stage = snapshot["stages"]["entities"]
+        if snapshot["run_id"] != "run-42" or snapshot["counters"] != {"pages_fetched": 1, "bytes_fetched": 2048}:
+            print(f"❌ Unexpected snapshot: {snapshot}")
+            return False
+        if stage["count"] != 4 or stage["p50"] != 0.0025 or stage["p95"] != 0.5 or snapshot["stages"]["extract"]["count"] != 1:
+            print(f"❌ Unexpected stage histogram: {stage}")
+            return False
+        if 'crawler_pages_fetched_total{run_id="run-42",shard="1"} 1' not in metrics.prometheus():
+            print("❌ Counter missing from Prometheus export")
+            return False
+        print(f"✅ entities p50 {stage['p50'] * 1000:g}ms, p95 {stage['p95'] * 1000:g}ms, stats file tagged {snapshot['run_id']}")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Crawl Metrics test failed: {str(e)}")
+        return False
+
+def test_host_health():
+    """Test the dead-host negative cache: back-off, exponential re-probe and persistence."""
+    print("🪦 Testing Host Health Cache...")
+    
+    try:
+        from crawler.host_health import HostHealthCache, ALLOW, PROBE, SKIP
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "health.db")
+            cache = HostHealthCache(path, failure_threshold=2, base_backoff=60, max_backoff=150)
+            cache.record_failure("dead.onion", "TimeoutError", elapsed=30.0, now=1000)
+            if cache.allow("dead.onion", now=1001) != ALLOW:
+                print("❌ Host backed off before reaching the failure threshold")
+                return False
+            cache.record_failure("dead.onion", "TimeoutError", elapsed=30.0, now=1002)
+            if cache.allow("dead.onion", now=1003) != SKIP or cache.allow("live.onion", now=1003) != ALLOW:
+                print("❌ Dead host not skipped")
+                return False
+            
+            # Window over: one probe; while it is out other requests are still skipped
+            decisions = [cache.allow("dead.onion", now=1063), cache.allow("dead.onion", now=1064)]
+            cache.record_failure("dead.onion", "TimeoutError", elapsed=30.0, now=1090)
+            if decisions != [PROBE, SKIP] or cache.hosts["dead.onion"].down_until != 1090 + 120:
+                print(f"❌ Failed probe did not double the back-off: {decisions}, {cache.hosts['dead.onion'].backoff}")
+                return False
+            print("✅ Back-off after repeated failures, doubled after a failed probe")
+            
+            stats = cache.snapshot()
+            cache.close()
+            if stats['skipped'] != 2 or stats['wasted_slot_seconds'] != 90.0 or stats['saved_slot_seconds'] != 60.0:
+                print(f"❌ Unexpected slot accounting: {stats}")
+                return False
+            print(f"✅ Slot accounting: {stats['wasted_slot_seconds']}s wasted, {stats['saved_slot_seconds']}s saved")
+            
+            # The next run starts out knowing the host is dead, and a response clears it
+            cache = HostHealthCache(path, failure_threshold=2, base_backoff=60, max_backoff=150)
+            if cache.allow("dead.onion", now=1100) != SKIP or cache.allow("dead.onion", now=1300) != PROBE:
+                print("❌ Back-off not persisted across runs")
+                return False
+            cache.record_failure("dead.onion", "TimeoutError", now=1301)
+            if cache.hosts["dead.onion"].backoff != 150:
+                print(f"❌ Back-off not capped: {cache.hosts['dead.onion'].backoff}")
+                return False
+            cache.record_success("dead.onion", now=1500)
+            if cache.allow("dead.onion", now=1501) != ALLOW:
+                print("❌ Recovered host still skipped")
+                return False
+            cache.close()
+            print("✅ Back-off persisted across runs and cleared by a response")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Host Health test failed: {str(e)}")
+        return False
+
+def test_download_filter():
+    """Test early-abort verdicts from headers and first bytes, and the metadata-only record."""
+    print("🚫 Testing Download Filter...")
+    pytest.importorskip("scrapy")
+    from scrapy import Request
+    from scrapy.exceptions import StopDownload
+    from scrapy.http import Headers
+    from scrapy.settings import Settings
+    from crawler.download_filter import DownloadFilter, ACCEPT, OCR, REJECT, SNIFF
+    from crawler.middlewares import DownloadFilterMiddleware
+    from database import models
+    
+    download_filter = DownloadFilter(max_bytes=1000, ocr_max_bytes=500)
+    verdicts = [
+        download_filter.check_headers("text/html; charset=utf-8", 900).action,
+        download_filter.check_headers("text/csv").action,
+        download_filter.check_headers("application/zip", 900),
+        download_filter.check_headers("text/plain", 5000),
+        download_filter.check_headers("image/png", 400).action,
+        download_filter.check_headers("application/octet-stream").action,
+        download_filter.check_headers("text/html", attachment=True).action,
+        DownloadFilter(ocr_max_bytes=0).check_headers("application/pdf").action,
+    ]
+    assert verdicts == [ACCEPT, ACCEPT, (REJECT, "content_type"), (REJECT, "too_large"), OCR, SNIFF, REJECT, REJECT]
+    heads = [download_filter.check_head(head).action for head in
+             (b"INSERT INTO users VALUES (1, 'a@b.com');", b"PK\x03\x04\x00\x00", b"\x89PNG\r\n\x1a\n....")]
+    assert heads == [ACCEPT, REJECT, OCR]
+    print("✅ Allow-list, size cap and first-bytes sniffing verdicts")
+    
+    class Crawler:
+        settings = Settings({'DOWNLOAD_MAX_BYTES': 1000, 'OCR_MAX_BYTES': 500})
+    
+    middleware = DownloadFilterMiddleware(Crawler())
+    archive = Request("http://a.onion/dump.zip")
+    with pytest.raises(StopDownload):
+        middleware.headers_received(Headers({'Content-Type': 'application/zip'}), 50000, archive, None)
+    # Unsized body: aborted once it passes the cap
+    stream = Request("http://a.onion/log")
+    middleware.headers_received(Headers({'Content-Type': 'text/plain'}), "UNKNOWN_LENGTH", stream, None)
+    with pytest.raises(StopDownload):
+        for _ in range(3):
+            middleware.bytes_received(b"x" * 400, stream, None)
+    scan = Request("http://a.onion/get?id=7")
+    middleware.headers_received(Headers({'Content-Type': 'application/octet-stream'}), 300, scan, None)
+    middleware.bytes_received(b"%PDF-1.4\n...", scan, None)
+    stats = middleware.snapshot()
+    assert archive.meta['download_filtered']['reason'] == "content_type"
+    assert stream.meta['download_filtered']['bytes_read'] == 1200
+    assert scan.meta.get('download_route') == OCR
+    assert stats['bytes_saved'] == 50000 and stats['routed_ocr'] == 1
+    print(f"✅ Middleware aborted {stats['aborted']} downloads, {stats['bytes_saved']} bytes saved")
+    
+    # Metadata-only record, in a scratch database
+    saved_path = models.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        models.DB_PATH = os.path.join(tmp, "scraped.db")
+        try:
+            models.initialize_database()
+            models.record_filtered_download(url="http://filter-test.onion/dump.zip", run_id="filter_test",
+                                            **archive.meta['download_filtered'])
+            rows = models.fetch_filtered_downloads(run_id="filter_test")
+        finally:
+            models.DB_PATH = saved_path
+    assert len(rows) == 1 and rows[0][2:6] == ("application/zip", 50000, 0, "content_type")
+    print("✅ Metadata-only record stored for the aborted download")
+
+def test_link_graph():
+    """Test link edge storage, per-run de-duplication of host links and warm-started host PageRank."""
+    print("🕸️ Testing Link Graph...")
+    np = pytest.importorskip("numpy")
+    from crawler.link_graph import LinkGraph, pagerank, url_host
+    from crawler.link_priority import LinkPrioritizer
+    
+    # Hosts 1 and 2 both link to 0; 0 links back to 1
+    rank, _ = pagerank(np.array([1, 2, 0]), np.array([0, 0, 1]), np.ones(3), 3)
+    assert rank[0] > rank[1] > rank[2] and abs(rank.sum() - 1) <= 1e-6
+    assert url_host("http://User@Hub.onion:80/x?y") == "hub.onion"
+    print("✅ PageRank orders hosts by incoming links")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "graph.db")
+        received = []
+        graph = LinkGraph(path, batch_size=4, rank_every=1000, on_rank=received.append)
+        for i in range(5):
+            graph.add(f"http://leaf{i}.onion/", ["http://hub.onion/dump", f"http://leaf{i}.onion/about"], "run_1")
+        graph.add("http://hub.onion/dump", ["http://leaf0.onion/"], "run_1")
+        graph.close()
+        # A second run re-finding the same links must not count them twice
+        graph = LinkGraph(path, batch_size=4, rank_every=1000)
+        warm_start = graph.rank.copy()
+        graph.add("http://leaf1.onion/", ["http://hub.onion/dump"], "run_2")
+        graph.flush()
+        stats = graph.snapshot()
+        links = dict(((s, t), n) for s, t, n in graph.conn.execute(
+            "SELECT s.host, t.host, links FROM host_links JOIN graph_hosts s ON s.id = source_id "
+            "JOIN graph_hosts t ON t.id = target_id"))
+        top = graph.top_hosts(2)
+        graph.close()
+    assert stats['edges_written'] == 1 and stats['host_edge_updates'] == 0
+    assert links[("leaf1.onion", "hub.onion")] == 1
+    assert warm_start.any() and [host for host, _ in top] == ["hub.onion", "leaf0.onion"]
+    assert received and received[0]["hub.onion"] == 1.0
+    print(f"✅ Host ranks stored and reloaded: {', '.join(host for host, _ in top)}")
+    
+    prioritizer = LinkPrioritizer(keyword_weight=0, parent_weight=0, host_weight=0, depth_penalty=0, rank_weight=20)
+    prioritizer.set_host_ranks(received[0])
+    assert prioritizer.score("http://hub.onion/x", "", 0, 1) > prioritizer.score("http://leaf3.onion/x", "", 0, 1)
+    print("✅ Host rank feeds link priority")
+
 def test_ocr_processor():
     """Test OCR document processor."""
     print("📄 Testing OCR Document Processor...")
@@ -157,6 +1612,93 @@ def test_ocr_processor():
         print(f"❌ OCR Processor test failed: {str(e)}")
         return False
 
+def test_ocr_attachments():
+    """Test attachment detection, the OCR worker stage and write-back to the parent page row."""
+    print("🖼️  Testing OCR Attachments...")
+    from database import models
+    from crawler.ocr_stage import OCRStage, attachment_suffix, sniff_suffix
+    
+    suffixes = [attachment_suffix(url) for url in ("http://a.onion/scans/Card.JPEG", "http://a.onion/kyc.pdf?dl=1",
+                                                   "http://a.onion/thread/2", "http://a.onion/v1.2/")]
+    assert suffixes == [".jpg", ".pdf", None, None]
+    assert sniff_suffix(b"%PDF-1.7 ...") == ".pdf" and sniff_suffix(b"<html>404</html>") is None
+    print("✅ Image / PDF links recognised, bodies checked by magic bytes")
+    
+    class TextAfterMagicOCR:
+        """Reads back the text a test attachment carries after its magic bytes (no Tesseract needed)."""
+        def extract_text_from_bytes(self, data, suffix, language='eng', max_pages=10):
+            text = data.split(b"\n", 1)[1].decode()
+            return {'cleaned_text': text, 'confidence': 90.0, 'processing_successful': True}
+    
+    results = []
+    stage = OCRStage(TextAfterMagicOCR(), on_result=lambda page, attachment, fields: results.append((page, attachment, fields)),
+                     workers=2, max_queue=2)
+    for i in range(2):
+        stage.submit("http://a.onion/post", f"http://a.onion/scan{i}.pdf", b"%PDF-1.4\nPAN: ABCDE1234F", ".pdf")
+    stage.shutdown(wait=True, timeout=10)
+    assert len(results) == 2 and stage.snapshot()['completed'] == 2
+    assert results[0][2]['entities'] == "PAN:ABCDE1234F"
+    print(f"✅ OCR stage processed {len(results)} attachments on worker threads")
+    
+    # Entities land on the row of the page that linked the attachment (in a scratch database)
+    saved_path = models.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        models.DB_PATH = os.path.join(tmp, "scraped.db")
+        try:
+            models.initialize_database()
+            page_url = "http://ocr-test.onion/post"
+            models.insert_data_batch([{'url': page_url, 'title': 'scans', 'matched_keywords': 'aadhaar',
+                                       'run_id': 'ocr_test', 'named_entities': 'Email:a@b.com'}])
+            fields = dict(results[0][2], run_id='ocr_test')
+            updated = models.record_ocr_result(url=page_url, attachment_url="http://ocr-test.onion/scan0.pdf", **fields)
+            models.record_ocr_result(url=page_url, attachment_url="http://ocr-test.onion/scan1.pdf", **fields)
+            conn = sqlite3.connect(models.DB_PATH)
+            row = conn.execute("SELECT named_entities, ocr_entities FROM scraped_data WHERE url = ?", (page_url,)).fetchone()
+            conn.close()
+            attachments = models.fetch_ocr_attachments(page_url)
+        finally:
+            models.DB_PATH = saved_path
+    assert updated == 1
+    assert row == ("Email:a@b.com,PAN:ABCDE1234F", "PAN:ABCDE1234F")
+    assert len(attachments) == 2
+    print("✅ OCR entities merged into the parent page row")
+    
+    # The crawl fetches each attachment once per run: the frontier remembers it on disk, not in memory
+    pytest.importorskip("scrapy")
+    from crawler.decimal_crawler import DecimalCrawlerSpider
+    from crawler.crawl_config import CrawlConfig, CrawlResources
+    from crawler.frontier import CrawlFrontier, ATTACHMENT, attachment_key
+    from crawler.seeds import Seed
+    
+    class RoomyStage:
+        def has_room(self, downloading):
+            return True
+    
+    def requested(path, urls):
+        config = CrawlConfig(seeds=(Seed('http://ocr-test.onion/'),))
+        spider = DecimalCrawlerSpider(config=config, resources=CrawlResources(config))
+        spider.frontier = CrawlFrontier(path)
+        spider.frontier.open_run("ocr_run")
+        spider.ocr_stage = RoomyStage()
+        try:
+            return [request.url for request in spider.request_attachments("http://ocr-test.onion/post", urls, 0, 0.0)]
+        finally:
+            spider.frontier.close()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "frontier.db")
+        scans = ["http://ocr-test.onion/scan0.jpg", "http://ocr-test.onion/scan1.pdf"]
+        first = requested(path, scans + scans[:1])
+        again = requested(path, scans + ["http://ocr-test.onion/scan2.png"])
+        frontier = CrawlFrontier(path)
+        frontier.open_run("ocr_run")
+        states = [frontier.state(attachment_key(url)) for url in scans] + [frontier.state(scans[0])]
+        counts, active = frontier.counts(), frontier.run_active()
+        frontier.close()
+    assert first == scans and again == ["http://ocr-test.onion/scan2.png"], (first, again)
+    assert states == [ATTACHMENT, ATTACHMENT, None] and sum(counts.values()) == 0 and not active, (states, counts)
+    print("✅ Attachments fetched once per run, remembered by the frontier (not as pages)")
+
 def test_database_functions():
     """Test database operations and AI workflow integration."""
     print("🗄️  Testing Database Functions...")
@@ -192,23 +1734,38 @@ def test_database_functions():
 def test_crawler_integration():
     """Test crawler AI integration."""
     print("🕷️  Testing Crawler AI Integration...")
+    pytest.importorskip("scrapy")
+    from scrapy.utils.misc import load_object
     
-    try:
-        # Import crawler modules
-        sys.path.append(os.path.join(os.path.dirname(__file__), 'crawler'))
-        from decimal_crawler import DecimalCrawlerSpider
-        
-        print("✅ Crawler modules imported successfully")
-        
-        # Test spider initialization (without actually crawling)
-        spider = DecimalCrawlerSpider()
-        print(f"✅ Spider initialized with AI enabled: {spider.ai_enabled}")
-        
-        return True
-        
-    except Exception as e:
-        print(f"❌ Crawler integration test failed: {str(e)}")
-        return False
+    # Import crawler modules
+    from crawler.decimal_crawler import DecimalCrawlerSpider
+    from crawler.crawl_config import CrawlConfig, CrawlResources
+    from crawler.seeds import Seed
+    print("✅ Crawler modules imported successfully")
+    
+    # Scrapy loads middlewares and pipelines by dotted path: they must be the modules the spider imported
+    for setting in ('DOWNLOADER_MIDDLEWARES', 'ITEM_PIPELINES'):
+        for path in DecimalCrawlerSpider.custom_settings.get(setting, {}):
+            load_object(path)
+    duplicated = sorted(name for name in sys.modules if f'crawler.{name}' in sys.modules)
+    assert not duplicated, f"crawler modules imported under two names: {duplicated}"
+    print("✅ Crawler modules are imported once, by package path")
+    
+    # Test spider initialization (without actually crawling)
+    config = CrawlConfig(seeds=(Seed('http://example.onion/'),))
+    resources = CrawlResources(config)
+    spider = DecimalCrawlerSpider(config=config, resources=resources)
+    print(f"✅ Spider initialized with AI enabled: {spider.ai_enabled}")
+    
+    # Frontier, keywords and Gemini are only built once the crawl starts
+    assert spider.frontier is None
+    assert resources._keyword_matcher is None and resources._ai_processor is None
+    print("✅ Spider construction is lazy (no frontier, keywords or Gemini client)")
+    
+    # Worker processes rebuild the config from its environment form
+    env_config = CrawlConfig.from_env({}, crawler_delay=0.2, proxy_pool=('http://127.0.0.1:9050', 'http://127.0.0.1:9051'))
+    assert CrawlConfig.from_env(env_config.to_env()) == env_config
+    print("✅ CrawlConfig round-trips through environment variables")
 
 def test_dashboard_api():
     """Test dashboard API endpoints."""
@@ -306,8 +1863,34 @@ def main():
     tests = {
         "Environment Setup": test_environment_setup,
         "AI Utils & Gemini": test_ai_utils,
+        "Gemini Response Cache": test_gemini_cache,
+        "Gemini Batch Classification": test_gemini_batching,
+        "Gemini Client Layer": test_gemini_client,
+        "Local Leak Gate": test_leak_gate,
+        "Leak Gate Sample Recall": test_leak_gate_sample_recall,
+        "Evidence Snippets": test_evidence_snippets,
+        "Worker Stage": test_worker_stage,
+        "AI Classification Stage": test_ai_stage,
         "NER Utils": test_ner_utils,
+        "Entity Engine": test_entity_engine,
+        "Keyword Matcher": test_keyword_matcher,
+        "Write-Behind Pipeline": test_write_behind_pipeline,
+        "Crawl Frontier": test_crawl_frontier,
+        "Sharded Frontier": test_frontier_sharding,
+        "Adaptive Host Throttle": test_host_throttle,
+        "Proxy Pool": test_proxy_pool,
+        "Seed Batches": test_seed_batch,
+        "Link Prioritization": test_link_priority,
+        "HTML Extraction": test_html_extract,
+        "Streaming Scan": test_stream_scan,
+        "Near-Duplicate Detection": test_near_duplicate,
+        "Incremental Recrawl": test_incremental_recrawl,
+        "Crawl Metrics": test_crawl_metrics,
+        "Host Health Cache": test_host_health,
+        "Download Filter": test_download_filter,
+        "Link Graph": test_link_graph,
         "OCR Processor": test_ocr_processor,
+        "OCR Attachments": test_ocr_attachments,
         "Database Functions": test_database_functions,
         "Crawler Integration": test_crawler_integration,
         "Dashboard API": test_dashboard_api,
@@ -320,7 +1903,11 @@ def main():
         try:
             print(f"\n{test_name}")
             print("-" * 40)
-            results[test_name] = test_func()
+            # Older tests report by returning a bool, newer ones assert and return None
+            results[test_name] = test_func() is not False
+        except pytest.skip.Exception as e:
+            print(f"⚠️  {test_name} skipped: {e}")
+            results[test_name] = True
         except Exception as e:
             print(f"❌ {test_name} failed with exception: {str(e)}")
             results[test_name] = False